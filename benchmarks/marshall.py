@@ -0,0 +1,125 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the (LGPL) GNU Lesser General Public License as
+# published by the Free Software Foundation; either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Library Lesser General Public License for more details at
+# ( http://www.gnu.org/licenses/lgpl.html ).
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+# Written by: David Lanstein ( lanstein yahoo com )
+
+'''
+Compare SObjectMarshaller against the element-per-field marshalling it replaced, including
+suds serializing the result, on 200-record batches of increasingly wide records
+
+Run from this directory: python marshall.py
+'''
+
+import sys
+import time
+
+from xml.etree import ElementTree
+
+sys.path.append('../')
+
+import suds.sudsobject
+from suds.sax.element import Element
+from sforce.marshall import SObjectMarshaller
+
+def elementTree(sObjects, tag = 'sObjects'):
+  '''
+  The previous implementation, kept here as the baseline
+  '''
+  if not isinstance(sObjects, (tuple, list)):
+    sObjects = (sObjects, )
+  if sObjects[0].type in ['LeadConvert', 'SingleEmailMessage', 'MassEmailMessage']:
+    nsPrefix = 'tns:'
+  else:
+    nsPrefix = 'ens:'
+
+  li = []
+  for obj in sObjects:
+    el = Element(tag)
+    el.set('xsi:type', nsPrefix + obj.type)
+    for k, v in obj:
+      if k == 'type':
+        continue
+      if v == None: 
+        tmp = Element(k)
+        tmp.set('xsi:nil', 'true')
+        el.append(tmp)
+      elif isinstance(v, (list, tuple)):
+        for value in v:
+          el.append(Element(k).setText(value))
+      elif isinstance(v, suds.sudsobject.Object):
+        el.append(elementTree(v, k))
+      else:
+        el.append(Element(k).setText(v))
+    li.append(el)
+  return li
+
+def makeRecord(width):
+  record = suds.sudsobject.Object()
+  record.type = 'Contact'
+  record.fieldsToNull = ['Email', 'Fax']
+  record.Id = '003000000000000AAA'
+  record.Email = None
+  record.Fax = None
+  for i in range(width):
+    setattr(record, 'Field%d__c' % i, u'value <%d> & "more" \xe9' % i)
+  account = suds.sudsobject.Object()
+  account.type = 'Account'
+  account.External_Id__c = 'ext-1'
+  record.Account = account
+  return record
+
+def serialize(elements):
+  return u''.join([el.str() for el in elements])
+
+def canonical(elements):
+  '''
+  Re-parse serialized elements into nested (tag, attributes, text, children) tuples, ignoring
+  the whitespace suds indents its output with
+  '''
+  xml = u'<batch xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">%s</batch>'
+  return _canonical(ElementTree.fromstring((xml % serialize(elements)).encode('utf-8')))
+
+def _canonical(el):
+  children = [_canonical(child) for child in el]
+  text = el.text or ''
+  if children:
+    text = text.strip()
+  return (el.tag, sorted(el.attrib.items()), text, children)
+
+def timeit(fn, batch, repeat = 5):
+  best = None
+  for i in range(repeat):
+    start = time.time()
+    serialize(fn(batch))
+    elapsed = time.time() - start
+    if best is None or elapsed < best:
+      best = elapsed
+  return best
+
+def main():
+  marshaller = SObjectMarshaller()
+
+  batch = [makeRecord(5) for i in range(3)]
+  assert canonical(elementTree(batch)) == canonical(marshaller.marshall(batch)), 'output differs'
+
+  print '%-24s %12s %12s %8s' % ('batch', 'elements', 'templates', 'speedup')
+  for width in (10, 50, 200, 500):
+    batch = [makeRecord(width) for i in range(200)]
+    before = timeit(elementTree, batch)
+    after = timeit(marshaller.marshall, batch)
+    label = '200 x %d fields' % width
+    print '%-24s %11.1fms %11.1fms %7.1fx' % (label, before * 1000, after * 1000, before / after)
+
+if __name__ == '__main__':
+  main()
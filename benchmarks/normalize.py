@@ -0,0 +1,118 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the (LGPL) GNU Lesser General Public License as
+# published by the Free Software Foundation; either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Library Lesser General Public License for more details at
+# ( http://www.gnu.org/licenses/lgpl.html ).
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+# Written by: David Lanstein ( lanstein yahoo com )
+
+'''
+Compare SforcePartnerClient._stringifyResultRecords() against the recursive, setattr()-based
+implementation it replaced, on pages of wide and of deeply nested records
+
+Run from this directory: python normalize.py
+'''
+
+import sys
+import time
+
+sys.path.append('../')
+
+import suds.sudsobject
+from sforce.partner import SforcePartnerClient
+
+def recursive(struct):
+  '''
+  The previous implementation, kept here as the baseline
+  '''
+  if not isinstance(struct, list):
+    struct = [struct]
+    originallyList = False
+  else:
+    originallyList = True
+
+  for record in struct:
+    for k, v in record:
+      if isinstance(v, list):
+        if v == []:
+          setattr(record, k, None)
+        else:
+          setattr(record, k, v[0])
+      v = getattr(record, k)
+      if isinstance(v, suds.sudsobject.Object):
+        v = recursive(v)
+        setattr(record, k, v)
+  if originallyList:
+    return struct
+  else:
+    return struct[0]
+
+def asDict(record):
+  result = {}
+  for (k, v) in record:
+    if isinstance(v, suds.sudsobject.Object):
+      v = asDict(v)
+    result[k] = v
+  return result
+
+def makeRecord(sObjectType, width, depth):
+  '''
+  A record as suds unmarshalls it from the Partner WSDL: <any/> fields wrapped in lists, and
+  depth levels of relationship fields
+  '''
+  record = suds.sudsobject.Object()
+  record.type = sObjectType
+  record.Id = '003000000000000AAA'
+  for i in range(width):
+    if i % 10 == 0:
+      setattr(record, 'Field%d__c' % i, [])
+    else:
+      setattr(record, 'Field%d__c' % i, ['value %d' % i])
+  if depth > 0:
+    record.Parent__r = [makeRecord(sObjectType, width, depth - 1)]
+  return record
+
+def makePage(records, width, depth):
+  return [makeRecord('Contact', width, depth) for i in range(records)]
+
+def timeit(fn, records, width, depth, repeat = 5):
+  best = None
+  for i in range(repeat):
+    page = makePage(records, width, depth)
+    start = time.time()
+    fn(page)
+    elapsed = time.time() - start
+    if best is None or elapsed < best:
+      best = elapsed
+  return best
+
+def main():
+  # Parsing a Partner WSDL isn't what we're measuring; the method doesn't need the instance
+  normalize = SforcePartnerClient.__dict__['_stringifyResultRecords']
+  iterative = lambda page: normalize(None, page)
+
+  expected = [asDict(record) for record in recursive(makePage(2, 5, 3))]
+  actual = [asDict(record) for record in iterative(makePage(2, 5, 3))]
+  assert expected == actual, 'implementations disagree'
+
+  print '%-28s %12s %12s %8s' % ('page', 'recursive', 'iterative', 'speedup')
+  for (records, width, depth) in ((2000, 10, 0),
+                                  (2000, 50, 0),
+                                  (2000, 200, 0),
+                                  (2000, 20, 2),
+                                  (500, 20, 5)):
+    before = timeit(recursive, records, width, depth)
+    after = timeit(iterative, records, width, depth)
+    label = '%d x %d fields, depth %d' % (records, width, depth)
+    print '%-28s %11.1fms %11.1fms %7.1fx' % (label, before * 1000, after * 1000, before / after)
+
+if __name__ == '__main__':
+  main()
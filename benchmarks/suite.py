@@ -0,0 +1,343 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the (LGPL) GNU Lesser General Public License as
+# published by the Free Software Foundation; either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Library Lesser General Public License for more details at
+# ( http://www.gnu.org/licenses/lgpl.html ).
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+# Written by: David Lanstein ( lanstein yahoo com )
+
+'''
+Benchmarks for the toolkit's hot paths, with results that can be saved and compared
+
+  wsdl.*      Constructing a client, i.e. loading and parsing the WSDL
+  marshall.*  _marshallSObjects() plus suds serializing the result, by batch size and width
+  stringify.* SforcePartnerClient._stringifyResultRecords(), by page size, width and depth
+  compact.*   sforce.record.compactRecords() on stringified pages, likewise
+  headers.*   _setHeaders() for the same call repeatedly, and alternating between calls
+  server.*    query, export and DML round trips against sforce.testserver
+
+Without --wsdl, the Partner WSDL that sforce.testserver serves is used.  Run from this
+directory:
+
+  python suite.py --save before.json
+  (upgrade the toolkit)
+  python suite.py --compare before.json
+
+Any further arguments select the benchmarks whose names start with them, e.g.
+'python suite.py marshall stringify'.
+'''
+
+import gc
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import urllib2
+
+from cStringIO import StringIO
+from optparse import OptionParser
+from timeit import default_timer
+
+sys.path.append('../')
+
+import suds
+
+import marshall
+import normalize
+
+from sforce.base import SforceBaseClient
+from sforce.export import CSVWriter
+from sforce.partner import SforcePartnerClient
+from sforce.record import compactRecords
+from sforce.testserver import SforceTestServer
+
+BENCHMARKS = []
+
+def benchmark(name):
+  '''
+  Register a benchmark factory
+
+  The factory is called with the options and returns (prepare, run, units): prepare() builds
+  untimed input for one run, run(input) is what's timed, and units is how many records (or
+  calls) one run processes, for the throughput column.  prepare may be None.
+  '''
+  def register(factory):
+    BENCHMARKS.append((name, factory))
+    return factory
+  return register
+
+#
+# Benchmarks
+#
+
+@benchmark('wsdl.load')
+def wsdlLoad(options):
+  return (None, lambda input: SforcePartnerClient(options.wsdl), 1)
+
+@benchmark('wsdl.load.schemaCache')
+def wsdlLoadSchemaCache(options):
+  location = tempfile.mkdtemp()
+  options.cleanup.append(lambda: shutil.rmtree(location, True))
+  # Warm the cache, so every timed run loads the pickle
+  SforcePartnerClient(options.wsdl, schemaCache = location)
+  return (None, lambda input: SforcePartnerClient(options.wsdl, schemaCache = location), 1)
+
+def marshallBenchmark(count, width):
+  def factory(options):
+    # Marshalling doesn't touch the WSDL, so skip parsing one
+    client = SforceBaseClient.__new__(SforceBaseClient)
+    batch = [marshall.makeRecord(width) for i in range(count)]
+    return (None, lambda input: marshall.serialize(client._marshallSObjects(batch)), count)
+  return factory
+
+for count in (1, 200):
+  for width in (5, 50, 200):
+    benchmark('marshall.%dx%d' % (count, width))(marshallBenchmark(count, width))
+
+def stringifyBenchmark(records, width, depth):
+  def factory(options):
+    client = SforcePartnerClient.__new__(SforcePartnerClient)
+    # Normalizing happens in place, so each run needs a fresh page
+    prepare = lambda: normalize.makePage(records, width, depth)
+    return (prepare, client._stringifyResultRecords, records)
+  return factory
+
+for (records, width, depth) in ((2000, 10, 0), (2000, 50, 0), (500, 20, 3)):
+  benchmark('stringify.%dx%dd%d' % (records, width, depth))(stringifyBenchmark(records, width, depth))
+
+def compactBenchmark(records, width, depth):
+  def factory(options):
+    client = SforcePartnerClient.__new__(SforcePartnerClient)
+    prepare = lambda: client._stringifyResultRecords(normalize.makePage(records, width, depth))
+    return (prepare, compactRecords, records)
+  return factory
+
+for (records, width, depth) in ((2000, 10, 0), (2000, 50, 0), (500, 20, 3)):
+  benchmark('compact.%dx%dd%d' % (records, width, depth))(compactBenchmark(records, width, depth))
+
+@benchmark('headers.same')
+def headersSame(options):
+  client = SforcePartnerClient(options.wsdl)
+  def run(input):
+    for i in xrange(1000):
+      client._setHeaders('query')
+  return (None, run, 1000)
+
+@benchmark('headers.alternating')
+def headersAlternating(options):
+  client = SforcePartnerClient(options.wsdl)
+  client.setQueryOptions(client.generateHeader('QueryOptions'))
+  def run(input):
+    for i in xrange(500):
+      client._setHeaders('query')
+      client._setHeaders('create')
+  return (None, run, 1000)
+
+def serverWsdl(options):
+  '''
+  Save the stand-in server's Partner WSDL to a file, so wsdl.* times parsing rather than
+  downloading it, and return its path
+  '''
+  server = SforceTestServer(records = 0).start()
+  try:
+    fp = urllib2.urlopen(server.getWsdlUrl('partner'))
+    try:
+      data = fp.read()
+    finally:
+      fp.close()
+  finally:
+    server.stop()
+
+  (fd, path) = tempfile.mkstemp(suffix = '.wsdl.xml')
+  os.write(fd, data)
+  os.close(fd)
+  options.cleanup.append(lambda: os.remove(path))
+  return path
+
+def serverClient(options, **kwargs):
+  '''
+  A logged-in client for a stand-in server that lives as long as the benchmark run
+  '''
+  server = SforceTestServer(records = options.records, pageSize = 2000, latency = options.latency).start()
+  options.cleanup.append(server.stop)
+  client = SforcePartnerClient(options.wsdl, location = server.getServerUrl(), **kwargs)
+  client.login('bench@example.com', 'password', '')
+  return client
+
+def serverQuery(**kwargs):
+  def factory(options):
+    client = serverClient(options, **kwargs)
+    soql = 'SELECT Id, FirstName, LastName, Company, Email, Phone, Status FROM Lead'
+    return (None, lambda input: list(client.queryIter(soql)), options.records)
+  return factory
+
+benchmark('server.query')(serverQuery())
+benchmark('server.query.keepAlive')(serverQuery(keepAlive = True))
+benchmark('server.query.compression')(serverQuery(keepAlive = True, compression = True))
+
+@benchmark('server.export.csv')
+def serverExportCsv(options):
+  client = serverClient(options, keepAlive = True)
+  soql = 'SELECT Id, FirstName, LastName, Company, Email, Phone, Status FROM Lead'
+  return (None, lambda input: client.queryExport(soql, CSVWriter(StringIO())), options.records)
+
+def makeLeads(client, count):
+  leads = []
+  for i in range(count):
+    lead = client.generateObject('Lead')
+    lead.FirstName = 'Joe'
+    lead.LastName = 'Moke %d' % i
+    lead.Company = 'Jamoke, Inc.'
+    lead.Email = 'joe%d@example.com' % i
+    leads.append(lead)
+  return leads
+
+def serverCreate(**kwargs):
+  def factory(options):
+    client = serverClient(options, **kwargs)
+    return (lambda: makeLeads(client, 1000), client.create, 1000)
+  return factory
+
+benchmark('server.create')(serverCreate())
+benchmark('server.create.keepAlive')(serverCreate(keepAlive = True))
+
+@benchmark('server.update')
+def serverUpdate(options):
+  client = serverClient(options, keepAlive = True)
+  ids = [result.id for result in client.create(makeLeads(client, 1000))]
+
+  def prepare():
+    leads = []
+    for id in ids:
+      lead = client.generateObject('Lead')
+      lead.Id = id
+      lead.Phone = '(617) 555-0100'
+      leads.append(lead)
+    return leads
+  return (prepare, client.update, 1000)
+
+#
+# Runner
+#
+
+def measure(prepare, run, repeat):
+  '''
+  Return the wall clock time of each of repeat runs, after one untimed warm-up run
+  '''
+  times = []
+  for i in range(repeat + 1):
+    if prepare is None:
+      input = None
+    else:
+      input = prepare()
+
+    gc.collect()
+    gcEnabled = gc.isenabled()
+    gc.disable()
+    try:
+      start = default_timer()
+      run(input)
+      elapsed = default_timer() - start
+    finally:
+      if gcEnabled:
+        gc.enable()
+
+    if i > 0:
+      times.append(elapsed)
+  return times
+
+def median(values):
+  values = sorted(values)
+  middle = len(values) // 2
+  if len(values) % 2:
+    return values[middle]
+  return (values[middle - 1] + values[middle]) / 2.0
+
+def report(results, baseline, threshold):
+  if baseline is None:
+    print '%-28s %10s %10s %14s' % ('benchmark', 'median', 'best', 'units/sec')
+  else:
+    print '%-28s %10s %10s %14s %10s %8s' % ('benchmark', 'median', 'best', 'units/sec', 'baseline', 'change')
+
+  for (name, result) in results:
+    line = '%-28s %8.2fms %8.2fms %14.0f' % (name, result['median'] * 1000, result['best'] * 1000,
+                                             result['units'] / result['median'])
+    if baseline is not None:
+      before = baseline.get(name)
+      if before is None:
+        line += ' %10s %8s' % ('-', 'new')
+      else:
+        change = (result['median'] - before['median']) / before['median'] * 100
+        line += ' %8.2fms %+7.1f%%' % (before['median'] * 1000, change)
+        if change > threshold:
+          line += '  SLOWER'
+        elif change < -threshold:
+          line += '  faster'
+    print line
+
+def main():
+  parser = OptionParser(usage = 'python suite.py [options] [benchmark prefix ...]')
+  parser.add_option('--wsdl', help = "Partner WSDL, by default the stand-in server's")
+  parser.add_option('--repeat', type = 'int', default = 5, help = 'timed runs per benchmark')
+  parser.add_option('--records', type = 'int', default = 5000,
+                    help = 'records the stand-in server serves to server.query*')
+  parser.add_option('--latency', type = 'float', default = 0,
+                    help = 'seconds the stand-in server waits per call')
+  parser.add_option('--save', help = 'write the results to this JSON file')
+  parser.add_option('--compare', help = 'compare against results saved with --save')
+  parser.add_option('--threshold', type = 'float', default = 10,
+                    help = 'percent change to flag as slower or faster')
+  (options, prefixes) = parser.parse_args()
+  options.cleanup = []
+  if not options.wsdl:
+    options.wsdl = serverWsdl(options)
+
+  baseline = None
+  if options.compare:
+    fp = open(options.compare)
+    try:
+      baseline = json.load(fp)['results']
+    finally:
+      fp.close()
+
+  results = []
+  try:
+    for (name, factory) in BENCHMARKS:
+      if prefixes and not [prefix for prefix in prefixes if name.startswith(prefix)]:
+        continue
+
+      (prepare, run, units) = factory(options)
+      times = measure(prepare, run, options.repeat)
+      results.append((name, {'median': median(times), 'best': min(times), 'units': units, 'times': times}))
+      sys.stderr.write('.')
+  finally:
+    for cleanup in options.cleanup:
+      cleanup()
+  sys.stderr.write('\n')
+
+  report(results, baseline, options.threshold)
+
+  if options.save:
+    fp = open(options.save, 'w')
+    try:
+      json.dump({'python': platform.python_version(),
+                 'suds': suds.__version__,
+                 'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                 'args': sys.argv[1:],
+                 'results': dict(results)}, fp, indent = 2, sort_keys = True)
+    finally:
+      fp.close()
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,487 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the (LGPL) GNU Lesser General Public License as
+# published by the Free Software Foundation; either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Library Lesser General Public License for more details at
+# ( http://www.gnu.org/licenses/lgpl.html ).
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+# Written by: David Lanstein ( lanstein yahoo com )
+
+import sys
+import threading
+
+from timeit import default_timer
+
+from asynctransport import AsyncHttpTransport
+from enterprise import SforceEnterpriseClient
+from instrument import CallInfo
+from partner import SforcePartnerClient
+from worker import Future, WorkerPool
+
+# Calls whose result is returned as Salesforce sent it
+_CALLS = ('getDeleted',
+          'getUpdated',
+          'query',
+          'queryAll',
+          'queryMore',
+          'search',
+          'getServerTimestamp',
+          'getUserInfo',
+          'resetPassword',
+          'setPassword')
+
+# Calls whose single result is unwrapped from its list unless setStrictResultTyping() is on
+_TYPED_CALLS = ('invalidateSessions',
+                'retrieve')
+
+# Typed calls taking sObjects, which we marshall ourselves
+_MARSHALLED_CALLS = ('convertLead',
+                     'merge',
+                     'process',
+                     'sendEmail')
+
+# Calls split into API-sized batches, setConcurrency() of which are in flight at once
+_BATCH_CALLS = ('create',
+                'delete',
+                'emptyRecycleBin',
+                'undelete',
+                'update')
+
+# Calls made with the wrapped client's own method on a worker thread: login() and logout()
+# change the session everyone shares, and describeSObjects() picks its calls from the cache
+_BLOCKING_CALLS = ('login',
+                   'logout',
+                   'describeSObjects')
+
+def _resolved(result):
+  future = Future()
+  future.setResult(result)
+  return future
+
+def _gather(futures, fn):
+  '''
+  Return a Future for fn(results), once all of futures have finished, or for the exception
+  raised by the first of them, in list order, that failed
+  '''
+  gathered = Future()
+  lock = threading.Lock()
+  remaining = [len(futures)]
+
+  def finished(future):
+    lock.acquire()
+    try:
+      remaining[0] -= 1
+      if remaining[0] > 0:
+        return
+    finally:
+      lock.release()
+
+    try:
+      result = fn([done.result() for done in futures])
+    except:
+      gathered.setException(sys.exc_info())
+      return
+    gathered.setResult(result)
+
+  if not futures:
+    remaining[0] = 1
+    finished(None)
+  for future in futures:
+    future.addCallback(finished)
+  return gathered
+
+def _then(future, fn):
+  '''
+  Return a Future for fn(future's result)
+  '''
+  return _gather([future], lambda results: fn(results[0]))
+
+class AsyncSforceClient(object):
+  '''
+  Wraps a Partner or Enterprise client so that its API calls return immediately with a
+  sforce.worker.Future, rather than blocking until Salesforce responds
+
+  Requests go out over an AsyncHttpTransport, whose one thread multiplexes all of them over
+  at most maxConnections keep-alive connections, so thousands of calls can be in flight
+  without a thread each.  Each call is marshalled on the thread that makes it, and its
+  response unmarshalled and normalized on one of a few 'workers' threads, by copies of the
+  wrapped client, so marshalling, SOAP headers, result normalization, the retry policy, the
+  describe cache and listeners are exactly those of the wrapped client.  Retries wait on the
+  transport's timers rather than holding a thread.
+
+  create(), update(), etc. send at most setConcurrency() batches at once, marshalling and
+  sending each of the rest as one finishes.  login(), logout(), describeSObjects() and the
+  Enterprise client's retrieve() (really a set of queries) are made with the wrapped client's
+  own blocking methods, on a worker.
+
+  Futures finish, and their callbacks run, on the workers.  Everything that doesn't touch the
+  network (generateObject(), set*Header(), etc.) is passed straight through to the wrapped
+  client.
+  '''
+  _clientClass = None
+
+  def __init__(self, wsdl, workers = 4, maxConnections = 16, **kwargs):
+    '''
+    'wsdl' : Location of WSDL
+    'workers' : Threads to unmarshall responses, run callbacks and make the blocking calls on
+    'maxConnections' : Most connections to have open at once; calls beyond what they can
+                       carry wait their turn
+
+    Any other arguments are passed to the wrapped client; keepAlive defaults to True
+    '''
+    if not kwargs.has_key('transport'):
+      kwargs.setdefault('keepAlive', True)
+
+    self._client = self._clientClass(wsdl, **kwargs)
+    self._transport = AsyncHttpTransport(maxConnections = maxConnections,
+                                         **self._client._httpOptions)
+    self._pool = WorkerPool(workers)
+    self._local = threading.local()
+
+  def __getattr__(self, name):
+    if name.startswith('__') or name in ('_client', '_transport', '_pool', '_local'):
+      raise AttributeError(name)
+    return getattr(self._client, name)
+
+  def _threadClient(self):
+    '''
+    Return the calling thread's copy of the client, recopying it if the session, endpoint,
+    SOAP headers or settings have changed since it was made
+    '''
+    client = getattr(self._local, 'client', None)
+    if client is None or not self._client._isCurrentClone(client):
+      client = self._client._clone()
+      self._local.client = client
+    return client
+
+  def _hop(self, future, fn, *args):
+    '''
+    Run fn(*args) on a worker; fn finishes future, unless the pool has been shut down
+    '''
+    def ran(task):
+      try:
+        task.result()
+      except:
+        if not future.done():
+          future.setException(sys.exc_info())
+
+    self._pool.submit(lambda state: fn(*args)).addCallback(ran)
+
+  def _invoke(self, call, args, batch = None):
+    '''
+    SforceBaseClient._invoke() without blocking: return a Future for the call's normalized
+    result
+    '''
+    future = Future()
+    self._attempt(future, call, args, batch, 0)
+    return future
+
+  def _attempt(self, future, call, args, batch, attempt):
+    client = self._threadClient()
+    sessionId = client._sessionId
+    info = None
+    try:
+      if client._listeners:
+        info = CallInfo(call)
+      sendArgs = args
+      if batch is not None:
+        if info is not None:
+          info.requestRecords = len(batch)
+        sendArgs += (client._prepareBatch(call, batch), )
+      client._setHeaders(call)
+      request = client._soapRequest(call, sendArgs)
+      if info is not None:
+        info.requestBytes = len(request.message)
+        info.sent = default_timer()
+      sent = self._transport.submit(request)
+    except:
+      self._failed(future, client, call, args, batch, attempt, sessionId, info, sys.exc_info())
+      return
+
+    def received(sent):
+      if info is not None:
+        info.received = default_timer()
+      self._hop(future, self._finish, future, call, args, batch, attempt, sessionId, info, sent)
+    sent.addCallback(received)
+
+  def _finish(self, future, call, args, batch, attempt, sessionId, info, sent):
+    client = self._threadClient()
+    try:
+      (status, reason, headers, body) = sent.result()
+      if info is not None:
+        info.responseBytes = len(body)
+      # Anything else this worker has run may have left another client's options active
+      client._sforce.wsdl.options.use(client._sforce.options)
+      result = client._soapReply(call, status, reason, body)
+      if info is not None:
+        info.unmarshalled = default_timer()
+      result = client._normalizeResult(call, result)
+    except:
+      self._failed(future, client, call, args, batch, attempt, sessionId, info, sys.exc_info())
+      return
+
+    if info is not None:
+      info.responseRecords = client._countRecords(result)
+      info.finished = default_timer()
+      client._notifyListeners(info)
+    future.setResult(result)
+
+  def _failed(self, future, client, call, args, batch, attempt, sessionId, info, excInfo):
+    '''
+    Fail the call, or retry it as the retry policy allows
+    '''
+    if info is not None:
+      info.error = excInfo[1]
+      info.finished = default_timer()
+      client._notifyListeners(info)
+
+    policy = client._retryPolicy
+    if policy is not None and attempt < policy.maxRetries:
+      if policy.shouldRelogin(call, excInfo[1]):
+        self._hop(future, self._relogin, future, call, args, batch, attempt, sessionId, excInfo)
+        return
+      if policy.shouldRetry(call, excInfo[1]):
+        self._transport.callLater(policy.getDelay(attempt), self._hop, future, self._attempt,
+                                  future, call, args, batch, attempt + 1)
+        return
+    future.setException(excInfo)
+
+  def _relogin(self, future, call, args, batch, attempt, sessionId, excInfo):
+    try:
+      relogged = self._threadClient()._relogin(sessionId)
+    except:
+      future.setException(sys.exc_info())
+      return
+    if not relogged:
+      future.setException(excInfo)
+      return
+    self._attempt(future, call, args, batch, attempt + 1)
+
+  def _typed(self, call, args):
+    client = self._threadClient()
+    return _then(self._invoke(call, args), client._handleResultTyping)
+
+  def _marshalled(self, call, sObjects):
+    return self._typed(call, (self._threadClient()._marshallSObjects(sObjects), ))
+
+  def _batchCall(self, call, items, *args):
+    '''
+    SforceBaseClient._batchCall() without blocking: at most setConcurrency() batches are in
+    flight at once, and each of the rest is marshalled and sent as one of them finishes
+    '''
+    client = self._threadClient()
+    batches = enumerate(client._batches(items))
+    gathered = Future()
+    lock = threading.Lock()
+    results = []
+    # Batches sent but not finished, whether batches has run out, and whether gathered is set
+    inFlight = [0]
+    exhausted = [False]
+    settled = [False]
+
+    def settle():
+      # Return True to the one caller that should set gathered
+      lock.acquire()
+      try:
+        if settled[0] or not exhausted[0] or inFlight[0] > 0:
+          return False
+        settled[0] = True
+        return True
+      finally:
+        lock.release()
+
+    def fail(excInfo):
+      lock.acquire()
+      try:
+        if settled[0]:
+          return
+        settled[0] = True
+      finally:
+        lock.release()
+      gathered.setException(excInfo)
+
+    def send():
+      # Send the next batch, if there is one and nothing has failed; return whether we did
+      lock.acquire()
+      try:
+        if settled[0] or exhausted[0]:
+          return False
+        try:
+          (i, batch) = batches.next()
+        except StopIteration:
+          exhausted[0] = True
+          return False
+        results.append(None)
+        inFlight[0] += 1
+      finally:
+        lock.release()
+      self._sendBatch(call, args, batch).addCallback(lambda sent: finished(i, sent))
+      return True
+
+    def finished(i, sent):
+      try:
+        results[i] = sent.result()
+        send()
+      except:
+        fail(sys.exc_info())
+        return
+
+      lock.acquire()
+      try:
+        inFlight[0] -= 1
+      finally:
+        lock.release()
+      if settle():
+        combine()
+
+    def combine():
+      try:
+        combined = []
+        for result in results:
+          combined.extend(result)
+        combined = client._handleResultTyping(combined)
+      except:
+        gathered.setException(sys.exc_info())
+        return
+      gathered.setResult(combined)
+
+    try:
+      for n in range(client._concurrency):
+        if not send():
+          break
+    except:
+      fail(sys.exc_info())
+    if settle():
+      combine()
+    return gathered
+
+  def _sendBatch(self, call, args, batch):
+    future = Future()
+    results = [None] * len(batch)
+    self._resubmit(future, call, args, batch, results, range(len(batch)), 0)
+    return future
+
+  def _resubmit(self, future, call, args, batch, results, failed, attempt):
+    '''
+    Send the records of batch at the indexes in failed, and fill in their results; as
+    SforceBaseClient._resubmitFailed(), records whose results show a transient failure are
+    sent again, with backoff
+    '''
+    sent = self._invoke(call, args, [batch[i] for i in failed])
+
+    def received(sent):
+      try:
+        retried = sent.result()
+      except:
+        future.setException(sys.exc_info())
+        return
+      if not isinstance(retried, list):
+        retried = [retried]
+      for (i, result) in zip(failed, retried):
+        results[i] = result
+
+      policy = self._client._retryPolicy
+      if policy is not None and attempt < policy.maxRetries:
+        stillFailed = [i for (i, result) in enumerate(results) if policy.shouldResubmit(result)]
+        if stillFailed:
+          self._transport.callLater(policy.getDelay(attempt), self._hop, future, self._resubmit,
+                                    future, call, args, batch, results, stillFailed, attempt + 1)
+          return
+      future.setResult(results)
+    sent.addCallback(received)
+
+  def _describe(self, call, *args):
+    '''
+    SforceBaseClient._cachedDescribe() without blocking
+    '''
+    client = self._threadClient()
+    cache = client._describeCache
+    if cache is None:
+      return self._invoke(call, args)
+
+    key = client._describeKey(call, *args)
+    result = cache.get(key)
+    if result is not None:
+      return _resolved(result)
+
+    def put(result):
+      cache.put(key, result)
+      return result
+    return _then(self._invoke(call, args), put)
+
+  def _blocking(self, name, *args):
+    '''
+    Make a call with the wrapped client's own method, on a worker
+    '''
+    return self._pool.submit(self._callBlocking, name, args)
+
+  def _callBlocking(self, state, name, args):
+    if name == 'login':
+      # Sets the session on the client everyone copies
+      return self._client.login(*args)
+    return getattr(self._threadClient(), name)(*args)
+
+  def upsert(self, externalIdFieldName, sObjects):
+    '''
+    Send upsert() and return a Future for its result
+    '''
+    return self._batchCall('upsert', sObjects, externalIdFieldName)
+
+  def describeLayout(self, sObjectType, recordTypeIds = None):
+    '''
+    Send describeLayout() and return a Future for its result
+    '''
+    return self._describe('describeLayout', sObjectType, recordTypeIds)
+
+  def getClient(self):
+    '''
+    Return the wrapped, synchronous client
+    '''
+    return self._client
+
+  def close(self):
+    '''
+    Close the connections and stop the worker threads; calls still in flight fail
+    '''
+    self._transport.close()
+    self._pool.shutdown()
+
+def _asyncCall(name, method):
+  def call(self, *args):
+    return method(self, name, *args)
+  call.__name__ = name
+  call.__doc__ = 'Send %s() and return a Future for its result' % name
+  return call
+
+for (names, method) in ((_CALLS, lambda self, name, *args: self._invoke(name, args)),
+                        (_TYPED_CALLS, lambda self, name, *args: self._typed(name, args)),
+                        (_MARSHALLED_CALLS, AsyncSforceClient._marshalled.im_func),
+                        (_BATCH_CALLS, AsyncSforceClient._batchCall.im_func),
+                        (('describeGlobal', 'describeSObject', 'describeTabs'),
+                         AsyncSforceClient._describe.im_func),
+                        (_BLOCKING_CALLS, AsyncSforceClient._blocking.im_func)):
+  for name in names:
+    setattr(AsyncSforceClient, name, _asyncCall(name, method))
+del names, method, name
+
+class AsyncSforcePartnerClient(AsyncSforceClient):
+  _clientClass = SforcePartnerClient
+
+class AsyncSforceEnterpriseClient(AsyncSforceClient):
+  _clientClass = SforceEnterpriseClient
+
+  def retrieve(self, fieldList, sObjectType, ids):
+    '''
+    Send retrieve() and return a Future for its result
+
+    The Enterprise client's retrieve() is a set of queries, so this is made with its own
+    blocking method, on a worker
+    '''
+    return self._blocking('retrieve', fieldList, sObjectType, ids)
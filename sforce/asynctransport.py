@@ -0,0 +1,797 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the (LGPL) GNU Lesser General Public License as
+# published by the Free Software Foundation; either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Library Lesser General Public License for more details at
+# ( http://www.gnu.org/licenses/lgpl.html ).
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+# Written by: David Lanstein ( lanstein yahoo com )
+
+import errno
+import heapq
+import httplib
+import itertools
+import logging
+import os
+import select
+import socket
+import sys
+import threading
+import time
+
+from collections import deque
+
+try:
+  import ssl
+except ImportError:
+  ssl = None
+
+from transport import HttpTransport, _decompressor
+from worker import Future
+
+log = logging.getLogger(__name__)
+
+# What connect_ex() returns for a non-blocking socket whose connection is under way (10035 is
+# Windows' WSAEWOULDBLOCK)
+_CONNECTING = (errno.EINPROGRESS, errno.EALREADY, errno.EWOULDBLOCK, 10035)
+
+def _wouldBlock(e):
+  '''
+  Whether a socket error only means the socket isn't ready yet
+  '''
+  if ssl is not None and isinstance(e, ssl.SSLError):
+    return e.args[0] in (ssl.SSL_ERROR_WANT_READ, ssl.SSL_ERROR_WANT_WRITE)
+  return e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR)
+
+def _socketpair():
+  if hasattr(socket, 'socketpair'):
+    return socket.socketpair()
+
+  # Windows
+  listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+  try:
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(1)
+    writer = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    writer.connect(listener.getsockname())
+    (reader, address) = listener.accept()
+  finally:
+    listener.close()
+  return (reader, writer)
+
+class _Refused(Exception):
+  '''
+  A reused connection was closed or reset before any of the response arrived, i.e. the server
+  had already given up on it, so the request can safely go out again on another connection
+  '''
+
+class _Response(object):
+  '''
+  An HTTP/1.1 response, parsed piece by piece as it arrives
+  '''
+  def __init__(self, headOnly = False):
+    # The response to CONNECT has no body, whatever its headers say
+    self.headOnly = headOnly
+    self.state = 'head'
+    self.buffer = ''
+    self.started = False
+    self.version = None
+    self.status = None
+    self.reason = None
+    self.headers = None
+    self.body = []
+    # Bytes still to come of the body, or of the current chunk
+    self.remaining = 0
+    self.willClose = False
+
+  def _parseHead(self, head):
+    lines = head.split('\r\n')
+    (version, status, reason) = (lines[0].split(' ', 2) + [''])[:3]
+    try:
+      status = int(status)
+    except ValueError:
+      raise httplib.BadStatusLine(lines[0])
+
+    headers = {}
+    for line in lines[1:]:
+      (name, sep, value) = line.partition(':')
+      name = name.strip().lower()
+      value = value.strip()
+      if headers.has_key(name):
+        headers[name] += ', ' + value
+      else:
+        headers[name] = value
+
+    if 100 <= status < 200:
+      # e.g. 100 Continue; the real response follows
+      return
+
+    (self.version, self.status, self.reason, self.headers) = (version, status, reason.strip(), headers)
+    connection = headers.get('connection', '').lower()
+    self.willClose = 'close' in connection or (version == 'HTTP/1.0' and 'keep-alive' not in connection)
+
+    if self.headOnly or status in (204, 304):
+      self.state = 'done'
+    elif 'chunked' in headers.get('transfer-encoding', '').lower():
+      self.state = 'chunkSize'
+    elif headers.has_key('content-length'):
+      self.remaining = int(headers['content-length'])
+      self.state = self.remaining and 'body' or 'done'
+    else:
+      # The body runs until the server closes the connection
+      self.state = 'close'
+      self.willClose = True
+
+  def feed(self, data):
+    '''
+    Take the next data read from the connection, returning True once the response is complete
+    '''
+    self.started = True
+    self.buffer += data
+    while self.state != 'done':
+      if self.state == 'head':
+        end = self.buffer.find('\r\n\r\n')
+        if end < 0:
+          return False
+        head = self.buffer[:end]
+        self.buffer = self.buffer[end + 4:]
+        self._parseHead(head)
+      elif self.state in ('body', 'chunkData'):
+        if not self.buffer:
+          return False
+        data = self.buffer[:self.remaining]
+        self.buffer = self.buffer[len(data):]
+        self.body.append(data)
+        self.remaining -= len(data)
+        if self.remaining == 0:
+          self.state = self.state == 'body' and 'done' or 'chunkEnd'
+      elif self.state == 'chunkEnd':
+        if len(self.buffer) < 2:
+          return False
+        self.buffer = self.buffer[2:]
+        self.state = 'chunkSize'
+      elif self.state in ('chunkSize', 'trailer'):
+        end = self.buffer.find('\r\n')
+        if end < 0:
+          return False
+        line = self.buffer[:end]
+        self.buffer = self.buffer[end + 2:]
+        if self.state == 'trailer':
+          if not line:
+            self.state = 'done'
+        else:
+          try:
+            self.remaining = int(line.split(';')[0].strip(), 16)
+          except ValueError:
+            raise httplib.IncompleteRead(''.join(self.body))
+          self.state = self.remaining and 'chunkData' or 'trailer'
+      else:
+        # 'close'
+        self.body.append(self.buffer)
+        self.buffer = ''
+        return False
+    return True
+
+  def closed(self):
+    '''
+    The server closed the connection; return True if that completed the response
+    '''
+    if self.state == 'close':
+      self.state = 'done'
+      return True
+    return False
+
+  def result(self):
+    '''
+    Return (status, reason, headers, body), with the body decompressed
+    '''
+    headers = dict(self.headers)
+    body = ''.join(self.body)
+    decompressor = _decompressor(headers.pop('content-encoding', 'identity'))
+    if decompressor is not None:
+      body = decompressor.decompress(body) + decompressor.flush()
+    return (self.status, self.reason, headers, body)
+
+class _Request(object):
+  __slots__ = ('key', 'data', 'future')
+
+  def __init__(self, key, data, future):
+    self.key = key
+    self.data = data
+    self.future = future
+
+class _Connection(object):
+  '''
+  One non-blocking connection, driven by _EventLoop: connecting, through a proxy's tunnel and
+  an SSL handshake as need be, then sending requests and reading their responses one at a time
+  '''
+  def __init__(self, loop, key, request):
+    self.loop = loop
+    self.key = key
+    # What we're connecting for, sending or awaiting the response to
+    self.request = request
+    self.response = None
+    self.out = ''
+    self.sent = 0
+    self.reused = False
+    self.lastUsed = None
+    self.deadline = None
+    # 'read' or 'write', whichever an SSL handshake is waiting on
+    self.handshake = None
+
+    transport = loop.transport
+    (scheme, host, port) = key
+    proxy = transport.proxy.get(scheme)
+    self.tunnel = proxy is not None and scheme == 'https'
+    if proxy is None:
+      address = (host, port)
+    else:
+      # As httplib parses it
+      (proxyHost, sep, proxyPort) = proxy.rpartition(':')
+      if sep and proxyPort.isdigit():
+        address = (proxyHost, int(proxyPort))
+      elif scheme == 'https':
+        address = (proxy, httplib.HTTPS_PORT)
+      else:
+        address = (proxy, httplib.HTTP_PORT)
+
+    (family, socktype, proto, name, sockaddr) = socket.getaddrinfo(address[0], address[1], 0,
+                                                                   socket.SOCK_STREAM)[0]
+    self.sock = socket.socket(family, socktype, proto)
+    self.sock.setblocking(0)
+    error = self.sock.connect_ex(sockaddr)
+    if error and error not in _CONNECTING:
+      self.sock.close()
+      raise socket.error(error, os.strerror(error))
+    self.state = 'connecting'
+    self.touch()
+
+  def fileno(self):
+    return self.sock.fileno()
+
+  def touch(self):
+    '''
+    Restart the timeout, after progress
+    '''
+    timeout = self.loop.transport.timeout
+    if timeout is not None:
+      self.deadline = time.time() + timeout
+
+  def wantsRead(self):
+    if self.state == 'handshake':
+      return self.handshake == 'read'
+    # An idle connection becomes readable when the server closes it
+    return self.state in ('tunnel', 'busy', 'idle')
+
+  def wantsWrite(self):
+    if self.state == 'connecting':
+      return True
+    if self.state == 'handshake':
+      return self.handshake == 'write'
+    return self.sent < len(self.out)
+
+  def start(self, request):
+    self.request = request
+    self.out = request.data
+    self.sent = 0
+    self.response = _Response()
+    self.state = 'busy'
+    self.touch()
+
+  def _connected(self):
+    if self.tunnel:
+      (scheme, host, port) = self.key
+      lines = ['CONNECT %s:%d HTTP/1.0' % (host, port)]
+      for (name, value) in self.loop.transport._proxyHeaders().items():
+        lines.append('%s: %s' % (name, value))
+      self.out = '\r\n'.join(lines) + '\r\n\r\n'
+      self.sent = 0
+      self.response = _Response(headOnly = True)
+      self.state = 'tunnel'
+    elif self.key[0] == 'https':
+      self._startTls()
+    else:
+      self.loop._ready(self)
+
+  def _startTls(self):
+    if ssl is None:
+      raise socket.error('SSL is not available')
+
+    host = self.key[1]
+    if hasattr(ssl, '_create_default_https_context'):
+      # The certificate checks httplib makes
+      context = ssl._create_default_https_context()
+      self.sock = context.wrap_socket(self.sock, server_hostname = host,
+                                      do_handshake_on_connect = False)
+    else:
+      self.sock = ssl.wrap_socket(self.sock, do_handshake_on_connect = False)
+    self.state = 'handshake'
+    self._handshake()
+
+  def _handshake(self):
+    try:
+      self.sock.do_handshake()
+    except ssl.SSLError, e:
+      if e.args[0] == ssl.SSL_ERROR_WANT_READ:
+        self.handshake = 'read'
+        return
+      if e.args[0] == ssl.SSL_ERROR_WANT_WRITE:
+        self.handshake = 'write'
+        return
+      raise
+    self.handshake = None
+    self.touch()
+    self.loop._ready(self)
+
+  def onWritable(self):
+    if self.state == 'connecting':
+      error = self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+      if error:
+        raise socket.error(error, os.strerror(error))
+      self.touch()
+      self._connected()
+    elif self.state == 'handshake':
+      self._handshake()
+    elif self.sent < len(self.out):
+      try:
+        self.sent += self.sock.send(self.out[self.sent:self.sent + 65536])
+      except socket.error, e:
+        if _wouldBlock(e):
+          return
+        if (self.reused and not self.response.started and
+            e.args[0] in (errno.ECONNRESET, errno.EPIPE)):
+          raise _Refused()
+        raise
+      self.touch()
+
+  def onReadable(self):
+    if self.state == 'handshake':
+      self._handshake()
+      return
+    if self.state == 'idle':
+      # The server has closed it, or sent something we didn't ask for
+      self.loop._close(self)
+      return
+
+    chunks = []
+    closed = False
+    while True:
+      try:
+        data = self.sock.recv(65536)
+      except socket.error, e:
+        if _wouldBlock(e):
+          break
+        if (self.reused and self.state == 'busy' and not chunks and not self.response.started and
+            e.args[0] in (errno.ECONNRESET, errno.EPIPE)):
+          raise _Refused()
+        raise
+      if not data:
+        closed = True
+        break
+      chunks.append(data)
+      # SSL may hold decrypted data that select() can't see
+      if not (hasattr(self.sock, 'pending') and self.sock.pending()):
+        break
+
+    response = self.response
+    if chunks:
+      self.touch()
+      if response.feed(''.join(chunks)):
+        self._responded()
+        return
+    if closed:
+      if response.closed():
+        self._responded()
+      elif self.reused and self.state == 'busy' and not response.started:
+        raise _Refused()
+      elif response.started:
+        raise httplib.IncompleteRead(''.join(response.body))
+      else:
+        raise httplib.BadStatusLine('')
+
+  def _responded(self):
+    if self.state == 'tunnel':
+      response = self.response
+      self.response = None
+      if response.status != 200:
+        raise socket.error('Tunnel connection failed: %d %s' % (response.status, response.reason))
+      self._startTls()
+      return
+    self.loop._respond(self)
+
+  def close(self):
+    try:
+      self.sock.close()
+    except socket.error:
+      pass
+
+class _EventLoop(object):
+  '''
+  One thread select()ing over every connection of an AsyncHttpTransport
+
+  Requests wait in a queue until a connection to their host is free, or a new one can be
+  opened without going over maxConnections.  Everything but submit(), callLater() and stop()
+  runs on the loop's thread, so needs no locking.
+  '''
+  def __init__(self, transport):
+    self.transport = transport
+    self._lock = threading.Lock()
+    # Handed over from other threads under _lock
+    self._submitted = []
+    self._timers = []
+    self._closed = False
+    self._woken = False
+    self._sequence = itertools.count()
+
+    self._queue = deque()
+    self._connections = set()
+    # (scheme, host, port) => [connection, ...], the most recently used last
+    self._idle = {}
+
+    (self._wakeReader, self._wakeWriter) = _socketpair()
+    self._wakeReader.setblocking(0)
+    self._wakeWriter.setblocking(0)
+
+    self._thread = threading.Thread(target = self._run)
+    self._thread.setDaemon(True)
+    self._thread.start()
+
+  def _wake(self):
+    # Called with _lock held
+    if not self._woken:
+      self._woken = True
+      try:
+        self._wakeWriter.send('x')
+      except socket.error:
+        pass
+
+  def submit(self, key, data):
+    future = Future()
+    self._lock.acquire()
+    try:
+      if self._closed:
+        raise RuntimeError('AsyncHttpTransport has been closed')
+      self._submitted.append(_Request(key, data, future))
+      self._wake()
+    finally:
+      self._lock.release()
+    return future
+
+  def callLater(self, delay, fn, *args):
+    self._lock.acquire()
+    try:
+      if self._closed:
+        raise RuntimeError('AsyncHttpTransport has been closed')
+      heapq.heappush(self._timers, (time.time() + delay, self._sequence.next(), fn, args))
+      self._wake()
+    finally:
+      self._lock.release()
+
+  def stop(self):
+    '''
+    Stop the loop and wait for it to close its connections; requests not yet answered fail
+    '''
+    self._lock.acquire()
+    try:
+      self._closed = True
+      self._wake()
+    finally:
+      self._lock.release()
+    if threading.currentThread() is not self._thread:
+      self._thread.join()
+
+  def _run(self):
+    try:
+      while self._step():
+        pass
+    except:
+      log.exception('AsyncHttpTransport event loop failed')
+    self._shutdown()
+
+  def _step(self):
+    self._lock.acquire()
+    try:
+      if self._closed:
+        return False
+      self._queue.extend(self._submitted)
+      self._submitted = []
+      self._woken = False
+      nextTimer = self._timers and self._timers[0][0] or None
+    finally:
+      self._lock.release()
+
+    self._dispatch()
+
+    readers = [self._wakeReader]
+    writers = []
+    for conn in self._connections:
+      if conn.wantsRead():
+        readers.append(conn)
+      if conn.wantsWrite():
+        writers.append(conn)
+
+    timeout = self._nextTimeout(nextTimer)
+    try:
+      (readable, writable, failed) = select.select(readers, writers, [], timeout)
+    except select.error, e:
+      if e.args[0] == errno.EINTR:
+        return True
+      raise
+
+    for conn in writable:
+      if conn in self._connections:
+        self._drive(conn, conn.onWritable)
+    for conn in readable:
+      if conn is self._wakeReader:
+        self._drain()
+      elif conn in self._connections:
+        self._drive(conn, conn.onReadable)
+
+    now = time.time()
+    self._expire(now)
+    self._runTimers(now)
+    return True
+
+  def _drain(self):
+    try:
+      while self._wakeReader.recv(4096):
+        pass
+    except socket.error:
+      pass
+
+  def _nextTimeout(self, nextTimer):
+    times = []
+    if nextTimer is not None:
+      times.append(nextTimer)
+    for conn in self._connections:
+      if conn.state == 'idle':
+        times.append(conn.lastUsed + self.transport.idleTimeout)
+      elif conn.deadline is not None:
+        times.append(conn.deadline)
+    if not times:
+      return None
+    return max(0, min(times) - time.time())
+
+  def _drive(self, conn, fn):
+    try:
+      fn()
+    except:
+      self._failed(conn, sys.exc_info())
+
+  def _dispatch(self):
+    '''
+    Start queued requests on idle connections to their hosts, opening new ones up to
+    maxConnections
+    '''
+    while self._queue:
+      request = self._queue[0]
+      conn = self._checkout(request.key)
+      if conn is not None:
+        self._queue.popleft()
+        conn.start(request)
+        continue
+
+      if len(self._connections) >= self.transport.maxConnections and not self._closeIdle():
+        # Wait for a connection to come free
+        return
+      self._queue.popleft()
+      try:
+        conn = _Connection(self, request.key, request)
+      except:
+        request.future.setException(sys.exc_info())
+        continue
+      self._connections.add(conn)
+
+  def _checkout(self, key):
+    idle = self._idle.get(key)
+    if idle:
+      return idle.pop()
+    return None
+
+  def _closeIdle(self):
+    '''
+    Close the connection idle the longest, to make room for one to another host
+    '''
+    oldest = None
+    for idle in self._idle.values():
+      if idle and (oldest is None or idle[0].lastUsed < oldest.lastUsed):
+        oldest = idle[0]
+    if oldest is None:
+      return False
+    self._close(oldest)
+    return True
+
+  def _ready(self, conn):
+    '''
+    A new connection is ready for requests
+    '''
+    request = conn.request
+    if request is None:
+      self._idle.setdefault(conn.key, []).append(conn)
+      conn.state = 'idle'
+      conn.lastUsed = time.time()
+    else:
+      conn.start(request)
+
+  def _respond(self, conn):
+    request = conn.request
+    response = conn.response
+    conn.request = None
+    conn.response = None
+    conn.out = ''
+    conn.sent = 0
+
+    if response.willClose:
+      self._close(conn)
+    else:
+      conn.state = 'idle'
+      conn.reused = True
+      conn.lastUsed = time.time()
+      conn.deadline = None
+      self._idle.setdefault(conn.key, []).append(conn)
+
+    try:
+      result = response.result()
+    except:
+      request.future.setException(sys.exc_info())
+      return
+    request.future.setResult(result)
+
+  def _failed(self, conn, excInfo):
+    request = conn.request
+    self._close(conn)
+    if request is None:
+      return
+    if isinstance(excInfo[1], _Refused):
+      self._queue.appendleft(request)
+    else:
+      request.future.setException(excInfo)
+
+  def _close(self, conn):
+    self._connections.discard(conn)
+    idle = self._idle.get(conn.key)
+    if idle and conn in idle:
+      idle.remove(conn)
+    conn.close()
+
+  def _expire(self, now):
+    for conn in list(self._connections):
+      if conn.state == 'idle':
+        if now - conn.lastUsed >= self.transport.idleTimeout:
+          self._close(conn)
+      elif conn.deadline is not None and now >= conn.deadline:
+        try:
+          raise socket.timeout('timed out')
+        except socket.timeout:
+          self._failed(conn, sys.exc_info())
+
+  def _runTimers(self, now):
+    due = []
+    self._lock.acquire()
+    try:
+      while self._timers and self._timers[0][0] <= now:
+        due.append(heapq.heappop(self._timers))
+    finally:
+      self._lock.release()
+
+    for (when, sequence, fn, args) in due:
+      try:
+        fn(*args)
+      except Exception:
+        log.exception('AsyncHttpTransport timer %r failed', fn)
+
+  def _shutdown(self):
+    self._lock.acquire()
+    try:
+      self._closed = True
+      self._queue.extend(self._submitted)
+      self._submitted = []
+      self._timers = []
+    finally:
+      self._lock.release()
+
+    requests = list(self._queue)
+    self._queue.clear()
+    for conn in list(self._connections):
+      if conn.request is not None:
+        requests.append(conn.request)
+      self._close(conn)
+    self._wakeReader.close()
+    self._wakeWriter.close()
+
+    for request in requests:
+      try:
+        raise RuntimeError('AsyncHttpTransport has been closed')
+      except RuntimeError:
+        request.future.setException(sys.exc_info())
+
+class AsyncHttpTransport(HttpTransport):
+  '''
+  An HttpTransport that can also send a SOAP request without waiting for its response
+
+  submit() queues the request and returns straight away with a sforce.worker.Future for the
+  response.  One thread select()s over every connection, keeping at most maxConnections of
+  them open (to any hosts) and reusing them as HttpTransport does, so any number of requests
+  can be outstanding at once without a thread each; those beyond what the connections can
+  carry wait their turn.  The futures finish, and their callbacks run, on that thread, so
+  callbacks must hand anything slow on to another thread.
+
+  suds' blocking send() and open() work as HttpTransport's, over connections of their own.
+  '''
+  def __init__(self, maxConnections = 16, **kwargs):
+    '''
+    'maxConnections' : Most connections submit() may have open at once.  They're select()ed
+                       over, so this must stay well below the process' FD_SETSIZE (usually
+                       1024).
+
+    Any other arguments are HttpTransport's
+    '''
+    HttpTransport.__init__(self, **kwargs)
+    self.maxConnections = maxConnections
+    self._loop = None
+
+  def __getstate__(self):
+    state = HttpTransport.__getstate__(self)
+    state['_loop'] = None
+    return state
+
+  def _eventLoop(self):
+    self._lock.acquire()
+    try:
+      if self._loop is None:
+        self._loop = _EventLoop(self)
+      return self._loop
+    finally:
+      self._lock.release()
+
+  def submit(self, request):
+    '''
+    Send a SOAP request, returning a Future for its (status, reason, headers, body), with the
+    body decompressed, as _request() returns them
+    '''
+    (message, headers) = self._prepare(request)
+    headers['Connection'] = 'keep-alive'
+    if isinstance(message, unicode):
+      message = message.encode('utf-8')
+
+    url = str(request.url)
+    key = self._key(url)
+    (path, headers) = self._path(key, url, headers)
+    (scheme, host, port) = key
+    if port == {'http': httplib.HTTP_PORT, 'https': httplib.HTTPS_PORT}.get(scheme):
+      headers['Host'] = host
+    else:
+      headers['Host'] = '%s:%d' % (host, port)
+    headers['Content-Length'] = str(len(message))
+
+    lines = ['POST %s HTTP/1.1' % path]
+    for (name, value) in headers.items():
+      lines.append('%s: %s' % (name, value))
+    head = str('\r\n'.join(lines) + '\r\n\r\n')
+    return self._eventLoop().submit(key, head + message)
+
+  def callLater(self, delay, fn, *args):
+    '''
+    Call fn(*args) on the transport's thread after delay seconds
+    '''
+    self._eventLoop().callLater(delay, fn, *args)
+
+  def close(self):
+    '''
+    Close all connections; requests not yet answered fail
+    '''
+    HttpTransport.close(self)
+    self._lock.acquire()
+    try:
+      (loop, self._loop) = (self._loop, None)
+    finally:
+      self._lock.release()
+    if loop is not None:
+      loop.stop()
@@ -14,9 +14,13 @@
 # Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
 # Written by: David Lanstein ( lanstein yahoo com )
 
+import copy
 import string
 import sys
 import os.path
+import threading
+
+from timeit import default_timer
 
 from suds.client import Client
 
@@ -28,7 +32,110 @@ except:
   from suds.cache import FileCache
 
 import suds.sudsobject
+from suds.bindings.multiref import MultiRef
+from suds.properties import Unskin
 from suds.sax.element import Element
+from suds.transport import Request
+from suds.transport.https import HttpAuthenticated
+
+from cache import SchemaCache
+from export import exportQuery
+from instrument import CallInfo, MeasuringTransport, begin, end
+from marshall import SObjectMarshaller
+from partition import partitionedQuery
+from record import Record
+from retry import faultCode
+from stream import openStream
+from transport import HttpTransport
+from worker import WorkerPool, spawn
+
+# The SOAP headers each call accepts, and the attribute of SforceBaseClient that holds each
+# header.  The session header is sent with every call.
+_HEADERS = (
+  ('AllowFieldTruncationHeader', '_allowFieldTruncationHeader',
+   ('convertLead', 'create', 'merge', 'process', 'undelete', 'update', 'upsert')),
+  ('AssignmentRuleHeader', '_assignmentRuleHeader',
+   ('create', 'merge', 'update', 'upsert')),
+  # CallOptions will only ever be set by the SforcePartnerClient
+  ('CallOptions', '_callOptions',
+   ('create', 'merge', 'queryAll', 'query', 'queryMore', 'retrieve', 'search', 'update',
+    'upsert', 'convertLead', 'login', 'delete', 'describeGlobal', 'describeLayout',
+    'describeTabs', 'describeSObject', 'describeSObjects', 'getDeleted', 'getUpdated',
+    'process', 'undelete', 'getServerTimestamp', 'getUserInfo', 'setPassword',
+    'resetPassword')),
+  ('EmailHeader', '_emailHeader',
+   ('create', 'delete', 'resetPassword', 'update', 'upsert')),
+  ('LocaleOptions', '_localeOptions',
+   ('describeSObject', 'describeSObjects')),
+  ('LoginScopeHeader', '_loginScopeHeader',
+   ('login', )),
+  ('MruHeader', '_mruHeader',
+   ('create', 'merge', 'query', 'retrieve', 'update', 'upsert')),
+  ('PackageVersionHeader', '_packageVersionHeader',
+   ('convertLead', 'create', 'delete', 'describeGlobal', 'describeLayout', 'describeSObject',
+    'describeSObjects', 'describeTabs', 'merge', 'process', 'query', 'retrieve', 'search',
+    'undelete', 'update', 'upsert')),
+  ('QueryOptions', '_queryOptions',
+   ('query', 'queryAll', 'queryMore', 'retrieve')),
+  ('UserTerritoryDeleteHeader', '_userTerritoryDeleteHeader',
+   ('delete', )),
+)
+
+# call => ((header name, attribute), ...)
+_CALL_HEADERS = {}
+for (name, attribute, calls) in _HEADERS:
+  for call in calls:
+    _CALL_HEADERS.setdefault(call, []).append((name, attribute))
+for call in _CALL_HEADERS:
+  _CALL_HEADERS[call] = tuple(_CALL_HEADERS[call])
+del name, attribute, calls, call
+
+class _CallOptions(object):
+  '''
+  Stands in for the options of a parsed WSDL, which suds 0.3.9 builds every message from
+  (SOAP headers included), even for a clone with options of its own.  Reads go to the
+  options of the client making a call on the current thread, set by _setHeaders(), so
+  clients sharing the WSDL don't send each other's headers.
+  '''
+  def __init__(self, options):
+    self.__dict__['_default'] = options
+    self.__dict__['_local'] = threading.local()
+
+  def use(self, options):
+    self._local.options = options
+
+  def _options(self):
+    options = getattr(self._local, 'options', None)
+    if options is None:
+      return self._default
+    return options
+
+  def __getattr__(self, name):
+    return getattr(self._options(), name)
+
+  def __setattr__(self, name, value):
+    setattr(self._options(), name, value)
+
+class _CallMultiRef(object):
+  '''
+  Stands in for the MultiRef of a parsed WSDL's bindings, which suds 0.3.9 resolves every
+  reply with, collecting the reply's nodes on itself along the way.  Clients sharing the WSDL
+  would take each other's replies, so use a new one for every reply.
+  '''
+  def process(self, body):
+    return MultiRef().process(body)
+
+def _isolateCalls(wsdl, options):
+  '''
+  Make a parsed WSDL safe for clients on different threads to call through at once; options
+  are those of the client that parsed it
+  '''
+  wsdl.options = _CallOptions(options)
+  for service in wsdl.services:
+    for port in service.ports:
+      for method in port.methods.values():
+        method.binding.input.multiref = _CallMultiRef()
+        method.binding.output.multiref = _CallMultiRef()
 
 class SforceBaseClient(object):
   _sforce = None
@@ -38,6 +145,12 @@ class SforceBaseClient(object):
   _version = (0, 1, 3)
   _objectNamespace = None
   _strictResultTyping = False
+  # The most records the API accepts in a single create(), update(), delete(), etc.
+  _maxBatchSize = 200
+  _concurrency = 1
+  _describeCache = None
+  # Shared by every client; it only caches tag layouts
+  _marshaller = SObjectMarshaller()
 
   _allowFieldTruncationHeader = None
   _assignmentRuleHeader = None
@@ -52,6 +165,36 @@ class SforceBaseClient(object):
   _sessionHeader = None
   _userTerritoryDeleteHeader = None
 
+  # See _setHeaders()
+  _headerSets = None
+  _appliedHeaders = None
+
+  # See addListener()
+  _listeners = ()
+
+  # See setRetryPolicy()
+  _retryPolicy = None
+  _sessionLock = None
+  # The latest session and the credentials it came from, shared with clones so that only one
+  # of them need log in again when the session expires, and the rest take up its new session
+  _sharedSession = None
+  # The session last taken up by this client; see _syncSession()
+  _sessionSeen = None
+
+  # See setSessionStore()
+  _sessionStore = None
+  # Where login() goes, as opposed to where the session's calls go
+  _loginLocation = None
+  # Set on clones from _rawClone()
+  _rawResults = False
+  # Set on clones from _streamClone()
+  _streamResults = False
+
+  # What set*() methods other than the header ones (and addListener()) change, which a clone
+  # must share with us to be handed out as a copy of us; see _isCurrentClone()
+  _settings = ('_strictResultTyping', '_concurrency', '_describeCache', '_listeners',
+               '_retryPolicy', '_sessionStore')
+
   def __init__(self, wsdl, cacheDuration = 0, **kwargs):
     '''
     Connect to Salesforce
@@ -62,7 +205,25 @@ class SforceBaseClient(object):
               e.g. {'http': 'my.insecure.proxy.example.com:80'}
     'username' : Username for HTTP auth when using a proxy ONLY
     'password' : Password for HTTP auth when using a proxy ONLY
+    'schemaCache' : Directory in which to keep the parsed WSDL between runs, or None for the
+                    system temp directory.  Entries are keyed on the WSDL's contents, so an
+                    updated WSDL is reparsed automatically
+    'keepAlive' : Reuse HTTP connections between calls, rather than opening a new connection
+                  (and SSL handshake) for every call
+    'poolSize' : With keepAlive, the number of idle connections to keep per server (default 4)
+    'idleTimeout' : With keepAlive, seconds after which an idle connection is discarded
+                    (default 60)
+    'compression' : Ask Salesforce to gzip its responses; SOAP XML compresses very well
+    'compressRequests' : Gzip the SOAP requests we send, too
+    'transport' : A suds Transport to use instead of the default
+    'location' : URL to log in at instead of the one in the WSDL, e.g. a sandbox's
+                 https://test.salesforce.com/services/Soap/u/20.0, or a local stand-in
+                 server (see sforce.testserver)
     '''
+    self._headerSets = {}
+    self._sessionLock = threading.Lock()
+    self._sharedSession = {}
+
     # Suds can only accept WSDL locations with a protocol prepended
     if '://' not in wsdl:
       # TODO windows users???
@@ -76,23 +237,54 @@ class SforceBaseClient(object):
       cache.setduration(seconds = cacheDuration)
     else:
       cache = None
-    
-    self._sforce = Client(wsdl, cache = cache)
+
+    # Also used for streaming results when 'transport' isn't an HttpTransport (see sforce.stream)
+    self._httpOptions = {'idleTimeout': kwargs.get('idleTimeout', 60),
+                         'proxy': kwargs.get('proxy'),
+                         'username': kwargs.get('username'),
+                         'password': kwargs.get('password'),
+                         'compress': kwargs.get('compression', False),
+                         'compressRequests': kwargs.get('compressRequests', False)}
+
+    transport = None
+    if kwargs.has_key('transport'):
+      transport = kwargs['transport']
+    elif kwargs.get('keepAlive') or kwargs.get('compression') or kwargs.get('compressRequests'):
+      if kwargs.get('keepAlive'):
+        poolSize = kwargs.get('poolSize', 4)
+      else:
+        poolSize = 0
+      transport = HttpTransport(poolSize = poolSize, **self._httpOptions)
+
+    if kwargs.has_key('proxy'):
+      # urllib2 cannot handle HTTPS proxies yet (see bottom of README); HttpTransport tunnels
+      if kwargs['proxy'].has_key('https') and not isinstance(transport, HttpTransport):
+        raise NotImplementedError('Connecting to a proxy over HTTPS not yet implemented due to a \
+limitation in the underlying urllib2 proxy implementation.  However, traffic from a proxy to \
+Salesforce will use HTTPS.')
+
+    if transport is None:
+      # suds' default, made here so the WSDL is read through the proxy too
+      if kwargs.has_key('proxy'):
+        transport = HttpAuthenticated(proxy = kwargs['proxy'])
+      else:
+        transport = HttpAuthenticated()
+
+    if kwargs.has_key('schemaCache'):
+      cache = SchemaCache(kwargs['schemaCache'], wsdl, documentCache = cache, transport = transport)
+
+    self._sforce = Client(wsdl, cache = cache, transport = transport)
+    _isolateCalls(self._sforce.wsdl, self._sforce.options)
 
     # Set HTTP headers
     headers = {'User-Agent': 'Salesforce/' + self._product + '/' + '.'.join(str(x) for x in self._version)}
 
-    # This HTTP header will not work until Suds gunzips/inflates the content
-    # 'Accept-Encoding': 'gzip, deflate'
+    # Suds doesn't gunzip/inflate responses, so 'Accept-Encoding: gzip, deflate' is only sent
+    # by HttpTransport, which does (see 'compression')
 
     self._sforce.set_options(headers = headers)
 
     if kwargs.has_key('proxy'):
-      # urllib2 cannot handle HTTPS proxies yet (see bottom of README)
-      if kwargs['proxy'].has_key('https'):
-        raise NotImplementedError('Connecting to a proxy over HTTPS not yet implemented due to a \
-limitation in the underlying urllib2 proxy implementation.  However, traffic from a proxy to \
-Salesforce will use HTTPS.')
       self._sforce.set_options(proxy = kwargs['proxy'])
 
     if kwargs.has_key('username'):
@@ -101,6 +293,10 @@ Salesforce will use HTTPS.')
     if kwargs.has_key('password'):
       self._sforce.set_options(password = kwargs['password'])
 
+    if kwargs.get('location'):
+      self._loginLocation = kwargs['location']
+      self._setEndpoint(kwargs['location'])
+
   # Toolkit-specific methods
 
   def generateHeader(self, sObjectType):
@@ -121,6 +317,461 @@ Salesforce will use HTTPS.')
     obj.type = sObjectType
     return obj
 
+  def _batches(self, items):
+    '''
+    Split a single item, or a list, tuple or any other iterable of them, into lists no longer
+    than the API allows in a single call
+    '''
+    if isinstance(items, (basestring, dict, suds.sudsobject.Object, Element, Record)):
+      items = (items, )
+
+    batch = []
+    for item in items:
+      batch.append(item)
+      if len(batch) == self._maxBatchSize:
+        yield batch
+        batch = []
+    if batch:
+      yield batch
+
+  def _batchCall(self, call, items, *args):
+    '''
+    Make the call once per API-sized batch of items, and return all of the results, in input
+    order, in a single list.  Batches are sent concurrently when setConcurrency() > 1.
+
+    args are passed ahead of the batch, e.g. upsert()'s externalIdFieldName
+    '''
+    def send(client, batch):
+      result = client._invoke(call, *args, **{'batch': batch})
+      if not isinstance(result, list):
+        result = [result]
+      if client._retryPolicy is not None:
+        result = client._resubmitFailed(call, args, batch, result)
+      return result
+
+    results = []
+    for result in self._mapBatches(send, items):
+      results.extend(result)
+
+    return self._handleResultTyping(results)
+
+  def _resubmitFailed(self, call, args, batch, results):
+    '''
+    Send again, with backoff, just the records of batch whose results show a transient failure
+    (e.g. UNABLE_TO_LOCK_ROW), and return the results with theirs replaced
+    '''
+    policy = self._retryPolicy
+    results = list(results)
+    for attempt in range(policy.maxRetries):
+      failed = [i for (i, result) in enumerate(results) if policy.shouldResubmit(result)]
+      if not failed:
+        break
+
+      policy.wait(attempt)
+      retried = self._invoke(call, *args, **{'batch': [batch[i] for i in failed]})
+      if not isinstance(retried, list):
+        retried = [retried]
+      for (i, result) in zip(failed, retried):
+        results[i] = result
+    return results
+
+  def _relogin(self, staleSessionId):
+    '''
+    Replace a session that has expired, returning False if we can't
+
+    If a clone sharing our session has already logged in again, we take its new session;
+    otherwise we log in with the credentials last passed to login().
+    '''
+    self._sessionLock.acquire()
+    try:
+      session = self._sharedSession
+      if session.get('sessionId') not in (None, staleSessionId):
+        self._useSession(session['sessionId'], session['serverUrl'])
+        return True
+      if not session.has_key('credentials'):
+        return False
+      self.login(*session['credentials'])
+      return True
+    finally:
+      self._sessionLock.release()
+
+  def _syncSession(self):
+    '''
+    Take up the session that a clone, or the client we were cloned from, logged in with
+    since we last looked, e.g. after the session expired
+    '''
+    session = self._sharedSession
+    if session.get('sessionId') in (None, self._sessionSeen):
+      return
+
+    self._sessionLock.acquire()
+    try:
+      if session['sessionId'] != self._sessionSeen:
+        self._useSession(session['sessionId'], session['serverUrl'])
+    finally:
+      self._sessionLock.release()
+
+  def _useSession(self, sessionId, serverUrl):
+    header = self.generateHeader('SessionHeader')
+    header.sessionId = sessionId
+    self.setSessionHeader(header)
+    self._sessionId = sessionId
+    self._sessionSeen = sessionId
+
+    # change URL to point from test.salesforce.com to something like cs2-api.salesforce.com
+    self._setEndpoint(serverUrl)
+
+  def setSessionStore(self, store):
+    '''
+    Have login() reuse a session saved by another process, where one is still valid, and
+    save the sessions it starts; store is a sforce.cache.SessionStore, or None
+    '''
+    self._sessionStore = store
+
+  def _restoreSession(self, key):
+    '''
+    Take up the stored session for key, returning a LoginResult, or None if there isn't one
+    or it has expired
+    '''
+    saved = self._sessionStore.get(key)
+    # When we're logging in again because our session expired, the stored one is that session
+    if saved is None or saved[0] == self._sessionId:
+      return None
+
+    (sessionId, serverUrl) = saved
+    previous = (self._sessionHeader, self._sessionId, self._sessionSeen, self._location)
+    self._useSession(sessionId, serverUrl)
+    try:
+      # About the cheapest call there is, and it fills in the LoginResult.  Not retried: an
+      # expired session is the answer we're checking for, not a failure
+      userInfo = self._send('getUserInfo', (), None)
+    except:
+      excInfo = sys.exc_info()
+
+      # Go back to the session and endpoint we had, to log in where we would have, or so a
+      # failed check leaves the client as it was
+      (sessionHeader, self._sessionId, self._sessionSeen, previousLocation) = previous
+      self.setSessionHeader(sessionHeader)
+      if previousLocation is not None:
+        self._setEndpoint(previousLocation)
+      else:
+        self._sforce.set_options(location = None)
+        self._location = None
+
+      if faultCode(excInfo[1]) != 'INVALID_SESSION_ID':
+        raise excInfo[0], excInfo[1], excInfo[2]
+      self._sessionStore.invalidate(key)
+      return None
+
+    result = self._sforce.factory.create('LoginResult')
+    result.sessionId = sessionId
+    result.serverUrl = serverUrl
+    result.userId = userInfo.userId
+    result.userInfo = userInfo
+    result.passwordExpired = False
+    return result
+
+  def setRetryPolicy(self, policy):
+    '''
+    Retry calls that fail transiently, and log in again when the session expires, as policy
+    (a sforce.retry.RetryPolicy) says; None, the default, lets every failure through
+    '''
+    self._retryPolicy = policy
+
+  def _mapBatches(self, fn, items):
+    '''
+    Yield fn(client, batch) for each API-sized batch of items, in order.  With
+    setConcurrency() > 1 the batches run on a pool of threads, each with its own client;
+    otherwise client is this one.
+    '''
+    if self._concurrency <= 1:
+      for batch in self._batches(items):
+        yield fn(self, batch)
+      return
+
+    pool = WorkerPool(self._concurrency, self._clone)
+    try:
+      for result in pool.map(fn, self._batches(items)):
+        yield result
+    finally:
+      pool.shutdown()
+
+  def _clone(self):
+    '''
+    Return a copy of this client for use on another thread
+
+    The copy shares the parsed WSDL, session and SOAP headers, but has its own suds options,
+    so its calls don't race with ours over the headers and endpoint set on the connection
+    '''
+    clone = copy.copy(self)
+    clone._sforce = self._sforce.clone()
+    return clone
+
+  def _rawClone(self):
+    '''
+    Return a copy of this client (see _clone()) whose calls return the raw SOAP response
+    rather than unmarshalling it, for sforce.export
+    '''
+    clone = self._clone()
+    clone._sforce.set_options(retxml = True)
+    clone._rawResults = True
+    return clone
+
+  def _streamClone(self):
+    '''
+    Return a copy of this client (see _clone()) whose query(), queryAll(), queryMore(),
+    retrieve() and search() calls return a sforce.stream.ResultStream, which parses the
+    response as it arrives
+    '''
+    clone = self._clone()
+    clone._streamResults = True
+    return clone
+
+  def _isCurrentClone(self, clone):
+    '''
+    Whether clone still has our session, endpoint, SOAP headers and settings, i.e. neither of
+    us has logged in, called a set*Header() or other set*() method, or added a listener since
+    it was made.  We first take up any session a clone has logged in again with, so a clone
+    that did so is replaced too.
+    '''
+    self._syncSession()
+    if (clone._headerSets is not self._headerSets or
+        clone._sessionId != self._sessionId or
+        clone._location != self._location):
+      return False
+    for name in self._settings:
+      if getattr(clone, name) != getattr(self, name):
+        return False
+    return True
+
+  def _prepareBatch(self, call, batch):
+    '''
+    Convert a batch of items into what the SOAP call expects; see SforceEnterpriseClient
+    '''
+    return batch
+
+  def _normalizeResult(self, call, result):
+    '''
+    Tidy up a call's unmarshalled result; see SforcePartnerClient and SforceEnterpriseClient
+    '''
+    return result
+
+  def _soapRequest(self, call, args):
+    '''
+    Build the suds Request for a call, as suds would send it with the SOAP headers last set
+    by _setHeaders(), for sending ourselves; see sforce.stream and sforce.asyncclient
+    '''
+    sforce = self._sforce
+    method = getattr(sforce.service, call).method
+    message = method.binding.input.get_message(method, args, {})
+
+    request = Request(Unskin(sforce.options).get('location', method.location), str(message))
+    request.headers = {'Content-Type': 'text/xml', 'SOAPAction': method.soap.action}
+    request.headers.update(sforce.options.headers)
+    return request
+
+  def _soapReply(self, call, status, reason, body):
+    '''
+    Unmarshall the response to a Request from _soapRequest() as suds would: raising the
+    WebFault for a fault, or Exception((status, reason)) for any other error status
+    '''
+    method = getattr(self._sforce.service, call).method
+    binding = method.binding.input
+    if status in (202, 204):
+      return None
+    if status == 200:
+      if not body:
+        return None
+      return binding.get_reply(method, body)[1]
+    if status == 500 and body:
+      # Raises the WebFault
+      binding.get_fault(body)
+    raise Exception((status, reason))
+
+  def _invoke(self, call, *args, **kwargs):
+    '''
+    Set the call's SOAP headers and make it, reporting it to any listeners (see addListener)
+    and retrying it as the retry policy allows (see setRetryPolicy)
+
+    'batch' : Items to convert with _prepareBatch() and send as the last argument
+    '''
+    batch = kwargs.get('batch')
+    if call != 'login':
+      # login() may be logging in again for _relogin(), which holds the session lock
+      self._syncSession()
+
+    policy = self._retryPolicy
+    if policy is None:
+      return self._send(call, args, batch)
+
+    attempt = 0
+    while True:
+      sessionId = self._sessionId
+      try:
+        return self._send(call, args, batch)
+      except Exception, e:
+        if attempt >= policy.maxRetries:
+          raise
+        if policy.shouldRelogin(call, e):
+          if not self._relogin(sessionId):
+            raise
+        elif policy.shouldRetry(call, e):
+          policy.wait(attempt)
+        else:
+          raise
+      attempt += 1
+
+  def _send(self, call, args, batch):
+    self._setHeaders(call)
+    if self._streamResults:
+      if self._listeners:
+        return self._measureStream(call, args)
+      return openStream(self, call, args)
+    if self._listeners:
+      return self._measure(call, args, batch)
+
+    if batch is not None:
+      args += (self._prepareBatch(call, batch), )
+    result = getattr(self._sforce.service, call)(*args)
+    if self._rawResults:
+      return result
+    return self._normalizeResult(call, result)
+
+  def _measure(self, call, args, batch):
+    '''
+    _send(), timing each phase of the call for the listeners
+    '''
+    info = CallInfo(call)
+
+    # The network phase is timed by the transport, which we only wrap once there's a listener
+    transport = self._sforce.options.transport
+    if not isinstance(transport, MeasuringTransport):
+      self._sforce.set_options(transport = MeasuringTransport(transport))
+
+    begin(info)
+    try:
+      try:
+        if batch is not None:
+          info.requestRecords = len(batch)
+          args += (self._prepareBatch(call, batch), )
+        result = getattr(self._sforce.service, call)(*args)
+        info.unmarshalled = default_timer()
+        if not self._rawResults:
+          result = self._normalizeResult(call, result)
+          info.responseRecords = self._countRecords(result)
+      except:
+        excInfo = sys.exc_info()
+        info.error = excInfo[1]
+        info.finished = default_timer()
+        self._notifyListeners(info)
+        raise excInfo[0], excInfo[1], excInfo[2]
+    finally:
+      end()
+
+    info.finished = default_timer()
+    self._notifyListeners(info)
+    return result
+
+  def _measureStream(self, call, args):
+    '''
+    openStream(), reporting the call to the listeners once its ResultStream is closed
+
+    The response is read and parsed as records are taken from the stream, so network covers
+    the call up to the response's headers, and unmarshal the rest of reading it, including
+    whatever the caller does with each record in between.
+    '''
+    info = CallInfo(call)
+
+    def finished(stream):
+      info.responseBytes = stream.bytesRead
+      info.responseRecords = stream.records
+      info.error = stream.error
+      info.unmarshalled = info.finished = default_timer()
+      self._notifyListeners(info)
+
+    try:
+      return openStream(self, call, args, info, finished)
+    except:
+      excInfo = sys.exc_info()
+      info.error = excInfo[1]
+      info.finished = default_timer()
+      self._notifyListeners(info)
+      raise excInfo[0], excInfo[1], excInfo[2]
+
+  def _notifyListeners(self, info):
+    for listener in self._listeners:
+      listener.callFinished(info)
+
+  def _countRecords(self, result):
+    '''
+    How many records (or per-record results) a call returned
+    '''
+    if isinstance(result, list):
+      return len(result)
+    if isinstance(result, suds.sudsobject.Object):
+      for attribute in ('records', 'searchRecords'):
+        records = getattr(result, attribute, None)
+        if isinstance(records, list):
+          return len(records)
+        if records is not None:
+          return 1
+      if hasattr(result, 'queryLocator'):
+        # A QueryResult with no records
+        return 0
+    if result is None or result == '':
+      return 0
+    return 1
+
+  def addListener(self, listener):
+    '''
+    Report every API call this client makes to listener, a CallListener (see
+    sforce.instrument), with its timing split into marshalling, network, unmarshalling and
+    normalizing, request and response sizes, record counts, and any error
+
+    Listeners are shared with the clients made for setConcurrency() and queryIter(), and
+    with clones made after they're added.  With no listeners, calls aren't measured at all.
+    Calls made by queryStream(), etc. are reported as each response's stream is closed.
+    '''
+    self._listeners = tuple(self._listeners) + (listener, )
+
+  def removeListener(self, listener):
+    self._listeners = tuple([l for l in self._listeners if l is not listener])
+
+  def _describeKey(self, call, *args):
+    '''
+    Describe results differ between orgs (our endpoint includes the org Id), between Partner
+    and Enterprise, and, for labels, by LocaleOptions
+    '''
+    language = None
+    if call in ('describeSObject', 'describeSObjects') and self._localeOptions is not None:
+      language = getattr(self._localeOptions, 'language', None)
+
+    key = [self.__class__.__name__, self._location, language, call]
+    for arg in args:
+      if isinstance(arg, basestring):
+        # sObject names aren't case-sensitive
+        arg = arg.lower()
+      elif isinstance(arg, list):
+        arg = tuple(arg)
+      key.append(arg)
+    return tuple(key)
+
+  def _cachedDescribe(self, call, *args):
+    '''
+    Make a describe call, or return its result from the describe cache (see setDescribeCache)
+    '''
+    if self._describeCache is not None:
+      key = self._describeKey(call, *args)
+      result = self._describeCache.get(key)
+      if result is not None:
+        return result
+
+    result = self._invoke(call, *args)
+
+    if self._describeCache is not None:
+      self._describeCache.put(key, result)
+    return result
+
   def _handleResultTyping(self, result):
     '''
     If any of the following calls return a single result, and self._strictResultTyping is true,
@@ -149,48 +800,22 @@ Salesforce will use HTTPS.')
     '''
     Marshall generic sObjects into a list of SAX elements
   
-    This code is going away ASAP
-
     tag param is for nested objects (e.g. MergeRequest) where 
     key: object must be in <key/>, not <sObjects/>
-    '''
-    if not isinstance(sObjects, (tuple, list)):
-      sObjects = (sObjects, )
-    if sObjects[0].type in ['LeadConvert', 'SingleEmailMessage', 'MassEmailMessage']:
-      nsPrefix = 'tns:'
-    else:
-      nsPrefix = 'ens:'
-
-    li = []
-    for obj in sObjects:
-      el = Element(tag)
-      el.set('xsi:type', nsPrefix + obj.type)
-      for k, v in obj:
-        if k == 'type':
-          continue
-
-        # This is here to avoid 'duplicate values' error when setting a field in fieldsToNull
-        # Even a tag like <FieldName/> will trigger it
-        if v == None: 
-          # not going to win any awards for variable-naming scheme here
-          tmp = Element(k)
-          tmp.set('xsi:nil', 'true')
-          el.append(tmp)
-        elif isinstance(v, (list, tuple)):
-          for value in v:
-            el.append(Element(k).setText(value))
-        elif isinstance(v, suds.sudsobject.Object):
-          el.append(self._marshallSObjects(v, k))
-        else:
-          el.append(Element(k).setText(v))
 
-      li.append(el)
-    return li
+    See SObjectMarshaller, which writes each sObject's fields as XML text directly rather
+    than as a tree of elements
+    '''
+    return self._marshaller.marshall(sObjects, tag)
  
   def _setEndpoint(self, location):
     '''
     Set the endpoint after when Salesforce returns the URL after successful login()
     '''
+    # Suds hands back the URL as unicode, which httplib on Python 2.7 joins with the encoded
+    # request body, failing on any non-ASCII character in it
+    location = str(location)
+
     # suds 0.3.7+ supports multiple wsdl services, but breaks setlocation :(
     # see https://fedorahosted.org/suds/ticket/261
     try:
@@ -203,113 +828,67 @@ Salesforce will use HTTPS.')
   def _setHeaders(self, call = None):
     '''
     Attach particular SOAP headers to the request depending on the method call made
+
+    The set of headers for each call is built once, from _CALL_HEADERS, and reused until one
+    of the set*Header() methods changes a header.  suds only takes SOAP headers as a client
+    option, so we only touch its options when the set differs from the one last sent.
+    '''
+    self._sforce.wsdl.options.use(self._sforce.options)
+
+    headers = self._headerSets.get(call)
+    if headers is None:
+      # All calls, including utility calls, set the session header
+      headers = {'SessionHeader': self._sessionHeader}
+      for (name, attribute) in _CALL_HEADERS.get(call, ()):
+        header = getattr(self, attribute)
+        if header is not None:
+          headers[name] = header
+      self._headerSets[call] = headers
+
+    if headers is not self._appliedHeaders:
+      self._sforce.set_options(soapheaders = headers)
+      self._appliedHeaders = headers
+
+  def _headersChanged(self):
+    '''
+    Discard the prebuilt header sets after a set*Header() call
+    '''
+    self._headerSets = {}
+
+  def setConcurrency(self, workers):
+    '''
+    Set how many batches create(), update(), upsert(), delete(), undelete(),
+    emptyRecycleBin() and (Enterprise) retrieve() may send at once when given more records
+    than fit in a single call.
+    Each worker uses its own connection.  Defaults to 1, i.e. one batch at a time.  Also
+    limits the batches an AsyncSforceClient wrapping this client has in flight.
+    '''
+    self._concurrency = max(1, int(workers))
+
+  def setDescribeCache(self, cache):
+    '''
+    Cache the results of describeGlobal(), describeLayout(), describeSObject(),
+    describeSObjects() and describeTabs(), which rarely change but are slow and count against
+    API limits.  'cache' is a DescribeCache, which can be shared between clients, or None to
+    stop caching.
     '''
-    # All calls, including utility calls, set the session header
-    headers = {'SessionHeader': self._sessionHeader}
-    
-    if call in ('convertLead',
-                'create',
-                'merge',
-                'process',
-                'undelete',
-                'update',
-                'upsert'):
-      if self._allowFieldTruncationHeader is not None:
-        headers['AllowFieldTruncationHeader'] = self._allowFieldTruncationHeader
-
-    if call in ('create',
-                'merge',
-                'update',
-                'upsert'):
-      if self._assignmentRuleHeader is not None:
-        headers['AssignmentRuleHeader'] = self._assignmentRuleHeader
-
-    # CallOptions will only ever be set by the SforcePartnerClient
-    if self._callOptions is not None:
-      if call in ('create',
-                  'merge',
-                  'queryAll',
-                  'query',
-                  'queryMore',
-                  'retrieve',
-                  'search',
-                  'update',
-                  'upsert',
-                  'convertLead',
-                  'login',
-                  'delete',
-                  'describeGlobal',
-                  'describeLayout',
-                  'describeTabs',
-                  'describeSObject',
-                  'describeSObjects',
-                  'getDeleted',
-                  'getUpdated',
-                  'process',
-                  'undelete',
-                  'getServerTimestamp',
-                  'getUserInfo',
-                  'setPassword',
-                  'resetPassword'):
-        headers['CallOptions'] = self._callOptions
-
-    if call in ('create',
-                'delete',
-                'resetPassword',
-                'update',
-                'upsert'):
-      if self._emailHeader is not None:
-        headers['EmailHeader'] = self._emailHeader
-
-    if call in ('describeSObject',
-                'describeSObjects'):
-      if self._localeOptions is not None:
-        headers['LocaleOptions'] = self._localeOptions
-
-    if call == 'login':
-      if self._loginScopeHeader is not None:
-        headers['LoginScopeHeader'] = self._loginScopeHeader
-
-    if call in ('create',
-                'merge',
-                'query',
-                'retrieve',
-                'update',
-                'upsert'):
-      if self._mruHeader is not None:
-        headers['MruHeader'] = self._mruHeader
-
-    if call in ('convertLead',
-                'create',
-                'delete',
-                'describeGlobal',
-                'describeLayout',
-                'describeSObject',
-                'describeSObjects',
-                'describeTabs',
-                'merge',
-                'process',
-                'query',
-                'retrieve',
-                'search',
-                'undelete',
-                'update',
-                'upsert'):
-      if self._packageVersionHeader is not None:
-        headers['PackageVersionHeader'] = self._packageVersionHeader
-
-    if call in ('query',
-                'queryAll',
-                'queryMore',
-                'retrieve'):
-      if self._queryOptions is not None:
-        headers['QueryOptions'] = self._queryOptions
-
-    if call == 'delete':
-      if self._userTerritoryDeleteHeader is not None:
-        headers['UserTerritoryDeleteHeader'] = self._userTerritoryDeleteHeader
-
-    self._sforce.set_options(soapheaders = headers)
+    self._describeCache = cache
+
+  def invalidateDescribeCache(self, sObjectType = None):
+    '''
+    Forget cached describe results: those for sObjectType, or all of them
+    '''
+    if self._describeCache is None:
+      return
+
+    if sObjectType is None:
+      self._describeCache.invalidate()
+      return
+
+    self._describeCache.invalidate(self._describeKey('describeSObject', sObjectType))
+    # A layout is cached for each list of record type Ids it was asked for with
+    layouts = self._describeKey('describeLayout', sObjectType)
+    self._describeCache.invalidateWhere(lambda key: key[:len(layouts)] == layouts)
 
   def setStrictResultTyping(self, strictResultTyping):
     '''
@@ -333,9 +912,11 @@ Salesforce will use HTTPS.')
     self._strictResultTyping = strictResultTyping
 
   def getSessionId(self):
+    self._syncSession()
     return self._sessionId
 
   def getLocation(self):
+    self._syncSession()
     return self._location
 
   def getConnection(self):
@@ -353,42 +934,39 @@ Salesforce will use HTTPS.')
     '''
     Converts a Lead into an Account, Contact, or (optionally) an Opportunity.
     '''
-    self._setHeaders('convertLead')
-    return self._handleResultTyping(self._sforce.service.convertLead(leadConverts))
+    return self._handleResultTyping(self._invoke('convertLead', leadConverts))
 
   def create(self, sObjects):
-    self._setHeaders('create')
-    return self._handleResultTyping(self._sforce.service.create(sObjects))
+    '''
+    Creates one or more objects, split into as many calls as the API's batch limit requires
+    '''
+    return self._batchCall('create', sObjects)
 
   def delete(self, ids):
     '''
     Deletes one or more objects
     '''
-    self._setHeaders('delete')
-    return self._handleResultTyping(self._sforce.service.delete(ids))
+    return self._batchCall('delete', ids)
 
   def emptyRecycleBin(self, ids):
     '''
     Permanently deletes one or more objects
     '''
-    self._setHeaders('emptyRecycleBin')
-    return self._handleResultTyping(self._sforce.service.emptyRecycleBin(ids))
+    return self._batchCall('emptyRecycleBin', ids)
   
   def getDeleted(self, sObjectType, startDate, endDate):
     '''
     Retrieves the list of individual objects that have been deleted within the
     given timespan for the specified object.
     '''
-    self._setHeaders('getDeleted')
-    return self._sforce.service.getDeleted(sObjectType, startDate, endDate)
+    return self._invoke('getDeleted', sObjectType, startDate, endDate)
 
   def getUpdated(self, sObjectType, startDate, endDate):
     '''
     Retrieves the list of individual objects that have been updated (added or
     changed) within the given timespan for the specified object.
     '''
-    self._setHeaders('getUpdated')
-    return self._sforce.service.getUpdated(sObjectType, startDate, endDate)
+    return self._invoke('getUpdated', sObjectType, startDate, endDate)
 
   def invalidateSessions(self, sessionIds):
     '''
@@ -400,8 +978,7 @@ Salesforce will use HTTPS.')
   
     return invalidateSessionsResult
     '''
-    self._setHeaders('invalidateSessions')
-    return self._handleResultTyping(self._sforce.service.invalidateSessions(sessionIds))
+    return self._handleResultTyping(self._invoke('invalidateSessions', sessionIds))
  
   def login(self, username, password, token):
     '''
@@ -417,17 +994,28 @@ Salesforce will use HTTPS.')
   
     return LoginResult
     '''
-    self._setHeaders('login')
-    result = self._sforce.service.login(username, password + token)
-
-    # set session header
-    header = self.generateHeader('SessionHeader')
-    header.sessionId = result['sessionId']
-    self.setSessionHeader(header)
-    self._sessionId = result['sessionId']
-
-    # change URL to point from test.salesforce.com to something like cs2-api.salesforce.com
-    self._setEndpoint(result['serverUrl'])
+    store = self._sessionStore
+    if store is None:
+      result = self._invoke('login', username, password + token)
+      self._useSession(result['sessionId'], result['serverUrl'])
+    else:
+      key = store.getKey(username, self._loginLocation, self.__class__.__name__)
+      # Held across the login, so concurrent workers wait for this session instead of each
+      # starting their own
+      lock = store.lock(key)
+      try:
+        result = self._restoreSession(key)
+        if result is None:
+          result = self._invoke('login', username, password + token)
+          self._useSession(result['sessionId'], result['serverUrl'])
+        store.put(key, result['sessionId'], result['serverUrl'])
+      finally:
+        store.unlock(lock)
+
+    # Kept for logging in again if the session expires; see setRetryPolicy()
+    self._sharedSession.update(credentials = (username, password, token),
+                               sessionId = result['sessionId'],
+                               serverUrl = result['serverUrl'])
 
     # na0.salesforce.com (a.k.a. ssl.salesforce.com) requires ISO-8859-1 instead of UTF-8
     if 'ssl.salesforce.com' in result['serverUrl'] or 'na0.salesforce.com' in result['serverUrl']:
@@ -446,67 +1034,157 @@ Salesforce will use HTTPS.')
   
     return LogoutResult
     '''
-    self._setHeaders('logout')
-    return self._sforce.service.logout()
+    result = self._invoke('logout')
+
+    session = self._sharedSession
+    if self._sessionStore is not None and session.has_key('credentials'):
+      key = self._sessionStore.getKey(session['credentials'][0], self._loginLocation,
+                                      self.__class__.__name__)
+      self._sessionStore.invalidate(key)
+    return result
 
   def merge(self, mergeRequests):
-    self._setHeaders('merge')
-    return self._handleResultTyping(self._sforce.service.merge(mergeRequests))
+    return self._handleResultTyping(self._invoke('merge', mergeRequests))
 
   def process(self, processRequests):
-    self._setHeaders('process')
-    return self._handleResultTyping(self._sforce.service.process(processRequests))
+    return self._handleResultTyping(self._invoke('process', processRequests))
 
   def query(self, queryString):
     '''
     Executes a query against the specified object and returns data that matches
     the specified criteria.
     '''
-    self._setHeaders('query')
-    return self._sforce.service.query(queryString)
+    return self._invoke('query', queryString)
 
   def queryAll(self, queryString):
     '''
     Retrieves data from specified objects, whether or not they have been deleted.
     '''
-    self._setHeaders('queryAll')
-    return self._sforce.service.queryAll(queryString)
+    return self._invoke('queryAll', queryString)
   
   def queryMore(self, queryLocator):
     '''
     Retrieves the next batch of objects from a query.
     '''
-    self._setHeaders('queryMore')
-    return self._sforce.service.queryMore(queryLocator)
+    return self._invoke('queryMore', queryLocator)
+
+  def queryIter(self, queryString, queryAll = False, prefetch = True, tuner = None):
+    '''
+    Executes a query and yields the matching records one at a time, calling queryMore() for
+    each subsequent batch until the result set is exhausted.
+
+    'queryAll' : Include deleted and archived records, as queryAll() does
+    'prefetch' : Fetch the next batch on a background thread while the current batch is
+                 being consumed
+    'tuner' : A sforce.tuning.BatchSizeTuner, to choose each batch's size from how long and
+              how large the batches before it were, instead of using the QueryOptions header
+    '''
+    pager = self
+    if tuner is not None:
+      # The pages are fetched with their own QueryOptions header, leaving ours as it is
+      pager = self._clone()
+      pager.addListener(tuner)
+      tuner.apply(pager)
+
+    if queryAll:
+      queryResult = pager.queryAll(queryString)
+    else:
+      queryResult = pager.query(queryString)
+
+    # The background fetches get their own connection, so the caller is free to make other
+    # calls (e.g. update()) with this client while iterating
+    if prefetch:
+      fetcher = pager._clone()
+    else:
+      fetcher = pager
+
+    while True:
+      nextResult = None
+      if not queryResult.done:
+        if tuner is not None:
+          # The tuner has seen the page just fetched
+          tuner.apply(fetcher)
+        if prefetch:
+          nextResult = spawn(fetcher.queryMore, queryResult.queryLocator)
+
+      if queryResult.size > 0:
+        records = queryResult.records
+        if not isinstance(records, list):
+          records = [records]
+        for record in records:
+          yield record
+
+      if queryResult.done:
+        break
+
+      if nextResult is not None:
+        queryResult = nextResult.result()
+      else:
+        queryResult = fetcher.queryMore(queryResult.queryLocator)
+
+  def queryExport(self, queryString, writer, queryAll = False, columns = None, prefetch = True):
+    '''
+    Executes a query and streams all of its pages to writer, parsing each page straight from
+    the SOAP response rather than into suds objects, so memory use doesn't grow with the
+    size of the result set.  Returns the number of records written.
+
+    'writer' : A sforce.export.ExportWriter: CSVWriter or JSONLWriter to write to a file, or
+               ColumnWriter to collect typed (NumPy, if installed) column arrays
+    'queryAll' : Include deleted and archived records, as queryAll() does
+    'columns' : Fields to write, e.g. ('Id', 'Account.Name'); defaults to the query's
+                SELECT list.  Child relationship subqueries are left out.
+    'prefetch' : Fetch the next page on a background thread while the current one is written
+    '''
+    return exportQuery(self, queryString, writer, queryAll, columns, prefetch)
+
+  def queryPartitioned(self, queryString, partitions = 4, field = 'Id', ordered = False,
+                       queryAll = False, workers = None):
+    '''
+    Executes a query as several queries over disjoint ranges of field, run concurrently, and
+    yields the matching records one at a time as their pages arrive
+
+    The ranges evenly divide the values between the lowest and highest that the query
+    matches, found with two one-row queries; they're only as even in size as the values are
+    spread.  Queries with GROUP BY, ORDER BY, LIMIT or OFFSET can't be partitioned.
+
+    'partitions' : How many ranges to split the query into
+    'field' : Id, or a date or datetime field (records where it's null are fetched too)
+    'ordered' : Yield records in order of field, rather than as soon as they arrive
+    'queryAll' : Include deleted and archived records, as queryAll() does
+    'workers' : How many partitions to run at once; defaults to all of them
+    '''
+    return partitionedQuery(self, queryString, partitions, field, ordered, queryAll, workers)
 
   def retrieve(self, fieldList, sObjectType, ids):
     '''
     Retrieves one or more objects based on the specified object IDs.
     '''
-    self._setHeaders('retrieve')
-    return self._handleResultTyping(self._sforce.service.retrieve(fieldList, sObjectType, ids))
+    return self._handleResultTyping(self._invoke('retrieve', fieldList, sObjectType, ids))
 
   def search(self, searchString):
     '''
     Executes a text search in your organization's data.
     '''
-    self._setHeaders('search')
-    return self._sforce.service.search(searchString)
+    return self._invoke('search', searchString)
 
   def undelete(self, ids):
     '''
     Undeletes one or more objects
     '''
-    self._setHeaders('undelete')
-    return self._handleResultTyping(self._sforce.service.undelete(ids))
+    return self._batchCall('undelete', ids)
 
   def update(self, sObjects):
-    self._setHeaders('update')
-    return self._handleResultTyping(self._sforce.service.update(sObjects))
+    '''
+    Updates one or more objects, split into as many calls as the API's batch limit requires
+    '''
+    return self._batchCall('update', sObjects)
 
   def upsert(self, externalIdFieldName, sObjects):
-    self._setHeaders('upsert')
-    return self._handleResultTyping(self._sforce.service.upsert(externalIdFieldName, sObjects))
+    '''
+    Creates or updates one or more objects, matching on externalIdFieldName, split into as
+    many calls as the API's batch limit requires
+    '''
+    return self._batchCall('upsert', sObjects, externalIdFieldName)
 
   # Describe calls
 
@@ -514,8 +1192,7 @@ Salesforce will use HTTPS.')
     '''
     Retrieves a list of available objects in your organization
     '''
-    self._setHeaders('describeGlobal')
-    return self._sforce.service.describeGlobal()
+    return self._cachedDescribe('describeGlobal')
 
   def describeLayout(self, sObjectType, recordTypeIds = None):
     '''
@@ -525,24 +1202,46 @@ Salesforce will use HTTPS.')
     display-only views and record type mappings. Note that field-level security
     and layout editability affects which fields appear in a layout.
     '''
-    self._setHeaders('describeLayout')
-    return self._sforce.service.describeLayout(sObjectType, recordTypeIds)
+    return self._cachedDescribe('describeLayout', sObjectType, recordTypeIds)
 
   def describeSObject(self, sObjectsType):
     '''
     Describes metadata (field list and object properties) for the specified
     object.
     '''
-    self._setHeaders('describeSObject')
-    return self._sforce.service.describeSObject(sObjectsType)
+    return self._cachedDescribe('describeSObject', sObjectsType)
 
   def describeSObjects(self, sObjectTypes):
     '''
     An array-based version of describeSObject; describes metadata (field list
     and object properties) for the specified object or array of objects.
     '''
-    self._setHeaders('describeSObjects')
-    return self._handleResultTyping(self._sforce.service.describeSObjects(sObjectTypes))
+    if self._describeCache is None:
+      return self._handleResultTyping(self._invoke('describeSObjects', sObjectTypes))
+
+    if isinstance(sObjectTypes, basestring):
+      sObjectTypes = (sObjectTypes, )
+
+    # Results are cached per type, shared with describeSObject(), so only ask for the types
+    # we don't already have
+    results = {}
+    missing = []
+    for sObjectType in sObjectTypes:
+      result = self._describeCache.get(self._describeKey('describeSObject', sObjectType))
+      if result is None:
+        missing.append(sObjectType)
+      else:
+        results[sObjectType.lower()] = result
+
+    if missing:
+      fetched = self._invoke('describeSObjects', missing)
+      if not isinstance(fetched, list):
+        fetched = [fetched]
+      for result in fetched:
+        self._describeCache.put(self._describeKey('describeSObject', result.name), result)
+        results[result.name.lower()] = result
+
+    return self._handleResultTyping([results[sObjectType.lower()] for sObjectType in sObjectTypes])
 
   # describeSoftphoneLayout not implemented
   # From the docs: "Use this call to obtain information about the layout of a SoftPhone. 
@@ -554,8 +1253,7 @@ Salesforce will use HTTPS.')
     custom apps, if any, available for the user who sends the call, including
     the list of tabs defined for each app.
     '''
-    self._setHeaders('describeTabs')
-    return self._sforce.service.describeTabs()
+    return self._cachedDescribe('describeTabs')
 
   # Utility calls
 
@@ -563,62 +1261,67 @@ Salesforce will use HTTPS.')
     '''
     Retrieves the current system timestamp (GMT) from the Web service.
     '''
-    self._setHeaders('getServerTimestamp')
-    return self._sforce.service.getServerTimestamp()
+    return self._invoke('getServerTimestamp')
 
   def getUserInfo(self):
-    self._setHeaders('getUserInfo')
-    return self._sforce.service.getUserInfo()
+    return self._invoke('getUserInfo')
 
   def resetPassword(self, userId):
     '''
     Changes a user's password to a system-generated value.
     '''
-    self._setHeaders('resetPassword')
-    return self._sforce.service.resetPassword(userId)
+    return self._invoke('resetPassword', userId)
 
   def sendEmail(self, emails):
-    self._setHeaders('sendEmail')
-    return self._handleResultTyping(self._sforce.service.sendEmail(emails))
+    return self._handleResultTyping(self._invoke('sendEmail', emails))
 
   def setPassword(self, userId, password):
     '''
     Sets the specified user's password to the specified value.
     '''
-    self._setHeaders('setPassword')
-    return self._sforce.service.setPassword(userId, password)
+    return self._invoke('setPassword', userId, password)
 
   # SOAP header-related calls
 
   def setAllowFieldTruncationHeader(self, header):
     self._allowFieldTruncationHeader = header
+    self._headersChanged()
 
   def setAssignmentRuleHeader(self, header):
     self._assignmentRuleHeader = header
+    self._headersChanged()
 
   # setCallOptions() is only implemented in SforcePartnerClient
   # http://www.salesforce.com/us/developer/docs/api/Content/sforce_api_header_calloptions.htm
 
   def setEmailHeader(self, header):
     self._emailHeader = header
+    self._headersChanged()
 
   def setLocaleOptions(self, header):
     self._localeOptions = header
+    self._headersChanged()
 
   def setLoginScopeHeader(self, header):
     self._loginScopeHeader = header
+    self._headersChanged()
 
   def setMruHeader(self, header):
     self._mruHeader = header
+    self._headersChanged()
 
   def setPackageVersionHeader(self, header):
     self._packageVersionHeader = header
+    self._headersChanged()
 
   def setQueryOptions(self, header):
     self._queryOptions = header
+    self._headersChanged()
 
   def setSessionHeader(self, header):
     self._sessionHeader = header
+    self._headersChanged()
 
   def setUserTerritoryDeleteHeader(self, header):
     self._userTerritoryDeleteHeader = header
+    self._headersChanged()
@@ -0,0 +1,495 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the (LGPL) GNU Lesser General Public License as
+# published by the Free Software Foundation; either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Library Lesser General Public License for more details at
+# ( http://www.gnu.org/licenses/lgpl.html ).
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+# Written by: David Lanstein ( lanstein yahoo com )
+
+'''
+A client for the Bulk API, which loads and queries large numbers of records as CSV batches
+processed asynchronously by Salesforce, using the session of a logged-in Partner or
+Enterprise client
+'''
+
+import csv
+import datetime
+import re
+import sys
+import time
+import urlparse
+
+from cStringIO import StringIO
+from xml.sax.saxutils import escape
+
+try:
+  import xml.etree.cElementTree as ElementTree
+except ImportError:
+  import xml.etree.ElementTree as ElementTree
+
+from export import parseSelect
+from instrument import MeasuringTransport
+from transport import HttpTransport
+
+BULK_NS = 'http://www.force.com/2009/06/asyncapi/dataload'
+
+# Batches in these states won't change again
+BATCH_DONE_STATES = ('Completed', 'Failed', 'Not Processed')
+
+class BulkError(Exception):
+  '''
+  An error returned by the Bulk API, or a batch that failed
+  '''
+  def __init__(self, code, message, status = None):
+    Exception.__init__(self, '%s: %s' % (code, message))
+    self.code = code
+    self.message = message
+    self.status = status
+
+def _localName(tag):
+  return tag[tag.rfind('}') + 1:]
+
+class BulkInfo(object):
+  '''
+  A jobInfo or batchInfo, with an attribute for each of its elements, e.g. id, state and
+  numberRecordsProcessed; counts and times are ints
+  '''
+  stateMessage = None
+  externalIdFieldName = None
+
+  def __init__(self, element):
+    for child in element:
+      name = _localName(child.tag)
+      value = child.text
+      if name.startswith('number') or name.endswith('Time'):
+        value = int(value or 0)
+      setattr(self, name, value)
+
+  def __repr__(self):
+    return '<%s %s>' % (self.__class__.__name__,
+                        ' '.join(['%s=%r' % item for item in sorted(self.__dict__.items())]))
+
+#
+# CSV
+#
+
+def _csvValue(value):
+  if value is None:
+    # Sets the field to null; an empty value leaves it alone
+    return '#N/A'
+  if isinstance(value, bool):
+    return value and 'true' or 'false'
+  if isinstance(value, datetime.datetime):
+    if value.tzinfo is not None:
+      value = (value - value.utcoffset()).replace(tzinfo = None)
+    return value.strftime('%Y-%m-%dT%H:%M:%S.000Z')
+  if isinstance(value, datetime.date):
+    return value.isoformat()
+  if isinstance(value, unicode):
+    return value.encode('utf-8')
+  return str(value)
+
+def _fields(record):
+  '''
+  Return (field, value) pairs for a dict, suds Object or compact Record, with fieldsToNull
+  applied
+  '''
+  if isinstance(record, dict):
+    pairs = record.items()
+  else:
+    # suds Objects and sforce.record.Records iterate as (field, value) pairs
+    pairs = list(record)
+
+  nulls = ()
+  for (k, v) in pairs:
+    if k == 'fieldsToNull':
+      nulls = v or ()
+      if isinstance(nulls, basestring):
+        nulls = [nulls]
+  pairs = [(k, v) for (k, v) in pairs if k not in ('type', 'fieldsToNull')]
+  return pairs + [(k, None) for k in nulls]
+
+def csvBatches(records, columns = None, batchSize = 10000, maxBytes = 10000000):
+  '''
+  Yield CSV batches, each with a header row, of up to batchSize records and maxBytes bytes,
+  reading records from an iterator as it goes
+
+  'records' : Dicts, suds Objects or compact Records, or with columns, sequences of values in
+              column order.  None sets a field to null; fields a record lacks are left alone.
+  'columns' : Field names; defaults to the fields of the first record
+  '''
+  buffer = StringIO()
+  writer = csv.writer(buffer)
+  def line(values):
+    buffer.seek(0)
+    buffer.truncate()
+    writer.writerow(values)
+    return buffer.getvalue()
+
+  header = None
+  lines = []
+  size = 0
+  for record in records:
+    if isinstance(record, (tuple, list)):
+      if columns is None:
+        raise ValueError('columns must be given for records that are sequences')
+      row = line([_csvValue(v) for v in record])
+    else:
+      pairs = _fields(record)
+      if columns is None:
+        columns = [k for (k, v) in pairs]
+      values = dict(pairs)
+      row = line([k in values and _csvValue(values[k]) or '' for k in columns])
+
+    if header is None:
+      header = line(columns)
+    if lines and (len(lines) >= batchSize or size + len(row) > maxBytes):
+      yield ''.join([header] + lines)
+      lines = []
+    if not lines:
+      size = len(header)
+    lines.append(row)
+    size += len(row)
+
+  if lines:
+    yield ''.join([header] + lines)
+
+def _lines(chunks):
+  pending = ''
+  for chunk in chunks:
+    lines = (pending + chunk).split('\n')
+    pending = lines.pop()
+    for line in lines:
+      yield line + '\n'
+  if pending:
+    yield pending
+
+def readCsv(chunks):
+  '''
+  Yield a dict per row of CSV arriving in pieces, keyed on the header row; empty values,
+  which is how the Bulk API writes nulls, are None
+  '''
+  reader = csv.reader(_lines(chunks))
+  try:
+    header = [name.decode('utf-8') for name in reader.next()]
+  except StopIteration:
+    return
+  for row in reader:
+    yield dict(zip(header, [v and v.decode('utf-8') or None for v in row]))
+
+#
+# The client
+#
+
+class SforceBulkClient(object):
+  '''
+  Runs Bulk API jobs with the session of a logged-in SforcePartnerClient or
+  SforceEnterpriseClient
+
+  A job has one operation (insert, update, upsert, delete, hardDelete or query) on one
+  sObject type.  Records are uploaded in batches of CSV, which Salesforce queues and processes
+  in the background, so a load of millions of records costs a handful of requests rather than
+  one call per 200.  load() and query() run a whole job; the other methods are the individual
+  Bulk API requests.
+
+  Requests go over the client's keep-alive connection pool when it has one (see keepAlive),
+  and if the session expires it's replaced as the client's retry policy allows (see
+  setRetryPolicy).  Results are parsed as they're read from the connection, so they're never
+  held in memory whole.
+  '''
+  # For serverUrls that don't include the version
+  apiVersion = '20.0'
+
+  def __init__(self, client, transport = None, pollInterval = 1, maxPollInterval = 30,
+               batchSize = 10000, compression = False):
+    '''
+    'client' : A logged-in SforcePartnerClient or SforceEnterpriseClient
+    'transport' : sforce.transport.HttpTransport to make requests with; defaults to the
+                  client's, or a new one
+    'pollInterval' : Seconds to wait before checking on a job again; the wait doubles each
+                     time it's still running
+    'maxPollInterval' : Most seconds to wait between checks
+    'batchSize' : Most records per batch (the API allows 10,000)
+    'compression' : Gzip requests and ask for gzipped responses
+    '''
+    self.client = client
+    if transport is None:
+      sforce = getattr(client, '_sforce', None)
+      if sforce is not None:
+        transport = sforce.options.transport
+      if isinstance(transport, MeasuringTransport):
+        transport = transport.transport
+      if not isinstance(transport, HttpTransport):
+        transport = HttpTransport()
+    self.transport = transport
+    self.pollInterval = pollInterval
+    self.maxPollInterval = maxPollInterval
+    self.batchSize = batchSize
+    self.compression = compression
+
+  def _url(self, path):
+    location = self.client.getLocation()
+    if location is None:
+      raise BulkError('InvalidSessionId', 'The client must log in first')
+    parts = urlparse.urlsplit(location)
+    match = re.search(r'/services/Soap/\w/([\d.]+)', parts.path)
+    if match is not None:
+      version = match.group(1)
+    else:
+      version = self.apiVersion
+    return '%s://%s/services/async/%s/%s' % (parts.scheme, parts.netloc, version, path)
+
+  def _relogin(self, staleSessionId):
+    policy = getattr(self.client, '_retryPolicy', None)
+    if policy is None or not policy.relogin:
+      return False
+    return self.client._relogin(staleSessionId)
+
+  def _request(self, method, path, body = None, contentType = 'application/xml; charset=UTF-8'):
+    '''
+    Make a request, returning a generator of the pieces of the response body
+    '''
+    headers = {}
+    if body is not None:
+      headers['Content-Type'] = contentType
+      if self.compression:
+        body = self.transport._gzip(body)
+        headers['Content-Encoding'] = 'gzip'
+    if self.compression:
+      headers['Accept-Encoding'] = 'gzip'
+
+    relogged = False
+    while True:
+      sessionId = self.client.getSessionId()
+      headers['X-SFDC-Session'] = sessionId
+      (status, reason, responseHeaders, chunks) = self.transport.stream(method, self._url(path), body, headers)
+      if status < 400:
+        return chunks
+
+      error = self._error(status, reason, ''.join(chunks))
+      if error.code == 'InvalidSessionId' and not relogged and self._relogin(sessionId):
+        relogged = True
+        continue
+      raise error
+
+  def _error(self, status, reason, body):
+    try:
+      root = ElementTree.fromstring(body)
+    except SyntaxError:
+      # ElementTree's ParseError
+      return BulkError('HTTP%d' % status, reason, status)
+    return BulkError(root.findtext('{%s}exceptionCode' % BULK_NS),
+                     root.findtext('{%s}exceptionMessage' % BULK_NS), status)
+
+  def _xml(self, method, path, body = None, contentType = 'application/xml; charset=UTF-8'):
+    return ElementTree.fromstring(''.join(self._request(method, path, body, contentType)))
+
+  def _jobXml(self, content):
+    return '<?xml version="1.0" encoding="UTF-8"?><jobInfo xmlns="%s">%s</jobInfo>' % (BULK_NS, content)
+
+  #
+  # Jobs
+  #
+
+  def createJob(self, operation, sObjectType, externalIdFieldName = None, concurrencyMode = None):
+    '''
+    Open a job, returning its BulkInfo
+
+    'operation' : insert, update, upsert, delete, hardDelete or query
+    'externalIdFieldName' : For upsert, the field to match records on
+    'concurrencyMode' : Parallel (the default) or Serial, to process one batch at a time
+                        and avoid lock contention between them
+    '''
+    content = ['<operation>%s</operation><object>%s</object>' % (escape(operation), escape(sObjectType))]
+    if externalIdFieldName is not None:
+      content.append('<externalIdFieldName>%s</externalIdFieldName>' % escape(externalIdFieldName))
+    if concurrencyMode is not None:
+      content.append('<concurrencyMode>%s</concurrencyMode>' % escape(concurrencyMode))
+    content.append('<contentType>CSV</contentType>')
+    return BulkInfo(self._xml('POST', 'job', self._jobXml(''.join(content))))
+
+  def closeJob(self, jobId):
+    '''
+    Say no more batches are coming, so the job can finish once they're processed
+    '''
+    return BulkInfo(self._xml('POST', 'job/%s' % jobId, self._jobXml('<state>Closed</state>')))
+
+  def abortJob(self, jobId):
+    '''
+    Stop a job; batches not yet processed never will be
+    '''
+    return BulkInfo(self._xml('POST', 'job/%s' % jobId, self._jobXml('<state>Aborted</state>')))
+
+  def getJob(self, jobId):
+    return BulkInfo(self._xml('GET', 'job/%s' % jobId))
+
+  #
+  # Batches
+  #
+
+  def addBatch(self, jobId, data):
+    '''
+    Add a batch to an open job, returning its BulkInfo
+
+    'data' : CSV with a header row, or for a query job, the SOQL
+    '''
+    if isinstance(data, unicode):
+      data = data.encode('utf-8')
+    return BulkInfo(self._xml('POST', 'job/%s/batch' % jobId, data, 'text/csv; charset=UTF-8'))
+
+  def addBatches(self, jobId, records, columns = None):
+    '''
+    Upload records as batches of batchSize, returning a list of their BulkInfos
+
+    Records are read from the iterator and turned into CSV one batch at a time, so only one
+    batch is ever in memory; see csvBatches() for what they can be.
+    '''
+    return [self.addBatch(jobId, data) for data in csvBatches(records, columns, self.batchSize)]
+
+  def getBatch(self, jobId, batchId):
+    return BulkInfo(self._xml('GET', 'job/%s/batch/%s' % (jobId, batchId)))
+
+  def getBatches(self, jobId):
+    return [BulkInfo(element) for element in self._xml('GET', 'job/%s/batch' % jobId)]
+
+  def _poll(self, check, timeout):
+    '''
+    Call check() until it returns something other than None, waiting pollInterval seconds
+    at first and twice as long each time after, up to maxPollInterval
+    '''
+    delay = self.pollInterval
+    deadline = None
+    if timeout is not None:
+      deadline = time.time() + timeout
+    while True:
+      result = check()
+      if result is not None:
+        return result
+      if deadline is not None:
+        remaining = deadline - time.time()
+        if remaining <= 0:
+          raise BulkError('Timeout', 'Still running after %s seconds' % timeout)
+        delay = min(delay, remaining)
+      time.sleep(delay)
+      delay = min(delay * 2, self.maxPollInterval)
+
+  def waitForBatch(self, jobId, batchId, timeout = None):
+    '''
+    Wait until a batch has been processed (or has failed), returning its BulkInfo
+
+    'timeout' : Seconds after which to give up with a BulkError, or None to wait for good
+    '''
+    def check():
+      info = self.getBatch(jobId, batchId)
+      if info.state in BATCH_DONE_STATES:
+        return info
+      return None
+    return self._poll(check, timeout)
+
+  def waitForJob(self, jobId, timeout = None):
+    '''
+    Wait until every batch of a job has been processed (or has failed), returning a list of
+    their BulkInfos
+    '''
+    def check():
+      batches = self.getBatches(jobId)
+      for info in batches:
+        if info.state not in BATCH_DONE_STATES:
+          return None
+      return batches
+    return self._poll(check, timeout)
+
+  #
+  # Results
+  #
+
+  def getBatchResults(self, jobId, batchId):
+    '''
+    Yield the result of each record of a processed insert, update, upsert, delete or
+    hardDelete batch, in the batch's order, as a dict with 'Id', 'Success' and 'Created'
+    (booleans) and 'Error'
+    '''
+    for row in readCsv(self._request('GET', 'job/%s/batch/%s/result' % (jobId, batchId))):
+      row['Success'] = row.get('Success') == 'true'
+      row['Created'] = row.get('Created') == 'true'
+      yield row
+
+  def getQueryResults(self, jobId, batchId):
+    '''
+    Yield the records a processed query batch found, as dicts of field (e.g. 'Account.Name')
+    => string, or None for nulls
+    '''
+    resultIds = [element.text for element in self._xml('GET', 'job/%s/batch/%s/result' % (jobId, batchId))]
+    for resultId in resultIds:
+      for row in readCsv(self._request('GET', 'job/%s/batch/%s/result/%s' % (jobId, batchId, resultId))):
+        yield row
+
+  def _checkBatch(self, info):
+    if info.state == 'Completed':
+      return
+    if info.stateMessage and ' : ' in info.stateMessage:
+      (code, message) = info.stateMessage.split(' : ', 1)
+      raise BulkError(code, message)
+    raise BulkError('BatchFailed', 'Batch %s is %s: %s' % (info.id, info.state, info.stateMessage))
+
+  #
+  # Whole jobs
+  #
+
+  def load(self, operation, sObjectType, records, columns = None, externalIdFieldName = None,
+           concurrencyMode = None, timeout = None):
+    '''
+    Run an insert, update, upsert, delete or hardDelete job over records, wait for it to
+    finish, and return a generator of the per-record results (see getBatchResults()) in the
+    order of records
+
+    Batches are uploaded as the records iterator produces them.  A batch that failed as a
+    whole (rather than record by record) raises a BulkError when its results are reached.
+
+    'records' : Iterator of records; see csvBatches().  For delete and hardDelete, only Id is
+                needed.
+    'columns' : Field names; defaults to the fields of the first record
+    'externalIdFieldName' : For upsert, the field to match records on
+    'concurrencyMode' : Parallel (the default) or Serial
+    'timeout' : Seconds to wait for the job, or None to wait for good
+    '''
+    job = self.createJob(operation, sObjectType, externalIdFieldName, concurrencyMode)
+    try:
+      batchIds = [info.id for info in self.addBatches(job.id, records, columns)]
+    except:
+      excInfo = sys.exc_info()
+      try:
+        self.abortJob(job.id)
+      except BulkError:
+        pass
+      raise excInfo[0], excInfo[1], excInfo[2]
+    self.closeJob(job.id)
+
+    batches = dict([(info.id, info) for info in self.waitForJob(job.id, timeout)])
+    def results():
+      for batchId in batchIds:
+        self._checkBatch(batches[batchId])
+        for row in self.getBatchResults(job.id, batchId):
+          yield row
+    return results()
+
+  def query(self, queryString, timeout = None):
+    '''
+    Run a query job, wait for it to finish, and return a generator of the records found (see
+    getQueryResults()).  Relationship subqueries and aggregates aren't supported.
+    '''
+    sObjectType = parseSelect(queryString)[1]
+    job = self.createJob('query', sObjectType)
+    info = self.addBatch(job.id, queryString)
+    self.closeJob(job.id)
+    info = self.waitForBatch(job.id, info.id, timeout)
+    self._checkBatch(info)
+    return self.getQueryResults(job.id, info.id)
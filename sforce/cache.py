@@ -0,0 +1,502 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the (LGPL) GNU Lesser General Public License as
+# published by the Free Software Foundation; either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Library Lesser General Public License for more details at
+# ( http://www.gnu.org/licenses/lgpl.html ).
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+# Written by: David Lanstein ( lanstein yahoo com )
+
+import errno
+import os
+import os.path
+import tempfile
+import threading
+import time
+import urllib2
+
+from collections import OrderedDict
+
+try:
+  import cPickle as pickle
+except ImportError:
+  import pickle
+
+try:
+  import fcntl
+except ImportError:
+  # Windows; sessions are still shared, but two workers may log in at the same time
+  fcntl = None
+
+try:
+  import json
+except ImportError:
+  # Python 2.5
+  import simplejson as json
+
+try:
+  from hashlib import sha1
+except ImportError:
+  # Python 2.4
+  from sha import new as sha1
+
+import suds
+import suds.sudsobject
+
+from suds.transport import Request
+
+try:
+  # suds 0.3.8 and prior
+  from suds.transport.cache import Cache
+except:
+  # suds 0.3.9+
+  from suds.cache import Cache
+
+class SchemaCache(Cache):
+  '''
+  On-disk cache of the fully parsed and resolved WSDL (the suds Definitions object)
+
+  suds asks its cache for the parsed WSDL before parsing it, under an id derived from the
+  WSDL's location.  We ignore that id and key the entry on a digest of the WSDL document
+  itself, so a regenerated WSDL at the same location is never served stale.  Anything else
+  suds asks for (raw documents) is passed through to documentCache, if given.
+  '''
+  def __init__(self, location, wsdl, documentCache = None, transport = None):
+    '''
+    'location' : Directory to store parsed WSDLs in, or None for the system temp directory
+    'wsdl' : Location of the WSDL, as passed to suds
+    'documentCache' : Cache to use for everything other than the parsed WSDL
+    'transport' : suds Transport to read the WSDL with, e.g. the client's, so its proxy and
+                  other options apply; None to read it with urllib2
+    '''
+    if location is None:
+      location = os.path.join(tempfile.gettempdir(), 'sforce')
+    self.location = location
+    self.documentCache = documentCache
+    self.transport = transport
+
+    # One prefix per WSDL location, so we know which entries a new version supersedes
+    self.prefix = sha1(wsdl).hexdigest()[:16]
+
+    digest = sha1(self._read(wsdl))
+    # A different suds or pickle format can't load the old object graph
+    digest.update(suds.__version__)
+    digest.update(str(pickle.HIGHEST_PROTOCOL))
+    self.key = '%s-%s' % (self.prefix, digest.hexdigest())
+
+  def _read(self, wsdl):
+    if self.transport is not None:
+      fp = self.transport.open(Request(wsdl))
+    else:
+      fp = urllib2.urlopen(wsdl)
+    try:
+      return fp.read()
+    finally:
+      fp.close()
+
+  def _isSchema(self, id):
+    # suds 0.3.9+ asks for an ObjectId, whose suffix is 'pw' for the parsed WSDL (and 'pxd'
+    # for raw documents); earlier versions mangle ids as '<hash>-wsdl'
+    suffix = getattr(id, 'suffix', None)
+    if suffix is not None:
+      return suffix == 'pw'
+    return id.endswith('-wsdl')
+
+  def _filename(self, key = None):
+    if key is None:
+      key = self.key
+    return os.path.join(self.location, key + '.pickle')
+
+  def get(self, id):
+    if not self._isSchema(id):
+      if self.documentCache is not None:
+        return self.documentCache.get(id)
+      return None
+
+    try:
+      fp = open(self._filename(), 'rb')
+    except IOError:
+      return None
+
+    try:
+      try:
+        return pickle.load(fp)
+      except Exception:
+        # Truncated or otherwise unreadable; reparse and overwrite it
+        return None
+    finally:
+      fp.close()
+
+  def getf(self, id):
+    if self.documentCache is not None and not self._isSchema(id):
+      return self.documentCache.getf(id)
+    return None
+
+  def put(self, id, object):
+    if not self._isSchema(id):
+      if self.documentCache is not None:
+        return self.documentCache.put(id, object)
+      return object
+
+    if not os.path.isdir(self.location):
+      try:
+        os.makedirs(self.location)
+      except OSError:
+        # Another process created it first
+        pass
+
+    # Write to a temporary file and rename it into place, so concurrent workers never load a
+    # half-written pickle
+    (fd, tmp) = tempfile.mkstemp(dir = self.location, prefix = self.key, suffix = '.tmp')
+    fp = os.fdopen(fd, 'wb')
+    try:
+      pickle.dump(object, fp, pickle.HIGHEST_PROTOCOL)
+    finally:
+      fp.close()
+
+    try:
+      os.rename(tmp, self._filename())
+    except OSError:
+      # Windows won't rename over an existing file
+      os.remove(tmp)
+
+    self._purgeStale()
+    return object
+
+  def putf(self, id, fp):
+    if self.documentCache is not None and not self._isSchema(id):
+      return self.documentCache.putf(id, fp)
+    return fp
+
+  def _purgeStale(self):
+    '''
+    Remove parsed copies of previous versions of this WSDL
+    '''
+    current = os.path.basename(self._filename())
+    for name in os.listdir(self.location):
+      if name.startswith(self.prefix) and name.endswith('.pickle') and name != current:
+        try:
+          os.remove(os.path.join(self.location, name))
+        except OSError:
+          pass
+
+  def purge(self, id):
+    if not self._isSchema(id):
+      if self.documentCache is not None:
+        self.documentCache.purge(id)
+      return
+
+    try:
+      os.remove(self._filename())
+    except OSError:
+      pass
+
+  def clear(self):
+    if self.documentCache is not None:
+      self.documentCache.clear()
+
+    if not os.path.isdir(self.location):
+      return
+    for name in os.listdir(self.location):
+      if name.startswith(self.prefix) and name.endswith('.pickle'):
+        try:
+          os.remove(os.path.join(self.location, name))
+        except OSError:
+          pass
+
+class DescribeCache(object):
+  '''
+  Cache of describe call results (describeGlobal(), describeSObject(), etc.)
+
+  Entries are kept in memory, least recently used first out once there are more than
+  maxEntries, and optionally also on disk in 'location' so later processes can use them.
+  Every entry expires ttl seconds after it was fetched.
+
+  One instance may be shared by any number of clients and threads.  Cached results are
+  shared, too, so callers shouldn't modify them.
+  '''
+  def __init__(self, maxEntries = 1000, ttl = 86400, location = None):
+    '''
+    'maxEntries' : Most results to keep in memory
+    'ttl' : Seconds before a result is fetched again
+    'location' : Directory to persist results in, or None to keep them in memory only
+    '''
+    self.maxEntries = maxEntries
+    self.ttl = ttl
+    self.location = location
+    self._lock = threading.Lock()
+    # key => (expires, value), oldest first
+    self._entries = OrderedDict()
+
+  def _filename(self, key):
+    return os.path.join(self.location, sha1(repr(key)).hexdigest() + '.describe')
+
+  def get(self, key):
+    '''
+    Return the cached result for key, or None if there isn't one or it has expired
+    '''
+    now = time.time()
+    self._lock.acquire()
+    try:
+      entry = self._entries.pop(key, None)
+      if entry is not None and entry[0] > now:
+        # Move to the most recently used end
+        self._entries[key] = entry
+        return entry[1]
+    finally:
+      self._lock.release()
+
+    if self.location is None:
+      return None
+
+    try:
+      fp = open(self._filename(key), 'rb')
+    except IOError:
+      return None
+    try:
+      try:
+        (storedKey, expires, frozen) = pickle.load(fp)
+      except Exception:
+        return None
+    finally:
+      fp.close()
+
+    if storedKey != key or expires <= now:
+      return None
+
+    value = _thaw(frozen)
+    self._remember(key, expires, value)
+    return value
+
+  def put(self, key, value, ttl = None):
+    '''
+    Cache value under key for ttl seconds (by default, the cache's ttl)
+    '''
+    if ttl is None:
+      ttl = self.ttl
+    expires = time.time() + ttl
+    self._remember(key, expires, value)
+
+    if self.location is None:
+      return
+
+    if not os.path.isdir(self.location):
+      try:
+        os.makedirs(self.location)
+      except OSError:
+        pass
+
+    (fd, tmp) = tempfile.mkstemp(dir = self.location, suffix = '.tmp')
+    fp = os.fdopen(fd, 'wb')
+    try:
+      pickle.dump((key, expires, _freeze(value)), fp, pickle.HIGHEST_PROTOCOL)
+    finally:
+      fp.close()
+    try:
+      os.rename(tmp, self._filename(key))
+    except OSError:
+      os.remove(tmp)
+
+  def _remember(self, key, expires, value):
+    self._lock.acquire()
+    try:
+      self._entries.pop(key, None)
+      self._entries[key] = (expires, value)
+      while len(self._entries) > self.maxEntries:
+        self._entries.popitem(last = False)
+    finally:
+      self._lock.release()
+
+  def invalidate(self, key = None):
+    '''
+    Forget the result cached under key, or every result if key is None
+    '''
+    self._lock.acquire()
+    try:
+      if key is None:
+        self._entries.clear()
+      else:
+        self._entries.pop(key, None)
+    finally:
+      self._lock.release()
+
+    if self.location is None or not os.path.isdir(self.location):
+      return
+
+    if key is not None:
+      try:
+        os.remove(self._filename(key))
+      except OSError:
+        pass
+      return
+
+    for name in os.listdir(self.location):
+      if name.endswith('.describe'):
+        try:
+          os.remove(os.path.join(self.location, name))
+        except OSError:
+          pass
+
+  def invalidateWhere(self, match):
+    '''
+    Forget every result whose key match(key) returns true for, e.g. the describeLayout()
+    results for an sObject type whatever their record type Ids
+
+    Results persisted in location are each read to find their keys, so this is slower than
+    invalidate()
+    '''
+    self._lock.acquire()
+    try:
+      for key in [key for key in self._entries if match(key)]:
+        del self._entries[key]
+    finally:
+      self._lock.release()
+
+    if self.location is None or not os.path.isdir(self.location):
+      return
+
+    for name in os.listdir(self.location):
+      if not name.endswith('.describe'):
+        continue
+      filename = os.path.join(self.location, name)
+      try:
+        fp = open(filename, 'rb')
+      except IOError:
+        continue
+      try:
+        try:
+          storedKey = pickle.load(fp)[0]
+        except Exception:
+          continue
+      finally:
+        fp.close()
+
+      if match(storedKey):
+        try:
+          os.remove(filename)
+        except OSError:
+          pass
+
+class SessionStore(object):
+  '''
+  On-disk store of sessions, so short-lived processes can reuse one rather than each logging in
+
+  Sessions are kept per username, login server and client class, one file each, readable only
+  by their owner.  A session saved more than maxAge seconds ago is assumed to have timed out
+  (by default, Salesforce ends sessions after two hours of inactivity) and is never tried.
+  Sessions are saved when login() logs in or takes one up, not on every call, so maxAge
+  counts from the last login(); a session still in use elsewhere may be passed over, which
+  costs a login rather than a failed call.
+
+  lock() serializes workers around a key, so that when the session has expired only one of
+  them logs in and the rest pick up its new session.
+  '''
+  def __init__(self, location = None, maxAge = 7200):
+    '''
+    'location' : Directory to keep sessions in, or None for one in the system temp directory
+    'maxAge' : Seconds since a session was last saved by login() after which it isn't tried
+    '''
+    if location is None:
+      location = os.path.join(tempfile.gettempdir(), 'sforce', 'sessions')
+    self.location = location
+    self.maxAge = maxAge
+
+  def getKey(self, username, loginLocation, clientClass):
+    return sha1(repr((username.lower(), loginLocation, clientClass))).hexdigest()
+
+  def _filename(self, key, suffix = '.session'):
+    return os.path.join(self.location, key + suffix)
+
+  def _makedirs(self):
+    if not os.path.isdir(self.location):
+      try:
+        os.makedirs(self.location, 0700)
+      except OSError:
+        pass
+
+  def lock(self, key):
+    '''
+    Block until we hold the lock for key, and return a handle to pass to unlock()
+    '''
+    self._makedirs()
+    fp = open(self._filename(key, '.lock'), 'a')
+    if fcntl is not None:
+      fcntl.flock(fp.fileno(), fcntl.LOCK_EX)
+    return fp
+
+  def unlock(self, handle):
+    if fcntl is not None:
+      fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+    handle.close()
+
+  def get(self, key):
+    '''
+    Return (sessionId, serverUrl) for key, or None if there isn't a recent enough one
+    '''
+    try:
+      fp = open(self._filename(key))
+    except IOError:
+      return None
+    try:
+      try:
+        entry = json.load(fp)
+      except ValueError:
+        return None
+    finally:
+      fp.close()
+
+    if time.time() - entry.get('lastUsed', 0) >= self.maxAge:
+      return None
+    return (entry['sessionId'], entry['serverUrl'])
+
+  def put(self, key, sessionId, serverUrl):
+    '''
+    Save a session, or mark it as just taken up
+    '''
+    self._makedirs()
+    (fd, tmp) = tempfile.mkstemp(dir = self.location, suffix = '.tmp')
+    fp = os.fdopen(fd, 'w')
+    try:
+      json.dump({'sessionId': sessionId, 'serverUrl': serverUrl, 'lastUsed': time.time()}, fp)
+    finally:
+      fp.close()
+    try:
+      os.rename(tmp, self._filename(key))
+    except OSError:
+      # Windows won't rename over an existing file
+      self.invalidate(key)
+      os.rename(tmp, self._filename(key))
+
+  def invalidate(self, key):
+    try:
+      os.remove(self._filename(key))
+    except OSError, e:
+      if e.errno != errno.ENOENT:
+        raise
+
+# suds creates a class on the fly for each type it unmarshalls, which pickle can't find again
+# by name, so results are stored as plain tuples and lists and rebuilt on the way out
+
+def _freeze(value):
+  if isinstance(value, suds.sudsobject.Object):
+    return ('__sudsobject__', value.__class__.__name__, [(k, _freeze(v)) for (k, v) in value])
+  if isinstance(value, (list, tuple)):
+    return [_freeze(v) for v in value]
+  return value
+
+def _thaw(value):
+  if isinstance(value, tuple) and len(value) == 3 and value[0] == '__sudsobject__':
+    obj = suds.sudsobject.Factory.object(value[1])
+    for (k, v) in value[2]:
+      setattr(obj, k, _thaw(v))
+    return obj
+  if isinstance(value, list):
+    return [_thaw(v) for v in value]
+  return value
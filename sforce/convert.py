@@ -0,0 +1,177 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the (LGPL) GNU Lesser General Public License as
+# published by the Free Software Foundation; either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Library Lesser General Public License for more details at
+# ( http://www.gnu.org/licenses/lgpl.html ).
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+# Written by: David Lanstein ( lanstein yahoo com )
+
+import datetime
+import threading
+
+import suds.sudsobject
+
+from suds import WebFault
+
+from retry import faultCode
+
+# Salesforce's own formats are fixed, so slicing is several times faster than strptime()
+
+def toBoolean(value):
+  return value == 'true'
+
+def toDate(value):
+  # 2010-06-29
+  return datetime.date(int(value[0:4]), int(value[5:7]), int(value[8:10]))
+
+def toDatetime(value):
+  '''
+  2010-06-29T22:54:53.000Z, as a naive datetime in UTC
+  '''
+  if value[19:20] == '.':
+    microsecond = int(value[20:23]) * 1000
+  else:
+    microsecond = 0
+  return datetime.datetime(int(value[0:4]), int(value[5:7]), int(value[8:10]),
+                           int(value[11:13]), int(value[14:16]), int(value[17:19]), microsecond)
+
+def toTime(value):
+  # 22:54:53.000Z
+  if value[8:9] == '.':
+    microsecond = int(value[9:12]) * 1000
+  else:
+    microsecond = 0
+  return datetime.time(int(value[0:2]), int(value[3:5]), int(value[6:8]), microsecond)
+
+# Describe field type => converter from the Partner WSDL's string; anything else stays a string
+FIELD_CONVERTERS = {
+  'boolean': toBoolean,
+  'int': int,
+  'double': float,
+  'currency': float,
+  'percent': float,
+  'date': toDate,
+  'datetime': toDatetime,
+  'time': toTime,
+}
+
+class RecordConverter(object):
+  '''
+  Converts the string fields of Partner records to Python types, by their describeSObject()
+  field types
+
+  Records are converted a page at a time, a field (column) at a time.  The list of
+  (field, converter) pairs for each sObject type and field list is worked out once and
+  reused for every later page with the same shape.
+  '''
+  def __init__(self):
+    self._lock = threading.Lock()
+    # sObject type => ({lowercased field name: converter}, set of lowercased field names)
+    self._types = {}
+    # (sObject type, field names) => ((field, converter), ...), (relationship field, ...)
+    self._plans = {}
+
+  def _fieldTypes(self, sObjectType, describe):
+    types = self._types.get(sObjectType)
+    if types is not None:
+      return types
+
+    converters = {}
+    names = set()
+    try:
+      fields = describe(sObjectType).fields
+    except WebFault, e:
+      # e.g. AggregateResult, which isn't an sObject type; leave its fields alone.  Anything
+      # else (e.g. an expired session) mustn't be remembered as a type with no fields
+      if faultCode(e) != 'INVALID_TYPE':
+        raise
+      fields = []
+    for field in fields:
+      names.add(field.name.lower())
+      converter = FIELD_CONVERTERS.get(field.type)
+      if converter is not None:
+        converters[field.name.lower()] = converter
+
+    types = (converters, names)
+    self._lock.acquire()
+    try:
+      self._types[sObjectType] = types
+    finally:
+      self._lock.release()
+    return types
+
+  def _plan(self, sObjectType, keys, describe):
+    plan = self._plans.get((sObjectType, keys))
+    if plan is not None:
+      return plan
+
+    (converters, names) = self._fieldTypes(sObjectType, describe)
+    columns = []
+    relationships = []
+    for k in keys:
+      converter = converters.get(k.lower())
+      if converter is not None:
+        columns.append((k, converter))
+      elif k.lower() not in names and k not in ('type', 'fieldsToNull'):
+        # Not a field, so a parent (Account) or child (Contacts) relationship
+        relationships.append(k)
+
+    plan = (tuple(columns), tuple(relationships))
+    self._lock.acquire()
+    try:
+      self._plans[(sObjectType, keys)] = plan
+    finally:
+      self._lock.release()
+    return plan
+
+  def convert(self, records, describe):
+    '''
+    Convert the fields of records, already run through _stringifyResultRecords(), in place
+
+    'records' : List of records
+    'describe' : Function returning the DescribeSObjectResult for an sObject type, called
+                 the first time each type is seen
+    '''
+    # Records of one page normally share a shape, but polymorphic relationships (e.g. Owner)
+    # and fields left out of a search result mean they needn't
+    shapes = {}
+    for record in records:
+      if record is not None:
+        shapes.setdefault((record.type, tuple(record.__keylist__)), []).append(record)
+
+    Object = suds.sudsobject.Object
+    for ((sObjectType, keys), group) in shapes.items():
+      (columns, relationships) = self._plan(sObjectType, keys, describe)
+
+      for (k, converter) in columns:
+        for record in group:
+          values = record.__dict__
+          v = values[k]
+          if v is not None and isinstance(v, basestring):
+            values[k] = converter(v)
+
+      for k in relationships:
+        related = []
+        for record in group:
+          v = record.__dict__[k]
+          if not isinstance(v, Object):
+            continue
+          if hasattr(v, 'records'):
+            # A child relationship subquery's QueryResult
+            children = v.records
+            if isinstance(children, list):
+              related.extend(children)
+            elif children is not None:
+              related.append(children)
+          elif hasattr(v, 'type'):
+            related.append(v)
+        if related:
+          self.convert(related, describe)
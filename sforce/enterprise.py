@@ -22,16 +22,29 @@ class SforceEnterpriseClient(SforceBaseClient):
   def __init__(self, wsdl, **kwargs):
     super(SforceEnterpriseClient, self).__init__(wsdl, **kwargs)
 
+  # Toolkit-specific calls
+
+  def _prepareBatch(self, call, batch):
+    '''
+    Marshall each batch of sObjects just before it is sent, rather than all of them up front
+    '''
+    if call in ('create', 'update', 'upsert'):
+      return self._marshallSObjects(batch)
+    return batch
+
+  def _normalizeResult(self, call, result):
+    # HACK <result/> gets unmarshalled as '' instead of an empty SearchResult
+    # return an empty SearchResult instead
+    if call == 'search' and result == '':
+      return self._sforce.factory.create('SearchResult')
+    return result
+
   # Core calls
 
   def convertLead(self, leadConverts):
     xml = self._marshallSObjects(leadConverts)
     return super(SforceEnterpriseClient, self).convertLead(xml)
 
-  def create(self, sObjects):
-    xml = self._marshallSObjects(sObjects)
-    return super(SforceEnterpriseClient, self).create(xml)
-
   def merge(self, sObjects):
     xml = self._marshallSObjects(sObjects)
     return super(SforceEnterpriseClient, self).merge(xml)
@@ -45,25 +58,39 @@ class SforceEnterpriseClient(SforceBaseClient):
     Currently, this uses query() to emulate the retrieve() functionality, as suds' unmarshaller
     borks on the sf: prefix that Salesforce prepends to all fields other than Id and type (any
     fields not defined in the 'sObject' section of the Enterprise WSDL)
+
+    Ids are queried in batches of WHERE Id IN (...), concurrently when setConcurrency() > 1
     '''
     # HACK HACK HACKITY HACK
     
     if not isinstance(ids, (list, tuple)):
       ids = (ids, )
 
-    # The only way to make sure we return objects in the correct order, and return None where an
-    # object can't be retrieved by Id, is to query each ID individually
+    # Salesforce faults a query that selects a field twice, and Id is always selected
+    fields = ['Id'] + [field.strip() for field in fieldList.split(',')
+                       if field.strip() and field.strip().lower() != 'id']
+
+    def fetch(client, batch):
+      quoted = ["'" + id.replace('\\', '\\\\').replace("'", "\\'") + "'" for id in batch]
+      queryString = 'SELECT ' + ', '.join(fields) + ' FROM ' + sObjectType + ' WHERE Id IN (' + ', '.join(quoted) + ')'
+      # A batch can span more than one page if QueryOptions.batchSize is small
+      return list(client.queryIter(queryString, prefetch = False))
+
+    # Salesforce always returns 18-character Ids, but callers may pass either form.  The first
+    # 15 characters are the (case-sensitive) Id proper; the last 3 are a checksum of its case.
+    records = {}
+    for batch in self._mapBatches(fetch, ids):
+      for record in batch:
+        records[record.Id[:15]] = record
+
+    # Return objects in the order they were asked for, with None where an Id wasn't found
     sObjects = []
     for id in ids:
-      queryString = 'SELECT Id, ' + fieldList + ' FROM ' + sObjectType + ' WHERE Id = \'' + id + '\' LIMIT 1'
-      queryResult = self.query(queryString)
-
-      if queryResult.size == 0:
+      record = records.get(id[:15])
+      if record is None:
         sObjects.append(None)
         continue
 
-      # There will exactly one record in queryResult.records[] at this point
-      record = queryResult.records[0]
       sObject = self.generateObject(sObjectType)
       for (k, v) in record:
         setattr(sObject, k, v)
@@ -71,24 +98,6 @@ class SforceEnterpriseClient(SforceBaseClient):
 
     return self._handleResultTyping(sObjects)
   
-  def search(self, searchString):
-    searchResult = super(SforceEnterpriseClient, self).search(searchString)
-
-    # HACK <result/> gets unmarshalled as '' instead of an empty SearchResult
-    # return an empty SearchResult instead
-    if searchResult == '':
-      return self._sforce.factory.create('SearchResult')
-
-    return searchResult
-
-  def update(self, sObjects):
-    xml = self._marshallSObjects(sObjects)
-    return super(SforceEnterpriseClient, self).update(xml)
-
-  def upsert(self, externalIdFieldName, sObjects):
-    xml = self._marshallSObjects(sObjects)
-    return super(SforceEnterpriseClient, self).upsert(externalIdFieldName, xml)
-
   # Utility calls
 
   def sendEmail(self, sObjects):
@@ -0,0 +1,458 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the (LGPL) GNU Lesser General Public License as
+# published by the Free Software Foundation; either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Library Lesser General Public License for more details at
+# ( http://www.gnu.org/licenses/lgpl.html ).
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+# Written by: David Lanstein ( lanstein yahoo com )
+
+'''
+Streams query results to CSV, JSON lines or column arrays a page at a time
+
+The pages are parsed straight from the SOAP response, so no suds objects are built for the
+records; memory use is one page plus whatever the writer keeps.  See
+SforceBaseClient.queryExport().
+'''
+
+import csv
+import re
+
+from collections import OrderedDict
+from cStringIO import StringIO
+
+try:
+  from xml.etree.cElementTree import iterparse
+except ImportError:
+  from xml.etree.ElementTree import iterparse
+
+try:
+  import json
+except ImportError:
+  # Python 2.5
+  import simplejson as json
+
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
+from suds import WebFault
+
+from convert import FIELD_CONVERTERS
+from retry import faultCode
+from worker import spawn
+
+XSI_NIL = '{http://www.w3.org/2001/XMLSchema-instance}nil'
+
+#
+# Writers
+#
+
+class ExportWriter(object):
+  '''
+  Base class for the writers passed to SforceBaseClient.queryExport()
+
+  'typed' says whether the writer wants the describe field type of each column passed to
+  begin(); otherwise types is None.
+  '''
+  typed = False
+
+  def begin(self, columns, types):
+    '''
+    'columns' : Column names, e.g. ['Id', 'Account.Name']
+    'types' : describeSObject() field type of each column (e.g. 'boolean'), or None where
+              unknown
+    '''
+    pass
+
+  def writeRows(self, rows):
+    '''
+    'rows' : List of rows for one page of results, each a list of strings (or None for
+             nulls) in column order
+    '''
+    pass
+
+  def end(self):
+    pass
+
+def _converters(types, columns, wanted = None):
+  converters = []
+  for i in range(len(columns)):
+    fieldType = types and types[i] or None
+    if wanted is not None and fieldType not in wanted:
+      converters.append(None)
+    else:
+      converters.append(FIELD_CONVERTERS.get(fieldType))
+  return converters
+
+def _convert(converter, value):
+  if value is None:
+    return None
+  return converter(value)
+
+class CSVWriter(ExportWriter):
+  '''
+  Writes rows to a file as CSV, with a header row, values as Salesforce formats them and
+  nulls as empty
+  '''
+  def __init__(self, fp, header = True, encoding = 'utf-8', **kwargs):
+    '''
+    'fp' : File-like object to write to
+    'header' : Whether to write the column names first
+    'encoding' : Encoding for non-ASCII values
+    'kwargs' : Formatting parameters for csv.writer(), e.g. delimiter = '\\t'
+    '''
+    self.writer = csv.writer(fp, **kwargs)
+    self.header = header
+    self.encoding = encoding
+
+  def begin(self, columns, types):
+    if self.header:
+      self.writer.writerow(columns)
+
+  def writeRows(self, rows):
+    encoding = self.encoding
+    self.writer.writerows([[v is not None and v.encode(encoding) or '' for v in row] for row in rows])
+
+class JSONLWriter(ExportWriter):
+  '''
+  Writes rows to a file as JSON lines, one object per record
+
+  boolean and numeric fields become JSON booleans and numbers; everything else, including
+  dates, stays a string.
+  '''
+  typed = True
+
+  def __init__(self, fp):
+    '''
+    'fp' : File-like object to write to
+    '''
+    self.fp = fp
+
+  def begin(self, columns, types):
+    self.columns = columns
+    self.converters = _converters(types, columns, ('boolean', 'int', 'double', 'currency', 'percent'))
+
+  def writeRows(self, rows):
+    columns = self.columns
+    converters = self.converters
+    lines = []
+    for row in rows:
+      values = OrderedDict()
+      for (column, converter, v) in zip(columns, converters, row):
+        if converter is not None:
+          v = _convert(converter, v)
+        values[column] = v
+      lines.append(json.dumps(values))
+    self.fp.write('\n'.join(lines) + '\n')
+
+# describe field type => NumPy dtype; other columns get object arrays
+NUMPY_TYPES = {
+  'boolean': 'bool',
+  'int': 'int64',
+  'double': 'float64',
+  'currency': 'float64',
+  'percent': 'float64',
+  'date': 'datetime64[D]',
+  'datetime': 'datetime64[ms]',
+}
+
+class ColumnWriter(ExportWriter):
+  '''
+  Collects rows into one array per column, with values converted to Python types as
+  setTypedFields() does
+
+  With NumPy installed (and useNumpy), each column is a NumPy array of the field's type:
+  float64 for double, currency and percent fields (nulls are NaN), datetime64 for date and
+  datetime fields (nulls are NaT), bool and int64 for boolean and int fields without nulls,
+  and object arrays for everything else.  Without it, each column is a list.
+
+  Once queryExport() returns, columns is an OrderedDict of column name => array.
+  '''
+  typed = True
+
+  def __init__(self, useNumpy = True):
+    self.useNumpy = useNumpy and numpy is not None
+    self.columns = None
+
+  def begin(self, columns, types):
+    self.names = columns
+    self.types = types or [None] * len(columns)
+    self.converters = _converters(types, columns)
+    self.chunks = [[] for column in columns]
+
+  def writeRows(self, rows):
+    if not rows:
+      return
+    for (i, values) in enumerate(zip(*rows)):
+      converter = self.converters[i]
+      if converter is not None:
+        values = [_convert(converter, v) for v in values]
+      if self.useNumpy:
+        # Converting a page at a time keeps the Python objects down to one page's worth
+        values = self._toArray(values, self.types[i])
+      else:
+        values = list(values)
+      self.chunks[i].append(values)
+
+  def _toArray(self, values, fieldType):
+    dtype = NUMPY_TYPES.get(fieldType, object)
+    if dtype not in (object, 'datetime64[D]', 'datetime64[ms]') and None in values:
+      if dtype == 'float64':
+        values = [v is None and numpy.nan or v for v in values]
+      else:
+        dtype = object
+    return numpy.array(values, dtype = dtype)
+
+  def end(self):
+    self.columns = OrderedDict()
+    for (i, name) in enumerate(self.names):
+      chunks = self.chunks[i]
+      if self.useNumpy:
+        if chunks:
+          column = numpy.concatenate(chunks)
+        else:
+          column = numpy.array([], dtype = NUMPY_TYPES.get(self.types[i], object))
+      else:
+        column = []
+        for chunk in chunks:
+          column.extend(chunk)
+      self.columns[name] = column
+    self.chunks = None
+
+#
+# Parsing
+#
+
+def _splitTopLevel(text, separator):
+  parts = []
+  depth = 0
+  start = 0
+  for (i, c) in enumerate(text):
+    if c == '(':
+      depth += 1
+    elif c == ')':
+      depth -= 1
+    elif c == separator and depth == 0:
+      parts.append(text[start:i])
+      start = i + 1
+  parts.append(text[start:])
+  return parts
+
+_selectPattern = re.compile(r'^\s*SELECT\s+(.*?)\s+FROM\s+(\w+)', re.IGNORECASE | re.DOTALL)
+
+# Functions whose column is named after the field they wrap rather than exprN
+_FIELD_FUNCTIONS = ('tolabel', 'convertcurrency', 'format')
+
+def parseSelect(queryString):
+  '''
+  Return (column names, sObject type) for a SOQL query
+
+  Child relationship subqueries are left out; unaliased aggregates are named expr0, expr1,
+  etc., and unaliased toLabel(), convertCurrency() and format() after their field, as
+  Salesforce names them.
+  '''
+  # Subqueries contain FROM too, so find the outer one by blanking out everything in brackets.
+  # Blank with something other than whitespace, or a trailing function call's arguments
+  # would be taken for the space before FROM
+  depth = 0
+  masked = []
+  for c in queryString:
+    if c == '(':
+      depth += 1
+    if depth > 0:
+      masked.append('_')
+    else:
+      masked.append(c)
+    if c == ')':
+      depth -= 1
+  match = _selectPattern.match(''.join(masked))
+  if match is None:
+    raise ValueError('Not a SOQL query: %s' % queryString)
+
+  selectList = queryString[match.start(1):match.end(1)]
+  columns = []
+  expressions = 0
+  for item in _splitTopLevel(selectList, ','):
+    item = item.strip()
+    if not item or item.startswith('('):
+      continue
+    if '(' in item:
+      alias = item[item.rindex(')') + 1:].split()
+      function = item[:item.index('(')].strip().lower()
+      if alias:
+        columns.append(alias[-1])
+      elif function in _FIELD_FUNCTIONS:
+        columns.append(item[item.index('(') + 1:item.rindex(')')].strip())
+      else:
+        columns.append('expr%d' % expressions)
+        expressions += 1
+    else:
+      columns.append(item.split()[0])
+  return (columns, match.group(2))
+
+def fieldTypes(describe, sObjectType, columns):
+  '''
+  Return the describe field type of each column, following relationships (e.g.
+  Account.Owner.IsActive) through their referenced types; None where it can't be told
+
+  'describe' : Function returning the DescribeSObjectResult for an sObject type
+  '''
+  describes = {}
+  def fields(sObjectType):
+    if sObjectType not in describes:
+      try:
+        describes[sObjectType] = describe(sObjectType).fields
+      except WebFault, e:
+        # e.g. AggregateResult, as in convert.RecordConverter; anything else (e.g. an expired
+        # session) is raised rather than exporting the rest untyped
+        if faultCode(e) != 'INVALID_TYPE':
+          raise
+        describes[sObjectType] = []
+    return describes[sObjectType]
+
+  types = []
+  for column in columns:
+    path = column.lower().split('.')
+    currentType = sObjectType
+    fieldType = None
+    for (i, name) in enumerate(path):
+      last = (i == len(path) - 1)
+      match = None
+      for field in fields(currentType):
+        if last and field.name.lower() == name:
+          match = field
+          break
+        if not last and (getattr(field, 'relationshipName', None) or '').lower() == name:
+          match = field
+          break
+      if match is None:
+        break
+      if last:
+        fieldType = match.type
+        break
+      referenceTo = getattr(match, 'referenceTo', None)
+      if isinstance(referenceTo, list):
+        if len(referenceTo) != 1:
+          # Polymorphic, e.g. Owner
+          break
+        referenceTo = referenceTo[0]
+      if not referenceTo:
+        break
+      currentType = referenceTo
+    types.append(fieldType)
+  return types
+
+def _localName(tag):
+  return tag[tag.rfind('}') + 1:]
+
+def _flatten(element, prefix, values):
+  for child in element:
+    name = prefix + _localName(child.tag)
+    if len(child):
+      if _localName(child[0].tag) == 'done':
+        # A child relationship's QueryResult, which has no place in a row
+        continue
+      _flatten(child, name + '.', values)
+    elif _localName(child.tag) == 'type':
+      continue
+    else:
+      key = name.lower()
+      # The Partner WSDL repeats Id
+      if key not in values:
+        if child.get(XSI_NIL) == 'true':
+          values[key] = None
+        else:
+          values[key] = child.text or ''
+
+def parsePage(xml, columns):
+  '''
+  Parse a raw query(), queryAll() or queryMore() response into (rows, done, queryLocator)
+
+  Each row is a list of the values of columns (matched case-insensitively; parent
+  relationship fields as e.g. 'Account.Name'), as strings or None.
+  '''
+  keys = [column.lower() for column in columns]
+  rows = []
+  done = True
+  queryLocator = None
+
+  depth = 0
+  resultDepth = None
+  for (event, element) in iterparse(StringIO(xml), ('start', 'end')):
+    if event == 'start':
+      depth += 1
+      if resultDepth is None and _localName(element.tag) == 'result':
+        resultDepth = depth
+      continue
+
+    if resultDepth is not None and depth == resultDepth + 1:
+      name = _localName(element.tag)
+      if name == 'records':
+        values = {}
+        _flatten(element, '', values)
+        rows.append([values.get(key) for key in keys])
+        # Let the record's elements go as we go
+        element.clear()
+      elif name == 'done':
+        done = (element.text == 'true')
+      elif name == 'queryLocator':
+        if element.get(XSI_NIL) != 'true':
+          queryLocator = element.text
+    depth -= 1
+  return (rows, done, queryLocator)
+
+def exportQuery(client, queryString, writer, queryAll = False, columns = None, prefetch = True):
+  '''
+  See SforceBaseClient.queryExport()
+  '''
+  (selected, sObjectType) = parseSelect(queryString)
+  if columns is None:
+    columns = selected
+  columns = list(columns)
+
+  types = None
+  if writer.typed:
+    types = fieldTypes(client.describeSObject, sObjectType, columns)
+
+  raw = client._rawClone()
+  if queryAll:
+    xml = raw._invoke('queryAll', queryString)
+  else:
+    xml = raw._invoke('query', queryString)
+
+  if prefetch:
+    fetcher = raw._clone()
+
+  writer.begin(columns, types)
+  count = 0
+  while True:
+    (rows, done, queryLocator) = parsePage(xml, columns)
+    xml = None
+
+    nextPage = None
+    if not done and prefetch:
+      nextPage = spawn(fetcher._invoke, 'queryMore', queryLocator)
+
+    writer.writeRows(rows)
+    count += len(rows)
+    rows = None
+
+    if done:
+      break
+
+    if nextPage is not None:
+      xml = nextPage.result()
+    else:
+      xml = raw._invoke('queryMore', queryLocator)
+
+  writer.end()
+  return count
@@ -0,0 +1,194 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the (LGPL) GNU Lesser General Public License as
+# published by the Free Software Foundation; either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Library Lesser General Public License for more details at
+# ( http://www.gnu.org/licenses/lgpl.html ).
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+# Written by: David Lanstein ( lanstein yahoo com )
+
+import copy
+import threading
+
+from timeit import default_timer
+
+from suds.transport import Transport
+
+# The CallInfo of the call in progress on each thread, for MeasuringTransport to fill in
+_current = threading.local()
+
+class CallInfo(object):
+  '''
+  What one API call cost; passed to CallListener.callFinished()
+
+  Times are in seconds:
+
+    marshal : Building the request, ours and suds', up to handing it to the transport
+    network : Sending the request and reading the response
+    unmarshal : suds parsing the response
+    normalize : Our post-processing of the result (e.g. the Partner client's
+                _stringifyResultRecords())
+    total : All of the above
+
+  requestBytes and responseBytes are the sizes of the (uncompressed) SOAP envelopes.
+  requestRecords is the number of records sent (e.g. by create()), and responseRecords the
+  number returned (results, or records on this page of a query).  error is the exception the
+  call raised, if any.
+  '''
+  def __init__(self, call):
+    self.call = call
+    self.started = default_timer()
+    self.sent = None
+    self.received = None
+    self.unmarshalled = None
+    self.finished = None
+
+    self.requestBytes = 0
+    self.responseBytes = 0
+    self.requestRecords = 0
+    self.responseRecords = 0
+    self.error = None
+
+  def _span(self, start, end):
+    if start is None or end is None:
+      return 0.0
+    return end - start
+
+  @property
+  def marshal(self):
+    return self._span(self.started, self.sent)
+
+  @property
+  def network(self):
+    return self._span(self.sent, self.received)
+
+  @property
+  def unmarshal(self):
+    return self._span(self.received, self.unmarshalled)
+
+  @property
+  def normalize(self):
+    return self._span(self.unmarshalled, self.finished)
+
+  @property
+  def total(self):
+    return self._span(self.started, self.finished)
+
+  def __repr__(self):
+    return '<CallInfo %s %.1fms (marshal %.1fms, network %.1fms, unmarshal %.1fms, normalize %.1fms)%s>' % (
+      self.call, self.total * 1000, self.marshal * 1000, self.network * 1000, self.unmarshal * 1000,
+      self.normalize * 1000, self.error is not None and ' failed' or '')
+
+class CallListener(object):
+  '''
+  Base class for objects passed to SforceBaseClient.addListener()
+
+  callFinished() runs on the thread that made the call, after it has finished (successfully
+  or not), so it should be quick, and thread-safe if the client makes concurrent calls.
+  '''
+  def callFinished(self, info):
+    '''
+    'info' : CallInfo for the call
+    '''
+    pass
+
+class CallStats(CallListener):
+  '''
+  A listener that totals up calls, errors, time, bytes and records per call name
+
+  Attach one per job to attribute API usage (every call counts against the org's daily limit)
+  and latency to that job.
+  '''
+  _fields = ('calls', 'errors', 'total', 'marshal', 'network', 'unmarshal', 'normalize',
+             'requestBytes', 'responseBytes', 'requestRecords', 'responseRecords')
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._stats = {}
+
+  def callFinished(self, info):
+    self._lock.acquire()
+    try:
+      stats = self._stats.get(info.call)
+      if stats is None:
+        stats = self._stats[info.call] = dict([(field, 0) for field in self._fields])
+      stats['calls'] += 1
+      if info.error is not None:
+        stats['errors'] += 1
+      for field in self._fields[2:]:
+        stats[field] += getattr(info, field)
+    finally:
+      self._lock.release()
+
+  def getStats(self):
+    '''
+    Return {call name: {'calls': ..., 'errors': ..., 'total': seconds, ...}}, plus the sum
+    over all calls under None
+    '''
+    self._lock.acquire()
+    try:
+      stats = dict([(call, dict(values)) for (call, values) in self._stats.items()])
+    finally:
+      self._lock.release()
+
+    overall = dict([(field, 0) for field in self._fields])
+    for values in stats.values():
+      for field in self._fields:
+        overall[field] += values[field]
+    stats[None] = overall
+    return stats
+
+  def reset(self):
+    self._lock.acquire()
+    try:
+      self._stats = {}
+    finally:
+      self._lock.release()
+
+def begin(info):
+  _current.info = info
+
+def end():
+  _current.info = None
+
+class MeasuringTransport(Transport):
+  '''
+  Wraps the client's transport while listeners are attached, to time the network round trip
+  and count the bytes of the call in progress on this thread
+  '''
+  def __init__(self, transport):
+    Transport.__init__(self)
+    self.transport = transport
+    # suds links the client's options (proxy, timeout, etc.) to its transport's; share the
+    # wrapped transport's, so they stay linked to it
+    self.options = transport.options
+
+  # suds deep-copies its options when a client is cloned; give the clone a wrapper around
+  # whatever copying the wrapped transport gives
+  def __deepcopy__(self, memo):
+    return MeasuringTransport(copy.deepcopy(self.transport, memo))
+
+  def open(self, request):
+    return self.transport.open(request)
+
+  def send(self, request):
+    info = getattr(_current, 'info', None)
+    if info is None:
+      return self.transport.send(request)
+
+    info.requestBytes += len(request.message)
+    info.sent = default_timer()
+    try:
+      reply = self.transport.send(request)
+    finally:
+      info.received = default_timer()
+    if reply is not None and reply.message is not None:
+      info.responseBytes += len(reply.message)
+    return reply
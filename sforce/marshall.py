@@ -0,0 +1,193 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the (LGPL) GNU Lesser General Public License as
+# published by the Free Software Foundation; either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Library Lesser General Public License for more details at
+# ( http://www.gnu.org/licenses/lgpl.html ).
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+# Written by: David Lanstein ( lanstein yahoo com )
+
+import datetime
+import threading
+
+import suds.sudsobject
+from suds.sax.element import Element
+from suds.sax.text import Raw
+
+from record import Record
+
+# These objects are defined in the Partner/Enterprise WSDL's own namespace rather than in the
+# sObject namespace
+TNS_TYPES = ('LeadConvert', 'SingleEmailMessage', 'MassEmailMessage')
+
+def formatValue(value):
+  '''
+  Format a field value the way the API expects, the reverse of sforce.convert: booleans as
+  true/false, datetimes as 2010-06-29T22:54:53.000Z, and dates and times in ISO 8601 too
+
+  Naive datetimes and times are taken to be in UTC, as sforce.convert returns them; aware ones
+  are converted to UTC.
+  '''
+  if isinstance(value, bool):
+    if value:
+      return 'true'
+    return 'false'
+  if isinstance(value, datetime.datetime):
+    if value.tzinfo is not None:
+      value = (value - value.utcoffset()).replace(tzinfo = None)
+    return '%s.%03dZ' % (value.strftime('%Y-%m-%dT%H:%M:%S'), value.microsecond // 1000)
+  if isinstance(value, datetime.date):
+    return value.isoformat()
+  if isinstance(value, datetime.time):
+    if value.tzinfo is not None:
+      offset = value.utcoffset()
+      value = (datetime.datetime.combine(datetime.date(2000, 1, 1), value.replace(tzinfo = None)) -
+               offset).time()
+    return '%s.%03dZ' % (value.strftime('%H:%M:%S'), value.microsecond // 1000)
+  return unicode(value)
+
+def escape(value):
+  '''
+  Format (see formatValue()) and escape a field value for use as XML character data
+
+  Unlike suds, which leaves anything that already looks like an entity alone, this escapes
+  every '&', so a value such as 'AT&amp;T' reaches Salesforce as written.
+  '''
+  if not isinstance(value, basestring):
+    value = formatValue(value)
+  if '&' in value:
+    value = value.replace('&', '&amp;')
+  if '<' in value:
+    value = value.replace('<', '&lt;')
+  if '>' in value:
+    value = value.replace('>', '&gt;')
+  if '"' in value:
+    value = value.replace('"', '&quot;')
+  if "'" in value:
+    value = value.replace("'", '&apos;')
+  return value
+
+def _type(obj):
+  '''
+  The sObject type of a suds object, Record or dict, or None
+  '''
+  if isinstance(obj, dict):
+    return obj.get('type')
+  return getattr(obj, 'type', None)
+
+class SObjectMarshaller(object):
+  '''
+  Marshalls sObjects straight into XML text
+
+  Building a suds Element for every field of every record, only for suds to serialize the
+  tree again, is a large share of the cost of a create()/update()/upsert().  Instead we write
+  the fields of each record as one string, and hand suds a single element per record with
+  that string as its (already escaped) content.
+
+  The tags for each distinct field list (in practice, one or two per sObject type) are
+  built once and reused.
+  '''
+  # Layouts are tiny, but don't let a caller with endlessly varying field lists grow the
+  # cache forever
+  maxLayouts = 1000
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    # tuple of field names => tuple of (name, open tag, close tag, nil tag)
+    self._layouts = {}
+
+  def _layout(self, keys):
+    layout = self._layouts.get(keys)
+    if layout is not None:
+      return layout
+
+    layout = tuple([(k, '<%s>' % k, '</%s>' % k, '<%s xsi:nil="true"/>' % k)
+                    for k in keys if k != 'type'])
+
+    self._lock.acquire()
+    try:
+      if len(self._layouts) >= self.maxLayouts:
+        self._layouts.clear()
+      self._layouts[keys] = layout
+    finally:
+      self._lock.release()
+    return layout
+
+  def _items(self, obj):
+    '''
+    Return (field names, field values) without going through suds' Object iterator
+    '''
+    if isinstance(obj, suds.sudsobject.Object):
+      return (tuple(obj.__keylist__), obj.__dict__)
+    if isinstance(obj, Record):
+      return (obj._fields, dict(zip(obj._fields, obj.values())))
+    if isinstance(obj, dict):
+      # A dict's keys have no order of their own; fieldsToNull and Id come first in an sObject
+      keys = sorted(obj, key = lambda k: (k != 'fieldsToNull', k != 'Id', k))
+      return (tuple(keys), obj)
+    items = list(obj)
+    return (tuple([k for (k, v) in items]), dict(items))
+
+  def _write(self, obj, parts):
+    '''
+    Append the XML for obj's fields to parts
+    '''
+    (keys, values) = self._items(obj)
+    for (k, openTag, closeTag, nilTag) in self._layout(keys):
+      v = values[k]
+
+      # This is here to avoid 'duplicate values' error when setting a field in fieldsToNull
+      # Even a tag like <FieldName/> will trigger it
+      if v is None:
+        parts.append(nilTag)
+      elif isinstance(v, (list, tuple)):
+        for value in v:
+          parts.append(openTag)
+          parts.append(escape(value))
+          parts.append(closeTag)
+      elif isinstance(v, (suds.sudsobject.Object, Record, dict)):
+        if _type(v) is None:
+          # Not an sObject, e.g. a child relationship's QueryResult, which can't be saved
+          continue
+        parts.append('<%s xsi:type="%s%s">' % (k, self._nsPrefix(v), _type(v)))
+        self._write(v, parts)
+        parts.append(closeTag)
+      else:
+        parts.append(openTag)
+        parts.append(escape(v))
+        parts.append(closeTag)
+
+  def _nsPrefix(self, obj):
+    if _type(obj) in TNS_TYPES:
+      return 'tns:'
+    return 'ens:'
+
+  def marshall(self, sObjects, tag = 'sObjects'):
+    '''
+    Marshall generic sObjects into a list of SAX elements, one per sObject
+
+    tag param is for nested objects (e.g. MergeRequest) where
+    key: object must be in <key/>, not <sObjects/>
+    '''
+    if not isinstance(sObjects, (tuple, list)):
+      sObjects = (sObjects, )
+    # The first object decides the namespace for all of them
+    nsPrefix = self._nsPrefix(sObjects[0])
+
+    li = []
+    for obj in sObjects:
+      parts = []
+      self._write(obj, parts)
+
+      el = Element(tag)
+      el.set('xsi:type', nsPrefix + _type(obj))
+      el.setText(Raw(u''.join(parts)))
+      li.append(el)
+    return li
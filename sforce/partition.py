@@ -0,0 +1,302 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the (LGPL) GNU Lesser General Public License as
+# published by the Free Software Foundation; either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Library Lesser General Public License for more details at
+# ( http://www.gnu.org/licenses/lgpl.html ).
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+# Written by: David Lanstein ( lanstein yahoo com )
+
+'''
+Splits a query into disjoint ranges of a field and runs them concurrently; see
+SforceBaseClient.queryPartitioned()
+'''
+
+import calendar
+import datetime
+import Queue
+import re
+import sys
+import threading
+
+from convert import toDate, toDatetime
+from export import parsePage, parseSelect
+from worker import WorkerPool
+
+# Salesforce Ids are base 62 numbers, with digits that sort in this (ASCII) order
+BASE62 = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+
+def idToNumber(id):
+  n = 0
+  for c in id[:15]:
+    n = n * 62 + BASE62.index(c)
+  return n
+
+def numberToId(n):
+  digits = []
+  for i in range(15):
+    (n, digit) = divmod(n, 62)
+    digits.append(BASE62[digit])
+  digits.reverse()
+  return ''.join(digits)
+
+#
+# Rewriting SOQL
+#
+
+def _mask(queryString):
+  '''
+  Blank out string literals and anything in brackets (e.g. subqueries), so keywords found in
+  what's left are the outer query's
+  '''
+  masked = []
+  depth = 0
+  quoted = False
+  escaped = False
+  for c in queryString:
+    if quoted:
+      masked.append(' ')
+      if escaped:
+        escaped = False
+      elif c == '\\':
+        escaped = True
+      elif c == "'":
+        quoted = False
+      continue
+    if c == "'":
+      quoted = True
+      masked.append(' ')
+      continue
+    if c == '(':
+      depth += 1
+    if depth > 0:
+      masked.append(' ')
+    else:
+      masked.append(c)
+    if c == ')':
+      depth -= 1
+  return ''.join(masked)
+
+_fromPattern = re.compile(r'\bFROM\s+\w+', re.IGNORECASE)
+_wherePattern = re.compile(r'\bWHERE\b', re.IGNORECASE)
+_tailPattern = re.compile(r'\b(WITH|GROUP\s+BY|HAVING|ORDER\s+BY|LIMIT|OFFSET|FOR)\b', re.IGNORECASE)
+# Clauses that would apply to each partition separately, rather than to the whole result
+_unpartitionable = ('GROUP', 'HAVING', 'ORDER', 'LIMIT', 'OFFSET', 'FOR')
+
+def splitQuery(queryString):
+  '''
+  Split a SOQL query into (SELECT ... FROM ..., WHERE condition or None, anything after it)
+  '''
+  masked = _mask(queryString)
+  fromMatch = _fromPattern.search(masked)
+  if fromMatch is None:
+    raise ValueError('Not a SOQL query: %s' % queryString)
+
+  tailMatch = _tailPattern.search(masked, fromMatch.end())
+  if tailMatch is None:
+    end = len(queryString)
+  else:
+    end = tailMatch.start()
+    if tailMatch.group(1).split()[0].upper() in _unpartitionable:
+      raise ValueError("Can't partition a query with %s: %s" % (tailMatch.group(1).upper(), queryString))
+
+  whereMatch = _wherePattern.search(masked, fromMatch.end(), end)
+  if whereMatch is None:
+    return (queryString[:end].strip(), None, queryString[end:].strip())
+  return (queryString[:whereMatch.start()].strip(), queryString[whereMatch.end():end].strip(),
+          queryString[end:].strip())
+
+def _withCondition(head, where, condition, tail, orderBy = None):
+  conditions = [c for c in (where and '(%s)' % where, condition) if c]
+  parts = [head]
+  if conditions:
+    parts.append('WHERE ' + ' AND '.join(conditions))
+  if tail:
+    parts.append(tail)
+  if orderBy:
+    parts.append('ORDER BY ' + orderBy)
+  return ' '.join(parts)
+
+#
+# Finding the ranges
+#
+
+def _bound(client, queryString, field, descending):
+  '''
+  The lowest (or highest) non-null value of field that the query matches, as Salesforce
+  formats it, or None
+  '''
+  (head, where, tail) = splitQuery(queryString)
+  sObjectType = parseSelect(queryString)[1]
+  condition = None
+  if field.lower() != 'id':
+    condition = '%s != null' % field
+  soql = _withCondition('SELECT %s FROM %s' % (field, sObjectType), where, condition, tail,
+                        field + (descending and ' DESC' or ' ASC') + ' LIMIT 1')
+  (rows, done, queryLocator) = parsePage(client._invoke('query', soql), [field])
+  if not rows:
+    return None
+  return rows[0][0]
+
+def _interpolate(low, high, partitions):
+  '''
+  Up to partitions - 1 distinct values evenly spaced strictly between low and high
+  '''
+  boundaries = []
+  for i in range(1, partitions):
+    boundary = low + (high - low) * i // partitions
+    if boundary > low and (not boundaries or boundary > boundaries[-1]):
+      boundaries.append(boundary)
+  return boundaries
+
+def boundaries(client, queryString, field, partitions):
+  '''
+  Return SOQL literals splitting the values of field that the query matches into up to
+  partitions ranges of similar width, found from its lowest and highest values; [] if the
+  query matches nothing
+
+  field must be Id, or a date or datetime field.
+  '''
+  raw = client._rawClone()
+  low = _bound(raw, queryString, field, False)
+  high = _bound(raw, queryString, field, True)
+  if low is None or high is None:
+    return []
+
+  if field.lower() == 'id':
+    return ["'%s'" % numberToId(n) for n in _interpolate(idToNumber(low), idToNumber(high), partitions)]
+
+  if 'T' in low:
+    low = calendar.timegm(toDatetime(low).timetuple())
+    high = calendar.timegm(toDatetime(high).timetuple())
+    return [datetime.datetime.utcfromtimestamp(n).strftime('%Y-%m-%dT%H:%M:%SZ')
+            for n in _interpolate(low, high, partitions)]
+
+  low = toDate(low).toordinal()
+  high = toDate(high).toordinal()
+  return [datetime.date.fromordinal(n).isoformat() for n in _interpolate(low, high, partitions)]
+
+def partitionQueries(client, queryString, partitions, field = 'Id', ordered = False):
+  '''
+  Return queries for disjoint ranges of field that between them match what queryString does
+
+  With ordered, each is sorted by field, and they're in the order of their ranges.
+  '''
+  (head, where, tail) = splitQuery(queryString)
+  orderBy = ordered and field or None
+
+  literals = boundaries(client, queryString, field, partitions)
+  conditions = []
+  if field.lower() != 'id':
+    # Nulls are in no range; SOQL sorts them first
+    conditions.append('%s = null' % field)
+  previous = None
+  for literal in literals + [None]:
+    parts = []
+    if previous is not None:
+      parts.append('%s >= %s' % (field, previous))
+    if literal is not None:
+      parts.append('%s < %s' % (field, literal))
+    conditions.append(' AND '.join(parts) or None)
+    previous = literal
+
+  return [_withCondition(head, where, condition, tail, orderBy) for condition in conditions]
+
+#
+# Running them
+#
+
+def _put(queue, item, cancelled):
+  '''
+  Put item on the queue once there's room, unless the consumer gives up first
+  '''
+  while not cancelled.isSet():
+    try:
+      queue.put(item, True, 0.1)
+      return True
+    except Queue.Full:
+      pass
+  return False
+
+def partitionedQuery(client, queryString, partitions = 4, field = 'Id', ordered = False,
+                     queryAll = False, workers = None):
+  '''
+  See SforceBaseClient.queryPartitioned()
+  '''
+  queries = partitionQueries(client, queryString, partitions, field, ordered)
+  return _merge(client, queries, ordered, queryAll, workers or len(queries))
+
+def _merge(client, queries, ordered, queryAll, workers):
+  # Pages wait in bounded queues, so fast partitions can't run far ahead of the consumer
+  cancelled = threading.Event()
+  if ordered:
+    queues = [Queue.Queue(2) for soql in queries]
+  else:
+    shared = Queue.Queue(2 * len(queries))
+    queues = [shared] * len(queries)
+
+  def fetch(fetcher, index, soql):
+    queue = queues[index]
+    try:
+      if queryAll:
+        result = fetcher.queryAll(soql)
+      else:
+        result = fetcher.query(soql)
+      while True:
+        if result.size > 0 and result.records is not None:
+          records = result.records
+          if not isinstance(records, list):
+            records = [records]
+          if not _put(queue, (index, records, None), cancelled):
+            return
+        if result.done:
+          break
+        result = fetcher.queryMore(result.queryLocator)
+    except:
+      _put(queue, (index, None, sys.exc_info()), cancelled)
+      return
+    _put(queue, (index, None, None), cancelled)
+
+  def failed(future, index):
+    # fetch() reports its own errors; this catches the worker failing to clone the client
+    e = future.exception()
+    if e is not None:
+      _put(queues[index], (index, None, (e.__class__, e, None)), cancelled)
+
+  pool = WorkerPool(min(workers, len(queries)), client._clone)
+  try:
+    for (index, soql) in enumerate(queries):
+      future = pool.submit(fetch, index, soql)
+      future.addCallback(lambda future, index = index: failed(future, index))
+
+    if ordered:
+      for queue in queues:
+        while True:
+          (index, records, excInfo) = queue.get()
+          if excInfo is not None:
+            raise excInfo[0], excInfo[1], excInfo[2]
+          if records is None:
+            break
+          for record in records:
+            yield record
+    else:
+      remaining = len(queries)
+      while remaining:
+        (index, records, excInfo) = shared.get()
+        if excInfo is not None:
+          raise excInfo[0], excInfo[1], excInfo[2]
+        if records is None:
+          remaining -= 1
+          continue
+        for record in records:
+          yield record
+  finally:
+    cancelled.set()
+    pool.shutdown()
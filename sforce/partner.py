@@ -16,16 +16,33 @@
 
 
 from base import SforceBaseClient
+from convert import RecordConverter
+from record import Record, compactRecords
 
 import string
 import suds.sudsobject
 
 class SforcePartnerClient(SforceBaseClient):
+  _converter = None
+  _compactRecords = False
+
+  _settings = SforceBaseClient._settings + ('_converter', '_compactRecords')
+
   def __init__(self, wsdl, *args, **kwargs):
     super(SforcePartnerClient, self).__init__(wsdl, *args, **kwargs)
 
   # Toolkit-specific calls
 
+  def _prepareBatch(self, call, batch):
+    '''
+    suds can't marshall compact records, so marshall batches with any in them ourselves
+    '''
+    if call in ('create', 'update', 'upsert'):
+      for sObject in batch:
+        if isinstance(sObject, Record):
+          return self._marshallSObjects(batch)
+    return batch
+
   def _stringifyResultRecords(self, struct):
     '''
     The Partner WSDL defines result element not defined in the "SObject"
@@ -93,43 +110,189 @@ searchRecords[] =
       },
     '''
     if not isinstance(struct, list):
-      struct = [struct]
-      originallyList = False
+      records = [struct]
     else:
-      originallyList = True
+      records = struct
 
-    for record in struct:
-      for k, v in record:
+    # This runs over every field of every record of every page, so it avoids recursion and
+    # setattr(): suds' Object.__setattr__ does a linear search of the record's __keylist__ on
+    # every call, which makes wide records quadratic.  We only ever replace values of existing
+    # keys, so writing to __dict__ directly is safe.
+    Object = suds.sudsobject.Object
+    stack = list(records)
+    while stack:
+      record = stack.pop()
+      values = record.__dict__
+      for k in record.__keylist__:
+        v = values[k]
         if isinstance(v, list):
           # At this point, we don't know whether a value of [] corresponds to '' or None
           # However, anecdotally I've been unable to find a field type whose 'empty' value
           # returns anything other that <sf:FieldNameHere xsi:nil="true"/>
           # so, for now, we'll set it to None
-          if v == []:
-            setattr(record, k, None)
-          else:
-            # Note that without strong typing there's no way to tell the difference between the 
-            # string 'false' and the bool false.  We get <sf:DoNotCall>false</sf:DoNotCall>.
-            # We have to assume strings for everything other than 'Id' and 'type', which are
-            # defined types in the Partner WSDL.
-	
-            # values that are objects may (query()) or may not (search()) be wrapped in a list
-            # so, remove from nested list first before calling ourselves recursively (if necessary)
-            setattr(record, k, v[0])
-        
-        # refresh v
-        v = getattr(record, k)
-
-        if isinstance(v, suds.sudsobject.Object):
-          v = self._stringifyResultRecords(v)
-          setattr(record, k, v)
-    if originallyList:
-      return struct
+          if not v:
+            values[k] = None
+            continue
+
+          if k == 'records' and 'queryLocator' in values:
+            # A child relationship subquery's QueryResult; its records stay a list
+            stack.extend(v)
+            continue
+
+          # Note that without strong typing there's no way to tell the difference between the 
+          # string 'false' and the bool false.  We get <sf:DoNotCall>false</sf:DoNotCall>.
+          # We have to assume strings for everything other than 'Id' and 'type', which are
+          # defined types in the Partner WSDL; see setTypedFields() for converting the rest.
+
+          # values that are objects may (query()) or may not (search()) be wrapped in a list
+          # so, remove from nested list first before visiting the object (if necessary)
+          v = v[0]
+          values[k] = v
+
+        if isinstance(v, Object):
+          stack.append(v)
+
+    return struct
+
+  def _normalizeResult(self, call, result):
+    '''
+    Stringify the <any/> fields of the records returned by queries, retrieve() and search(),
+    convert them to Python types if setTypedFields() is on, and to compact records if
+    setCompactRecords() is
+    '''
+    converter = self._converter
+    if call in ('query', 'queryAll', 'queryMore'):
+      if result.size > 0:
+        result.records = self._stringifyResultRecords(result.records)
+        if converter is not None:
+          converter.convert(self._asList(result.records), self.describeSObject)
+        if self._compactRecords:
+          result.records = self._compact(result.records)
+    elif call == 'retrieve':
+      result = self._stringifyResultRecords(result)
+      if converter is not None:
+        converter.convert(self._asList(result), self.describeSObject)
+      if self._compactRecords:
+        result = self._compact(result)
+    elif call == 'search':
+      # HACK <result/> gets unmarshalled as '' instead of an empty SearchResult
+      # return an empty SearchResult instead
+      if result == '':
+        return self._sforce.factory.create('SearchResult')
+      result.searchRecords = self._stringifyResultRecords(result.searchRecords)
+      if converter is not None:
+        converter.convert([searchRecord.record for searchRecord in self._asList(result.searchRecords)],
+                          self.describeSObject)
+      if self._compactRecords:
+        searchRecords = self._asList(result.searchRecords)
+        records = compactRecords([searchRecord.record for searchRecord in searchRecords])
+        for (searchRecord, record) in zip(searchRecords, records):
+          searchRecord.record = record
+    return result
+
+  def _finishRecord(self, record):
+    '''
+    Convert a record parsed by sforce.stream as _normalizeResult() converts those of a page
+    '''
+    if record is None:
+      return None
+    if self._converter is not None:
+      self._converter.convert([record], self.describeSObject)
+    if self._compactRecords:
+      record = compactRecords([record])[0]
+    return record
+
+  def _compact(self, records):
+    if isinstance(records, list):
+      return compactRecords(records)
+    return compactRecords([records])[0]
+
+  def _asList(self, records):
+    if records is None:
+      return []
+    if not isinstance(records, list):
+      return [records]
+    return records
+
+  def setTypedFields(self, typedFields):
+    '''
+    Set whether queries, retrieve() and search() return fields as Python types rather than
+    strings: boolean fields as bool, int as int, double, currency and percent as float, and
+    date, datetime and time as datetime.date, datetime.datetime (naive, in UTC) and
+    datetime.time.  Fields of parent and child relationships are converted too.
+
+    Field types come from describeSObject(), once per sObject type, so combine this with
+    setDescribeCache() to avoid the describe calls in every process.
+    '''
+    if typedFields:
+      self._converter = RecordConverter()
     else:
-      return struct[0]
+      self._converter = None
+
+  def setCompactRecords(self, compactRecords):
+    '''
+    Set whether queries, retrieve() and search() return records as compact sforce.record
+    Records (with __slots__, one class per sObject type and field list) rather than suds
+    objects, which take several times the memory.  Fields are still read and set as
+    attributes, asDict() returns them as a dict, and the records can be passed back to
+    update(), etc.
+    '''
+    self._compactRecords = compactRecords
+
+  def invalidateDescribeCache(self, sObjectType = None):
+    super(SforcePartnerClient, self).invalidateDescribeCache(sObjectType)
+    if self._converter is not None:
+      # Pick up changed field types too
+      self._converter = RecordConverter()
 
   # Core calls
 
+  def _streamRecords(self, stream):
+    try:
+      for record in stream:
+        yield self._finishRecord(record)
+    finally:
+      stream.close()
+
+  def queryStream(self, queryString, queryAll = False):
+    '''
+    Executes a query and yields the matching records one at a time, calling queryMore() for
+    each subsequent batch, like queryIter().  Unlike queryIter(), each response is parsed as
+    it arrives, and records are yielded as they're read rather than once suds has read and
+    unmarshalled the whole batch, so only about one record is held in memory at a time.
+
+    Records are those query() returns, converted as setTypedFields() and
+    setCompactRecords() say.
+
+    'queryAll' : Include deleted and archived records, as queryAll() does
+    '''
+    streamer = self._streamClone()
+    if queryAll:
+      stream = streamer._invoke('queryAll', queryString)
+    else:
+      stream = streamer._invoke('query', queryString)
+
+    while True:
+      for record in self._streamRecords(stream):
+        yield record
+      if stream.done or stream.queryLocator is None:
+        break
+      stream = streamer._invoke('queryMore', stream.queryLocator)
+
+  def retrieveStream(self, fieldList, sObjectType, ids):
+    '''
+    Retrieves objects by Id like retrieve(), but yields each record (or None, for an Id
+    that wasn't found) as it's read from the response; see queryStream()
+    '''
+    return self._streamRecords(self._streamClone()._invoke('retrieve', fieldList, sObjectType, ids))
+
+  def searchStream(self, searchString):
+    '''
+    Executes a SOSL search like search(), but yields each record found as it's read from
+    the response; see queryStream()
+    '''
+    return self._streamRecords(self._streamClone()._invoke('search', searchString))
+
   def convertLead(self, leadConverts):
     xml = self._marshallSObjects(leadConverts)
     return super(SforcePartnerClient, self).convertLead(xml)
@@ -142,40 +305,6 @@ searchRecords[] =
     xml = self._marshallSObjects(sObjects)
     return super(SforcePartnerClient, self).process(xml)
 
-  def query(self, queryString):
-    queryResult = super(SforcePartnerClient, self).query(queryString)
-    if queryResult.size > 0:
-      queryResult.records = self._stringifyResultRecords(queryResult.records)
-    return queryResult
-
-  def queryAll(self, queryString):
-    queryResult = super(SforcePartnerClient, self).queryAll(queryString)
-    if queryResult.size > 0:
-      queryResult.records = self._stringifyResultRecords(queryResult.records)
-    return queryResult
-  
-  def queryMore(self, queryLocator):
-    queryResult = super(SforcePartnerClient, self).queryMore(queryLocator)
-    if queryResult.size > 0:
-      queryResult.records = self._stringifyResultRecords(queryResult.records)
-    return queryResult
-  
-  def retrieve(self, fieldList, sObjectType, ids):
-    sObjects = super(SforcePartnerClient, self).retrieve(fieldList, sObjectType, ids)
-    sObjects = self._stringifyResultRecords(sObjects)
-    return sObjects
-  
-  def search(self, searchString):
-    searchResult = super(SforcePartnerClient, self).search(searchString)
-
-    # HACK <result/> gets unmarshalled as '' instead of an empty SearchResult
-    # return an empty SearchResult instead
-    if searchResult == '':
-      return self._sforce.factory.create('SearchResult')
-
-    searchResult.searchRecords = self._stringifyResultRecords(searchResult.searchRecords)
-    return searchResult
-
   # Utility calls
 
   def sendEmail(self, sObjects):
@@ -189,3 +318,4 @@ searchRecords[] =
     This header is only applicable to the Partner WSDL
     '''
     self._callOptions = header
+    self._headersChanged()
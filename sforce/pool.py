@@ -0,0 +1,107 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the (LGPL) GNU Lesser General Public License as
+# published by the Free Software Foundation; either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Library Lesser General Public License for more details at
+# ( http://www.gnu.org/licenses/lgpl.html ).
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+# Written by: David Lanstein ( lanstein yahoo com )
+
+import threading
+
+from contextlib import contextmanager
+
+class SforceClientPool(object):
+  '''
+  Hands out clients for use by one thread at a time, all sharing a single parsed WSDL
+
+  A client isn't safe to share between threads, and building one per thread means parsing
+  the WSDL (and holding the schema in memory) once per thread.  The pool builds one client,
+  which you log in and configure with getClient(), and checkout() returns lightweight
+  copies of it.  Each copy has its own session, endpoint, SOAP headers and settings (e.g.
+  setTypedFields(), setRetryPolicy(), listeners), so changing them on one doesn't affect any
+  other; a copy whose state has drifted from the pool's client is replaced with a fresh one
+  when next checked out.  The exception is logging in: a session
+  one copy logs in with, e.g. once the last has expired (see setRetryPolicy()), is taken up
+  by the pool's client and every other copy.
+
+  At most maxClients copies are checked out at once; checkout() waits for one to be
+  checked back in.
+
+    pool = SforceClientPool(SforcePartnerClient, 'partner.wsdl.xml', maxClients = 8)
+    pool.getClient().login(username, password, token)
+
+    with pool.client() as h:
+      h.query('SELECT Id FROM Lead')
+  '''
+  def __init__(self, clientClass, wsdl, maxClients = 8, **kwargs):
+    '''
+    'clientClass' : SforcePartnerClient or SforceEnterpriseClient
+    'wsdl' : Location of WSDL
+    'maxClients' : Most clients to have checked out at once
+
+    Any other arguments are passed to clientClass
+    '''
+    self._client = clientClass(wsdl, **kwargs)
+    self._available = threading.BoundedSemaphore(maxClients)
+    self._lock = threading.Lock()
+    self._idle = []
+
+  def getClient(self):
+    '''
+    Return the client every checked out client is copied from; log in and set SOAP headers
+    on this one
+    '''
+    return self._client
+
+  def checkout(self, blocking = True):
+    '''
+    Return a client for the calling thread to use until it calls checkin(), or None if
+    blocking is False and maxClients are already checked out
+    '''
+    if not self._available.acquire(blocking):
+      return None
+
+    self._lock.acquire()
+    try:
+      while self._idle:
+        client = self._idle.pop()
+        if self._client._isCurrentClone(client):
+          return client
+    finally:
+      self._lock.release()
+
+    try:
+      return self._client._clone()
+    except:
+      self._available.release()
+      raise
+
+  def checkin(self, client):
+    '''
+    Return a client from checkout() to the pool
+    '''
+    self._lock.acquire()
+    try:
+      self._idle.append(client)
+    finally:
+      self._lock.release()
+    self._available.release()
+
+  @contextmanager
+  def client(self):
+    '''
+    Check out a client for the duration of a with block
+    '''
+    client = self.checkout()
+    try:
+      yield client
+    finally:
+      self.checkin(client)
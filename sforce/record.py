@@ -0,0 +1,140 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the (LGPL) GNU Lesser General Public License as
+# published by the Free Software Foundation; either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Library Lesser General Public License for more details at
+# ( http://www.gnu.org/licenses/lgpl.html ).
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+# Written by: David Lanstein ( lanstein yahoo com )
+
+import threading
+
+import suds.sudsobject
+
+class Record(object):
+  '''
+  Base class of the compact records made by recordType()
+
+  A record has one slot per field and no __dict__, so it takes a fraction of the memory of a
+  suds Object.  Fields are read and set as attributes, like a suds Object's, but no new ones
+  can be added.  Iterating over a record yields (field, value) pairs, as iterating over a suds
+  Object does, so records can be passed back to update(), etc.
+  '''
+  __slots__ = ()
+  # Set on each generated class
+  type = None
+  _fields = ()
+
+  def __init__(self, *values):
+    for (k, v) in zip(self._fields, values):
+      setattr(self, k, v)
+
+  def __iter__(self):
+    yield ('type', self.type)
+    for k in self._fields:
+      yield (k, getattr(self, k))
+
+  def __getitem__(self, k):
+    if k not in self._fields:
+      raise KeyError(k)
+    return getattr(self, k)
+
+  def __len__(self):
+    return len(self._fields)
+
+  def __eq__(self, other):
+    return (isinstance(other, Record) and self.type == other.type and
+            self._fields == other._fields and self.values() == other.values())
+
+  def __ne__(self, other):
+    return not self.__eq__(other)
+
+  def __reduce__(self):
+    # The class is generated, so can't be pickled by name
+    return (makeRecord, (self.type, self._fields, self.values()))
+
+  def __repr__(self):
+    return '<%s %s>' % (self.type, ' '.join(['%s=%r' % (k, getattr(self, k)) for k in self._fields]))
+
+  def fields(self):
+    return self._fields
+
+  def values(self):
+    return tuple([getattr(self, k) for k in self._fields])
+
+  def asDict(self):
+    '''
+    Return the fields as a dict, including 'type'; related records stay records
+    '''
+    values = dict(zip(self._fields, self.values()))
+    values['type'] = self.type
+    return values
+
+_lock = threading.Lock()
+# (sObject type, field names) => Record subclass
+_types = {}
+
+def recordType(sObjectType, fields):
+  '''
+  Return the Record class for sObjectType records with fields, creating it the first time
+  '''
+  key = (sObjectType, fields)
+  cls = _types.get(key)
+  if cls is not None:
+    return cls
+
+  cls = type(str(sObjectType), (Record, ), {'__slots__': fields, '_fields': fields, 'type': sObjectType})
+  _lock.acquire()
+  try:
+    cls = _types.setdefault(key, cls)
+  finally:
+    _lock.release()
+  return cls
+
+def makeRecord(sObjectType, fields, values):
+  return recordType(sObjectType, tuple(fields))(*values)
+
+def compactRecords(records):
+  '''
+  Return a list of compact records for a list of suds records (which have been through
+  SforcePartnerClient._stringifyResultRecords()), converting parent relationship records too.
+  Child relationship QueryResults are kept, with their records converted.
+  '''
+  Object = suds.sudsobject.Object
+  # (sObject type, suds field names) => Record subclass, for the records of this page
+  classes = {}
+  compact = []
+  for record in records:
+    if not isinstance(record, Object):
+      # e.g. None, for an Id retrieve() didn't find
+      compact.append(record)
+      continue
+
+    values = record.__dict__
+    key = (record.type, tuple(record.__keylist__))
+    cls = classes.get(key)
+    if cls is None:
+      cls = classes[key] = recordType(record.type, tuple([k for k in key[1] if k != 'type']))
+
+    row = []
+    for k in cls._fields:
+      v = values[k]
+      if isinstance(v, Object):
+        if hasattr(v, 'records'):
+          if v.records is not None:
+            if isinstance(v.records, list):
+              v.records = compactRecords(v.records)
+            else:
+              v.records = compactRecords([v.records])[0]
+        elif hasattr(v, 'type'):
+          v = compactRecords([v])[0]
+      row.append(v)
+    compact.append(cls(*row))
+  return compact
@@ -0,0 +1,147 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the (LGPL) GNU Lesser General Public License as
+# published by the Free Software Foundation; either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Library Lesser General Public License for more details at
+# ( http://www.gnu.org/licenses/lgpl.html ).
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+# Written by: David Lanstein ( lanstein yahoo com )
+
+import httplib
+import random
+import re
+import socket
+import time
+import urllib2
+
+from suds import WebFault
+from suds.transport import TransportError
+
+# Faults worth trying the whole call again for
+TRANSIENT_FAULTS = ('SERVER_UNAVAILABLE', 'UNABLE_TO_LOCK_ROW', 'REQUEST_RUNNING_TOO_LONG')
+
+# Per-record errors in a SaveResult, DeleteResult, etc. worth resubmitting the record for
+TRANSIENT_RECORD_ERRORS = ('UNABLE_TO_LOCK_ROW', )
+
+# HTTP statuses from a gateway or load balancer in front of Salesforce that's briefly unable to
+# pass the call on; suds raises these as Exception((status, reason))
+TRANSIENT_STATUSES = (502, 503, 504)
+
+# Calls that do the same thing if repeated, so can be retried even when a network error leaves
+# us not knowing whether Salesforce received them.  update() and upsert() write the same values
+# again, which is only harmless if nothing else changed the records in between (and triggers and
+# workflow run twice).  delete(), undelete() and emptyRecycleBin() aren't here: repeated after
+# they were applied, they report every record as failed (ENTITY_IS_DELETED, etc.).  Those and
+# anything else (e.g. create(), sendEmail()) are only retried when they certainly failed, i.e.
+# on a fault.
+IDEMPOTENT_CALLS = ('login', 'query', 'queryAll', 'queryMore', 'retrieve', 'search', 'update',
+                    'upsert', 'getDeleted', 'getUpdated', 'describeGlobal', 'describeLayout',
+                    'describeSObject', 'describeSObjects', 'describeTabs', 'getServerTimestamp',
+                    'getUserInfo')
+
+def faultCode(e):
+  '''
+  The exception code of a WebFault, e.g. 'INVALID_SESSION_ID', or None
+  '''
+  if not isinstance(e, WebFault):
+    return None
+  faultcode = getattr(getattr(e, 'fault', None), 'faultcode', None)
+  if faultcode:
+    return str(faultcode).split(':')[-1]
+  match = re.search(r'([A-Z_]{4,}):', str(e))
+  if match is not None:
+    return match.group(1)
+  return None
+
+def httpStatus(e):
+  '''
+  The HTTP status of a failed call that wasn't a fault, e.g. 503, or None
+  '''
+  if isinstance(e, TransportError):
+    return getattr(e, 'httpcode', None)
+  if isinstance(e, urllib2.HTTPError):
+    return e.code
+  if type(e) is Exception and len(e.args) == 1:
+    arg = e.args[0]
+    if isinstance(arg, tuple) and len(arg) == 2 and isinstance(arg[0], int):
+      return arg[0]
+  return None
+
+class RetryPolicy(object):
+  '''
+  When, and how soon, SforceBaseClient repeats a call that failed
+
+  Calls that fault with one of faults, or (for IDEMPOTENT_CALLS: queries, retrieve(), search(),
+  update(), upsert(), the describe calls, etc.) fail with a network error or one of
+  TRANSIENT_STATUSES, are retried up to maxRetries times.  Before attempt n (counting
+  from 0) we wait a random time between 0 and min(maxDelay, baseDelay * 2 ** n) seconds
+  ("full jitter"), so many clients that failed together don't all retry together.
+
+  A call that faults with INVALID_SESSION_ID logs in again with the credentials last passed
+  to login(), and is retried straight away.
+
+  Records that create(), update(), etc. report as failed with one of recordErrors are
+  resubmitted on their own, with the same backoff; records that succeeded are never sent twice.
+  '''
+  def __init__(self, maxRetries = 5, baseDelay = 0.5, maxDelay = 60, faults = TRANSIENT_FAULTS,
+               recordErrors = TRANSIENT_RECORD_ERRORS, retryNetworkErrors = True, relogin = True):
+    '''
+    'maxRetries' : Most times to repeat a call (or resubmit a record)
+    'baseDelay' : Seconds to wait, at most, before the first retry
+    'maxDelay' : Most seconds to wait before any retry
+    'faults' : Fault codes to retry on
+    'recordErrors' : Per-record status codes to resubmit records for
+    'retryNetworkErrors' : Retry idempotent calls on socket, HTTP and transport errors
+    'relogin' : Log in again on INVALID_SESSION_ID
+    '''
+    self.maxRetries = maxRetries
+    self.baseDelay = baseDelay
+    self.maxDelay = maxDelay
+    self.faults = faults
+    self.recordErrors = recordErrors
+    self.retryNetworkErrors = retryNetworkErrors
+    self.relogin = relogin
+
+  def getDelay(self, attempt):
+    return random.random() * min(self.maxDelay, self.baseDelay * 2 ** attempt)
+
+  def wait(self, attempt):
+    time.sleep(self.getDelay(attempt))
+
+  def shouldRelogin(self, call, e):
+    return (self.relogin and call not in ('login', 'logout') and
+            faultCode(e) == 'INVALID_SESSION_ID')
+
+  def shouldRetry(self, call, e):
+    if faultCode(e) in self.faults:
+      return True
+    if self.retryNetworkErrors and call in IDEMPOTENT_CALLS:
+      # A 500 carrying a fault surfaces as a WebFault; suds raises any other bad status as
+      # Exception((status, reason)), and a streamed call as TransportError.  Other statuses
+      # (e.g. 404) would only fail again
+      status = httpStatus(e)
+      if status is not None:
+        return status in TRANSIENT_STATUSES
+      return isinstance(e, (socket.error, httplib.HTTPException, urllib2.URLError, TransportError))
+    return False
+
+  def shouldResubmit(self, result):
+    '''
+    Whether a per-record result (SaveResult, DeleteResult, etc.) failed transiently
+    '''
+    if result is None or getattr(result, 'success', True):
+      return False
+    errors = getattr(result, 'errors', None) or []
+    if not isinstance(errors, list):
+      errors = [errors]
+    for error in errors:
+      if getattr(error, 'statusCode', None) in self.recordErrors:
+        return True
+    return False
@@ -0,0 +1,249 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the (LGPL) GNU Lesser General Public License as
+# published by the Free Software Foundation; either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Library Lesser General Public License for more details at
+# ( http://www.gnu.org/licenses/lgpl.html ).
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+# Written by: David Lanstein ( lanstein yahoo com )
+
+'''
+Parses query(), queryAll(), queryMore(), retrieve() and search() responses as they arrive
+from the network, rather than once suds has read and unmarshalled the whole body; see
+SforcePartnerClient.queryStream()
+'''
+
+from StringIO import StringIO
+from timeit import default_timer
+
+try:
+  from xml.etree.cElementTree import iterparse
+except ImportError:
+  from xml.etree.ElementTree import iterparse
+
+from suds.sudsobject import Factory
+from suds.transport import TransportError
+
+from instrument import MeasuringTransport
+from transport import HttpTransport
+
+XSI_NIL = '{http://www.w3.org/2001/XMLSchema-instance}nil'
+
+# call => names of the elements from the response element down to each record
+RECORD_PATHS = {
+  'query': ('result', 'records'),
+  'queryAll': ('result', 'records'),
+  'queryMore': ('result', 'records'),
+  'retrieve': ('result', ),
+  'search': ('result', 'searchRecords', 'record'),
+}
+
+# Envelope, Body and the response element
+_RESPONSE_DEPTH = 3
+
+def _localName(tag):
+  return tag[tag.rfind('}') + 1:]
+
+class _ChunkFile(object):
+  '''
+  A file-like object reading from a generator of strings, for iterparse()
+  '''
+  def __init__(self, chunks):
+    self.chunks = chunks
+    self.pending = ''
+    self.bytesRead = 0
+
+  def read(self, size = -1):
+    while size < 0 or len(self.pending) < size:
+      try:
+        chunk = self.chunks.next()
+      except StopIteration:
+        break
+      self.bytesRead += len(chunk)
+      self.pending += chunk
+    if size < 0:
+      size = len(self.pending)
+    (data, self.pending) = (self.pending[:size], self.pending[size:])
+    return data
+
+  def close(self):
+    self.chunks.close()
+
+def toObject(element):
+  '''
+  Build the suds Object for a Partner record element, as suds and
+  SforcePartnerClient._stringifyResultRecords() would make it: fields are strings (or None
+  for nulls), parent relationships are Objects and child relationships QueryResults
+  '''
+  record = Factory.object(_localName(element.tag))
+  values = record.__dict__
+  keys = record.__keylist__
+  for child in element:
+    k = _localName(child.tag)
+    if k in values:
+      # The Partner WSDL repeats Id
+      continue
+    if len(child):
+      if _localName(child[0].tag) == 'done':
+        v = toQueryResult(child)
+      else:
+        v = toObject(child)
+    elif child.get(XSI_NIL) == 'true' or not child.text:
+      v = None
+    else:
+      v = child.text
+    keys.append(k)
+    values[k] = v
+  return record
+
+def toQueryResult(element):
+  '''
+  Build the QueryResult of a child relationship subquery, as query() returns it: done and size
+  are strings, like the record's other fields, and records a list, or None if there are none
+  '''
+  result = Factory.object(_localName(element.tag))
+  records = []
+  for child in element:
+    k = _localName(child.tag)
+    if k == 'records':
+      records.append(toObject(child))
+    elif k == 'done':
+      result.done = child.text
+    elif k == 'queryLocator':
+      result.queryLocator = child.get(XSI_NIL) != 'true' and child.text or None
+    elif k == 'size':
+      result.size = child.text
+  result.records = records or None
+  return result
+
+class ResultStream(object):
+  '''
+  The records of a response, parsed as they're read from the connection
+
+  Iterating yields each record (None for an Id retrieve() didn't find) as a suds Object,
+  as soon as its closing tag arrives; parsed elements are discarded as it goes, so memory use
+  is one record however large the response.  For queries, done, queryLocator and size are
+  set as they're read; done and queryLocator come before the records, size after them.
+
+  records is the number of records yielded so far, and error the exception reading the
+  response raised, if any.
+  '''
+  done = True
+  queryLocator = None
+  size = None
+
+  def __init__(self, call, chunks, finished = None):
+    '''
+    'finished' : Called with the stream once it's closed, e.g. to report the call to listeners
+    '''
+    self.call = call
+    self.file = _ChunkFile(chunks)
+    self.records = 0
+    self.error = None
+    self._finished = finished
+
+  @property
+  def bytesRead(self):
+    '''
+    Bytes of the (uncompressed) response read so far
+    '''
+    return self.file.bytesRead
+
+  def __iter__(self):
+    path = RECORD_PATHS[self.call]
+    recordDepth = _RESPONSE_DEPTH + len(path)
+    # Elements from the envelope down to the one being parsed
+    stack = []
+    names = []
+    try:
+      for (event, element) in iterparse(self.file, ('start', 'end')):
+        if event == 'start':
+          stack.append(element)
+          names.append(_localName(element.tag))
+          continue
+
+        depth = len(stack)
+        if depth > recordDepth:
+          # Inside a record; it's built once the record ends
+          stack.pop()
+          names.pop()
+          continue
+
+        name = names[-1]
+        if depth == recordDepth and tuple(names[_RESPONSE_DEPTH:]) == path:
+          self.records += 1
+          if element.get(XSI_NIL) == 'true':
+            yield None
+          else:
+            yield toObject(element)
+        elif depth == _RESPONSE_DEPTH + 2 and names[_RESPONSE_DEPTH] == 'result':
+          if name == 'done':
+            self.done = (element.text == 'true')
+          elif name == 'queryLocator':
+            self.queryLocator = element.get(XSI_NIL) != 'true' and element.text or None
+          elif name == 'size':
+            self.size = int(element.text)
+
+        stack.pop()
+        names.pop()
+        if len(stack) > _RESPONSE_DEPTH - 1:
+          # Let go of what's been read
+          stack[-1].remove(element)
+    except Exception, e:
+      self.error = e
+      raise
+    finally:
+      self.close()
+
+  def close(self):
+    '''
+    Stop reading, e.g. when giving up part way through; the connection is closed rather than
+    reused
+    '''
+    self.file.close()
+    if self._finished is not None:
+      (finished, self._finished) = (self._finished, None)
+      finished(self)
+
+def _transport(client):
+  transport = client._sforce.options.transport
+  if isinstance(transport, MeasuringTransport):
+    transport = transport.transport
+  if isinstance(transport, HttpTransport):
+    return transport
+  # suds' own transport reads the whole response before returning it; make one of ours with
+  # the proxy, credentials and compression the client was made with
+  return HttpTransport(poolSize = 0, **client._httpOptions)
+
+def openStream(client, call, args, info = None, finished = None):
+  '''
+  Send a call as suds would, and return a ResultStream of its response
+
+  Faults are raised as WebFaults, as suds raises them, before any records are read.
+
+  'info' : A CallInfo to record the request's size, and when it was sent and the response
+           arrived, in
+  'finished' : Passed on to the ResultStream
+  '''
+  request = client._soapRequest(call, args)
+  if info is not None:
+    info.requestBytes = len(request.message)
+    info.sent = default_timer()
+  (status, reason, headers, chunks) = _transport(client).sendStream(request)
+  if info is not None:
+    info.received = default_timer()
+  if status == 200:
+    return ResultStream(call, chunks, finished)
+
+  data = ''.join(chunks)
+  if status == 500 and data:
+    # Raises the WebFault
+    getattr(client._sforce.service, call).method.binding.input.get_fault(data)
+  raise TransportError(reason, status, StringIO(data))
@@ -0,0 +1,295 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the (LGPL) GNU Lesser General Public License as
+# published by the Free Software Foundation; either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Library Lesser General Public License for more details at
+# ( http://www.gnu.org/licenses/lgpl.html ).
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+# Written by: David Lanstein ( lanstein yahoo com )
+
+'''
+Keeps a local copy of sObjects up to date with getUpdated() and getDeleted()
+'''
+
+import datetime
+import os
+import os.path
+import tempfile
+import threading
+
+try:
+  import json
+except ImportError:
+  # Python 2.5
+  import simplejson as json
+
+from suds import WebFault
+from suds.sax.date import Timezone
+
+from convert import toDatetime
+from retry import faultCode
+from worker import WorkerPool
+
+def formatDatetime(value):
+  return value.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+def toUtc(value):
+  '''
+  Return a naive UTC datetime for a timestamp from a call's result
+
+  suds turns xsd:dateTime values into naive datetimes in local (standard) time; undo that.
+  '''
+  if isinstance(value, basestring):
+    return toDatetime(value)
+  if value.tzinfo is not None:
+    return (value - value.utcoffset()).replace(tzinfo = None)
+  return value - datetime.timedelta(hours = Timezone.local)
+
+class SyncSink(object):
+  '''
+  Base class for where SyncEngine sends changes, e.g. a database table per sObject type
+  '''
+  def upsert(self, sObjectType, records):
+    '''
+    'records' : Records created or changed since the last sync, as retrieve() returns them
+    '''
+    pass
+
+  def delete(self, sObjectType, ids):
+    '''
+    'ids' : Ids of records deleted since the last sync
+    '''
+    pass
+
+  def checkpoint(self, sObjectType):
+    '''
+    Called once every change up to a new watermark has been sent, just before the watermark
+    is saved; a sink that buffers or uses transactions should commit here
+    '''
+    pass
+
+class WatermarkStore(object):
+  '''
+  Saves how far each sObject type has been synced, in a JSON file
+
+  Watermarks are UTC timestamps, kept separately for updates and deletes.
+  '''
+  def __init__(self, path):
+    '''
+    'path' : File to keep the watermarks in; created on the first put()
+    '''
+    self.path = path
+    self._lock = threading.Lock()
+    self._watermarks = {}
+    if os.path.exists(path):
+      fp = open(path)
+      try:
+        self._watermarks = json.load(fp)
+      finally:
+        fp.close()
+
+  def get(self, sObjectType, kind):
+    '''
+    Return the watermark for 'updated' or 'deleted' records of sObjectType as a datetime,
+    or None if there isn't one yet
+    '''
+    self._lock.acquire()
+    try:
+      value = self._watermarks.get(sObjectType, {}).get(kind)
+    finally:
+      self._lock.release()
+    if value is None:
+      return None
+    return toDatetime(value)
+
+  def put(self, sObjectType, kind, value):
+    self._lock.acquire()
+    try:
+      self._watermarks.setdefault(sObjectType, {})[kind] = formatDatetime(value)
+
+      # Write the new file beside the old one and rename it over, so a crash part way through
+      # can't lose every watermark
+      (fd, tmp) = tempfile.mkstemp(dir = os.path.dirname(os.path.abspath(self.path)), suffix = '.tmp')
+      fp = os.fdopen(fd, 'w')
+      try:
+        json.dump(self._watermarks, fp, indent = 2, sort_keys = True)
+      finally:
+        fp.close()
+      try:
+        os.rename(tmp, self.path)
+      except OSError:
+        # Windows won't rename over an existing file
+        os.remove(self.path)
+        os.rename(tmp, self.path)
+    finally:
+      self._lock.release()
+
+class SyncEngine(object):
+  '''
+  Sends the records created, changed and deleted since the last sync to a SyncSink
+
+  For each sObject type, the window from its watermark up to the server's current time (in
+  windows of at most maxWindow; the API allows 30 days) is passed to getUpdated() and
+  getDeleted().  Windows holding more Ids than the API will return (EXCEEDED_ID_LIMIT) are
+  split in two until they fit.  Changed records are fetched with retrieve(), in batches of
+  retrieveBatchSize run on 'workers' threads, each with its own connection.  Watermarks are
+  saved after each window, so an interrupted sync picks up where it left off.
+
+  The first sync of a type with no watermark just records the current time, unless
+  'since' is given; load the existing records some other way (e.g. queryExport()) first.
+
+  getUpdated() and getDeleted() only go back 30 and 15 days, so sync at least that often.
+  '''
+  maxWindow = datetime.timedelta(days = 29)
+  # The API works in whole minutes
+  minWindow = datetime.timedelta(minutes = 1)
+  # The most Ids retrieve() takes at once
+  retrieveBatchSize = 2000
+
+  def __init__(self, client, sink, watermarks, fields = None, workers = 4, clock = None):
+    '''
+    'client' : A logged-in SforcePartnerClient or SforceEnterpriseClient
+    'sink' : SyncSink to send changes to
+    'watermarks' : WatermarkStore
+    'fields' : Dict of sObject type => fields to retrieve, as a list or a comma-separated
+               string; types not in it get all of their fields, per describeSObject()
+    'workers' : How many retrieve() calls to make at once
+    'clock' : Function returning the UTC datetime to sync up to; by default the server's
+              current time, from getServerTimestamp()
+    '''
+    self.client = client
+    self.sink = sink
+    self.watermarks = watermarks
+    self.fields = fields or {}
+    self.workers = workers
+    self.clock = clock or self._serverTime
+
+  def _serverTime(self):
+    return toUtc(self.client.getServerTimestamp().timestamp)
+
+  def sync(self, sObjectTypes, since = None):
+    '''
+    Sync each of sObjectTypes in turn, and return {sObject type: {'upserted': count,
+    'deleted': count}}
+
+    'since' : Datetime (UTC) to sync types without a watermark from
+    '''
+    counts = {}
+    for sObjectType in sObjectTypes:
+      counts[sObjectType] = self.syncObject(sObjectType, since)
+    return counts
+
+  def syncObject(self, sObjectType, since = None):
+    '''
+    Sync one sObject type; returns {'upserted': count, 'deleted': count}
+    '''
+    now = self.clock()
+    counts = {'upserted': 0, 'deleted': 0}
+
+    for kind in ('updated', 'deleted'):
+      start = self.watermarks.get(sObjectType, kind) or since
+      if start is None:
+        self.watermarks.put(sObjectType, kind, now)
+        continue
+
+      while now - start >= self.minWindow:
+        end = min(now, start + self.maxWindow)
+        latest = self._syncWindow(sObjectType, kind, start, end, counts)
+        self._checkpoint(sObjectType, kind, latest)
+        if latest <= start or latest < end:
+          # Salesforce hasn't caught up past latest yet
+          break
+        start = latest
+
+    return counts
+
+  def _checkpoint(self, sObjectType, kind, watermark):
+    self.sink.checkpoint(sObjectType)
+    self.watermarks.put(sObjectType, kind, watermark)
+
+  def _syncWindow(self, sObjectType, kind, start, end, counts):
+    '''
+    Send the changes from start to end, and return the latest date they're complete up to
+    '''
+    try:
+      if kind == 'updated':
+        result = self.client.getUpdated(sObjectType, formatDatetime(start), formatDatetime(end))
+      else:
+        result = self.client.getDeleted(sObjectType, formatDatetime(start), formatDatetime(end))
+    except WebFault, e:
+      if faultCode(e) != 'EXCEEDED_ID_LIMIT' or end - start <= self.minWindow:
+        raise
+
+      middle = start + (end - start) / 2
+      middle = max(middle.replace(second = 0, microsecond = 0), start + self.minWindow)
+      latest = self._syncWindow(sObjectType, kind, start, middle, counts)
+      if latest < middle:
+        return latest
+      self._checkpoint(sObjectType, kind, latest)
+      return self._syncWindow(sObjectType, kind, latest, end, counts)
+
+    if kind == 'updated':
+      ids = _asList(getattr(result, 'ids', None))
+      counts['upserted'] += self._retrieve(sObjectType, ids)
+    else:
+      ids = [record.id for record in _asList(getattr(result, 'deletedRecords', None))]
+      if ids:
+        self.sink.delete(sObjectType, ids)
+      counts['deleted'] += len(ids)
+
+    return toUtc(result.latestDateCovered)
+
+  def _fieldList(self, sObjectType):
+    fields = self.fields.get(sObjectType)
+    if fields is None:
+      fields = [field.name for field in self.client.describeSObject(sObjectType).fields]
+    if not isinstance(fields, basestring):
+      fields = ', '.join(fields)
+    return fields
+
+  def _retrieve(self, sObjectType, ids):
+    '''
+    Send the records with ids to the sink; returns how many there were
+    '''
+    if not ids:
+      return 0
+
+    fieldList = self._fieldList(sObjectType)
+    size = self.retrieveBatchSize
+    batches = [ids[i:i + size] for i in range(0, len(ids), size)]
+
+    def fetch(client, batch):
+      # Records deleted since getUpdated() come back as None
+      return [record for record in _asList(client.retrieve(fieldList, sObjectType, batch))
+              if record is not None]
+
+    count = 0
+    if self.workers <= 1 or len(batches) == 1:
+      for batch in batches:
+        records = fetch(self.client, batch)
+        self.sink.upsert(sObjectType, records)
+        count += len(records)
+      return count
+
+    pool = WorkerPool(min(self.workers, len(batches)), self.client._clone)
+    try:
+      for records in pool.map(fetch, batches):
+        self.sink.upsert(sObjectType, records)
+        count += len(records)
+    finally:
+      pool.shutdown()
+    return count
+
+def _asList(value):
+  if value is None:
+    return []
+  if not isinstance(value, list):
+    return [value]
+  return value
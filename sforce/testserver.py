@@ -0,0 +1,2404 @@
+# coding: utf-8
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the (LGPL) GNU Lesser General Public License as
+# published by the Free Software Foundation; either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Library Lesser General Public License for more details at
+# ( http://www.gnu.org/licenses/lgpl.html ).
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+# Written by: David Lanstein ( lanstein yahoo com )
+
+'''
+A local stand-in for the Salesforce SOAP API, serving synthetic data, for running the tests
+and benchmarks without an org
+
+It speaks both the Partner and Enterprise dialects (whichever the request is written in) and
+implements login, logout, invalidateSessions, query, queryAll, queryMore, create, update,
+upsert, delete, undelete, emptyRecycleBin, merge, convertLead, process, retrieve, search,
+sendEmail, setPassword, resetPassword, describeGlobal, describeSObject, describeSObjects,
+describeLayout, describeTabs, getServerTimestamp, getUserInfo, getUpdated and getDeleted.
+It serves a Partner and an Enterprise WSDL for its schema too, see getWsdlUrl().  SOQL support
+covers SELECT ... FROM ... [WHERE ...] [ORDER BY ...] [LIMIT n], including parent
+relationship fields (e.g. Account.Name) and COUNT().
+
+It also serves the Bulk API (under /services/async/), for CSV insert, update, upsert, delete,
+hardDelete and query jobs, processing each batch on a background thread; see sforce.bulk.
+
+Point a client at it with the WSDL from getWsdlUrl():
+
+  server = SforceTestServer(records = 10000, latency = 0.05)
+  server.start()
+  h = SforcePartnerClient(server.getWsdlUrl('partner'))
+  h.login('anyone@example.com', 'password', '')
+
+or pass the URL from getServerUrl() as 'location' along with a WSDL downloaded from an org.
+
+or run it on its own:
+
+  python -m sforce.testserver --port 8080 --records 10000 --page-size 500
+'''
+
+import BaseHTTPServer
+import SocketServer
+import csv
+import datetime
+import random
+import re
+import threading
+import time
+import urlparse
+import zlib
+
+from cStringIO import StringIO
+from optparse import OptionParser
+
+try:
+  import xml.etree.cElementTree as ElementTree
+except ImportError:
+  import xml.etree.ElementTree as ElementTree
+
+SOAP_NS = 'http://schemas.xmlsoap.org/soap/envelope/'
+XSI_NS = 'http://www.w3.org/2001/XMLSchema-instance'
+BULK_NS = 'http://www.force.com/2009/06/asyncapi/dataload'
+
+# dialect => (API namespace, sObject namespace, fault namespace, URL letter)
+DIALECTS = {
+  'partner': ('urn:partner.soap.sforce.com', 'urn:sobject.partner.soap.sforce.com',
+              'urn:fault.partner.soap.sforce.com', 'u'),
+  'enterprise': ('urn:enterprise.soap.sforce.com', 'urn:sobject.enterprise.soap.sforce.com',
+                 'urn:fault.enterprise.soap.sforce.com', 'c'),
+}
+
+ORGANIZATION_ID = '00D000000000001AAA'
+USER_ID = '005000000000001AAA'
+# Every sObject type has just the master record type
+MASTER_RECORD_TYPE_ID = '012000000000000AAA'
+
+# sObject type => (key prefix, ((field, type, referenceTo), ...))
+SCHEMA = {
+  'Account': ('001', (
+    ('Id', 'id', None),
+    ('Name', 'string', None),
+    ('Industry', 'picklist', None),
+    ('AnnualRevenue', 'currency', None),
+    ('NumberOfEmployees', 'int', None),
+    ('Website', 'url', None),
+    ('CreatedDate', 'datetime', None),
+    ('SystemModstamp', 'datetime', None),
+    ('IsDeleted', 'boolean', None),
+  )),
+  'Contact': ('003', (
+    ('Id', 'id', None),
+    ('FirstName', 'string', None),
+    ('LastName', 'string', None),
+    ('Email', 'email', None),
+    ('Phone', 'phone', None),
+    ('AccountId', 'reference', 'Account'),
+    ('Birthdate', 'date', None),
+    ('DoNotCall', 'boolean', None),
+    ('Description', 'textarea', None),
+    ('CreatedDate', 'datetime', None),
+    ('SystemModstamp', 'datetime', None),
+    ('IsDeleted', 'boolean', None),
+  )),
+  'Lead': ('00Q', (
+    ('Id', 'id', None),
+    ('FirstName', 'string', None),
+    ('LastName', 'string', None),
+    ('Name', 'string', None),
+    ('Company', 'string', None),
+    ('Email', 'email', None),
+    ('Phone', 'phone', None),
+    ('Fax', 'phone', None),
+    ('Status', 'picklist', None),
+    ('DoNotCall', 'boolean', None),
+    ('IsConverted', 'boolean', None),
+    ('OwnerId', 'reference', 'User'),
+    ('AnnualRevenue', 'currency', None),
+    ('Description', 'textarea', None),
+    ('CreatedDate', 'datetime', None),
+    ('SystemModstamp', 'datetime', None),
+    ('IsDeleted', 'boolean', None),
+  )),
+  'Opportunity': ('006', (
+    ('Id', 'id', None),
+    ('Name', 'string', None),
+    ('AccountId', 'reference', 'Account'),
+    ('StageName', 'picklist', None),
+    ('Amount', 'currency', None),
+    ('CloseDate', 'date', None),
+    ('CreatedDate', 'datetime', None),
+    ('SystemModstamp', 'datetime', None),
+    ('IsDeleted', 'boolean', None),
+  )),
+  'CampaignMember': ('00v', (
+    ('Id', 'id', None),
+    ('LeadId', 'reference', 'Lead'),
+    ('ContactId', 'reference', 'Contact'),
+    ('Status', 'picklist', None),
+    ('HasResponded', 'boolean', None),
+    ('CreatedDate', 'datetime', None),
+    ('SystemModstamp', 'datetime', None),
+    ('IsDeleted', 'boolean', None),
+  )),
+  'Case': ('500', (
+    ('Id', 'id', None),
+    ('Subject', 'string', None),
+    ('Status', 'picklist', None),
+    ('ContactId', 'reference', 'Contact'),
+    ('CreatedDate', 'datetime', None),
+    ('SystemModstamp', 'datetime', None),
+    ('IsDeleted', 'boolean', None),
+  )),
+  'Case_Note__c': ('a0E', (
+    ('Id', 'id', None),
+    ('case__c', 'reference', 'Case'),
+    ('subject__c', 'string', None),
+    ('description__c', 'textarea', None),
+    ('CreatedDate', 'datetime', None),
+    ('SystemModstamp', 'datetime', None),
+    ('IsDeleted', 'boolean', None),
+  )),
+  'User': ('005', (
+    ('Id', 'id', None),
+    ('Name', 'string', None),
+    ('Username', 'string', None),
+    ('Email', 'email', None),
+    ('IsActive', 'boolean', None),
+    ('CreatedDate', 'datetime', None),
+    ('SystemModstamp', 'datetime', None),
+    ('IsDeleted', 'boolean', None),
+  )),
+}
+
+SOAP_TYPES = {
+  'id': 'tns:ID',
+  'reference': 'tns:ID',
+  'boolean': 'xsd:boolean',
+  'currency': 'xsd:double',
+  'double': 'xsd:double',
+  'int': 'xsd:int',
+  'date': 'xsd:date',
+  'datetime': 'xsd:dateTime',
+}
+
+# Fields the API maintains itself
+SYSTEM_FIELDS = ('Id', 'CreatedDate', 'SystemModstamp', 'IsDeleted')
+
+# The tests search for their own Joë Möke leads, so the synthetic ones are named otherwise
+FIRST_NAMES = (u'Joe', u'Bob', u'Alice', u'Carol', u'Dave', u'Erin', u'Frank', u'Grace', u'Zoë')
+LAST_NAMES = (u'Moke', u'Smith', u'Jones', u'Lee', u'Garcia', u'Chen', u'Müller')
+COMPANIES = (u'Acme', u'Jamoke, Inc.', u'Initech', u'Globex', u'你好公司')
+# (FirstName, LastName, Company) of leads created alongside the synthetic ones
+FIXTURE_LEADS = (
+  (u'Single', u'User', u'Jamoke, Inc.'),
+  (u'Joë', u'Möke', u'你好公司'),
+  (u'Joë', u'Möke', u'你好公司'),
+)
+INDUSTRIES = ('Agriculture', 'Banking', 'Education', 'Media', 'Technology')
+
+class SoapFault(Exception):
+  def __init__(self, code, message):
+    Exception.__init__(self, '%s: %s' % (code, message))
+    self.code = code
+    self.message = message
+
+class BulkFault(Exception):
+  def __init__(self, code, message, status = 400):
+    Exception.__init__(self, '%s: %s' % (code, message))
+    self.code = code
+    self.message = message
+    self.status = status
+
+def escape(value):
+  value = unicode(value)
+  return value.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+def formatDatetime(value):
+  return value.strftime('%Y-%m-%dT%H:%M:%S.000Z')
+
+def parseDatetime(value):
+  value = value.strip()
+  if len(value) == 10:
+    return datetime.datetime.strptime(value, '%Y-%m-%d')
+  value = re.sub(r'(\.\d+)?(Z|[+-]\d\d:?\d\d)?$', '', value)
+  return datetime.datetime.strptime(value, '%Y-%m-%dT%H:%M:%S')
+
+_ID = re.compile(r'^[a-zA-Z0-9]{15}(?:[a-zA-Z0-9]{3})?$')
+_EMAIL = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+
+def localName(tag):
+  return tag.rsplit('}', 1)[-1]
+
+def isNil(el):
+  return el.get('{%s}nil' % XSI_NS) == 'true'
+
+def makeId(prefix, number):
+  '''
+  An 18-character Id: prefix, zero-padded base-62 number, and the case-checksum suffix
+  '''
+  digits = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+  body = ''
+  while number:
+    (number, digit) = divmod(number, 62)
+    body = digits[digit] + body
+  id = prefix + body.rjust(12, '0')
+
+  suffix = ''
+  for chunk in (id[0:5], id[5:10], id[10:15]):
+    bits = 0
+    for (i, c) in enumerate(chunk):
+      if 'A' <= c <= 'Z':
+        bits |= 1 << i
+    suffix += 'ABCDEFGHIJKLMNOPQRSTUVWXYZ012345'[bits]
+  return id + suffix
+
+#
+# SOQL
+#
+
+_TOKEN = re.compile(r'''\s*(?:
+    (?P<string>'(?:[^'\\]|\\.)*')
+  | (?P<datetime>\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d(?:\.\d+)?(?:Z|[+-]\d\d:\d\d))
+  | (?P<date>\d{4}-\d\d-\d\d)
+  | (?P<number>-?\d+(?:\.\d+)?)
+  | (?P<op><=|>=|!=|<>|=|<|>|\(|\)|,)
+  | (?P<word>[A-Za-z_][\w.]*)
+  )''', re.VERBOSE)
+
+class Query(object):
+  '''
+  A parsed SOQL SELECT
+
+  'tokens' : the tokens of a child relationship subquery, whose FROM names a relationship
+             rather than an sObject type
+  '''
+  def __init__(self, soql, tokens = None):
+    if tokens is None:
+      tokens = self._tokenize(soql)
+    self.tokens = tokens
+    self.pos = 0
+
+    self._expect('SELECT')
+    self.fields = []
+    self.subqueries = []
+    self.count = False
+    while True:
+      word = self._next()
+      if word == '(':
+        self.subqueries.append(Query(None, self._parenthesized()))
+      elif word.upper() == 'COUNT' and self._peek() == '(':
+        self._next()
+        self._expect(')')
+        self.count = True
+      else:
+        self.fields.append(word)
+      if self._peek() != ',':
+        break
+      self._next()
+
+    selected = set()
+    for field in self.fields:
+      if field.lower() in selected:
+        raise SoapFault('MALFORMED_QUERY', 'duplicate field selected: %s' % field)
+      selected.add(field.lower())
+
+    self._expect('FROM')
+    if soql is None:
+      self.sObjectType = self._next()
+    else:
+      self.sObjectType = canonicalType(self._next())
+
+    self.where = None
+    self.orderBy = []
+    self.limit = None
+
+    if self._peekWord() == 'WHERE':
+      self._next()
+      self.where = self._condition()
+    if self._peekWord() == 'ORDER':
+      self._next()
+      self._expect('BY')
+      while True:
+        field = self._next()
+        descending = False
+        if self._peekWord() in ('ASC', 'DESC'):
+          descending = self._next().upper() == 'DESC'
+        if self._peekWord() == 'NULLS':
+          self._next()
+          self._next()
+        self.orderBy.append((field, descending))
+        if self._peek() != ',':
+          break
+        self._next()
+    if self._peekWord() == 'LIMIT':
+      self._next()
+      self.limit = int(self._next())
+    if self.pos != len(self.tokens):
+      raise SoapFault('MALFORMED_QUERY', 'unexpected token: %s' % self.tokens[self.pos][1])
+
+  def _parenthesized(self):
+    '''
+    The tokens up to the ')' closing an already consumed '('
+    '''
+    start = self.pos
+    depth = 1
+    while True:
+      value = self._next()
+      if value == '(':
+        depth += 1
+      elif value == ')':
+        depth -= 1
+        if depth == 0:
+          return self.tokens[start:self.pos - 1]
+
+  def _tokenize(self, soql):
+    tokens = []
+    pos = 0
+    soql = soql.strip()
+    while pos < len(soql):
+      match = _TOKEN.match(soql, pos)
+      if match is None or match.end() == pos:
+        raise SoapFault('MALFORMED_QUERY', 'unexpected character at %d' % pos)
+      kind = match.lastgroup
+      tokens.append((kind, match.group(kind)))
+      pos = match.end()
+    return tokens
+
+  def _peek(self):
+    if self.pos < len(self.tokens):
+      return self.tokens[self.pos][1]
+    return None
+
+  def _peekWord(self):
+    value = self._peek()
+    if value is not None:
+      return value.upper()
+    return None
+
+  def _next(self):
+    if self.pos >= len(self.tokens):
+      raise SoapFault('MALFORMED_QUERY', 'unexpected end of query')
+    value = self.tokens[self.pos][1]
+    self.pos += 1
+    return value
+
+  def _expect(self, word):
+    value = self._next()
+    if value.upper() != word:
+      raise SoapFault('MALFORMED_QUERY', 'expected %s, found %s' % (word, value))
+
+  def _value(self):
+    (kind, value) = self.tokens[self.pos]
+    self.pos += 1
+    if kind == 'string':
+      return re.sub(r'\\(.)', r'\1', value[1:-1])
+    if kind == 'datetime':
+      return formatDatetime(parseDatetime(value))
+    if kind == 'date':
+      return value
+    if kind == 'number':
+      return float(value)
+    if value.upper() == 'NULL':
+      return None
+    if value.upper() in ('TRUE', 'FALSE'):
+      return value.upper() == 'TRUE'
+    raise SoapFault('MALFORMED_QUERY', 'unexpected value: %s' % value)
+
+  def _condition(self):
+    terms = [self._term()]
+    while self._peekWord() in ('AND', 'OR'):
+      terms.append(self._next().upper())
+      terms.append(self._term())
+    # AND binds tighter than OR
+    ors = [[terms[0]]]
+    for i in range(1, len(terms), 2):
+      if terms[i] == 'AND':
+        ors[-1].append(terms[i + 1])
+      else:
+        ors.append([terms[i + 1]])
+    return ('or', [('and', ands) for ands in ors])
+
+  def _term(self):
+    if self._peek() == '(':
+      self._next()
+      condition = self._condition()
+      self._expect(')')
+      return condition
+    if self._peekWord() == 'NOT':
+      self._next()
+      return ('not', self._term())
+
+    field = self._next()
+    op = self._next().upper()
+    if op == 'NOT':
+      self._expect('IN')
+      op = 'NOT IN'
+    if op in ('IN', 'NOT IN'):
+      self._expect('(')
+      values = [self._value()]
+      while self._peek() == ',':
+        self._next()
+        values.append(self._value())
+      self._expect(')')
+      return ('compare', field, op, values)
+    if op == 'LIKE':
+      pattern = re.escape(self._value()).replace('\\%', '.*').replace('\\_', '.')
+      return ('compare', field, op, re.compile('^' + pattern + '$', re.I | re.S))
+    return ('compare', field, op, self._value())
+
+def canonicalType(name):
+  for sObjectType in SCHEMA:
+    if sObjectType.lower() == name.lower():
+      return sObjectType
+  raise SoapFault('INVALID_TYPE', "sObject type '%s' is not supported." % name)
+
+def relationshipName(field):
+  '''
+  The name of the relationship a reference field is the Id of, e.g. Account for AccountId
+  '''
+  if field.endswith('__c'):
+    return field[:-1] + 'r'
+  return field[:-2]
+
+def childRelationshipName(sObjectType):
+  if sObjectType.endswith('__c'):
+    return sObjectType[:-3] + 's__r'
+  if sObjectType.endswith('y'):
+    return sObjectType[:-1] + 'ies'
+  return sObjectType + 's'
+
+def childRelationships(sObjectType):
+  '''
+  (child sObject type, reference field, relationship name) for each reference to sObjectType
+  '''
+  relationships = []
+  for childType in sorted(SCHEMA):
+    for (field, type, referenceTo) in SCHEMA[childType][1]:
+      if referenceTo == sObjectType:
+        relationships.append((childType, field, childRelationshipName(childType)))
+  return relationships
+
+def canonicalField(sObjectType, name):
+  for (field, type, referenceTo) in SCHEMA[sObjectType][1]:
+    if field.lower() == name.lower():
+      return field
+  raise SoapFault('INVALID_FIELD', "No such column '%s' on entity '%s'." % (name, sObjectType))
+
+#
+# Data
+#
+
+class Store(object):
+  '''
+  In-memory records, per sObject type, in insertion (i.e. Id) order
+  '''
+  def __init__(self, records, seed):
+    self.lock = threading.RLock()
+    self.records = {}
+    self.counters = {}
+    # Id => deletion datetime, for the recycle bin and getDeleted()
+    self.deleted = {}
+    for sObjectType in SCHEMA:
+      self.records[sObjectType] = {}
+      self.counters[sObjectType] = 0
+
+    self.generate(records, seed)
+
+  def nextId(self, sObjectType):
+    self.counters[sObjectType] += 1
+    return makeId(SCHEMA[sObjectType][0], self.counters[sObjectType])
+
+  def generate(self, records, seed):
+    '''
+    Fill the store with the API user, records of each of Account, Contact and Lead, and
+    FIXTURE_LEADS
+    '''
+    rnd = random.Random(seed)
+    now = datetime.datetime.utcnow().replace(microsecond = 0)
+
+    def timestamp():
+      return formatDatetime(now - datetime.timedelta(seconds = rnd.randint(3600, 365 * 86400)))
+
+    self.insert('User', {'Name': u'Test User', 'Username': 'user@example.com',
+                         'Email': 'user@example.com', 'IsActive': True}, timestamp())
+
+    accountIds = []
+    for i in range(records):
+      created = timestamp()
+      record = {'Name': u'%s %d' % (rnd.choice(COMPANIES), i),
+                'Industry': rnd.choice(INDUSTRIES),
+                'AnnualRevenue': float(rnd.randint(0, 10000000)),
+                'NumberOfEmployees': rnd.randint(1, 100000),
+                'Website': 'http://www%d.example.com' % i,
+                'CreatedDate': created,
+                'SystemModstamp': created}
+      accountIds.append(self.insert('Account', record, created))
+
+    for i in range(records):
+      created = timestamp()
+      record = {'FirstName': rnd.choice(FIRST_NAMES),
+                'LastName': rnd.choice(LAST_NAMES),
+                'Email': 'contact%d@example.com' % i,
+                'Phone': '(617) 555-%04d' % (i % 10000),
+                'AccountId': rnd.choice(accountIds),
+                'Birthdate': (datetime.date(1950, 1, 1) + datetime.timedelta(days = rnd.randint(0, 18000))).isoformat(),
+                'DoNotCall': rnd.random() < 0.2,
+                'Description': None,
+                'CreatedDate': created,
+                'SystemModstamp': created}
+      self.insert('Contact', record, created)
+
+    for i in range(records):
+      created = timestamp()
+      record = {'FirstName': rnd.choice(FIRST_NAMES),
+                'LastName': rnd.choice(LAST_NAMES),
+                'Company': rnd.choice(COMPANIES),
+                'Email': 'lead%d@example.com' % i,
+                'Phone': '(617) 555-%04d' % (i % 10000),
+                'Fax': None,
+                'Status': 'Open',
+                'DoNotCall': rnd.random() < 0.2,
+                'AnnualRevenue': float(rnd.randint(0, 1000000)),
+                'Description': None,
+                'CreatedDate': created,
+                'SystemModstamp': created}
+      self.insert('Lead', record, created)
+
+    # Records the tests look for
+    for (firstName, lastName, company) in FIXTURE_LEADS:
+      created = timestamp()
+      self.insert('Lead', {'FirstName': firstName, 'LastName': lastName, 'Company': company,
+                           'Status': 'Open', 'DoNotCall': False, 'CreatedDate': created,
+                           'SystemModstamp': created}, created)
+
+  def insert(self, sObjectType, values, now):
+    record = dict([(field, None) for (field, type, referenceTo) in SCHEMA[sObjectType][1]])
+    record.update(values)
+    record['Id'] = self.nextId(sObjectType)
+    record['IsDeleted'] = False
+    if 'OwnerId' in record and record['OwnerId'] is None:
+      record['OwnerId'] = USER_ID
+    # Checkboxes are never null
+    for (field, type, referenceTo) in SCHEMA[sObjectType][1]:
+      if type == 'boolean' and record[field] is None:
+        record[field] = False
+    record['CreatedDate'] = values.get('CreatedDate') or now
+    record['SystemModstamp'] = values.get('SystemModstamp') or now
+    self.records[sObjectType][record['Id']] = record
+    return record['Id']
+
+  def find(self, id):
+    '''
+    Return (sObjectType, record) for an 15- or 18-character Id, or (None, None)
+    '''
+    if not id:
+      return (None, None)
+    for (sObjectType, (prefix, fields)) in SCHEMA.items():
+      if id.startswith(prefix):
+        for (key, record) in self.records[sObjectType].iteritems():
+          if key[:15] == id[:15]:
+            return (sObjectType, record)
+    return (None, None)
+
+  def get(self, sObjectType, id):
+    if id is None:
+      return None
+    records = self.records[sObjectType]
+    record = records.get(id)
+    if record is None and len(id) == 15:
+      for (key, candidate) in records.iteritems():
+        if key[:15] == id:
+          return candidate
+    return record
+
+#
+# WSDL
+#
+
+# The API's own types.  Fields are 'name type', type being an XML Schema type (string,
+# boolean, ...), one of these types or ens:sObject; a trailing ? makes a field optional and
+# nillable, and * makes it a list.  (name, base type, fields)
+WSDL_TYPES = (
+  ('LoginResult', None,
+   'metadataServerUrl string?, passwordExpired boolean, sandbox boolean, serverUrl string?, '
+   'sessionId string?, userId ID?, userInfo GetUserInfoResult?'),
+  ('GetUserInfoResult', None,
+   'accessibilityMode boolean, currencySymbol string?, orgDefaultCurrencyIsoCode string?, '
+   'orgDisallowHtmlAttachments boolean, orgHasPersonAccounts boolean, organizationId ID, '
+   'organizationMultiCurrency boolean, organizationName string, profileId ID, roleId ID?, '
+   'userDefaultCurrencyIsoCode string?, userEmail string, userFullName string, userId ID, '
+   'userLanguage string, userLocale string, userName string, userTimeZone string, '
+   'userType string, userUiSkin string'),
+  ('QueryResult', None, 'done boolean, queryLocator QueryLocator?, records ens:sObject*, size int'),
+  ('SearchResult', None, 'searchRecords SearchRecord*, sforceReserved string?'),
+  ('SearchRecord', None, 'record ens:sObject'),
+  ('Error', None, 'fields string*, message string, statusCode string'),
+  ('SaveResult', None, 'errors Error*, id ID?, success boolean'),
+  ('UpsertResult', None, 'created boolean, errors Error*, id ID?, success boolean'),
+  ('DeleteResult', None, 'errors Error*, id ID?, success boolean'),
+  ('UndeleteResult', None, 'errors Error*, id ID?, success boolean'),
+  ('EmptyRecycleBinResult', None, 'errors Error*, id ID?, success boolean'),
+  ('MergeRequest', None, 'masterRecord ens:sObject, recordToMergeIds ID*'),
+  ('MergeResult', None,
+   'errors Error*, id ID?, mergedRecordIds ID*, success boolean, updatedRelatedIds ID*'),
+  ('LeadConvert', None,
+   'accountId ID?, contactId ID?, convertedStatus string, doNotCreateOpportunity boolean?, '
+   'leadId ID, opportunityName string?, overwriteLeadSource boolean?, ownerId ID?, '
+   'sendNotificationEmail boolean?'),
+  ('LeadConvertResult', None,
+   'accountId ID?, contactId ID?, errors Error*, leadId ID?, opportunityId ID?, success boolean'),
+  ('ProcessRequest', None, 'comments string?, nextApproverIds ID*'),
+  ('ProcessSubmitRequest', 'ProcessRequest', 'objectId ID'),
+  ('ProcessWorkitemRequest', 'ProcessRequest', 'action string, workitemId ID'),
+  ('ProcessResult', None,
+   'actorIds ID*, entityId ID?, errors Error*, instanceId ID?, instanceStatus string?, '
+   'newWorkitemIds ID*, success boolean'),
+  ('Email', None,
+   'bccSender boolean?, emailPriority string?, replyTo string?, saveAsActivity boolean?, '
+   'senderDisplayName string?, subject string?, useSignature boolean?'),
+  ('SingleEmailMessage', 'Email',
+   'bccAddresses string*, ccAddresses string*, charset string?, documentAttachments ID*, '
+   'htmlBody string?, inReplyTo string?, orgWideEmailAddressId ID?, plainTextBody string?, '
+   'references string?, targetObjectId ID?, templateId ID?, toAddresses string*, whatId ID?'),
+  ('MassEmailMessage', 'Email',
+   'description string?, targetObjectIds ID*, templateId ID, whatIds ID*'),
+  ('SendEmailError', None,
+   'fields string*, message string, statusCode string, targetObjectId ID?'),
+  ('SendEmailResult', None, 'errors SendEmailError*, success boolean'),
+  ('InvalidateSessionsResult', None, 'errors Error*, success boolean'),
+  ('GetUpdatedResult', None, 'ids ID*, latestDateCovered dateTime'),
+  ('GetDeletedResult', None,
+   'deletedRecords DeletedRecord*, earliestDateAvailable dateTime, latestDateCovered dateTime'),
+  ('DeletedRecord', None, 'deletedDate dateTime, id ID'),
+  ('GetServerTimestampResult', None, 'timestamp dateTime'),
+  ('SetPasswordResult', None, ''),
+  ('ResetPasswordResult', None, 'password string'),
+  ('DescribeGlobalResult', None,
+   'encoding string?, maxBatchSize int, sobjects DescribeGlobalSObjectResult*'),
+  ('DescribeGlobalSObjectResult', None,
+   'activateable boolean, createable boolean, custom boolean, customSetting boolean, '
+   'deletable boolean, deprecatedAndHidden boolean, keyPrefix string?, label string, '
+   'labelPlural string, layoutable boolean, mergeable boolean, name string, '
+   'queryable boolean, replicateable boolean, retrieveable boolean, searchable boolean, '
+   'triggerable boolean, undeletable boolean, updateable boolean'),
+  ('DescribeSObjectResult', None,
+   'activateable boolean, childRelationships ChildRelationship*, createable boolean, '
+   'custom boolean, customSetting boolean, deletable boolean, deprecatedAndHidden boolean, '
+   'feedEnabled boolean, fields Field*, keyPrefix string?, label string, labelPlural string, '
+   'layoutable boolean, mergeable boolean, name string, queryable boolean, '
+   'recordTypeInfos RecordTypeInfo*, replicateable boolean, retrieveable boolean, '
+   'searchable boolean, triggerable boolean, undeletable boolean, updateable boolean'),
+  ('ChildRelationship', None,
+   'cascadeDelete boolean, childSObject string, deprecatedAndHidden boolean, field string, '
+   'relationshipName string?'),
+  ('Field', None,
+   'autoNumber boolean, byteLength int, calculated boolean, caseSensitive boolean, '
+   'createable boolean, custom boolean, defaultedOnCreate boolean, dependentPicklist boolean?, '
+   'deprecatedAndHidden boolean, digits int, externalId boolean?, filterable boolean, '
+   'groupable boolean, htmlFormatted boolean?, idLookup boolean, label string, length int, '
+   'name string, nameField boolean, namePointing boolean?, nillable boolean, '
+   'permissionable boolean, picklistValues PicklistEntry*, precision int, '
+   'referenceTo string*, relationshipName string?, restrictedPicklist boolean, scale int, '
+   'soapType string, sortable boolean?, type string, unique boolean, updateable boolean'),
+  ('PicklistEntry', None, 'active boolean, defaultValue boolean, label string?, value string'),
+  ('RecordTypeInfo', None,
+   'available boolean, defaultRecordTypeMapping boolean, name string, recordTypeId ID?'),
+  ('DescribeLayoutResult', None,
+   'layouts DescribeLayout*, recordTypeMappings RecordTypeMapping*, '
+   'recordTypeSelectorRequired boolean'),
+  ('DescribeLayout', None,
+   'detailLayoutSections DescribeLayoutSection*, editLayoutSections DescribeLayoutSection*, '
+   'id ID'),
+  ('DescribeLayoutSection', None,
+   'columns int, heading string, layoutRows DescribeLayoutRow*, rows int, useHeading boolean'),
+  ('DescribeLayoutRow', None, 'layoutItems DescribeLayoutItem*, numItems int'),
+  ('DescribeLayoutItem', None,
+   'editable boolean, label string?, layoutComponents DescribeLayoutComponent*, '
+   'placeholder boolean, required boolean'),
+  ('DescribeLayoutComponent', None, 'displayLines int, tabOrder int, type string, value string'),
+  ('RecordTypeMapping', None,
+   'available boolean, defaultRecordTypeMapping boolean, layoutId ID, name string, '
+   'recordTypeId ID?'),
+  ('DescribeTabSetResult', None,
+   'label string, logoUrl string, namespace string?, selected boolean, tabs DescribeTab*'),
+  ('DescribeTab', None,
+   'custom boolean, iconUrl string, label string, miniIconUrl string, sobjectName string?, '
+   'url string'),
+  ('PackageVersion', None, 'majorNumber int, minorNumber int, namespace string'),
+)
+
+# header => (fields, calls it's sent with); SessionHeader goes with every call but login
+WSDL_HEADERS = (
+  ('SessionHeader', 'sessionId string', None),
+  ('AllowFieldTruncationHeader', 'allowFieldTruncation boolean',
+   'convertLead create merge process undelete update upsert'),
+  ('AssignmentRuleHeader', 'assignmentRuleId ID?, useDefaultRule boolean?',
+   'create merge update upsert'),
+  ('CallOptions', 'client string, defaultNamespace string',
+   'convertLead create delete describeGlobal describeLayout describeSObject describeSObjects '
+   'describeTabs getDeleted getServerTimestamp getUpdated getUserInfo login merge process '
+   'query queryAll queryMore resetPassword retrieve search setPassword undelete update upsert'),
+  ('EmailHeader', 'triggerAutoResponseEmail boolean, triggerOtherEmail boolean, '
+   'triggerUserEmail boolean', 'create delete resetPassword update upsert'),
+  ('LocaleOptions', 'language string?', 'describeSObject describeSObjects'),
+  ('LoginScopeHeader', 'organizationId ID, portalId ID?', 'login'),
+  ('MruHeader', 'updateMru boolean', 'create merge query retrieve update upsert'),
+  ('PackageVersionHeader', 'packageVersions PackageVersion*',
+   'convertLead create delete describeGlobal describeLayout describeSObject describeSObjects '
+   'describeTabs merge process query retrieve search undelete update upsert'),
+  ('QueryOptions', 'batchSize int?', 'query queryAll queryMore retrieve'),
+  ('UserTerritoryDeleteHeader', 'transferToUserId ID?', 'delete'),
+)
+
+# call => (request fields, response fields)
+WSDL_OPERATIONS = (
+  ('login', 'username string, password string', 'result LoginResult'),
+  ('logout', '', ''),
+  ('invalidateSessions', 'sessionIds string*', 'result InvalidateSessionsResult*'),
+  ('describeGlobal', '', 'result DescribeGlobalResult'),
+  ('describeSObject', 'sObjectType string', 'result DescribeSObjectResult?'),
+  ('describeSObjects', 'sObjectType string*', 'result DescribeSObjectResult*'),
+  ('describeLayout', 'sObjectType string, recordTypeIds ID*', 'result DescribeLayoutResult?'),
+  ('describeTabs', '', 'result DescribeTabSetResult*'),
+  ('create', 'sObjects ens:sObject*', 'result SaveResult*'),
+  ('update', 'sObjects ens:sObject*', 'result SaveResult*'),
+  ('upsert', 'externalIDFieldName string, sObjects ens:sObject*', 'result UpsertResult*'),
+  ('merge', 'request MergeRequest*', 'result MergeResult*'),
+  ('delete', 'ids ID*', 'result DeleteResult*'),
+  ('undelete', 'ids ID*', 'result UndeleteResult*'),
+  ('emptyRecycleBin', 'ids ID*', 'result EmptyRecycleBinResult*'),
+  ('process', 'actions ProcessRequest*', 'result ProcessResult*'),
+  ('convertLead', 'leadConverts LeadConvert*', 'result LeadConvertResult*'),
+  ('retrieve', 'fieldList string, sObjectType string, ids ID*', 'result ens:sObject*'),
+  ('query', 'queryString string', 'result QueryResult'),
+  ('queryAll', 'queryString string', 'result QueryResult'),
+  ('queryMore', 'queryLocator QueryLocator', 'result QueryResult'),
+  ('search', 'searchString string', 'result SearchResult'),
+  ('getUpdated', 'sObjectType string, startDate dateTime, endDate dateTime',
+   'result GetUpdatedResult'),
+  ('getDeleted', 'sObjectType string, startDate dateTime, endDate dateTime',
+   'result GetDeletedResult'),
+  ('getServerTimestamp', '', 'result GetServerTimestampResult'),
+  ('getUserInfo', '', 'result GetUserInfoResult'),
+  ('setPassword', 'userId ID, password string', 'result SetPasswordResult'),
+  ('resetPassword', 'userId ID', 'result ResetPasswordResult'),
+  ('sendEmail', 'messages Email*', 'result SendEmailResult*'),
+)
+
+_XSD_TYPES = ('string', 'boolean', 'int', 'double', 'date', 'dateTime')
+
+def _wsdlSequence(fields):
+  out = ['<sequence>']
+  for spec in fields.split(','):
+    if not spec.strip():
+      continue
+    (name, type) = spec.split()
+    occurs = ''
+    if type[-1] == '?':
+      (type, occurs) = (type[:-1], ' minOccurs="0" nillable="true"')
+    elif type[-1] == '*':
+      (type, occurs) = (type[:-1], ' minOccurs="0" maxOccurs="unbounded" nillable="true"')
+    if ':' not in type:
+      type = (type in _XSD_TYPES and 'xsd:' or 'tns:') + type
+    out.append('<element name="%s" type="%s"%s/>' % (name, type, occurs))
+  out.append('</sequence>')
+  return ''.join(out)
+
+def _wsdlComplexType(name, base, fields):
+  if base is None:
+    return '<complexType name="%s">%s</complexType>' % (name, _wsdlSequence(fields))
+  return ('<complexType name="%s"><complexContent><extension base="tns:%s">%s</extension>'
+          '</complexContent></complexType>' % (name, base, _wsdlSequence(fields)))
+
+def _wsdlSObjects(dialect):
+  '''
+  The sObject namespace's schema: a generic sObject for the Partner WSDL, and a type per
+  sObject for the Enterprise WSDL
+  '''
+  (tns, ens, fns, letter) = DIALECTS[dialect]
+  out = ['<schema elementFormDefault="qualified" xmlns="http://www.w3.org/2001/XMLSchema" '
+         'targetNamespace="%s"><import namespace="%s"/>' % (ens, tns)]
+  if dialect == 'partner':
+    out.append('<complexType name="sObject"><sequence><element name="type" type="xsd:string"/>'
+               '<element name="fieldsToNull" type="xsd:string" minOccurs="0" maxOccurs="unbounded" nillable="true"/>'
+               '<element name="Id" type="tns:ID" nillable="true"/>'
+               '<any namespace="##targetNamespace" minOccurs="0" maxOccurs="unbounded" processContents="lax"/>'
+               '</sequence></complexType>')
+  else:
+    out.append('<complexType name="sObject"><sequence>'
+               '<element name="fieldsToNull" type="xsd:string" minOccurs="0" maxOccurs="unbounded" nillable="true"/>'
+               '<element name="Id" type="tns:ID" minOccurs="0" nillable="true"/>'
+               '</sequence></complexType>')
+    for sObjectType in sorted(SCHEMA):
+      fields = []
+      for (field, type, referenceTo) in SCHEMA[sObjectType][1]:
+        if field == 'Id':
+          continue
+        if referenceTo is not None:
+          fields.append('<element name="%s" type="ens:%s" minOccurs="0" nillable="true"/>'
+                        % (field[:-2], referenceTo))
+        fields.append('<element name="%s" type="%s" minOccurs="0" nillable="true"/>'
+                      % (field, SOAP_TYPES.get(type, 'xsd:string')))
+      for (childType, field, name) in childRelationships(sObjectType):
+        fields.append('<element name="%s" type="tns:QueryResult" minOccurs="0" nillable="true"/>' % name)
+      out.append('<complexType name="%s"><complexContent><extension base="ens:sObject"><sequence>'
+                 '%s</sequence></extension></complexContent></complexType>' % (sObjectType, ''.join(fields)))
+  out.append('</schema>')
+  return ''.join(out)
+
+def wsdl(dialect, location):
+  '''
+  A Partner or Enterprise WSDL covering the calls, headers and types the server implements,
+  with location as the login endpoint
+  '''
+  (tns, ens, fns, letter) = DIALECTS[dialect]
+  out = ['<?xml version="1.0" encoding="UTF-8"?>'
+         '<definitions targetNamespace="%s" xmlns="http://schemas.xmlsoap.org/wsdl/" '
+         'xmlns:soap="http://schemas.xmlsoap.org/wsdl/soap/" xmlns:xsd="http://www.w3.org/2001/XMLSchema" '
+         'xmlns:tns="%s" xmlns:ens="%s" xmlns:fns="%s"><types>' % (tns, tns, ens, fns)]
+  out.append(_wsdlSObjects(dialect))
+
+  out.append('<schema elementFormDefault="qualified" xmlns="http://www.w3.org/2001/XMLSchema" '
+             'targetNamespace="%s"><import namespace="%s"/>' % (tns, ens))
+  out.append('<simpleType name="ID"><restriction base="xsd:string"/></simpleType>'
+             '<simpleType name="QueryLocator"><restriction base="xsd:string"/></simpleType>')
+  for (name, base, fields) in WSDL_TYPES:
+    out.append(_wsdlComplexType(name, base, fields))
+  for (name, fields, calls) in WSDL_HEADERS:
+    if name == 'CallOptions' and dialect == 'enterprise':
+      fields = 'client string'
+    out.append('<element name="%s"><complexType>%s</complexType></element>' % (name, _wsdlSequence(fields)))
+  for (call, request, response) in WSDL_OPERATIONS:
+    out.append('<element name="%s"><complexType>%s</complexType></element>'
+               '<element name="%sResponse"><complexType>%s</complexType></element>'
+               % (call, _wsdlSequence(request), call, _wsdlSequence(response)))
+  out.append('</schema></types>')
+
+  out.append('<message name="Header">')
+  for (name, fields, calls) in WSDL_HEADERS:
+    out.append('<part element="tns:%s" name="%s"/>' % (name, name))
+  out.append('</message>')
+  for (call, request, response) in WSDL_OPERATIONS:
+    out.append('<message name="%sRequest"><part element="tns:%s" name="parameters"/></message>'
+               '<message name="%sResponse"><part element="tns:%sResponse" name="parameters"/></message>'
+               % (call, call, call, call))
+
+  out.append('<portType name="Soap">')
+  for (call, request, response) in WSDL_OPERATIONS:
+    out.append('<operation name="%s"><input message="tns:%sRequest"/><output message="tns:%sResponse"/></operation>'
+               % (call, call, call))
+  out.append('</portType>')
+
+  out.append('<binding name="SoapBinding" type="tns:Soap">'
+             '<soap:binding style="document" transport="http://schemas.xmlsoap.org/soap/http"/>')
+  for (call, request, response) in WSDL_OPERATIONS:
+    out.append('<operation name="%s"><soap:operation soapAction=""/><input>' % call)
+    for (name, fields, calls) in WSDL_HEADERS:
+      if (calls is None and call != 'login') or (calls is not None and call in calls.split()):
+        out.append('<soap:header use="literal" message="tns:Header" part="%s"/>' % name)
+    out.append('<soap:body parts="parameters" use="literal"/></input>'
+               '<output><soap:body use="literal"/></output></operation>')
+  out.append('</binding>')
+
+  out.append('<service name="SforceService"><port binding="tns:SoapBinding" name="Soap">'
+             '<soap:address location="%s"/></port></service></definitions>' % escape(location))
+  return ''.join(out)
+
+#
+# Server
+#
+
+class SforceTestServer(object):
+  '''
+  A stand-in Salesforce SOAP and Bulk API endpoint, run on a background thread with start()
+  or in the foreground with serveForever()
+  '''
+  def __init__(self, host = '127.0.0.1', port = 0, records = 1000, pageSize = 500,
+               latency = 0, sessionTimeout = None, maxUpdatedIds = 600000, seed = 0,
+               apiVersion = '20.0', username = None, password = None):
+    '''
+    'host', 'port' : Address to listen on; port 0 picks a free one
+    'records' : Number of synthetic Accounts, Contacts and Leads (each) to start with
+    'pageSize' : Records per query()/queryMore() page, unless QueryOptions asks for fewer
+    'latency' : Seconds to wait before answering each call
+    'sessionTimeout' : Seconds after which a session is rejected with INVALID_SESSION_ID
+    'maxUpdatedIds' : Most Ids getUpdated()/getDeleted() will return before faulting with
+                      EXCEEDED_ID_LIMIT
+    'seed' : Seed for the synthetic data
+    'apiVersion' : Version to put in the server URLs
+    'username', 'password' : Credentials login() accepts (password includes the token), or
+                             None to accept any
+    '''
+    self.store = Store(records, seed)
+    self.pageSize = pageSize
+    self.latency = latency
+    self.sessionTimeout = sessionTimeout
+    self.maxUpdatedIds = maxUpdatedIds
+    self.apiVersion = apiVersion
+    self.username = username
+    self.password = password
+
+    # sessionId => time issued
+    self.sessions = {}
+    # queryLocator => (records, offset, page size, fields, sObjectType)
+    self.cursors = {}
+    # Bulk API job Id => job, as a dict
+    self.jobs = {}
+    self.calls = {}
+    self._counter = 0
+
+    server = self
+
+    class Handler(_Handler):
+      pass
+    Handler.server_ = server
+
+    self.httpd = _HTTPServer((host, port), Handler)
+    self.thread = None
+
+  def getServerUrl(self, dialect = 'partner'):
+    '''
+    The URL to pass to the client as 'location'
+    '''
+    (host, port) = self.httpd.server_address
+    return 'http://%s:%d/services/Soap/%s/%s' % (host, port, DIALECTS[dialect][3], self.apiVersion)
+
+  def getWsdlUrl(self, dialect = 'partner'):
+    '''
+    The URL of a Partner or Enterprise WSDL for the server, to pass to the client in place of
+    one downloaded from an org; its endpoint is the server, so no 'location' is needed
+    '''
+    (host, port) = self.httpd.server_address
+    return 'http://%s:%d/soap/wsdl.jsp?type=%s' % (host, port, dialect)
+
+  def start(self):
+    self.thread = threading.Thread(target = self.httpd.serve_forever)
+    self.thread.setDaemon(True)
+    self.thread.start()
+    return self
+
+  def serveForever(self):
+    self.httpd.serve_forever()
+
+  def stop(self):
+    self.httpd.shutdown()
+    self.httpd.server_close()
+
+  def expireSessions(self):
+    '''
+    Invalidate every session, as if they had all timed out
+    '''
+    self.sessions.clear()
+
+  def _nextToken(self, prefix):
+    self.store.lock.acquire()
+    try:
+      self._counter += 1
+      return '%s%015d' % (prefix, self._counter)
+    finally:
+      self.store.lock.release()
+
+  #
+  # Request handling
+  #
+
+  def handle(self, body):
+    '''
+    Answer a SOAP request, returning (HTTP status, response XML)
+    '''
+    if self.latency:
+      time.sleep(self.latency)
+
+    dialect = 'partner'
+    try:
+      envelope = ElementTree.fromstring(body)
+      header = envelope.find('{%s}Header' % SOAP_NS)
+      bodyEl = envelope.find('{%s}Body' % SOAP_NS)
+      if bodyEl is None or len(bodyEl) == 0:
+        raise SoapFault('INVALID_OPERATION', 'No operation in request')
+      operation = bodyEl[0]
+      call = localName(operation.tag)
+      if operation.tag.startswith('{%s}' % DIALECTS['enterprise'][0]):
+        dialect = 'enterprise'
+
+      headers = {}
+      if header is not None:
+        for el in header:
+          headers[localName(el.tag)] = dict([(localName(child.tag), child.text) for child in el])
+
+      self.calls[call] = self.calls.get(call, 0) + 1
+
+      method = getattr(self, 'do_' + call, None)
+      if method is None:
+        raise SoapFault('INVALID_OPERATION', 'Unsupported call: %s' % call)
+      if call != 'login':
+        self._checkSession(headers)
+
+      result = method(dialect, operation, headers)
+      return (200, self._envelope(dialect, '<%sResponse>%s</%sResponse>' % (call, result, call)))
+    except SoapFault, e:
+      return (500, self._fault(dialect, e))
+    except SyntaxError, e:
+      # ElementTree's ParseError
+      return (500, self._fault(dialect, SoapFault('INVALID_XML', str(e))))
+
+  def _validSession(self, sessionId):
+    issued = self.sessions.get(sessionId)
+    return issued is not None and (self.sessionTimeout is None or time.time() - issued <= self.sessionTimeout)
+
+  def _checkSession(self, headers):
+    if not self._validSession(headers.get('SessionHeader', {}).get('sessionId')):
+      raise SoapFault('INVALID_SESSION_ID', 'Invalid Session ID found in SessionHeader: Illegal Session')
+
+  def _envelope(self, dialect, content):
+    (tns, sf, fault, letter) = DIALECTS[dialect]
+    return ('<?xml version="1.0" encoding="UTF-8"?>'
+            '<soapenv:Envelope xmlns:soapenv="%s" xmlns="%s" xmlns:xsi="%s" xmlns:sf="%s">'
+            '<soapenv:Body>%s</soapenv:Body></soapenv:Envelope>' % (SOAP_NS, tns, XSI_NS, sf, content))
+
+  def _fault(self, dialect, e):
+    (tns, sf, fault, letter) = DIALECTS[dialect]
+    if e.code == 'INVALID_SESSION_ID':
+      faultType = 'UnexpectedErrorFault'
+    elif e.code in ('MALFORMED_QUERY', 'INVALID_FIELD', 'INVALID_TYPE', 'INVALID_QUERY_LOCATOR'):
+      faultType = 'InvalidSObjectFault'
+    elif e.code in ('MALFORMED_ID', 'INVALID_ID_FIELD', 'INVALID_CROSS_REFERENCE_KEY'):
+      faultType = 'InvalidIdFault'
+    else:
+      faultType = 'UnexpectedErrorFault'
+    return ('<?xml version="1.0" encoding="UTF-8"?>'
+            '<soapenv:Envelope xmlns:soapenv="%s" xmlns:xsi="%s" xmlns:sf="%s">'
+            '<soapenv:Body><soapenv:Fault><faultcode>sf:%s</faultcode><faultstring>%s: %s</faultstring>'
+            '<detail><sf:%s xsi:type="sf:%s"><sf:exceptionCode>%s</sf:exceptionCode>'
+            '<sf:exceptionMessage>%s</sf:exceptionMessage></sf:%s></detail>'
+            '</soapenv:Fault></soapenv:Body></soapenv:Envelope>'
+            % (SOAP_NS, XSI_NS, fault, e.code, e.code, escape(e.message), faultType, faultType,
+               e.code, escape(e.message), faultType))
+
+  def _args(self, operation):
+    '''
+    The operation's arguments, by name; repeated ones become lists of elements
+    '''
+    args = {}
+    for el in operation:
+      name = localName(el.tag)
+      args.setdefault(name, []).append(el)
+    return args
+
+  def _text(self, args, name, default = None):
+    values = args.get(name)
+    if not values or values[0].text is None:
+      return default
+    return values[0].text
+
+  def _now(self):
+    return formatDatetime(datetime.datetime.utcnow())
+
+  #
+  # Record serialization
+  #
+
+  def _fieldValue(self, sObjectType, record, field):
+    if field == 'Name' and sObjectType == 'Lead' and record.get('Name') is None:
+      return ' '.join([part for part in (record.get('FirstName'), record.get('LastName')) if part])
+    return record.get(field)
+
+  def _formatValue(self, value):
+    if isinstance(value, bool):
+      return value and 'true' or 'false'
+    if isinstance(value, float) and value == int(value):
+      return str(int(value))
+    return escape(value)
+
+  def _resolve(self, sObjectType, record, path):
+    '''
+    Follow a field path such as Account.Name; returns (sObjectType, record, field) for the
+    last step, with record None if a relationship along the way is empty
+    '''
+    parts = path.split('.')
+    for part in parts[:-1]:
+      referenceField = canonicalField(sObjectType, part + 'Id')
+      referenceTo = [r for (f, t, r) in SCHEMA[sObjectType][1] if f == referenceField][0]
+      if record is not None:
+        record = self.store.get(referenceTo, record.get(referenceField))
+      sObjectType = referenceTo
+    return (sObjectType, record, canonicalField(sObjectType, parts[-1]))
+
+  def _record(self, dialect, sObjectType, record, fields, tag = 'records'):
+    '''
+    Serialize record with the given fields (field paths) as it would appear in a result
+    '''
+    out = []
+    if dialect == 'partner':
+      out.append('<%s xsi:type="sf:sObject"><sf:type>%s</sf:type>' % (tag, sObjectType))
+      out.append('<sf:Id>%s</sf:Id>' % record['Id'])
+    else:
+      out.append('<%s xsi:type="sf:%s"><sf:Id>%s</sf:Id>' % (tag, sObjectType, record['Id']))
+
+    # Relationship fields are grouped under one element per relationship
+    relationships = []
+    nested = {}
+    subqueries = []
+    for path in fields:
+      if isinstance(path, Query):
+        subqueries.append(path)
+        continue
+      if '.' in path:
+        (relationship, rest) = path.split('.', 1)
+        if relationship.lower() not in nested:
+          relationships.append(relationship)
+          nested[relationship.lower()] = []
+        nested[relationship.lower()].append(rest)
+        continue
+
+      field = canonicalField(sObjectType, path)
+      if field == 'Id':
+        continue
+      value = self._fieldValue(sObjectType, record, field)
+      if value is None:
+        if dialect == 'partner':
+          out.append('<sf:%s xsi:nil="true"/>' % field)
+      else:
+        out.append('<sf:%s>%s</sf:%s>' % (field, self._formatValue(value), field))
+
+    for relationship in relationships:
+      (parentType, parent, field) = self._resolve(sObjectType, record, relationship + '.Id')
+      name = canonicalField(sObjectType, relationship + 'Id')[:-2]
+      if parent is None:
+        if dialect == 'partner':
+          out.append('<sf:%s xsi:nil="true"/>' % name)
+        continue
+      out.append(self._record(dialect, parentType, parent, nested[relationship.lower()], 'sf:' + name))
+
+    # Child relationships come back as a QueryResult each, nil when there are no children
+    for subquery in subqueries:
+      (childType, field, name) = self._childRelationship(sObjectType, subquery.sObjectType)
+      children = self._children(childType, field, record['Id'], subquery)
+      if not children:
+        if dialect == 'partner':
+          out.append('<sf:%s xsi:nil="true"/>' % name)
+        continue
+      out.append('<sf:%s xsi:type="QueryResult"><done>true</done><queryLocator xsi:nil="true"/>' % name)
+      for child in children:
+        out.append(self._record(dialect, childType, child, subquery.fields))
+      out.append('<size>%d</size></sf:%s>' % (len(children), name))
+
+    out.append('</%s>' % tag)
+    return ''.join(out)
+
+  #
+  # SOQL evaluation
+  #
+
+  def _evaluate(self, sObjectType, record, condition):
+    kind = condition[0]
+    if kind == 'or':
+      for term in condition[1]:
+        if self._evaluate(sObjectType, record, term):
+          return True
+      return False
+    if kind == 'and':
+      for term in condition[1]:
+        if not self._evaluate(sObjectType, record, term):
+          return False
+      return True
+    if kind == 'not':
+      return not self._evaluate(sObjectType, record, condition[1])
+
+    (kind, path, op, expected) = condition
+    (fieldType, target, field) = self._resolve(sObjectType, record, path)
+    if target is None:
+      actual = None
+    else:
+      actual = self._fieldValue(fieldType, target, field)
+
+    if field == 'Id' and actual is not None:
+      # Either form of the Id matches
+      actual = actual[:15]
+      if isinstance(expected, basestring):
+        expected = expected[:15]
+      elif isinstance(expected, list):
+        expected = [value and value[:15] for value in expected]
+
+    if isinstance(actual, (int, long)) and not isinstance(actual, bool):
+      actual = float(actual)
+
+    if op == 'IN':
+      return actual in expected
+    if op == 'NOT IN':
+      return actual not in expected
+    if op == 'LIKE':
+      return actual is not None and expected.match(unicode(actual)) is not None
+    if op == '=':
+      return actual == expected
+    if op in ('!=', '<>'):
+      return actual != expected
+    if actual is None or expected is None:
+      return False
+    if op == '<':
+      return actual < expected
+    if op == '<=':
+      return actual <= expected
+    if op == '>':
+      return actual > expected
+    if op == '>=':
+      return actual >= expected
+    raise SoapFault('MALFORMED_QUERY', 'unknown operator %s' % op)
+
+  def _childRelationship(self, sObjectType, name):
+    for (childType, field, relationship) in childRelationships(sObjectType):
+      if relationship.lower() == name.lower():
+        return (childType, field, relationship)
+    raise SoapFault('INVALID_TYPE', "Didn't understand relationship '%s' in FROM part of query call." % name)
+
+  def _children(self, childType, field, id, subquery):
+    '''
+    The undeleted childType records whose field references id and which match subquery
+    '''
+    self.store.lock.acquire()
+    try:
+      children = [child for child in self.store.records[childType].itervalues()
+                  if not child['IsDeleted'] and child.get(field) == id
+                  and (subquery.where is None or self._evaluate(childType, child, subquery.where))]
+    finally:
+      self.store.lock.release()
+    children.sort(key = lambda child: child['Id'])
+    if subquery.limit is not None:
+      children = children[:subquery.limit]
+    return children
+
+  def _select(self, soql, includeDeleted):
+    query = Query(soql)
+    for path in query.fields:
+      self._resolve(query.sObjectType, None, path)
+    for subquery in query.subqueries:
+      (childType, field, name) = self._childRelationship(query.sObjectType, subquery.sObjectType)
+      for path in subquery.fields:
+        self._resolve(childType, None, path)
+
+    self.store.lock.acquire()
+    try:
+      records = []
+      for record in self.store.records[query.sObjectType].itervalues():
+        if record['IsDeleted'] and not includeDeleted:
+          continue
+        if query.where is None or self._evaluate(query.sObjectType, record, query.where):
+          records.append(record)
+    finally:
+      self.store.lock.release()
+
+    if query.orderBy:
+      for (path, descending) in reversed(query.orderBy):
+        def key(record, path = path):
+          (fieldType, target, field) = self._resolve(query.sObjectType, record, path)
+          if target is None:
+            return None
+          return self._fieldValue(fieldType, target, field)
+        records.sort(key = key, reverse = descending)
+    else:
+      records.sort(key = lambda record: record['Id'])
+
+    if query.limit is not None:
+      records = records[:query.limit]
+    return (query, records)
+
+  def _page(self, dialect, locator, records, offset, pageSize, fields, sObjectType):
+    page = records[offset:offset + pageSize]
+    done = offset + pageSize >= len(records)
+
+    out = ['<result xsi:type="QueryResult"><done>%s</done>' % (done and 'true' or 'false')]
+    if done:
+      self.cursors.pop(locator, None)
+      out.append('<queryLocator xsi:nil="true"/>')
+    else:
+      nextLocator = '%s-%d' % (locator.split('-')[0], offset + pageSize)
+      self.cursors[nextLocator] = (records, offset + pageSize, pageSize, fields, sObjectType)
+      self.cursors.pop(locator, None)
+      out.append('<queryLocator>%s</queryLocator>' % nextLocator)
+    for record in page:
+      out.append(self._record(dialect, sObjectType, record, fields))
+    out.append('<size>%d</size></result>' % len(records))
+    return ''.join(out)
+
+  def _pageSize(self, headers):
+    batchSize = headers.get('QueryOptions', {}).get('batchSize')
+    if batchSize:
+      return min(max(200, min(int(batchSize), 2000)), self.pageSize)
+    return self.pageSize
+
+  def _query(self, dialect, operation, headers, includeDeleted):
+    args = self._args(operation)
+    (query, records) = self._select(self._text(args, 'queryString', ''), includeDeleted)
+
+    if query.count:
+      return ('<result xsi:type="QueryResult"><done>true</done><queryLocator xsi:nil="true"/>'
+              '<size>%d</size></result>' % len(records))
+
+    locator = self._nextToken('01g')
+    return self._page(dialect, locator, records, 0, self._pageSize(headers), query.fields + query.subqueries,
+                      query.sObjectType)
+
+  def do_query(self, dialect, operation, headers):
+    return self._query(dialect, operation, headers, False)
+
+  def do_queryAll(self, dialect, operation, headers):
+    return self._query(dialect, operation, headers, True)
+
+  def do_queryMore(self, dialect, operation, headers):
+    locator = self._text(self._args(operation), 'queryLocator')
+    cursor = self.cursors.get(locator)
+    if cursor is None:
+      raise SoapFault('INVALID_QUERY_LOCATOR', 'invalid query locator')
+    (records, offset, pageSize, fields, sObjectType) = cursor
+    return self._page(dialect, locator, records, offset, self._pageSize(headers) or pageSize, fields, sObjectType)
+
+  #
+  # Calls
+  #
+
+  def do_login(self, dialect, operation, headers):
+    args = self._args(operation)
+    username = self._text(args, 'username')
+    password = self._text(args, 'password', '')
+    if not username or (self.username is not None and
+                        (username != self.username or password != self.password)):
+      raise SoapFault('INVALID_LOGIN', 'Invalid username, password, security token; or user locked out.')
+
+    sessionId = self._nextToken(ORGANIZATION_ID[:15] + '!')
+    self.sessions[sessionId] = time.time()
+    serverUrl = '%s/%s' % (self.getServerUrl(dialect), ORGANIZATION_ID[:15])
+    return ('<result><metadataServerUrl>%s</metadataServerUrl><passwordExpired>false</passwordExpired>'
+            '<sandbox>true</sandbox><serverUrl>%s</serverUrl><sessionId>%s</sessionId>'
+            '<userId>%s</userId>%s</result>'
+            % (serverUrl.replace('/Soap/', '/Soap/m/'), serverUrl, sessionId, USER_ID,
+               self._userInfo(username, 'userInfo')))
+
+  def _userInfo(self, username, tag):
+    return ('<%s><accessibilityMode>false</accessibilityMode><currencySymbol>$</currencySymbol>'
+            '<orgDefaultCurrencyIsoCode>USD</orgDefaultCurrencyIsoCode>'
+            '<orgDisallowHtmlAttachments>false</orgDisallowHtmlAttachments>'
+            '<orgHasPersonAccounts>false</orgHasPersonAccounts><organizationId>%s</organizationId>'
+            '<organizationMultiCurrency>false</organizationMultiCurrency>'
+            '<organizationName>Stand-in</organizationName><profileId>00e000000000001AAA</profileId>'
+            '<roleId xsi:nil="true"/><userDefaultCurrencyIsoCode xsi:nil="true"/>'
+            '<userEmail>%s</userEmail><userFullName>Test User</userFullName><userId>%s</userId>'
+            '<userLanguage>en_US</userLanguage><userLocale>en_US</userLocale><userName>%s</userName>'
+            '<userTimeZone>America/Los_Angeles</userTimeZone><userType>Standard</userType>'
+            '<userUiSkin>Theme3</userUiSkin></%s>'
+            % (tag, ORGANIZATION_ID, escape(username), USER_ID, escape(username), tag))
+
+  def do_logout(self, dialect, operation, headers):
+    self.sessions.pop(headers.get('SessionHeader', {}).get('sessionId'), None)
+    return ''
+
+  def do_invalidateSessions(self, dialect, operation, headers):
+    out = []
+    for el in operation:
+      if self.sessions.pop(el.text, None) is None:
+        out.append(self._failure([('INVALID_SESSION_ID', 'invalid session id')]))
+      else:
+        out.append('<result><success>true</success></result>')
+    return ''.join(out)
+
+  def do_getUserInfo(self, dialect, operation, headers):
+    return self._userInfo('user@example.com', 'result')
+
+  def do_getServerTimestamp(self, dialect, operation, headers):
+    return '<result><timestamp>%s</timestamp></result>' % self._now()
+
+  def _user(self, args):
+    userId = self._text(args, 'userId', '')
+    if not _ID.match(userId):
+      raise SoapFault('MALFORMED_ID', 'malformed id %s' % userId)
+    if self.store.get('User', userId) is None:
+      raise SoapFault('INVALID_CROSS_REFERENCE_KEY', 'invalid cross reference id')
+
+  def do_setPassword(self, dialect, operation, headers):
+    args = self._args(operation)
+    self._user(args)
+    if self.password is not None:
+      self.password = self._text(args, 'password', '')
+    return '<result/>'
+
+  def do_resetPassword(self, dialect, operation, headers):
+    self._user(self._args(operation))
+    password = '%08x' % random.getrandbits(32)
+    if self.password is not None:
+      self.password = password
+    return '<result><password>%s</password></result>' % password
+
+  def _emailErrors(self, message):
+    '''
+    What's wrong with a SingleEmailMessage or MassEmailMessage element, as [(code, message)]
+    '''
+    args = self._args(message)
+    if (message.get('{%s}type' % XSI_NS) or '').endswith('MassEmailMessage') or 'targetObjectIds' in args:
+      ids = [el.text or '' for el in args.get('targetObjectIds', [])]
+      if not ids:
+        return [('REQUIRED_FIELD_MISSING', 'Missing targetObjectIds')]
+      for id in ids:
+        (sObjectType, record) = _ID.match(id) and self.store.find(id) or (None, None)
+        if sObjectType not in ('Contact', 'Lead', 'User'):
+          return [('INVALID_ID_FIELD', 'Invalid id: %s' % id)]
+      # There are no email templates
+      return [('INVALID_ID_FIELD', 'Invalid templateId: %s' % self._text(args, 'templateId', ''))]
+
+    addresses = [el.text for name in ('toAddresses', 'ccAddresses', 'bccAddresses')
+                 for el in args.get(name, []) if el.text]
+    for address in addresses:
+      if not _EMAIL.match(address):
+        return [('INVALID_EMAIL_ADDRESS', 'Email address is invalid: %s' % address)]
+    if not addresses and self._text(args, 'targetObjectId') is None:
+      return [('REQUIRED_FIELD_MISSING', 'Add a recipient to send an email.')]
+    return []
+
+  def do_sendEmail(self, dialect, operation, headers):
+    '''
+    Check each message, but send nothing
+    '''
+    out = []
+    for message in operation:
+      errors = self._emailErrors(message)
+      if errors:
+        out.append(self._failure(errors))
+      else:
+        out.append('<result><success>true</success></result>')
+    return ''.join(out)
+
+  def _sObject(self, el):
+    '''
+    Parse an sObject element into (sObjectType, values, fieldsToNull)
+    '''
+    sObjectType = None
+    xsiType = el.get('{%s}type' % XSI_NS)
+    if xsiType:
+      sObjectType = xsiType.split(':')[-1]
+    values = {}
+    fieldsToNull = []
+    for child in el:
+      name = localName(child.tag)
+      if name == 'type':
+        sObjectType = child.text
+      elif name == 'fieldsToNull':
+        if child.text:
+          fieldsToNull.append(child.text)
+      elif isNil(child):
+        values[name] = None
+      elif len(child):
+        # A parent referenced by external Id isn't supported; keep the Id if there is one
+        for grandchild in child:
+          if localName(grandchild.tag) == 'Id' and grandchild.text:
+            values[name + 'Id'] = grandchild.text
+      else:
+        values[name] = child.text or ''
+    if sObjectType in (None, 'sObject'):
+      raise SoapFault('INVALID_TYPE', 'Must send a concretely typed sObject')
+    return (canonicalType(sObjectType), values, fieldsToNull)
+
+  def _sObjects(self, operation):
+    '''
+    Parse the <sObjects> of a create/update/upsert into (sObjectType, values, fieldsToNull)
+    '''
+    sObjects = [self._sObject(el) for el in operation if localName(el.tag) == 'sObjects']
+    if len(sObjects) > 200:
+      raise SoapFault('EXCEEDED_ID_LIMIT', 'record limit reached. cannot submit more than 200 records into this call')
+    return sObjects
+
+  def _coerce(self, sObjectType, values):
+    '''
+    Convert submitted text to stored values, rejecting unknown or read-only fields
+    '''
+    result = {}
+    for (name, value) in values.items():
+      field = canonicalField(sObjectType, name)
+      if field in SYSTEM_FIELDS and field != 'Id':
+        continue
+      type = [t for (f, t, r) in SCHEMA[sObjectType][1] if f == field][0]
+      if value is not None:
+        if type == 'boolean':
+          value = value.lower() == 'true'
+        elif type in ('double', 'currency'):
+          value = float(value)
+        elif type == 'int':
+          value = int(float(value))
+        elif type == 'datetime':
+          value = formatDatetime(parseDatetime(value))
+      result[field] = value
+    return result
+
+  def _errors(self, errors):
+    return ''.join(['<errors><message>%s</message><statusCode>%s</statusCode></errors>'
+                    % (escape(message), code) for (code, message) in errors])
+
+  def _failure(self, errors, nilFields = ()):
+    '''
+    The result of a call that failed for one item, with nilFields (e.g. 'id') empty
+    '''
+    return '<result>%s%s<success>false</success></result>' % (
+      self._errors(errors), ''.join(['<%s xsi:nil="true"/>' % field for field in nilFields]))
+
+  def _saveResult(self, id, errors = None, created = None):
+    out = ['<result>']
+    if created is not None:
+      out.append('<created>%s</created>' % (created and 'true' or 'false'))
+    if errors:
+      out.append(self._errors(errors))
+      out.append('<id xsi:nil="true"/><success>false</success>')
+    else:
+      out.append('<id>%s</id><success>true</success>' % id)
+    out.append('</result>')
+    return ''.join(out)
+
+  def _insert(self, sObjectType, values, now):
+    '''
+    Create a record from submitted values; returns (id, errors)
+    '''
+    try:
+      values = self._coerce(sObjectType, values)
+    except SoapFault, e:
+      return (None, [(e.code, e.message)])
+    values.pop('Id', None)
+    if sObjectType in ('Lead', 'Contact') and not values.get('LastName'):
+      return (None, [('REQUIRED_FIELD_MISSING', 'Required fields are missing: [LastName]')])
+    return (self.store.insert(sObjectType, values, now), None)
+
+  def do_create(self, dialect, operation, headers):
+    out = []
+    now = self._now()
+    self.store.lock.acquire()
+    try:
+      for (sObjectType, values, fieldsToNull) in self._sObjects(operation):
+        out.append(self._saveResult(*self._insert(sObjectType, values, now)))
+    finally:
+      self.store.lock.release()
+    return ''.join(out)
+
+  def _apply(self, sObjectType, record, values, fieldsToNull, now):
+    for name in fieldsToNull:
+      values[name] = None
+    values = self._coerce(sObjectType, values)
+    values.pop('Id', None)
+    record.update(values)
+    record['SystemModstamp'] = now
+
+  def _change(self, sObjectType, values, fieldsToNull, now):
+    '''
+    Update the record with values['Id']; returns (id, errors)
+    '''
+    record = self.store.get(sObjectType, values.get('Id'))
+    if record is None or record['IsDeleted']:
+      return (None, [('ENTITY_IS_DELETED', 'entity is deleted')])
+    try:
+      self._apply(sObjectType, record, values, fieldsToNull, now)
+    except SoapFault, e:
+      return (None, [(e.code, e.message)])
+    return (record['Id'], None)
+
+  def do_update(self, dialect, operation, headers):
+    out = []
+    now = self._now()
+    self.store.lock.acquire()
+    try:
+      for (sObjectType, values, fieldsToNull) in self._sObjects(operation):
+        out.append(self._saveResult(*self._change(sObjectType, values, fieldsToNull, now)))
+    finally:
+      self.store.lock.release()
+    return ''.join(out)
+
+  def _upsertRecord(self, sObjectType, externalIdField, values, fieldsToNull, now):
+    '''
+    Update the record matching values on externalIdField, or create one; returns (id,
+    errors, created)
+    '''
+    try:
+      field = canonicalField(sObjectType, externalIdField)
+    except SoapFault, e:
+      return (None, [(e.code, e.message)], False)
+
+    key = values.get(field)
+    record = None
+    if field == 'Id':
+      record = self.store.get(sObjectType, key)
+    elif key is not None:
+      for candidate in self.store.records[sObjectType].itervalues():
+        if candidate.get(field) == key and not candidate['IsDeleted']:
+          record = candidate
+          break
+
+    try:
+      if record is None:
+        coerced = self._coerce(sObjectType, values)
+        coerced.pop('Id', None)
+        return (self.store.insert(sObjectType, coerced, now), None, True)
+      self._apply(sObjectType, record, values, fieldsToNull, now)
+      return (record['Id'], None, False)
+    except SoapFault, e:
+      return (None, [(e.code, e.message)], False)
+
+  def do_upsert(self, dialect, operation, headers):
+    args = self._args(operation)
+    externalIdField = self._text(args, 'externalIDFieldName') or self._text(args, 'externalIdFieldName')
+    out = []
+    now = self._now()
+    self.store.lock.acquire()
+    try:
+      for (sObjectType, values, fieldsToNull) in self._sObjects(operation):
+        out.append(self._saveResult(*self._upsertRecord(sObjectType, externalIdField, values, fieldsToNull, now)))
+    finally:
+      self.store.lock.release()
+    return ''.join(out)
+
+  def _merge(self, request, now):
+    '''
+    Merge the records in request's recordToMergeIds into its masterRecord, updating the master
+    with the masterRecord's fields and deleting the others; now is a datetime
+    '''
+    master = None
+    ids = []
+    for child in request:
+      name = localName(child.tag)
+      if name == 'masterRecord':
+        master = child
+      elif name == 'recordToMergeIds' and child.text:
+        ids.append(child.text)
+    if master is None:
+      return self._failure([('REQUIRED_FIELD_MISSING', 'Required fields are missing: [masterRecord]')], ('id', ))
+
+    (sObjectType, values, fieldsToNull) = self._sObject(master)
+    if sObjectType not in ('Account', 'Contact', 'Lead'):
+      return self._failure([('INVALID_TYPE', 'Cannot merge %s records' % sObjectType)], ('id', ))
+    record = self.store.get(sObjectType, values.get('Id'))
+    if record is None or record['IsDeleted']:
+      return self._failure([('ENTITY_IS_DELETED', 'entity is deleted')], ('id', ))
+    if not 1 <= len(ids) <= 2:
+      return self._failure([('INVALID_ID_FIELD', 'A merge request needs one or two records to merge')], ('id', ))
+
+    merged = []
+    for id in ids:
+      candidate = self.store.get(sObjectType, id)
+      if candidate is None or candidate['IsDeleted'] or candidate is record:
+        return self._failure([('INVALID_ID_FIELD', 'invalid record id for merging: %s' % id)], ('id', ))
+      merged.append(candidate)
+
+    try:
+      self._apply(sObjectType, record, values, fieldsToNull, formatDatetime(now))
+    except SoapFault, e:
+      return self._failure([(e.code, e.message)], ('id', ))
+    for candidate in merged:
+      self._remove(candidate['Id'], now)
+    return '<result><id>%s</id>%s<success>true</success></result>' % (
+      record['Id'], ''.join(['<mergedRecordIds>%s</mergedRecordIds>' % candidate['Id'] for candidate in merged]))
+
+  def do_merge(self, dialect, operation, headers):
+    out = []
+    now = datetime.datetime.utcnow()
+    self.store.lock.acquire()
+    try:
+      for request in operation:
+        out.append(self._merge(request, now))
+    finally:
+      self.store.lock.release()
+    return ''.join(out)
+
+  def _convertLead(self, args, now):
+    '''
+    Convert the lead args['leadId'] into a Contact, under a new Account (or args['accountId']),
+    and an Opportunity unless args['doNotCreateOpportunity'] is true
+    '''
+    failed = ('accountId', 'contactId', 'leadId', 'opportunityId')
+    lead = self.store.get('Lead', self._text(args, 'leadId'))
+    if lead is None or lead['IsDeleted']:
+      return self._failure([('INVALID_CROSS_REFERENCE_KEY', 'invalid cross reference id')], failed)
+    if lead['IsConverted']:
+      return self._failure([('CANNOT_UPDATE_CONVERTED_LEAD', 'cannot reference converted lead')], failed)
+    status = self._text(args, 'convertedStatus')
+    if not status:
+      return self._failure([('REQUIRED_FIELD_MISSING', 'Required fields are missing: [convertedStatus]')], failed)
+
+    accountId = self._text(args, 'accountId')
+    if accountId is None:
+      accountId = self.store.insert('Account', {'Name': lead['Company']}, now)
+    elif self.store.get('Account', accountId) is None:
+      return self._failure([('INVALID_CROSS_REFERENCE_KEY', 'invalid cross reference id')], failed)
+
+    contactId = self._text(args, 'contactId')
+    if contactId is None:
+      contactId = self.store.insert('Contact', {'FirstName': lead['FirstName'], 'LastName': lead['LastName'],
+                                                'Email': lead['Email'], 'Phone': lead['Phone'],
+                                                'DoNotCall': lead['DoNotCall'], 'AccountId': accountId}, now)
+    elif self.store.get('Contact', contactId) is None:
+      return self._failure([('INVALID_CROSS_REFERENCE_KEY', 'invalid cross reference id')], failed)
+
+    opportunity = '<opportunityId xsi:nil="true"/>'
+    if self._text(args, 'doNotCreateOpportunity', 'false') != 'true':
+      name = self._text(args, 'opportunityName') or u'%s-' % lead['Company']
+      opportunity = '<opportunityId>%s</opportunityId>' % self.store.insert('Opportunity', {
+        'Name': name, 'AccountId': accountId, 'StageName': 'Prospecting',
+        'CloseDate': datetime.datetime.utcnow().date().isoformat()}, now)
+
+    lead.update({'IsConverted': True, 'Status': status, 'SystemModstamp': now})
+    return ('<result><accountId>%s</accountId><contactId>%s</contactId><leadId>%s</leadId>%s'
+            '<success>true</success></result>' % (accountId, contactId, lead['Id'], opportunity))
+
+  def do_convertLead(self, dialect, operation, headers):
+    out = []
+    now = self._now()
+    self.store.lock.acquire()
+    try:
+      for leadConvert in operation:
+        out.append(self._convertLead(self._args(leadConvert), now))
+    finally:
+      self.store.lock.release()
+    return ''.join(out)
+
+  def _ids(self, operation):
+    ids = [el.text for el in operation if localName(el.tag) == 'ids']
+    if len(ids) > 200:
+      raise SoapFault('EXCEEDED_ID_LIMIT', 'record limit reached. cannot submit more than 200 records into this call')
+    return ids
+
+  def _remove(self, id, now):
+    '''
+    Move a record to the recycle bin; now is a datetime.  Returns (id, errors)
+    '''
+    (sObjectType, record) = self.store.find(id)
+    if record is None or record['IsDeleted']:
+      return (None, [('ENTITY_IS_DELETED', 'entity is deleted')])
+    record['IsDeleted'] = True
+    record['SystemModstamp'] = formatDatetime(now)
+    self.store.deleted[record['Id']] = now
+    return (record['Id'], None)
+
+  def do_delete(self, dialect, operation, headers):
+    out = []
+    now = datetime.datetime.utcnow()
+    self.store.lock.acquire()
+    try:
+      for id in self._ids(operation):
+        out.append(self._saveResult(*self._remove(id, now)))
+    finally:
+      self.store.lock.release()
+    return ''.join(out)
+
+  def do_undelete(self, dialect, operation, headers):
+    out = []
+    self.store.lock.acquire()
+    try:
+      for id in self._ids(operation):
+        (sObjectType, record) = self.store.find(id)
+        if record is None or not record['IsDeleted']:
+          out.append(self._saveResult(None, [('UNDELETE_FAILED', 'Entity is not in the recycle bin')]))
+          continue
+        record['IsDeleted'] = False
+        record['SystemModstamp'] = self._now()
+        self.store.deleted.pop(record['Id'], None)
+        out.append(self._saveResult(record['Id']))
+    finally:
+      self.store.lock.release()
+    return ''.join(out)
+
+  def do_emptyRecycleBin(self, dialect, operation, headers):
+    out = []
+    self.store.lock.acquire()
+    try:
+      for id in self._ids(operation):
+        (sObjectType, record) = self.store.find(id)
+        if record is None or not record['IsDeleted']:
+          out.append(self._saveResult(None, [('INVALID_ID_FIELD', 'Entity is not in the recycle bin')]))
+          continue
+        del self.store.records[sObjectType][record['Id']]
+        out.append(self._saveResult(record['Id']))
+    finally:
+      self.store.lock.release()
+    return ''.join(out)
+
+  def do_process(self, dialect, operation, headers):
+    '''
+    There are no approval processes or work items, so every request fails, as it does in an
+    org without them
+    '''
+    out = []
+    for request in operation:
+      args = self._args(request)
+      workitem = (request.get('{%s}type' % XSI_NS) or '').endswith('ProcessWorkitemRequest') or 'workitemId' in args
+      id = self._text(args, workitem and 'workitemId' or 'objectId', '')
+      if not _ID.match(id):
+        error = ('MALFORMED_ID', 'malformed id %s' % id)
+      elif workitem:
+        error = ('INVALID_CROSS_REFERENCE_KEY', 'invalid cross reference id')
+      elif self.store.find(id)[1] is None:
+        error = ('INSUFFICIENT_ACCESS_ON_CROSS_REFERENCE_ENTITY', 'insufficient access rights on cross-reference id')
+      else:
+        error = ('NO_APPLICABLE_PROCESS', 'No applicable approval process was found.')
+      out.append(self._failure([error], ('entityId', 'instanceId', 'instanceStatus')))
+    return ''.join(out)
+
+  def do_retrieve(self, dialect, operation, headers):
+    args = self._args(operation)
+    sObjectType = canonicalType(self._text(args, 'sObjectType', ''))
+    fields = [field.strip() for field in self._text(args, 'fieldList', '').split(',') if field.strip()]
+    for path in fields:
+      self._resolve(sObjectType, None, path)
+
+    out = []
+    ids = [el.text for el in args.get('ids', [])]
+    if len(ids) > 2000:
+      raise SoapFault('EXCEEDED_ID_LIMIT', 'record limit reached. cannot submit more than 2000 records into this call')
+    for id in ids:
+      record = self.store.get(sObjectType, id)
+      if record is None or record['IsDeleted']:
+        out.append('<result xsi:nil="true"/>')
+      else:
+        out.append(self._record(dialect, sObjectType, record, fields, 'result'))
+    return ''.join(out)
+
+  def do_search(self, dialect, operation, headers):
+    sosl = self._text(self._args(operation), 'searchString', '')
+    match = re.match(r'\s*FIND\s*\{(.*?)\}(.*?)RETURNING\s+(.*)$', sosl, re.I | re.S)
+    if match is None:
+      raise SoapFault('MALFORMED_SEARCH', 'Search query is malformed')
+    term = match.group(1).replace('\\', '').lower()
+
+    out = []
+    for (name, fieldList) in re.findall(r'(\w+)\s*(?:\(([^)]*)\))?', match.group(3)):
+      sObjectType = canonicalType(name)
+      fields = [field.strip() for field in (fieldList or 'Id').split(',') if field.strip()]
+      for record in self.store.records[sObjectType].values():
+        if record['IsDeleted']:
+          continue
+        for (field, type, referenceTo) in SCHEMA[sObjectType][1]:
+          value = self._fieldValue(sObjectType, record, field)
+          if isinstance(value, basestring) and term in value.lower():
+            out.append('<searchRecords>%s</searchRecords>' % self._record(dialect, sObjectType, record, fields, 'record'))
+            break
+
+    if not out:
+      return '<result/>'
+    return '<result>%s</result>' % ''.join(out)
+
+  def do_describeGlobal(self, dialect, operation, headers):
+    out = ['<result><encoding>UTF-8</encoding><maxBatchSize>200</maxBatchSize>']
+    for sObjectType in sorted(SCHEMA):
+      out.append('<sobjects><activateable>false</activateable><createable>true</createable>'
+                 '<custom>%s</custom><customSetting>false</customSetting><deletable>true</deletable>'
+                 '<deprecatedAndHidden>false</deprecatedAndHidden><keyPrefix>%s</keyPrefix>'
+                 '<label>%s</label><labelPlural>%ss</labelPlural><layoutable>true</layoutable>'
+                 '<mergeable>false</mergeable><name>%s</name><queryable>true</queryable>'
+                 '<replicateable>true</replicateable><retrieveable>true</retrieveable>'
+                 '<searchable>true</searchable><triggerable>true</triggerable>'
+                 '<undeletable>true</undeletable><updateable>true</updateable></sobjects>'
+                 % (sObjectType.endswith('__c') and 'true' or 'false', SCHEMA[sObjectType][0],
+                    sObjectType, sObjectType, sObjectType))
+    out.append('</result>')
+    return ''.join(out)
+
+  def _describe(self, sObjectType):
+    (prefix, fields) = SCHEMA[sObjectType]
+    out = ['<result><activateable>false</activateable>']
+    for (childType, field, name) in childRelationships(sObjectType):
+      out.append('<childRelationships><cascadeDelete>false</cascadeDelete><childSObject>%s</childSObject>'
+                 '<deprecatedAndHidden>false</deprecatedAndHidden><field>%s</field>'
+                 '<relationshipName>%s</relationshipName></childRelationships>'
+                 % (childType, field, name))
+    out.append('<createable>true</createable><custom>%s</custom><customSetting>false</customSetting>'
+               '<deletable>true</deletable><deprecatedAndHidden>false</deprecatedAndHidden>'
+               '<feedEnabled>false</feedEnabled>' % (sObjectType.endswith('__c') and 'true' or 'false'))
+    for (field, type, referenceTo) in fields:
+      system = field in SYSTEM_FIELDS
+      out.append('<fields><autoNumber>false</autoNumber><byteLength>%d</byteLength>'
+                 '<calculated>false</calculated><caseSensitive>false</caseSensitive>'
+                 '<createable>%s</createable><custom>%s</custom><defaultedOnCreate>%s</defaultedOnCreate>'
+                 '<dependentPicklist>false</dependentPicklist><deprecatedAndHidden>false</deprecatedAndHidden>'
+                 '<digits>%d</digits><externalId>false</externalId><filterable>true</filterable>'
+                 '<groupable>true</groupable><htmlFormatted>false</htmlFormatted><idLookup>%s</idLookup>'
+                 '<label>%s</label><length>%d</length><name>%s</name><nameField>%s</nameField>'
+                 '<namePointing>false</namePointing><nillable>%s</nillable><permissionable>false</permissionable>'
+                 '<precision>%d</precision>%s<restrictedPicklist>false</restrictedPicklist><scale>%d</scale>'
+                 '<soapType>%s</soapType><sortable>true</sortable><type>%s</type><unique>false</unique>'
+                 '<updateable>%s</updateable></fields>'
+                 % (type in ('id', 'reference') and 18 or 765,
+                    (not system) and 'true' or 'false',
+                    field.endswith('__c') and 'true' or 'false',
+                    system and 'true' or 'false',
+                    type == 'int' and 9 or 0,
+                    field == 'Id' and 'true' or 'false',
+                    field, type in ('id', 'reference') and 18 or 255, field,
+                    field == 'Name' and 'true' or 'false',
+                    (not system and type != 'boolean') and 'true' or 'false',
+                    type in ('currency', 'double') and 18 or 0,
+                    referenceTo and '<referenceTo>%s</referenceTo><relationshipName>%s</relationshipName>'
+                                    % (referenceTo, relationshipName(field)) or '',
+                    type in ('currency', 'double') and 2 or 0,
+                    SOAP_TYPES.get(type, 'xsd:string'), type,
+                    (not system) and 'true' or 'false'))
+    out.append('<keyPrefix>%s</keyPrefix><label>%s</label><labelPlural>%ss</labelPlural>'
+               '<layoutable>true</layoutable><mergeable>false</mergeable><name>%s</name>'
+               '<queryable>true</queryable><recordTypeInfos><available>true</available>'
+               '<defaultRecordTypeMapping>true</defaultRecordTypeMapping><name>Master</name>'
+               '<recordTypeId>%s</recordTypeId></recordTypeInfos><replicateable>true</replicateable>'
+               '<retrieveable>true</retrieveable><searchable>true</searchable>'
+               '<triggerable>true</triggerable><undeletable>true</undeletable>'
+               '<updateable>true</updateable></result>'
+               % (prefix, sObjectType, sObjectType, sObjectType, MASTER_RECORD_TYPE_ID))
+    return ''.join(out)
+
+  def do_describeSObject(self, dialect, operation, headers):
+    return self._describe(canonicalType(self._text(self._args(operation), 'sObjectType', '')))
+
+  def do_describeSObjects(self, dialect, operation, headers):
+    types = [el.text for el in operation if localName(el.tag) == 'sObjectType']
+    if len(types) > 100:
+      raise SoapFault('EXCEEDED_MAX_TYPES_LIMIT', 'Maximum number of types exceeded')
+    return ''.join([self._describe(canonicalType(sObjectType)) for sObjectType in types])
+
+  def do_describeLayout(self, dialect, operation, headers):
+    '''
+    One layout per sObject type, for the master record type, with its fields in one section
+    '''
+    args = self._args(operation)
+    sObjectType = canonicalType(self._text(args, 'sObjectType', ''))
+    for el in args.get('recordTypeIds', []):
+      if (el.text or '')[:15] != MASTER_RECORD_TYPE_ID[:15]:
+        raise SoapFault('INVALID_ID_FIELD', 'Invalid record type id: %s' % el.text)
+
+    rows = []
+    for (field, type, referenceTo) in SCHEMA[sObjectType][1]:
+      if field == 'Id':
+        continue
+      rows.append('<layoutRows><layoutItems><editable>%s</editable><label>%s</label><layoutComponents>'
+                  '<displayLines>1</displayLines><tabOrder>%d</tabOrder><type>Field</type><value>%s</value>'
+                  '</layoutComponents><placeholder>false</placeholder><required>false</required></layoutItems>'
+                  '<numItems>1</numItems></layoutRows>'
+                  % (field not in SYSTEM_FIELDS and 'true' or 'false', field, len(rows) + 1, field))
+    layoutId = makeId('00h', sorted(SCHEMA).index(sObjectType) + 1)
+    return ('<result><layouts><detailLayoutSections><columns>1</columns><heading>Information</heading>'
+            '%s<rows>%d</rows><useHeading>true</useHeading></detailLayoutSections><id>%s</id></layouts>'
+            '<recordTypeMappings><available>true</available><defaultRecordTypeMapping>true</defaultRecordTypeMapping>'
+            '<layoutId>%s</layoutId><name>Master</name><recordTypeId>%s</recordTypeId></recordTypeMappings>'
+            '<recordTypeSelectorRequired>false</recordTypeSelectorRequired></result>'
+            % (''.join(rows), len(rows), layoutId, layoutId, MASTER_RECORD_TYPE_ID))
+
+  def do_describeTabs(self, dialect, operation, headers):
+    '''
+    A single app, with a tab per sObject type
+    '''
+    root = 'http://%s:%d' % self.httpd.server_address
+    tabs = []
+    for sObjectType in sorted(SCHEMA):
+      tabs.append('<tabs><custom>%s</custom><iconUrl>%s/img/icon/%s32.png</iconUrl><label>%ss</label>'
+                  '<miniIconUrl>%s/img/icon/%s16.png</miniIconUrl><sobjectName>%s</sobjectName>'
+                  '<url>%s/%s/o</url></tabs>'
+                  % (sObjectType.endswith('__c') and 'true' or 'false', root, sObjectType.lower(), sObjectType,
+                     root, sObjectType.lower(), sObjectType, root, SCHEMA[sObjectType][0]))
+    return ('<result><label>Stand-in</label><logoUrl>%s/img/seasonLogos/logo.png</logoUrl>'
+            '<namespace xsi:nil="true"/><selected>true</selected>%s</result>' % (root, ''.join(tabs)))
+
+  def _window(self, operation):
+    args = self._args(operation)
+    sObjectType = canonicalType(self._text(args, 'sObjectType', ''))
+    start = parseDatetime(self._text(args, 'startDate', ''))
+    end = parseDatetime(self._text(args, 'endDate', ''))
+    if end <= start:
+      raise SoapFault('INVALID_REPLICATION_DATE', 'startDate must chronologically precede endDate')
+    if end - start > datetime.timedelta(days = 30):
+      raise SoapFault('INVALID_REPLICATION_DATE', 'startDate to endDate range must be within 30 days')
+    # Like the real API, windows are whole minutes
+    end = end.replace(second = 0, microsecond = 0)
+    return (sObjectType, start, end)
+
+  def do_getUpdated(self, dialect, operation, headers):
+    (sObjectType, start, end) = self._window(operation)
+    (start, end) = (formatDatetime(start), formatDatetime(end))
+    ids = [record['Id'] for record in self.store.records[sObjectType].values()
+           if not record['IsDeleted'] and start <= record['SystemModstamp'] < end]
+    if len(ids) > self.maxUpdatedIds:
+      raise SoapFault('EXCEEDED_ID_LIMIT', 'The number of ids exceeded the limit of %d' % self.maxUpdatedIds)
+    ids.sort()
+    return '<result>%s<latestDateCovered>%s</latestDateCovered></result>' % (
+      ''.join(['<ids>%s</ids>' % id for id in ids]), end)
+
+  def do_getDeleted(self, dialect, operation, headers):
+    (sObjectType, start, end) = self._window(operation)
+    prefix = SCHEMA[sObjectType][0]
+    deleted = [(id, when) for (id, when) in self.store.deleted.items()
+               if id.startswith(prefix) and start <= when < end]
+    if len(deleted) > self.maxUpdatedIds:
+      raise SoapFault('EXCEEDED_ID_LIMIT', 'The number of ids exceeded the limit of %d' % self.maxUpdatedIds)
+    deleted.sort()
+    earliest = formatDatetime(datetime.datetime.utcnow() - datetime.timedelta(days = 15))
+    return '<result>%s<earliestDateAvailable>%s</earliestDateAvailable><latestDateCovered>%s</latestDateCovered></result>' % (
+      ''.join(['<deletedRecords><deletedDate>%s</deletedDate><id>%s</id></deletedRecords>' % (formatDatetime(when), id)
+               for (id, when) in deleted]), earliest, formatDatetime(end))
+
+  #
+  # Bulk API
+  #
+
+  # Most records a batch may hold, and a query result file holds (the real API splits query
+  # results by size, at 1 GB)
+  bulkBatchRecords = 10000
+  bulkResultRecords = 10000
+
+  def handleBulk(self, method, path, sessionId, body):
+    '''
+    Answer a Bulk API request, returning (HTTP status, content type, response body)
+    '''
+    if self.latency:
+      time.sleep(self.latency)
+
+    try:
+      try:
+        if not self._validSession(sessionId):
+          raise BulkFault('InvalidSessionId', 'Invalid session id')
+        return self._bulkRoute(method, path, body)
+      except SoapFault, e:
+        raise BulkFault('InvalidJob', e.message)
+      except SyntaxError, e:
+        # ElementTree's ParseError
+        raise BulkFault('XmlInputError', str(e))
+    except BulkFault, e:
+      return (e.status, 'application/xml; charset=UTF-8',
+              '<?xml version="1.0" encoding="UTF-8"?><error xmlns="%s"><exceptionCode>%s</exceptionCode>'
+              '<exceptionMessage>%s</exceptionMessage></error>' % (BULK_NS, e.code, escape(e.message)))
+
+  def _bulkRoute(self, method, path, body):
+    # /services/async/<version>/job/<job>/batch/<batch>/result/<result>
+    parts = [part for part in path.split('?')[0].split('/') if part][3:]
+    if not parts or parts[0] != 'job' or len(parts) > 7 or (len(parts) > 2 and parts[2] != 'batch'):
+      raise BulkFault('InvalidUrl', 'Unknown resource: %s' % path, 404)
+
+    if len(parts) == 1:
+      if method != 'POST':
+        raise BulkFault('InvalidUrl', 'Jobs can only be created', 405)
+      return self._bulkXml(self._jobInfo(self._createJob(body)), 201)
+
+    job = self.jobs.get(parts[1])
+    if job is None:
+      raise BulkFault('InvalidJob', 'Unable to find job: %s' % parts[1])
+    if len(parts) == 2:
+      if method == 'POST':
+        self._updateJob(job, body)
+      return self._bulkXml(self._jobInfo(job))
+
+    if len(parts) == 3:
+      if method == 'POST':
+        return self._bulkXml(self._batchInfo(self._addBatch(job, body), True), 201)
+      return self._bulkXml('<batchInfoList xmlns="%s">%s</batchInfoList>'
+                           % (BULK_NS, ''.join([self._batchInfo(batch) for batch in job['batches']])))
+
+    batches = [batch for batch in job['batches'] if batch['id'] == parts[3]]
+    if not batches:
+      raise BulkFault('InvalidBatch', 'Unable to find batch: %s' % parts[3])
+    batch = batches[0]
+    if len(parts) == 4:
+      return self._bulkXml(self._batchInfo(batch, True))
+    if parts[4] == 'request' and len(parts) == 5:
+      return (200, 'text/csv; charset=UTF-8', batch['request'])
+    if parts[4] != 'result':
+      raise BulkFault('InvalidUrl', 'Unknown resource: %s' % path, 404)
+
+    if batch['state'] != 'Completed':
+      raise BulkFault('InvalidBatch', 'Batch not completed')
+    if job['operation'] != 'query':
+      return (200, 'text/csv; charset=UTF-8', batch['results'][0][1])
+    if len(parts) == 5:
+      return self._bulkXml('<result-list xmlns="%s">%s</result-list>'
+                           % (BULK_NS, ''.join(['<result>%s</result>' % id for (id, data) in batch['results']])))
+    for (id, data) in batch['results']:
+      if id == parts[5]:
+        return (200, 'text/csv; charset=UTF-8', data)
+    raise BulkFault('InvalidBatch', 'Unable to find result: %s' % parts[5])
+
+  def _bulkXml(self, content, status = 200):
+    return (status, 'application/xml; charset=UTF-8', '<?xml version="1.0" encoding="UTF-8"?>' + content)
+
+  def _bulkFields(self, body):
+    return dict([(localName(el.tag), el.text) for el in ElementTree.fromstring(body)])
+
+  def _createJob(self, body):
+    fields = self._bulkFields(body)
+    operation = fields.get('operation')
+    if operation not in ('insert', 'update', 'upsert', 'delete', 'hardDelete', 'query'):
+      raise BulkFault('InvalidJob', 'Invalid operation: %s' % operation)
+    if (fields.get('contentType') or 'CSV') != 'CSV':
+      raise BulkFault('InvalidJob', 'Only CSV jobs are supported')
+    sObjectType = canonicalType(fields.get('object') or '')
+    externalIdField = None
+    if operation == 'upsert':
+      externalIdField = canonicalField(sObjectType, fields.get('externalIdFieldName') or '')
+
+    now = self._now()
+    job = {'id': self._nextToken('750'),
+           'operation': operation,
+           'object': sObjectType,
+           'externalIdFieldName': externalIdField,
+           'concurrencyMode': fields.get('concurrencyMode') or 'Parallel',
+           'state': 'Open',
+           'createdDate': now,
+           'systemModstamp': now,
+           'batches': [],
+           'lock': threading.Lock()}
+    self.jobs[job['id']] = job
+    return job
+
+  def _updateJob(self, job, body):
+    state = self._bulkFields(body).get('state')
+    if state not in ('Closed', 'Aborted') or job['state'] != 'Open':
+      raise BulkFault('InvalidJobState', 'Job %s is %s; it can only be Closed or Aborted while Open'
+                      % (job['id'], job['state']))
+    job['state'] = state
+    job['systemModstamp'] = self._now()
+
+  def _addBatch(self, job, body):
+    if job['state'] != 'Open':
+      raise BulkFault('InvalidJobState', 'Job %s is not open' % job['id'])
+    now = self._now()
+    batch = {'id': self._nextToken('751'),
+             'jobId': job['id'],
+             'state': 'Queued',
+             'stateMessage': None,
+             'request': body,
+             # [(result Id, CSV), ...]
+             'results': None,
+             'processed': 0,
+             'failed': 0,
+             'createdDate': now,
+             'systemModstamp': now}
+    job['batches'].append(batch)
+
+    thread = threading.Thread(target = self._runBatch, args = (job, batch))
+    thread.setDaemon(True)
+    thread.start()
+    return batch
+
+  def _runBatch(self, job, batch):
+    if self.latency:
+      time.sleep(self.latency)
+
+    serial = job['concurrencyMode'] == 'Serial'
+    if serial:
+      job['lock'].acquire()
+    try:
+      if job['state'] == 'Aborted':
+        batch['state'] = 'Not Processed'
+        return
+      batch['state'] = 'InProgress'
+      try:
+        if job['operation'] == 'query':
+          self._bulkQuery(batch)
+        else:
+          self._bulkSave(job, batch)
+      except (BulkFault, SoapFault), e:
+        batch['state'] = 'Failed'
+        batch['stateMessage'] = '%s : %s' % (e.code, e.message)
+      else:
+        batch['state'] = 'Completed'
+    finally:
+      batch['systemModstamp'] = self._now()
+      if serial:
+        job['lock'].release()
+
+  def _bulkSave(self, job, batch):
+    rows = csv.reader(StringIO(batch['request']))
+    try:
+      header = rows.next()
+    except StopIteration:
+      raise BulkFault('InvalidBatch', 'No records in batch')
+    header = [name.strip() for name in header]
+    header = [name.lower() == 'id' and 'Id' or name for name in header]
+    rows = list(rows)
+    if len(rows) > self.bulkBatchRecords:
+      raise BulkFault('InvalidBatch', 'Records in a batch: %d exceeds the limit of %d' % (len(rows), self.bulkBatchRecords))
+
+    out = StringIO()
+    writer = csv.writer(out, quoting = csv.QUOTE_ALL)
+    writer.writerow(['Id', 'Success', 'Created', 'Error'])
+    (sObjectType, operation) = (job['object'], job['operation'])
+    now = self._now()
+    self.store.lock.acquire()
+    try:
+      for row in rows:
+        # Empty values are left unset; #N/A sets a field to null
+        values = {}
+        for (name, value) in zip(header, row):
+          if value == '#N/A':
+            values[name] = None
+          elif value != '':
+            values[name] = value.decode('utf-8')
+
+        created = False
+        if operation == 'insert':
+          (id, errors) = self._insert(sObjectType, values, now)
+          created = True
+        elif operation == 'update':
+          (id, errors) = self._change(sObjectType, values, [], now)
+        elif operation == 'upsert':
+          (id, errors, created) = self._upsertRecord(sObjectType, job['externalIdFieldName'], values, [], now)
+        else:
+          (id, errors) = self._remove(values.get('Id'), datetime.datetime.utcnow())
+          if id is not None and operation == 'hardDelete':
+            del self.store.records[sObjectType][id]
+
+        batch['processed'] += 1
+        if errors:
+          batch['failed'] += 1
+          writer.writerow(['', 'false', 'false',
+                           ' '.join(['%s:%s --' % (code, message) for (code, message) in errors]).encode('utf-8')])
+        else:
+          writer.writerow([id, 'true', created and 'true' or 'false', ''])
+    finally:
+      self.store.lock.release()
+    batch['results'] = [(self._nextToken('752'), out.getvalue())]
+
+  def _csvValue(self, value):
+    if value is None:
+      return ''
+    if isinstance(value, bool):
+      return value and 'true' or 'false'
+    if isinstance(value, float) and value == int(value):
+      return str(int(value))
+    return unicode(value).encode('utf-8')
+
+  def _bulkQuery(self, batch):
+    (query, records) = self._select(batch['request'], False)
+    if query.count:
+      raise BulkFault('InvalidBatch', 'Aggregate queries are not supported by the Bulk API')
+
+    results = []
+    size = self.bulkResultRecords
+    for offset in range(0, max(len(records), 1), size):
+      out = StringIO()
+      writer = csv.writer(out, quoting = csv.QUOTE_ALL)
+      writer.writerow(query.fields)
+      for record in records[offset:offset + size]:
+        row = []
+        for path in query.fields:
+          (fieldType, target, field) = self._resolve(query.sObjectType, record, path)
+          if target is None:
+            row.append('')
+          else:
+            row.append(self._csvValue(self._fieldValue(fieldType, target, field)))
+        writer.writerow(row)
+      results.append((self._nextToken('752'), out.getvalue()))
+    batch['processed'] = len(records)
+    batch['results'] = results
+
+  def _jobInfo(self, job):
+    batches = job['batches']
+    def count(state):
+      return len([batch for batch in batches if batch['state'] == state])
+
+    out = ['<jobInfo xmlns="%s"><id>%s</id><operation>%s</operation><object>%s</object>'
+           '<createdById>%s</createdById><createdDate>%s</createdDate><systemModstamp>%s</systemModstamp>'
+           '<state>%s</state>' % (BULK_NS, job['id'], job['operation'], job['object'], USER_ID,
+                                  job['createdDate'], job['systemModstamp'], job['state'])]
+    if job['externalIdFieldName']:
+      out.append('<externalIdFieldName>%s</externalIdFieldName>' % job['externalIdFieldName'])
+    out.append('<concurrencyMode>%s</concurrencyMode><contentType>CSV</contentType>'
+               '<numberBatchesQueued>%d</numberBatchesQueued><numberBatchesInProgress>%d</numberBatchesInProgress>'
+               '<numberBatchesCompleted>%d</numberBatchesCompleted><numberBatchesFailed>%d</numberBatchesFailed>'
+               '<numberBatchesTotal>%d</numberBatchesTotal><numberRecordsProcessed>%d</numberRecordsProcessed>'
+               '<numberRetries>0</numberRetries><apiVersion>%s</apiVersion>'
+               '<numberRecordsFailed>%d</numberRecordsFailed></jobInfo>'
+               % (job['concurrencyMode'], count('Queued'), count('InProgress'), count('Completed'),
+                  count('Failed'), len(batches), sum([batch['processed'] for batch in batches]),
+                  self.apiVersion, sum([batch['failed'] for batch in batches])))
+    return ''.join(out)
+
+  def _batchInfo(self, batch, root = False):
+    out = ['<batchInfo%s><id>%s</id><jobId>%s</jobId><state>%s</state>'
+           % (root and ' xmlns="%s"' % BULK_NS or '', batch['id'], batch['jobId'], batch['state'])]
+    if batch['stateMessage']:
+      out.append('<stateMessage>%s</stateMessage>' % escape(batch['stateMessage']))
+    out.append('<createdDate>%s</createdDate><systemModstamp>%s</systemModstamp>'
+               '<numberRecordsProcessed>%d</numberRecordsProcessed><numberRecordsFailed>%d</numberRecordsFailed>'
+               '<totalProcessingTime>0</totalProcessingTime><apiActiveProcessingTime>0</apiActiveProcessingTime>'
+               '<apexProcessingTime>0</apexProcessingTime></batchInfo>'
+               % (batch['createdDate'], batch['systemModstamp'], batch['processed'], batch['failed']))
+    return ''.join(out)
+
+class _HTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+  daemon_threads = True
+  allow_reuse_address = True
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+  protocol_version = 'HTTP/1.1'
+  server_ = None
+
+  def do_GET(self):
+    self._handle('GET')
+
+  def do_POST(self):
+    self._handle('POST')
+
+  def _handle(self, method):
+    body = ''
+    if method == 'POST':
+      body = self.rfile.read(int(self.headers.getheader('content-length') or 0))
+      if (self.headers.getheader('content-encoding') or '').lower() == 'gzip':
+        body = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+
+    if self.path.startswith('/services/async/'):
+      (status, contentType, response) = self.server_.handleBulk(method, self.path,
+                                                                self.headers.getheader('x-sfdc-session'), body)
+    elif method == 'POST':
+      (status, response) = self.server_.handle(body)
+      contentType = 'text/xml; charset=utf-8'
+    elif self.path.split('?')[0] == '/soap/wsdl.jsp':
+      dialect = urlparse.parse_qs(urlparse.urlparse(self.path)[4]).get('type', [''])[0]
+      if dialect in DIALECTS:
+        (status, contentType, response) = (200, 'text/xml; charset=utf-8',
+                                           wsdl(dialect, self.server_.getServerUrl(dialect)))
+      else:
+        (status, contentType, response) = (404, 'text/plain', 'No such WSDL')
+    else:
+      (status, contentType, response) = (405, 'text/plain', 'Method not allowed')
+    if isinstance(response, unicode):
+      response = response.encode('utf-8')
+
+    self.send_response(status)
+    self.send_header('Content-Type', contentType)
+    if 'gzip' in (self.headers.getheader('accept-encoding') or ''):
+      compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+      response = compressor.compress(response) + compressor.flush()
+      self.send_header('Content-Encoding', 'gzip')
+    self.send_header('Content-Length', str(len(response)))
+    self.end_headers()
+    self.wfile.write(response)
+
+  def log_message(self, format, *args):
+    pass
+
+def main():
+  parser = OptionParser(usage = 'python -m sforce.testserver [options]')
+  parser.add_option('--host', default = '127.0.0.1')
+  parser.add_option('--port', type = 'int', default = 8080)
+  parser.add_option('--records', type = 'int', default = 1000,
+                    help = 'synthetic Accounts, Contacts and Leads to create (each)')
+  parser.add_option('--page-size', type = 'int', default = 500, dest = 'pageSize')
+  parser.add_option('--latency', type = 'float', default = 0, help = 'seconds per call')
+  parser.add_option('--session-timeout', type = 'float', default = None, dest = 'sessionTimeout')
+  parser.add_option('--seed', type = 'int', default = 0)
+  (options, args) = parser.parse_args()
+
+  server = SforceTestServer(options.host, options.port, records = options.records,
+                            pageSize = options.pageSize, latency = options.latency,
+                            sessionTimeout = options.sessionTimeout, seed = options.seed)
+  print 'Partner:    %s (WSDL: %s)' % (server.getServerUrl('partner'), server.getWsdlUrl('partner'))
+  print 'Enterprise: %s (WSDL: %s)' % (server.getServerUrl('enterprise'), server.getWsdlUrl('enterprise'))
+  try:
+    server.serveForever()
+  except KeyboardInterrupt:
+    pass
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,393 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the (LGPL) GNU Lesser General Public License as
+# published by the Free Software Foundation; either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Library Lesser General Public License for more details at
+# ( http://www.gnu.org/licenses/lgpl.html ).
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+# Written by: David Lanstein ( lanstein yahoo com )
+
+import base64
+import copy
+import errno
+import httplib
+import socket
+import threading
+import time
+import urllib2
+import urlparse
+import zlib
+
+from StringIO import StringIO
+
+from suds.transport import Transport, TransportError, Reply
+
+class _Inflater(object):
+  '''
+  Incrementally inflate a deflate-encoded body
+
+  Strictly it's zlib-wrapped, but some servers send raw deflate; which one it is is told from
+  its first two bytes, which can't form a zlib header in a raw deflate stream
+  '''
+  def __init__(self):
+    self.pending = ''
+    self.decompressor = None
+
+  def decompress(self, data):
+    if self.decompressor is None:
+      self.pending += data
+      if len(self.pending) < 2:
+        return ''
+      (data, self.pending) = (self.pending, '')
+      (cmf, flg) = (ord(data[0]), ord(data[1]))
+      if cmf & 0x0f == 8 and (cmf << 8 | flg) % 31 == 0:
+        self.decompressor = zlib.decompressobj()
+      else:
+        self.decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+    return self.decompressor.decompress(data)
+
+  def flush(self):
+    if self.decompressor is None:
+      return zlib.decompress(self.pending, -zlib.MAX_WBITS) if self.pending else ''
+    return self.decompressor.flush()
+
+def _decompressor(encoding):
+  '''
+  Return an object to inflate a response body with the given Content-Encoding piece by piece
+  (with decompress() and flush(), as zlib's), or None if it isn't compressed
+  '''
+  encoding = encoding.lower()
+  if encoding == 'gzip':
+    return zlib.decompressobj(16 + zlib.MAX_WBITS)
+  if encoding == 'deflate':
+    return _Inflater()
+  return None
+
+class HttpTransport(Transport):
+  '''
+  A suds transport that keeps HTTP/1.1 connections open between calls
+
+  urllib2, which suds' own transport sits on, sends "Connection: close" with every request,
+  so every call pays for a new TCP connection and SSL handshake.  This transport keeps up to
+  poolSize idle connections per host (i.e. per serverUrl returned by login()) and reuses them
+  until they have been idle for idleTimeout seconds.
+
+  It also handles gzip/deflate compression, which urllib2 leaves to the caller and suds
+  doesn't do at all.
+
+  One instance is safe to share between threads, and between cloned clients.
+  '''
+  def __init__(self, poolSize = 4, idleTimeout = 60, timeout = 90, proxy = None,
+               username = None, password = None, compress = False, compressRequests = False):
+    '''
+    'poolSize' : Maximum number of idle connections to keep per host, or 0 to close every
+                 connection after use
+    'idleTimeout' : Seconds after which an idle connection is closed instead of reused
+    'timeout' : Socket timeout in seconds
+    'proxy' : Dict of pair of 'protocol' and 'location'
+              e.g. {'http': 'my.insecure.proxy.example.com:80'}
+    'username' : Username for HTTP auth when using a proxy ONLY
+    'password' : Password for HTTP auth when using a proxy ONLY
+    'compress' : Ask for gzip- or deflate-compressed responses
+    'compressRequests' : Gzip the body of every SOAP request
+    '''
+    Transport.__init__(self)
+    self.poolSize = poolSize
+    self.idleTimeout = idleTimeout
+    self.timeout = timeout
+    self.proxy = proxy or {}
+    self.username = username
+    self.password = password
+    self.compress = compress
+    self.compressRequests = compressRequests
+
+    self._lock = threading.Lock()
+    # (scheme, host, port) => [(connection, time last used), ...]
+    self._idle = {}
+
+  # suds deep-copies its options, transport included, whenever a client is cloned; the
+  # clones should share our pool rather than each starting an empty one.  Each copy still
+  # needs suds options of its own, which suds links to just the one client's
+  def __deepcopy__(self, memo):
+    clone = copy.copy(self)
+    Transport.__init__(clone)
+    return clone
+
+  def __getstate__(self):
+    state = self.__dict__.copy()
+    del state['_lock']
+    state['_idle'] = {}
+    return state
+
+  def __setstate__(self, state):
+    self.__dict__.update(state)
+    self._lock = threading.Lock()
+
+  def _key(self, url):
+    parts = urlparse.urlsplit(url)
+    if parts.port:
+      port = parts.port
+    elif parts.scheme == 'https':
+      port = httplib.HTTPS_PORT
+    else:
+      port = httplib.HTTP_PORT
+    return (parts.scheme, parts.hostname, port)
+
+  def _connect(self, key):
+    (scheme, host, port) = key
+    proxy = self.proxy.get(scheme)
+
+    if proxy is None:
+      if scheme == 'https':
+        return httplib.HTTPSConnection(host, port, timeout = self.timeout)
+      return httplib.HTTPConnection(host, port, timeout = self.timeout)
+
+    if scheme == 'https':
+      # Tunnel through the proxy, so it never sees the traffic in the clear
+      conn = httplib.HTTPSConnection(proxy, timeout = self.timeout)
+      conn.set_tunnel(host, port, self._proxyHeaders())
+      return conn
+
+    return httplib.HTTPConnection(proxy, timeout = self.timeout)
+
+  def _proxyHeaders(self):
+    if self.username is None:
+      return {}
+    credentials = base64.b64encode('%s:%s' % (self.username, self.password or ''))
+    return {'Proxy-Authorization': 'Basic ' + credentials}
+
+  def _checkout(self, key):
+    '''
+    Return (connection, reused), preferring the most recently used idle connection
+    '''
+    now = time.time()
+    self._lock.acquire()
+    try:
+      idle = self._idle.get(key, [])
+      while idle:
+        (conn, lastUsed) = idle.pop()
+        if now - lastUsed < self.idleTimeout:
+          return (conn, True)
+        conn.close()
+    finally:
+      self._lock.release()
+
+    return (self._connect(key), False)
+
+  def _checkin(self, key, conn):
+    self._lock.acquire()
+    try:
+      idle = self._idle.setdefault(key, [])
+      if len(idle) < self.poolSize:
+        idle.append((conn, time.time()))
+        return
+    finally:
+      self._lock.release()
+    conn.close()
+
+  def close(self):
+    '''
+    Close all idle connections
+    '''
+    self._lock.acquire()
+    try:
+      for idle in self._idle.values():
+        for (conn, lastUsed) in idle:
+          conn.close()
+      self._idle.clear()
+    finally:
+      self._lock.release()
+
+  def _decode(self, headers, data):
+    '''
+    Inflate a gzip- or deflate-encoded response body
+    '''
+    decompressor = _decompressor(headers.pop('content-encoding', 'identity'))
+    if decompressor is None:
+      return data
+    return decompressor.decompress(data) + decompressor.flush()
+
+  def _gzip(self, data):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+  def _path(self, key, url, headers):
+    '''
+    Return (path, headers) to send a request for url with
+    '''
+    # Plain HTTP through a proxy sends the absolute URL; otherwise just the path
+    if key[0] == 'http' and key[0] in self.proxy:
+      headers = dict(headers or {})
+      headers.update(self._proxyHeaders())
+      return (url, headers)
+
+    parts = urlparse.urlsplit(url)
+    path = parts.path or '/'
+    if parts.query:
+      path += '?' + parts.query
+    return (path, headers or {})
+
+  def _send(self, key, method, path, body, headers):
+    '''
+    Send a request over a pooled connection, returning (connection, response) once the
+    response's status line has arrived
+
+    The server may have closed an idle connection since we last used it, in which case the
+    request is refused before any response: the connection is reset as we send, or closed
+    without a status line.  Only then is the request sent again, on another connection;
+    anything else is raised, since Salesforce may already have acted on the request.
+    '''
+    while True:
+      (conn, reused) = self._checkout(key)
+      try:
+        conn.request(method, path, body, headers)
+      except socket.error, e:
+        conn.close()
+        if reused and e.errno in (errno.ECONNRESET, errno.EPIPE):
+          continue
+        raise
+      except:
+        conn.close()
+        raise
+
+      try:
+        return (conn, conn.getresponse())
+      except httplib.BadStatusLine:
+        conn.close()
+        if reused:
+          continue
+        raise
+      except:
+        conn.close()
+        raise
+
+  def _request(self, method, url, body = None, headers = None):
+    '''
+    Make a request over a pooled connection, returning (status, reason, headers, body) with
+    the body already decompressed
+    '''
+    key = self._key(url)
+    (path, headers) = self._path(key, url, headers)
+
+    (conn, response) = self._send(key, method, path, body, headers)
+    try:
+      data = response.read()
+    except:
+      conn.close()
+      raise
+
+    if response.will_close:
+      conn.close()
+    else:
+      self._checkin(key, conn)
+
+    responseHeaders = dict(response.getheaders())
+    return (response.status, response.reason, responseHeaders, self._decode(responseHeaders, data))
+
+  def stream(self, method, url, body = None, headers = None, chunkSize = 65536):
+    '''
+    Make a request like _request(), but return (status, reason, headers, chunks), where
+    chunks is a generator of pieces of the decompressed body as they arrive, so a large
+    response never has to be held in memory whole
+
+    The connection goes back to the pool once chunks has been read to the end; closing it
+    early closes the connection.
+    '''
+    key = self._key(url)
+    (path, headers) = self._path(key, url, headers)
+
+    (conn, response) = self._send(key, method, path, body, headers)
+    responseHeaders = dict(response.getheaders())
+    encoding = responseHeaders.pop('content-encoding', 'identity')
+
+    def chunks():
+      decompressor = _decompressor(encoding)
+      finished = False
+      try:
+        while True:
+          data = response.read(chunkSize)
+          if not data:
+            break
+          if decompressor is not None:
+            data = decompressor.decompress(data)
+          if data:
+            yield data
+        if decompressor is not None:
+          data = decompressor.flush()
+          if data:
+            yield data
+        finished = True
+      finally:
+        # Part of the body may still be unread, so the connection can't be reused
+        if finished and not response.will_close:
+          self._checkin(key, conn)
+        else:
+          conn.close()
+
+    return (response.status, response.reason, responseHeaders, chunks())
+
+  def open(self, request):
+    '''
+    Fetch a document, such as the WSDL
+    '''
+    if not request.url.startswith(('http://', 'https://')):
+      # file:// and friends
+      return urllib2.urlopen(request.url)
+
+    headers = dict(request.headers)
+    if self.compress:
+      headers['Accept-Encoding'] = 'gzip, deflate'
+
+    (status, reason, headers, data) = self._request('GET', request.url, None, headers)
+    if status != 200:
+      raise TransportError(reason, status, StringIO(data))
+    return StringIO(data)
+
+  def _prepare(self, request):
+    '''
+    Return the (body, headers) to send a SOAP request with
+    '''
+    headers = dict(request.headers)
+    if self.poolSize > 0:
+      headers['Connection'] = 'keep-alive'
+    else:
+      headers['Connection'] = 'close'
+
+    if self.compress:
+      headers['Accept-Encoding'] = 'gzip, deflate'
+
+    message = request.message
+    if self.compressRequests:
+      if isinstance(message, unicode):
+        message = message.encode('utf-8')
+      message = self._gzip(message)
+      headers['Content-Encoding'] = 'gzip'
+    return (message, headers)
+
+  def sendStream(self, request):
+    '''
+    Send a SOAP request, returning (status, reason, headers, chunks) as stream() does, so the
+    response can be parsed as it arrives
+    '''
+    (message, headers) = self._prepare(request)
+    return self.stream('POST', request.url, message, headers)
+
+  def send(self, request):
+    '''
+    Send a SOAP request, returning the Reply
+    '''
+    (message, headers) = self._prepare(request)
+    (status, reason, headers, data) = self._request('POST', request.url, message, headers)
+    if status in (202, 204):
+      return None
+    if status != 200:
+      # suds parses SOAP faults out of the body of the 500 response
+      raise TransportError(reason, status, StringIO(data))
+    return Reply(status, headers, data)
@@ -0,0 +1,114 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the (LGPL) GNU Lesser General Public License as
+# published by the Free Software Foundation; either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Library Lesser General Public License for more details at
+# ( http://www.gnu.org/licenses/lgpl.html ).
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+# Written by: David Lanstein ( lanstein yahoo com )
+
+'''
+Picks the QueryOptions batch size of each page of a query from how long, and how large, the
+pages before it were; see SforceBaseClient.queryIter()
+'''
+
+import threading
+
+from instrument import CallListener
+
+QUERY_CALLS = ('query', 'queryAll', 'queryMore')
+
+class BatchSizeTuner(CallListener):
+  '''
+  Chooses the batch size of each page so it takes about targetLatency seconds, and its
+  response is no larger than maxPageBytes
+
+  The time and response size per record are averaged over the pages so far (weighting the
+  latest by smoothing), and the next batch size is the most records expected to fit both.
+  It's kept between minBatchSize and maxBatchSize, the range Salesforce accepts, and at most
+  doubles from one page to the next; it shrinks to fit straight away.  For maxPageBytes, the
+  larger of the average and the latest page's bytes per record is used, so one oversized
+  page isn't followed by more.  Salesforce may still return fewer records than
+  asked for, e.g. for objects with many or long fields.
+
+  A tuner keeps what it's learned from one query to the next, so reuse one for queries of
+  the same shape, and use a new one for a different object or field list.
+  '''
+  minBatchSize = 200
+  maxBatchSize = 2000
+
+  def __init__(self, targetLatency = 2.0, maxPageBytes = None, batchSize = 500, smoothing = 0.5):
+    '''
+    'targetLatency' : Seconds each page should take, from sending the call to having its
+                      records; None to size pages by maxPageBytes alone
+    'maxPageBytes' : Most bytes each page's (uncompressed) SOAP response should take, as a
+                     bound on the memory one page of records uses; None for no bound
+    'batchSize' : Batch size of the first page
+    'smoothing' : Weight of the latest page in the averages, between 0 and 1; higher follows
+                  changes in latency sooner, lower is steadier
+    '''
+    self.targetLatency = targetLatency
+    self.maxPageBytes = maxPageBytes
+    self.smoothing = smoothing
+    self.batchSize = self._clamp(batchSize)
+    self.secondsPerRecord = None
+    self.bytesPerRecord = None
+    self._lock = threading.Lock()
+
+  def _clamp(self, batchSize):
+    return max(self.minBatchSize, min(int(batchSize), self.maxBatchSize))
+
+  def _average(self, average, value):
+    if average is None:
+      return value
+    return self.smoothing * value + (1 - self.smoothing) * average
+
+  def callFinished(self, info):
+    if info.call in QUERY_CALLS and info.error is None and info.responseRecords > 0:
+      self.observe(info.responseRecords, info.total, info.responseBytes)
+
+  def observe(self, records, seconds, size):
+    '''
+    Account for a page, and choose the next batch size
+
+    'records' : Number of records on the page
+    'seconds' : How long the page took
+    'size' : Bytes in the page's response
+    '''
+    self._lock.acquire()
+    try:
+      self.secondsPerRecord = self._average(self.secondsPerRecord, float(seconds) / records)
+      bytesPerRecord = None
+      if size:
+        self.bytesPerRecord = self._average(self.bytesPerRecord, float(size) / records)
+        # maxPageBytes is a ceiling, so don't let a lower average talk it down
+        bytesPerRecord = max(self.bytesPerRecord, float(size) / records)
+
+      limits = []
+      if self.targetLatency is not None and self.secondsPerRecord:
+        limits.append(self.targetLatency / self.secondsPerRecord)
+      if self.maxPageBytes is not None and bytesPerRecord:
+        limits.append(self.maxPageBytes / bytesPerRecord)
+      if limits:
+        self.batchSize = self._clamp(min(int(min(limits)), self.batchSize * 2))
+    finally:
+      self._lock.release()
+
+  def apply(self, client):
+    '''
+    Set client's QueryOptions header to the current batch size, if it isn't already
+    '''
+    batchSize = self.batchSize
+    header = client._queryOptions
+    if header is not None and getattr(header, 'batchSize', None) == batchSize:
+      return
+    header = client.generateHeader('QueryOptions')
+    header.batchSize = batchSize
+    client.setQueryOptions(header)
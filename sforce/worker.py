@@ -0,0 +1,197 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the (LGPL) GNU Lesser General Public License as
+# published by the Free Software Foundation; either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Library Lesser General Public License for more details at
+# ( http://www.gnu.org/licenses/lgpl.html ).
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+# Written by: David Lanstein ( lanstein yahoo com )
+
+import logging
+import sys
+import threading
+import Queue
+
+from collections import deque
+
+log = logging.getLogger(__name__)
+
+class Future(object):
+  '''
+  The result of a call running on another thread
+  '''
+  def __init__(self):
+    self._event = threading.Event()
+    self._lock = threading.Lock()
+    self._result = None
+    self._excInfo = None
+    self._callbacks = []
+
+  def _finish(self):
+    self._lock.acquire()
+    try:
+      self._event.set()
+      callbacks = self._callbacks
+      self._callbacks = []
+    finally:
+      self._lock.release()
+
+    for callback in callbacks:
+      self._callback(callback)
+
+  def _callback(self, callback):
+    # One failing callback mustn't keep the others from running, nor kill the worker thread
+    try:
+      callback(self)
+    except Exception:
+      log.exception('Future callback %r failed', callback)
+
+  def setResult(self, result):
+    self._result = result
+    self._finish()
+
+  def setException(self, excInfo):
+    '''
+    'excInfo' : sys.exc_info() of the failure, re-raised with its traceback by result()
+    '''
+    self._excInfo = excInfo
+    self._finish()
+
+  def addCallback(self, callback):
+    '''
+    Call callback(future) once the call has finished, on the thread that finished it, or
+    straight away if it already has.  An exception raised by callback is logged, not raised.
+    '''
+    self._lock.acquire()
+    try:
+      if not self._event.isSet():
+        self._callbacks.append(callback)
+        return
+    finally:
+      self._lock.release()
+    self._callback(callback)
+
+  def done(self):
+    return self._event.isSet()
+
+  def exception(self):
+    '''
+    Block until the call has finished, then return the exception it raised, if any
+    '''
+    self._event.wait()
+    if self._excInfo is not None:
+      return self._excInfo[1]
+    return None
+
+  def result(self):
+    '''
+    Block until the call has finished, then return its result or raise its exception
+    '''
+    self._event.wait()
+    if self._excInfo is not None:
+      raise self._excInfo[0], self._excInfo[1], self._excInfo[2]
+    return self._result
+
+def spawn(fn, *args):
+  '''
+  Run fn(*args) on a new daemon thread and return a Future for its result
+  '''
+  future = Future()
+
+  def run():
+    try:
+      future.setResult(fn(*args))
+    except:
+      future.setException(sys.exc_info())
+
+  thread = threading.Thread(target = run)
+  thread.setDaemon(True)
+  thread.start()
+  return future
+
+class WorkerPool(object):
+  '''
+  A fixed number of threads working through a shared queue of calls
+
+  Each thread calls initializer() once when it starts, and passes the result as the first
+  argument to every call it runs; the clients use this to give each thread its own connection.
+  '''
+  def __init__(self, workers, initializer = None):
+    self._workers = workers
+    self._tasks = Queue.Queue()
+    self._closed = False
+    self._threads = []
+    for i in range(workers):
+      thread = threading.Thread(target = self._work, args = (initializer, ))
+      thread.setDaemon(True)
+      thread.start()
+      self._threads.append(thread)
+
+  def _work(self, initializer):
+    state = None
+    failure = None
+    if initializer is not None:
+      try:
+        state = initializer()
+      except:
+        failure = sys.exc_info()
+
+    while True:
+      task = self._tasks.get()
+      if task is None:
+        break
+
+      (future, fn, args) = task
+      if failure is not None:
+        future.setException(failure)
+        continue
+      if self._closed:
+        future.setException((RuntimeError, RuntimeError('WorkerPool has been shut down'), None))
+        continue
+
+      try:
+        future.setResult(fn(state, *args))
+      except:
+        future.setException(sys.exc_info())
+
+  def submit(self, fn, *args):
+    '''
+    Queue fn(state, *args) and return a Future for its result
+    '''
+    future = Future()
+    self._tasks.put((future, fn, args))
+    return future
+
+  def map(self, fn, iterable):
+    '''
+    Yield fn(state, item) for each item, in the order of iterable
+
+    Only a couple of items per thread are taken from iterable ahead of the results being
+    consumed, so a large generator is never read into memory all at once.
+    '''
+    pending = deque()
+    for item in iterable:
+      pending.append(self.submit(fn, item))
+      if len(pending) >= 2 * self._workers:
+        yield pending.popleft().result()
+
+    while pending:
+      yield pending.popleft().result()
+
+  def shutdown(self):
+    '''
+    Stop the threads once they finish their current call, and wait for them to do so;
+    anything still queued fails
+    '''
+    self._closed = True
+    for thread in self._threads:
+      self._tasks.put(None)
+    for thread in self._threads:
+      thread.join()
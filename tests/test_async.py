@@ -0,0 +1,239 @@
+# coding: utf-8
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the (LGPL) GNU Lesser General Public License as
+# published by the Free Software Foundation; either version 3 of the 
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Library Lesser General Public License for more details at
+# ( http://www.gnu.org/licenses/lgpl.html ).
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+# Written by: David Lanstein ( lanstein yahoo com )
+
+import sys
+import threading
+import time
+import unittest
+
+sys.path.append('../')
+
+import test_config
+from sforce.asyncclient import AsyncSforceEnterpriseClient, AsyncSforcePartnerClient
+from sforce.cache import DescribeCache
+from sforce.instrument import CallListener, CallStats
+from sforce.retry import RetryPolicy
+
+from suds import WebFault
+
+class CallRecorder(CallListener):
+  '''
+  Keeps the CallInfo of every call
+  '''
+  def __init__(self):
+    self.calls = []
+
+  def callFinished(self, info):
+    self.calls.append(info)
+
+class AsyncSforcePartnerClientTest(unittest.TestCase):
+  clientClass = AsyncSforcePartnerClient
+  wsdl = test_config.PARTNER_WSDL
+  h = None
+
+  def setUp(self):
+    if self.h is None:
+      self.h = self.clientClass(self.wsdl, workers = 4, location = test_config.LOCATION)
+      self.h.login(test_config.USERNAME, test_config.PASSWORD, test_config.TOKEN).result()
+
+  def testLoginSetsSession(self):
+    self.assertTrue(self.h.getSessionId() is not None)
+    self.assertTrue(self.h.getLocation() is not None)
+
+  def testManyQueriesInFlight(self):
+    futures = [self.h.query('SELECT Id FROM Lead LIMIT 1') for i in range(20)]
+
+    for future in futures:
+      result = future.result()
+      self.assertTrue(result.size <= 1)
+
+  def testCallsRunConcurrently(self):
+    if not test_config.TEST_SERVER:
+      return
+
+    # Every call takes half a second; four workers each blocking on a call would take five
+    # seconds over 40 calls, and 16 connections at once take about 1.5
+    test_config.server.latency = 0.5
+    try:
+      started = time.time()
+      futures = [self.h.query('SELECT Id FROM Lead LIMIT 1') for i in range(40)]
+      # Sending doesn't wait for responses
+      self.assertTrue(time.time() - started < 0.5)
+      for future in futures:
+        self.assertTrue(future.result().size <= 1)
+      self.assertTrue(time.time() - started < 3)
+    finally:
+      test_config.server.latency = 0
+
+  def testCreateAndDelete(self):
+    lead = self.h.generateObject('Lead')
+    lead.LastName = u'Möke'
+    lead.Company = u'你好公司'
+
+    result = self.h.create(lead).result()
+    self.assertTrue(result.success)
+
+    result = self.h.delete(result.id).result()
+    self.assertTrue(result.success)
+
+  def testBatchesInFlightLimited(self):
+    leads = []
+    for i in range(450):
+      lead = self.h.generateObject('Lead')
+      lead.LastName = u'Möke %d' % i
+      lead.Company = u'你好公司'
+      leads.append(lead)
+
+    client = self.h.getClient()
+    recorder = CallRecorder()
+    client.addListener(recorder)
+    client.setConcurrency(2)
+    if test_config.TEST_SERVER:
+      test_config.server.latency = 0.2
+    try:
+      saveResults = self.h.create(leads).result()
+      result = self.h.delete([saveResult.id for saveResult in saveResults]).result()
+    finally:
+      if test_config.TEST_SERVER:
+        test_config.server.latency = 0
+      client.setConcurrency(1)
+      client.removeListener(recorder)
+
+    self.assertEqual(len(saveResults), 450)
+    self.assertEqual(len(result), 450)
+    for (deleteResult, saveResult) in zip(result, saveResults):
+      self.assertTrue(deleteResult.success)
+      # results come back in input order
+      self.assertEqual(deleteResult.id, saveResult.id)
+
+    # Three batches each, at most two of them in flight at once
+    self.assertEqual(len(recorder.calls), 6)
+    for info in recorder.calls:
+      inFlight = [other for other in recorder.calls
+                  if other.sent <= info.sent < other.received]
+      self.assertTrue(len(inFlight) <= 2)
+
+  def testCallback(self):
+    called = threading.Event()
+    results = []
+
+    def callback(future):
+      results.append(future.result())
+      called.set()
+
+    self.h.getServerTimestamp().addCallback(callback)
+    called.wait(30)
+
+    self.assertEqual(len(results), 1)
+    self.assertTrue(results[0].timestamp is not None)
+
+  def testFailingCallbackDoesntStopOthers(self):
+    called = threading.Event()
+    results = []
+
+    def failing(future):
+      raise ValueError('callback failed')
+
+    def callback(future):
+      results.append(future.result())
+      called.set()
+
+    future = self.h.getServerTimestamp()
+    future.addCallback(failing)
+    future.addCallback(callback)
+    called.wait(30)
+
+    self.assertEqual(len(results), 1)
+    self.assertTrue(future.result().timestamp is not None)
+
+  def testWorkerReloginReachesClient(self):
+    client = self.h.getClient()
+    client.setRetryPolicy(RetryPolicy(baseDelay = 0.1))
+    stale = self.h.getSessionId()
+    self.h.getServerTimestamp().result()
+
+    client.invalidateSessions(stale)
+    # A worker logs in again, having found the session expired
+    self.h.getServerTimestamp().result()
+    self.assertNotEqual(self.h.getSessionId(), stale)
+
+    client.setRetryPolicy(None)
+    client.getServerTimestamp()
+    self.h.getServerTimestamp().result()
+
+  def testListenersAndDescribeCache(self):
+    client = self.h.getClient()
+    stats = CallStats()
+    client.addListener(stats)
+    client.setDescribeCache(DescribeCache())
+    try:
+      describe = self.h.describeSObject('Lead').result()
+      self.assertTrue(self.h.describeSObject('lead').result() is describe)
+      self.h.query('SELECT Id FROM Lead LIMIT 2').result()
+    finally:
+      client.removeListener(stats)
+      client.setDescribeCache(None)
+
+    calls = stats.getStats()
+    self.assertEqual(calls['describeSObject']['calls'], 1)
+    self.assertEqual(calls['query']['responseRecords'], 2)
+    self.assertTrue(calls['query']['total'] >= calls['query']['network'] > 0)
+
+  def testFaultRaisedFromResult(self):
+    future = self.h.query('SELECT NotAField__c FROM Lead')
+
+    self.assertTrue(isinstance(future.exception(), WebFault))
+    try:
+      future.result()
+      self.fail('WebFault not thrown')
+    except WebFault:
+      pass
+
+  def testWorkersUnmarshallWithTheirOwnOptions(self):
+    # Clients sharing the parsed WSDL each activate their own suds options for a call, on the
+    # thread making it; with faults = False, a fault would be returned rather than raised
+    other = self.h.getClient()._clone()
+    other._sforce.set_options(faults = False)
+
+    # Have each of the four workers make a call with the other client, as a callback might
+    gate = threading.Event()
+    called = threading.Semaphore(0)
+    def call(state):
+      try:
+        other.getServerTimestamp()
+      finally:
+        called.release()
+      gate.wait()
+
+    tasks = [self.h._pool.submit(call) for i in range(4)]
+    for task in tasks:
+      called.acquire()
+    gate.set()
+    for task in tasks:
+      task.result()
+
+    future = self.h.query('SELECT NotAField__c FROM Lead')
+    self.assertTrue(isinstance(future.exception(), WebFault))
+
+class AsyncSforceEnterpriseClientTest(AsyncSforcePartnerClientTest):
+  clientClass = AsyncSforceEnterpriseClient
+  wsdl = test_config.ENTERPRISE_WSDL
+  h = None
+
+if __name__ == '__main__':
+  unittest.main('test_async')
@@ -17,16 +17,34 @@
 # Written by: David Lanstein ( lanstein yahoo com )
 
 import datetime
+import httplib
+import os
 import re
+import shutil
+import socket
 import string
 import sys
+import tempfile
+import time
 import unittest
+import urllib2
+
+from cStringIO import StringIO
 
 sys.path.append('../')
 
+import test_config
 from sforce.base import SforceBaseClient
+from sforce.cache import DescribeCache, SessionStore
+from sforce.export import ColumnWriter, CSVWriter
+from sforce.instrument import CallStats
+from sforce.retry import RetryPolicy
+from sforce.sync import SyncEngine, SyncSink, WatermarkStore, toUtc
+from sforce.transport import HttpTransport
+from sforce.tuning import BatchSizeTuner
 
 from suds import WebFault
+from suds.transport import TransportError
 
 # strings we can look for to ensure headers sent
 ALLOW_FIELD_TRUNCATION_HEADER_STRING = '<tns:allowFieldTruncation>false</tns:allowFieldTruncation>'
@@ -43,6 +61,46 @@ SESSION_HEADER_STRING = '</tns:sessionId>'
 # starting in 0.3.7, xsi:type="ns1:ID" is omitted from opening tag
 USER_TERRITORY_DELETE_HEADER_STRING = '>005000xxxxxxxxx</tns:transferToUserId>'
 
+class UnavailableTransport(HttpTransport):
+  '''
+  Answers the next 'failures' SOAP requests with a 503 (or 'status'), as a load balancer in
+  front of Salesforce might
+  '''
+  failures = 0
+  status = 503
+
+  def send(self, request):
+    if self.failures > 0:
+      self.failures -= 1
+      raise TransportError(httplib.responses[self.status], self.status, StringIO(''))
+    return HttpTransport.send(self, request)
+
+class DroppingTransport(HttpTransport):
+  '''
+  Sends the next 'drops' SOAP requests but loses Salesforce's response, as a connection reset
+  after the request got through would
+  '''
+  drops = 0
+
+  def send(self, request):
+    reply = HttpTransport.send(self, request)
+    if self.drops > 0:
+      self.drops -= 1
+      raise socket.error(104, 'Connection reset by peer')
+    return reply
+
+class OpeningTransport(HttpTransport):
+  '''
+  Records the documents it's asked to open
+  '''
+  def __init__(self, *args, **kwargs):
+    HttpTransport.__init__(self, *args, **kwargs)
+    self.opened = []
+
+  def open(self, request):
+    self.opened.append(request.url)
+    return HttpTransport.open(self, request)
+
 class SforceBaseClientTest(unittest.TestCase):
   def setUp(self):
     pass
@@ -401,6 +459,41 @@ class SforceBaseClientTest(unittest.TestCase):
     self.assertTrue(result[1].success)
     self.assertTrue(result[1].id[0:3] == '00Q')
 
+  def testCreateLeadFromDict(self):
+    # A single dict is one record, not a list of its keys
+    result = self.h.create({'type': 'Lead', 'LastName': u'Möke', 'Company': u'你好公司'})
+    self.assertTrue(result.success)
+
+    lead = self.h.retrieve('LastName, Company', 'Lead', result.id)
+    self.assertEqual(lead.LastName, u'Möke')
+    self.assertEqual(lead.Company, u'你好公司')
+
+  def testCreateLeadsOverBatchLimit(self):
+    leads = []
+    for i in range(450):
+      lead = self.h.generateObject('Lead')
+      lead.LastName = u'Möke %d' % i
+      lead.Company = u'你好公司'
+      leads.append(lead)
+
+    saveResults = self.h.create(iter(leads))
+
+    self.assertEqual(len(saveResults), 450)
+    for saveResult in saveResults:
+      self.assertTrue(saveResult.success)
+
+    self.h.setConcurrency(3)
+    try:
+      result = self.h.delete([saveResult.id for saveResult in saveResults])
+    finally:
+      self.h.setConcurrency(1)
+
+    self.assertEqual(len(result), 450)
+    for (deleteResult, saveResult) in zip(result, saveResults):
+      self.assertTrue(deleteResult.success)
+      # results come back in input order
+      self.assertEqual(deleteResult.id, saveResult.id)
+
   def testDeleteLead(self):
     self.setHeaders('delete')
 
@@ -445,7 +538,7 @@ class SforceBaseClientTest(unittest.TestCase):
     now = datetime.datetime.utcnow()
     result = self.createLead()
     result = self.h.delete(result.id)
-    result = self.h.getDeleted('Lead', now.isoformat(), '2019-01-01T23:01:01Z')
+    result = self.h.getDeleted('Lead', now.isoformat(), (now + datetime.timedelta(days = 1)).isoformat())
 
     # This will nearly always be one single result
     self.assertTrue(len(result.deletedRecords) > 0)
@@ -462,7 +555,7 @@ class SforceBaseClientTest(unittest.TestCase):
     now = datetime.datetime.utcnow()
     (result, lead) = self.createLead(True)
     result = self.h.update(lead)
-    result = self.h.getUpdated('Lead', now.isoformat(), '2019-01-01T23:01:01Z')
+    result = self.h.getUpdated('Lead', now.isoformat(), (now + datetime.timedelta(days = 1)).isoformat())
 
     # This will nearly always be one single result
     self.assertTrue(len(result.ids) > 0)
@@ -684,6 +777,71 @@ class SforceBaseClientTest(unittest.TestCase):
 
     self.checkHeaders('queryMore')
     
+  def testQueryIter(self):
+    self.setHeaders('queryMore')
+
+    result = self.h.queryAll('SELECT Id FROM Lead')
+    expected = result.size
+
+    count = 0
+    for record in self.h.queryIter('SELECT FirstName, LastName FROM Lead', queryAll = True):
+      self.assertTrue(hasattr(record, 'LastName'))
+      self.assertFalse(isinstance(record.LastName, list))
+      count += 1
+
+    self.assertTrue(count > 200)
+    self.assertEqual(count, expected)
+
+  def testQueryIterWithoutPrefetch(self):
+    self.setHeaders('queryMore')
+
+    result = self.h.query('SELECT Id FROM Lead')
+    records = list(self.h.queryIter('SELECT Id FROM Lead', prefetch = False))
+
+    self.assertEqual(len(records), result.size)
+
+  def testQueryIterTuned(self):
+    result = self.h.query('SELECT Id FROM Lead')
+    queryOptions = self.h._queryOptions
+
+    # Far too small to hold a page, so the pages should shrink as they're fetched
+    tuner = BatchSizeTuner(targetLatency = None, maxPageBytes = 1000, batchSize = 2000)
+    records = list(self.h.queryIter('SELECT Id, Description FROM Lead', tuner = tuner))
+
+    self.assertEqual(len(records), result.size)
+    self.assertTrue(tuner.bytesPerRecord > 0)
+    self.assertTrue(tuner.batchSize < 2000)
+    # Our own QueryOptions are left alone
+    self.assertTrue(self.h._queryOptions is queryOptions)
+
+  def testQueryExport(self):
+    result = self.h.query('SELECT Id FROM Lead')
+
+    fp = StringIO()
+    count = self.h.queryExport('SELECT Id, LastName, Owner.Name FROM Lead', CSVWriter(fp))
+    self.assertEqual(count, result.size)
+    lines = fp.getvalue().splitlines()
+    self.assertEqual(lines[0], 'Id,LastName,Owner.Name')
+    self.assertEqual(len(lines), result.size + 1)
+
+    writer = ColumnWriter(useNumpy = False)
+    self.h.queryExport('SELECT Id, IsConverted, CreatedDate FROM Lead', writer)
+    self.assertEqual(len(writer.columns['Id']), result.size)
+    self.assertTrue(writer.columns['IsConverted'][0] in (True, False))
+    self.assertTrue(isinstance(writer.columns['CreatedDate'][0], datetime.datetime))
+
+  def testQueryPartitioned(self):
+    result = self.h.queryAll('SELECT Id FROM Lead')
+
+    ids = [record.Id for record in self.h.queryPartitioned('SELECT Id FROM Lead', 4, queryAll = True)]
+    self.assertEqual(len(ids), result.size)
+    self.assertEqual(len(set(ids)), result.size)
+
+    records = list(self.h.queryPartitioned('SELECT Id, CreatedDate FROM Lead', 3, 'CreatedDate', ordered = True))
+    self.assertEqual(len(records), self.h.query('SELECT Id FROM Lead').size)
+    dates = [record.CreatedDate for record in records]
+    self.assertEqual(dates, sorted(dates))
+
   def testRetrievePassingList(self):
     self.setHeaders('retrieve')
 
@@ -980,6 +1138,287 @@ class SforceBaseClientTest(unittest.TestCase):
 
     self.assertTrue(result.find('<getServerTimestampResponse>') != -1)
 
+  def testKeepAlive(self):
+    h = self.h.__class__(self.wsdl, keepAlive = True, location = test_config.LOCATION)
+    h.login(test_config.USERNAME, test_config.PASSWORD, test_config.TOKEN)
+    transport = h.getConnection().options.transport
+
+    key = transport._key(h.getLocation())
+
+    h.getServerTimestamp()
+    self.assertEqual(len(transport._idle[key]), 1)
+    conn = transport._idle[key][0][0]
+
+    # same connection is reused for the next call
+    h.getServerTimestamp()
+    self.assertTrue(transport._idle[key][0][0] is conn)
+
+  def testCompression(self):
+    h = self.h.__class__(self.wsdl, compression = True, compressRequests = True, location = test_config.LOCATION)
+    h.login(test_config.USERNAME, test_config.PASSWORD, test_config.TOKEN)
+
+    result = h.query('SELECT FirstName, LastName FROM Lead')
+    self.assertTrue(result.size > 0)
+    self.assertTrue(h.getLastResponse().find('<queryResponse>') != -1)
+
+  def testListener(self):
+    stats = CallStats()
+    self.h.addListener(stats)
+    try:
+      self.h.query('SELECT Id FROM Lead LIMIT 3')
+      try:
+        self.h.query('SELECT NoSuchField__c FROM Lead')
+      except WebFault:
+        pass
+    finally:
+      self.h.removeListener(stats)
+    self.h.query('SELECT Id FROM Lead LIMIT 1')
+
+    query = stats.getStats()['query']
+    self.assertEqual(query['calls'], 2)
+    self.assertEqual(query['errors'], 1)
+    self.assertTrue(query['responseRecords'] <= 3)
+    self.assertTrue(query['requestBytes'] > 0)
+    self.assertTrue(query['responseBytes'] > 0)
+    self.assertTrue(query['network'] > 0)
+    self.assertTrue(query['total'] >= query['network'])
+
+  def testRetryPolicyRecoversSession(self):
+    sessionId = self.h.getSessionId()
+    header = self.h.generateHeader('SessionHeader')
+    header.sessionId = 'bogus'
+    self.h.setSessionHeader(header)
+    self.h._sessionId = 'bogus'
+
+    self.assertRaises(WebFault, self.h.getServerTimestamp)
+
+    self.h.setRetryPolicy(RetryPolicy(baseDelay = 0.1))
+    try:
+      self.h.getServerTimestamp()
+    finally:
+      self.h.setRetryPolicy(None)
+    self.assertEqual(self.h.getSessionId(), sessionId)
+
+  def testRetryPolicyRetriesServiceUnavailable(self):
+    transport = UnavailableTransport()
+    h = self.h.__class__(self.wsdl, transport = transport, location = test_config.LOCATION)
+    h.login(test_config.USERNAME, test_config.PASSWORD, test_config.TOKEN)
+
+    transport.failures = 1
+    self.assertRaises(Exception, h.getServerTimestamp)
+
+    transport.failures = 2
+    h.setRetryPolicy(RetryPolicy(baseDelay = 0.1))
+    self.assertTrue(h.getServerTimestamp().timestamp is not None)
+    self.assertEqual(transport.failures, 0)
+
+  def testRetryPolicySkipsClientErrors(self):
+    transport = UnavailableTransport()
+    h = self.h.__class__(self.wsdl, transport = transport, location = test_config.LOCATION)
+    h.login(test_config.USERNAME, test_config.PASSWORD, test_config.TOKEN)
+
+    transport.failures = 2
+    transport.status = 404
+    h.setRetryPolicy(RetryPolicy(baseDelay = 0.1))
+    self.assertRaises(Exception, h.getServerTimestamp)
+    self.assertEqual(transport.failures, 1)
+
+  def testRetryPolicyDoesntRepeatDelete(self):
+    transport = DroppingTransport()
+    h = self.h.__class__(self.wsdl, transport = transport, location = test_config.LOCATION)
+    h.login(test_config.USERNAME, test_config.PASSWORD, test_config.TOKEN)
+    h.setRetryPolicy(RetryPolicy(baseDelay = 0.1))
+
+    result = self.createLead()
+    transport.drops = 1
+    self.assertRaises(socket.error, h.delete, result.id)
+    self.assertEqual(transport.drops, 0)
+
+    # The lead was deleted all the same; a retry would have reported it as ENTITY_IS_DELETED
+    result = self.h.delete(result.id)
+    self.assertFalse(result.success)
+    self.assertEqual(result.errors[0].statusCode, 'ENTITY_IS_DELETED')
+
+    # Calls that are safe to repeat are still retried
+    transport.drops = 1
+    h.getServerTimestamp()
+    self.assertEqual(transport.drops, 0)
+
+  def testSessionStore(self):
+    location = tempfile.mkdtemp()
+    try:
+      store = SessionStore(location)
+      h1 = self.h.__class__(self.wsdl, location = test_config.LOCATION)
+      h1.setSessionStore(store)
+      result1 = h1.login(test_config.USERNAME, test_config.PASSWORD, test_config.TOKEN)
+
+      h2 = self.h.__class__(self.wsdl, location = test_config.LOCATION)
+      h2.setSessionStore(store)
+      result2 = h2.login(test_config.USERNAME, test_config.PASSWORD, test_config.TOKEN)
+
+      self.assertEqual(result2.sessionId, result1.sessionId)
+      self.assertEqual(h2.getLocation(), h1.getLocation())
+      self.assertEqual(result2.userId, result1.userId)
+      self.assertTrue(h2.getServerTimestamp())
+    finally:
+      shutil.rmtree(location)
+
+  def testSessionStoreCheckFails(self):
+    location = tempfile.mkdtemp()
+    try:
+      store = SessionStore(location)
+      transport = UnavailableTransport()
+      h = self.h.__class__(self.wsdl, transport = transport, location = test_config.LOCATION)
+      h.setSessionStore(store)
+      key = store.getKey(test_config.USERNAME, h._loginLocation, h.__class__.__name__)
+      store.put(key, 'saved', 'https://cs2-api.salesforce.com/services/Soap/u/20.0')
+      endpoint = h.getLocation()
+
+      # The getUserInfo() checking the saved session fails with something other than an
+      # expired session, which leaves the client as it was
+      transport.failures = 1
+      self.assertRaises(Exception, h.login, test_config.USERNAME, test_config.PASSWORD,
+                        test_config.TOKEN)
+      self.assertEqual(h._sessionHeader, None)
+      self.assertEqual(h.getSessionId(), None)
+      self.assertEqual(h.getLocation(), endpoint)
+      self.assertEqual(store.get(key)[0], 'saved')
+    finally:
+      shutil.rmtree(location)
+
+  def sync(self, fields):
+    '''
+    Create a lead and delete another, and sync Leads with a SyncEngine; return (lead, Id of
+    the deleted lead, records upserted, Ids deleted, counts)
+    '''
+    class Sink(SyncSink):
+      def __init__(self):
+        self.upserted = []
+        self.deleted = []
+      def upsert(self, sObjectType, records):
+        self.upserted.extend(records)
+      def delete(self, sObjectType, ids):
+        self.deleted.extend(ids)
+
+    since = datetime.datetime.utcnow() - datetime.timedelta(minutes = 5)
+    (result, lead) = self.createLead(True)
+    result = self.h.delete(self.createLead().id)
+
+    # getUpdated() and getDeleted() work in whole minutes, so the changes are only covered once
+    # their minute has ended.  The stand-in takes a window ending in the future, so sync up to
+    # the next minute rather than waiting for it
+    now = toUtc(self.h.getServerTimestamp().timestamp)
+    nextMinute = now.replace(second = 0, microsecond = 0) + datetime.timedelta(minutes = 1)
+    if test_config.TEST_SERVER:
+      clock = lambda: nextMinute
+    else:
+      time.sleep(61 - now.second)
+      clock = None
+
+    location = tempfile.mkdtemp()
+    try:
+      sink = Sink()
+      watermarks = WatermarkStore(os.path.join(location, 'watermarks.json'))
+      engine = SyncEngine(self.h, sink, watermarks, fields, clock = clock)
+      counts = engine.sync(['Lead'], since)
+      self.assertTrue(watermarks.get('Lead', 'updated') > since)
+    finally:
+      shutil.rmtree(location)
+    return (lead, result.id, sink.upserted, sink.deleted, counts)
+
+  def testSyncEngine(self):
+    (lead, deletedId, upserted, deleted, counts) = self.sync({'Lead': 'LastName'})
+
+    self.assertTrue(lead.Id in [record.Id for record in upserted])
+    self.assertTrue(deletedId in deleted)
+    self.assertEqual(counts['Lead']['upserted'], len(upserted))
+
+  def testSyncEngineDescribedFields(self):
+    # Every field describeSObject() lists, Id among them
+    (lead, deletedId, upserted, deleted, counts) = self.sync({})
+
+    (record, ) = [record for record in upserted if record.Id == lead.Id]
+    self.assertEqual(record.LastName, u'Möke')
+    self.assertEqual(record.Company, u'你好公司')
+    self.assertTrue(deletedId in deleted)
+
+  def testDescribeCache(self):
+    self.h.setDescribeCache(DescribeCache())
+    try:
+      result = self.h.describeSObject('Lead')
+      self.assertTrue(self.h.describeSObject('lead') is result)
+
+      # Lead comes from the cache, only Contact is fetched
+      results = self.h.describeSObjects(('Contact', 'Lead'))
+      self.assertTrue(results[1] is result)
+      self.assertTrue(self.h.getLastRequest().find('Lead') == -1)
+      self.assertEqual(results[0].name, 'Contact')
+
+      self.h.invalidateDescribeCache('Lead')
+      self.assertFalse(self.h.describeSObject('Lead') is result)
+    finally:
+      self.h.setDescribeCache(None)
+
+  def testDescribeCacheInvalidatesLayouts(self):
+    location = tempfile.mkdtemp()
+    self.h.setDescribeCache(DescribeCache(location = location))
+    try:
+      recordTypeIds = ['012000000000000AAA']
+      layout = self.h.describeLayout('Lead')
+      typedLayout = self.h.describeLayout('Lead', recordTypeIds)
+      contactLayout = self.h.describeLayout('Contact', recordTypeIds)
+      self.assertTrue(self.h.describeLayout('Lead', recordTypeIds) is typedLayout)
+      self.assertEqual(len(os.listdir(location)), 3)
+
+      # Every layout of Lead's goes, from disk too, whatever record type Ids it was asked for
+      self.h.invalidateDescribeCache('Lead')
+      self.assertEqual(len(os.listdir(location)), 1)
+      self.assertFalse(self.h.describeLayout('Lead') is layout)
+      self.assertFalse(self.h.describeLayout('Lead', recordTypeIds) is typedLayout)
+      self.assertTrue(self.h.describeLayout('Contact', recordTypeIds) is contactLayout)
+    finally:
+      self.h.setDescribeCache(None)
+      shutil.rmtree(location)
+
+  def testSchemaCache(self):
+    location = tempfile.mkdtemp()
+    try:
+      # A copy of the WSDL we can change
+      wsdl = os.path.join(location, 'sforce.wsdl.xml')
+      fp = open(wsdl, 'w')
+      fp.write(urllib2.urlopen(self.wsdl).read())
+      fp.close()
+      cache = os.path.join(location, 'cache')
+
+      # The cache reads the WSDL through the client's transport, then suds parses it
+      transport = OpeningTransport()
+      h = self.h.__class__(wsdl, schemaCache = cache, transport = transport,
+                           location = test_config.LOCATION)
+      self.assertEqual(transport.opened, ['file://' + wsdl] * 2)
+      (name, ) = os.listdir(cache)
+      pickled = os.stat(os.path.join(cache, name))
+
+      # second client loads the pickled schema instead of parsing; parsing would open the WSDL
+      # again, and write a new file and rename it over the old one
+      transport = OpeningTransport()
+      h = self.h.__class__(wsdl, schemaCache = cache, transport = transport,
+                           location = test_config.LOCATION)
+      self.assertEqual(transport.opened, ['file://' + wsdl])
+      self.assertEqual(os.listdir(cache), [name])
+      self.assertEqual(os.stat(os.path.join(cache, name)).st_ino, pickled.st_ino)
+      self.assertEqual(h.generateObject('Lead').type, 'Lead')
+
+      # a changed WSDL replaces the entry
+      fp = open(wsdl, 'a')
+      fp.write('<!-- regenerated -->\n')
+      fp.close()
+      h = self.h.__class__(wsdl, schemaCache = cache, location = test_config.LOCATION)
+      (newName, ) = os.listdir(cache)
+      self.assertNotEqual(newName, name)
+      self.assertEqual(h.generateObject('Lead').type, 'Lead')
+    finally:
+      shutil.rmtree(location)
+
   # SOAP Headers tested as part of the method calls
 
 if __name__ == '__main__':
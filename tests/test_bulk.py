@@ -0,0 +1,90 @@
+# coding: utf-8
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the (LGPL) GNU Lesser General Public License as
+# published by the Free Software Foundation; either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Library Lesser General Public License for more details at
+# ( http://www.gnu.org/licenses/lgpl.html ).
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+# Written by: David Lanstein ( lanstein yahoo com )
+
+import sys
+import unittest
+
+sys.path.append('../')
+
+import test_config
+from sforce.bulk import BulkError, SforceBulkClient, csvBatches
+from sforce.partner import SforcePartnerClient
+
+class SforceBulkClientTest(unittest.TestCase):
+  h = None
+
+  def setUp(self):
+    if self.h is None:
+      SforceBulkClientTest.h = SforcePartnerClient(test_config.PARTNER_WSDL, keepAlive = True,
+                                                   location = test_config.LOCATION)
+      self.h.login(test_config.USERNAME, test_config.PASSWORD, test_config.TOKEN)
+    self.bulk = SforceBulkClient(self.h, pollInterval = 0.5, batchSize = 2)
+
+  def testCsvBatches(self):
+    records = [{'LastName': u'Möke', 'Company': None}, {'LastName': 'Smith'}, {'LastName': 'Lee'}]
+    batches = list(csvBatches(iter(records), ['LastName', 'Company'], batchSize = 2))
+    self.assertEqual(len(batches), 2)
+    self.assertEqual(batches[0], 'LastName,Company\r\nM\xc3\xb6ke,#N/A\r\nSmith,\r\n')
+    self.assertEqual(batches[1], 'LastName,Company\r\nLee,\r\n')
+
+  def testLoadAndQuery(self):
+    records = [{'LastName': 'Bulk %d' % i, 'Company': 'Jamoke, Inc.'} for i in range(3)]
+    results = list(self.bulk.load('insert', 'Lead', iter(records)))
+    self.assertEqual(len(results), 3)
+    self.assertTrue(results[0]['Success'])
+    self.assertTrue(results[0]['Created'])
+    ids = [result['Id'] for result in results]
+
+    try:
+      results = list(self.bulk.load('update', 'Lead', [(id, 'Bulk') for id in ids], ['Id', 'FirstName']))
+      self.assertEqual([result['Success'] for result in results], [True] * 3)
+
+      rows = list(self.bulk.query("SELECT Id, FirstName, LastName FROM Lead WHERE Company = 'Jamoke, Inc.' "
+                                  "AND LastName LIKE 'Bulk %'"))
+      self.assertEqual(sorted([row['Id'] for row in rows]), sorted(ids))
+      self.assertEqual(rows[0]['FirstName'], 'Bulk')
+    finally:
+      results = list(self.bulk.load('delete', 'Lead', [{'Id': id} for id in ids]))
+    self.assertEqual([result['Success'] for result in results], [True] * 3)
+
+  def testRecordErrors(self):
+    results = list(self.bulk.load('insert', 'Lead', [{'Company': 'Jamoke, Inc.'}]))
+    self.assertFalse(results[0]['Success'])
+    self.assertEqual(results[0]['Id'], None)
+    self.assertTrue(results[0]['Error'].startswith('REQUIRED_FIELD_MISSING'))
+
+  def testInvalidJob(self):
+    try:
+      self.bulk.createJob('insert', 'NoSuchObject__c')
+      self.fail()
+    except BulkError, e:
+      self.assertEqual(e.code, 'InvalidJob')
+
+  def testJobLifecycle(self):
+    job = self.bulk.createJob('query', 'Lead')
+    self.assertEqual(job.state, 'Open')
+    batch = self.bulk.addBatch(job.id, 'SELECT Id FROM Lead LIMIT 5')
+    job = self.bulk.closeJob(job.id)
+    self.assertEqual(job.state, 'Closed')
+    batches = self.bulk.waitForJob(job.id)
+    self.assertEqual([info.id for info in batches], [batch.id])
+    self.assertEqual(batches[0].state, 'Completed')
+    self.assertEqual(len(list(self.bulk.getQueryResults(job.id, batch.id))), 5)
+
+if __name__ == '__main__':
+  unittest.main('test_bulk')
@@ -1,3 +1,26 @@
+import os
+
 USERNAME = ''
 PASSWORD = ''
 TOKEN = ''
+
+# WSDLs downloaded from the org (Setup > Develop > API)
+PARTNER_WSDL = '../partner.wsdl.xml'
+ENTERPRISE_WSDL = '../enterprise.wsdl.xml'
+
+# URL to log in at instead of the WSDL's, e.g. a sandbox's
+#   'https://test.salesforce.com/services/Soap/u/20.0'
+LOCATION = None
+
+# Run the tests against a local sforce.testserver, started in-process, instead of an org;
+# the server provides the WSDLs and accepts any login.  Also set by SFORCE_TEST_SERVER=1
+TEST_SERVER = os.environ.get('SFORCE_TEST_SERVER', '') not in ('', '0')
+
+if TEST_SERVER:
+  from sforce.testserver import SforceTestServer
+
+  server = SforceTestServer(records = 500).start()
+  USERNAME = 'user@example.com'
+  PARTNER_WSDL = server.getWsdlUrl('partner')
+  ENTERPRISE_WSDL = server.getWsdlUrl('enterprise')
+  LOCATION = None
@@ -0,0 +1,120 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the (LGPL) GNU Lesser General Public License as
+# published by the Free Software Foundation; either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Library Lesser General Public License for more details at
+# ( http://www.gnu.org/licenses/lgpl.html ).
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+# Written by: David Lanstein ( lanstein yahoo com )
+
+import datetime
+import sys
+import unittest
+
+sys.path.append('../')
+
+import suds.sudsobject
+
+from suds import WebFault
+
+from sforce.convert import FIELD_CONVERTERS, RecordConverter
+from sforce.marshall import SObjectMarshaller, escape
+
+def makeFault(code):
+  fault = suds.sudsobject.Object()
+  fault.faultcode = 'sf:' + code
+  fault.faultstring = '%s: something went wrong' % code
+  return WebFault(fault, None)
+
+def makeDescribe(fields):
+  describe = suds.sudsobject.Object()
+  describe.fields = []
+  for (name, fieldType) in fields:
+    field = suds.sudsobject.Object()
+    field.name = name
+    field.type = fieldType
+    describe.fields.append(field)
+  return describe
+
+class RoundTripTest(unittest.TestCase):
+  '''
+  Values marshalled for create(), update(), etc. come back as they went in once converted
+  from a query result, without a Salesforce org
+  '''
+  def assertRoundTrip(self, fieldType, value, text):
+    self.assertEqual(escape(value), text)
+    self.assertEqual(FIELD_CONVERTERS[fieldType](escape(value)), value)
+
+  def testBoolean(self):
+    self.assertRoundTrip('boolean', True, 'true')
+    self.assertRoundTrip('boolean', False, 'false')
+
+  def testDatetime(self):
+    self.assertRoundTrip('datetime', datetime.datetime(2010, 6, 29, 22, 54, 53, 120000),
+                         '2010-06-29T22:54:53.120Z')
+    self.assertRoundTrip('datetime', datetime.datetime(2010, 6, 29), '2010-06-29T00:00:00.000Z')
+
+  def testDate(self):
+    self.assertRoundTrip('date', datetime.date(2010, 6, 29), '2010-06-29')
+
+  def testTime(self):
+    self.assertRoundTrip('time', datetime.time(22, 54, 53), '22:54:53.000Z')
+
+  def testNumbers(self):
+    self.assertRoundTrip('int', 42, '42')
+    self.assertRoundTrip('double', 1.5, '1.5')
+
+  def testMarshalledRecord(self):
+    record = suds.sudsobject.Object()
+    record.type = 'Lead'
+    record.DoNotCall = False
+    record.LastActivityDate = datetime.date(2010, 6, 29)
+
+    (el, ) = SObjectMarshaller().marshall(record)
+    self.assertEqual(el.getText(), '<DoNotCall>false</DoNotCall>'
+                                   '<LastActivityDate>2010-06-29</LastActivityDate>')
+
+  def testMarshalledDict(self):
+    record = {'type': 'Lead', 'LastName': 'Smith', 'Id': '00Q000000000001AAA',
+              'fieldsToNull': ['Email'], 'Owner': {'type': 'User', 'Alias': 'jsmith'}}
+
+    (el, ) = SObjectMarshaller().marshall(record)
+    self.assertEqual(el.get('xsi:type'), 'ens:Lead')
+    self.assertEqual(el.getText(), '<fieldsToNull>Email</fieldsToNull>'
+                                   '<Id>00Q000000000001AAA</Id><LastName>Smith</LastName>'
+                                   '<Owner xsi:type="ens:User"><Alias>jsmith</Alias></Owner>')
+
+class RecordConverterTest(unittest.TestCase):
+  def testNotAnSObjectType(self):
+    calls = []
+    def describe(sObjectType):
+      calls.append(sObjectType)
+      raise makeFault('INVALID_TYPE')
+
+    converter = RecordConverter()
+    self.assertEqual(converter._fieldTypes('AggregateResult', describe), ({}, set()))
+    converter._fieldTypes('AggregateResult', describe)
+    self.assertEqual(calls, ['AggregateResult'])
+
+  def testOtherFaultsNotCached(self):
+    faults = [makeFault('INVALID_SESSION_ID')]
+    def describe(sObjectType):
+      if faults:
+        raise faults.pop()
+      return makeDescribe([('Id', 'id'), ('DoNotCall', 'boolean')])
+
+    converter = RecordConverter()
+    self.assertRaises(WebFault, converter._fieldTypes, 'Lead', describe)
+    (converters, names) = converter._fieldTypes('Lead', describe)
+    self.assertEqual(names, set(['id', 'donotcall']))
+    self.assertTrue(converters['donotcall'] is FIELD_CONVERTERS['boolean'])
+
+if __name__ == '__main__':
+  unittest.main()
@@ -37,11 +37,12 @@ from suds import WebFault
   
 class SforceEnterpriseClientTest(test_base.SforceBaseClientTest):
   wsdlFormat = 'Enterprise'
+  wsdl = test_config.ENTERPRISE_WSDL
   h = None
 
   def setUp(self):
     if self.h is None:
-      self.h = SforceEnterpriseClient('../enterprise.wsdl.xml')
+      self.h = SforceEnterpriseClient(self.wsdl, location = test_config.LOCATION)
       self.h.login(test_config.USERNAME, test_config.PASSWORD, test_config.TOKEN)
 
   def testSearchOneResult(self):
@@ -100,5 +101,22 @@ class SforceEnterpriseClientTest(test_base.SforceBaseClientTest):
     self.assertEqual(result.LastName, u'Möke')
     self.assertFalse(hasattr(result, 'Email'))
 
+  def testRetrieveManyIdsInOrder(self):
+    (result, leads) = self.createLeads(True)
+    ids = [leads[1].Id, leads[0].Id[:15], '00Q000000000000', leads[1].Id]
+
+    self.h.setConcurrency(2)
+    try:
+      result = self.h.retrieve('FirstName, LastName', 'Lead', ids)
+    finally:
+      self.h.setConcurrency(1)
+
+    self.assertEqual(len(result), 4)
+    self.assertEqual(result[0].Id, leads[1].Id)
+    # 15-character Ids match their 18-character form
+    self.assertEqual(result[1].Id, leads[0].Id)
+    self.assertEqual(result[2], None)
+    self.assertEqual(result[3].FirstName, u'Böb')
+
 if __name__ == '__main__':
   unittest.main('test_enterprise')
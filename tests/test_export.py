@@ -0,0 +1,119 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the (LGPL) GNU Lesser General Public License as
+# published by the Free Software Foundation; either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Library Lesser General Public License for more details at
+# ( http://www.gnu.org/licenses/lgpl.html ).
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+# Written by: David Lanstein ( lanstein yahoo com )
+
+import sys
+import unittest
+
+sys.path.append('../')
+
+from suds import WebFault
+
+from sforce.export import fieldTypes, parsePage, parseSelect
+from test_convert import makeDescribe, makeFault
+
+PAGE = '''<?xml version="1.0" encoding="UTF-8"?>
+<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/"
+  xmlns="urn:partner.soap.sforce.com" xmlns:sf="urn:sobject.partner.soap.sforce.com"
+  xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">
+<soapenv:Body><queryResponse><result xsi:type="QueryResult">
+<done>%s</done>
+<queryLocator%s</queryLocator>
+<records xsi:type="sf:sObject"><sf:type>Contact</sf:type><sf:Id>003000000000001AAA</sf:Id>
+<sf:Id>003000000000001AAA</sf:Id><sf:LastName>O'Brien &amp; Sons</sf:LastName>
+<sf:Email xsi:nil="true"/><sf:Account xsi:type="sf:sObject"><sf:type>Account</sf:type>
+<sf:Id xsi:nil="true"/><sf:Name>Acme</sf:Name></sf:Account>
+<sf:Cases xsi:type="QueryResult"><done>true</done><queryLocator xsi:nil="true"/>
+<size>0</size></sf:Cases></records>
+<records xsi:type="sf:sObject"><sf:type>Contact</sf:type><sf:Id>003000000000002AAA</sf:Id>
+<sf:Id>003000000000002AAA</sf:Id><sf:LastName></sf:LastName><sf:Email>a@example.com</sf:Email>
+<sf:Account xsi:nil="true"/></records>
+<size>2</size>
+</result></queryResponse></soapenv:Body></soapenv:Envelope>'''
+
+class ParseSelectTest(unittest.TestCase):
+  '''
+  SOQL parsing for queryExport(), which needs neither suds nor a Salesforce org
+  '''
+  def testFields(self):
+    self.assertEqual(parseSelect('SELECT Id, Name, Account.Owner.Name FROM Contact'),
+                     (['Id', 'Name', 'Account.Owner.Name'], 'Contact'))
+
+  def testCaseAndWhitespace(self):
+    self.assertEqual(parseSelect('  select Id,\n  Name\nfrom  Lead where Name = \'x\''),
+                     (['Id', 'Name'], 'Lead'))
+
+  def testAggregates(self):
+    self.assertEqual(parseSelect('SELECT COUNT(Id) c, MAX(Amount) FROM Opportunity'),
+                     (['c', 'expr0'], 'Opportunity'))
+    self.assertEqual(parseSelect('SELECT StageName, SUM(Amount), MIN(Amount) FROM Opportunity '
+                                 'GROUP BY StageName'),
+                     (['StageName', 'expr0', 'expr1'], 'Opportunity'))
+
+  def testFieldFunctions(self):
+    self.assertEqual(parseSelect('SELECT Id, toLabel(Status) FROM Lead'), (['Id', 'Status'], 'Lead'))
+    self.assertEqual(parseSelect('SELECT convertCurrency(Amount) amt FROM Opportunity'),
+                     (['amt'], 'Opportunity'))
+
+  def testSubqueriesLeftOut(self):
+    self.assertEqual(parseSelect('SELECT Name, (SELECT LastName FROM Contacts WHERE Email != null) '
+                                 'FROM Account'),
+                     (['Name'], 'Account'))
+    self.assertEqual(parseSelect('SELECT (SELECT Id FROM Contacts), Id FROM Account'),
+                     (['Id'], 'Account'))
+
+  def testNotAQuery(self):
+    self.assertRaises(ValueError, parseSelect, 'DELETE FROM Lead')
+
+class ParsePageTest(unittest.TestCase):
+  def testRows(self):
+    xml = PAGE % ('false', '>01g000000000001AAA-500')
+    (rows, done, queryLocator) = parsePage(xml, ['id', 'LastName', 'Email', 'Account.Name'])
+
+    self.assertEqual(rows, [['003000000000001AAA', "O'Brien & Sons", None, 'Acme'],
+                            ['003000000000002AAA', '', 'a@example.com', None]])
+    self.assertEqual(done, False)
+    self.assertEqual(queryLocator, '01g000000000001AAA-500')
+
+  def testLastPage(self):
+    xml = PAGE % ('true', ' xsi:nil="true">')
+    (rows, done, queryLocator) = parsePage(xml, ['Id'])
+
+    self.assertEqual(len(rows), 2)
+    self.assertEqual(done, True)
+    self.assertEqual(queryLocator, None)
+
+  def testUnknownColumn(self):
+    (rows, done, queryLocator) = parsePage(PAGE % ('true', ' xsi:nil="true">'), ['NotAField__c'])
+    self.assertEqual(rows, [[None], [None]])
+
+class FieldTypesTest(unittest.TestCase):
+  def testNotAnSObjectType(self):
+    def describe(sObjectType):
+      raise makeFault('INVALID_TYPE')
+    self.assertEqual(fieldTypes(describe, 'AggregateResult', ['expr0']), [None])
+
+  def testOtherFaultsRaised(self):
+    def describe(sObjectType):
+      raise makeFault('INVALID_SESSION_ID')
+    self.assertRaises(WebFault, fieldTypes, describe, 'Lead', ['Id'])
+
+  def testTypes(self):
+    describe = lambda sObjectType: makeDescribe([('Id', 'id'), ('DoNotCall', 'boolean')])
+    self.assertEqual(fieldTypes(describe, 'Lead', ['donotcall', 'Id', 'Nope__c']),
+                     ['boolean', 'id', None])
+
+if __name__ == '__main__':
+  unittest.main()
@@ -26,17 +26,21 @@ sys.path.append('../')
 
 import test_base
 import test_config
+from sforce.instrument import CallStats
 from sforce.partner import SforcePartnerClient
+from sforce.record import Record
+from sforce.stream import _transport
 
 from suds import WebFault
   
 class SforcePartnerClientTest(test_base.SforceBaseClientTest):
   wsdlFormat = 'Partner'
+  wsdl = test_config.PARTNER_WSDL
   h = None
 
   def setUp(self):
     if self.h is None:
-      self.h = SforcePartnerClient('../partner.wsdl.xml')
+      self.h = SforcePartnerClient(self.wsdl, location = test_config.LOCATION)
       self.h.login(test_config.USERNAME, test_config.PASSWORD, test_config.TOKEN)
 
   def testSearchOneResult(self):
@@ -97,5 +101,145 @@ class SforcePartnerClientTest(test_base.SforceBaseClientTest):
     self.assertEqual(result.LastName, u'Möke')
     self.assertEqual(result.Email, None)
 
+  def testTypedFields(self):
+    (result, lead) = self.createLead(True)
+
+    self.h.setTypedFields(True)
+    try:
+      result = self.h.query("SELECT Id, DoNotCall, CreatedDate, Owner.Name FROM Lead WHERE Id = '%s'" % lead.Id)
+      record = result.records[0]
+      self.assertTrue(record.DoNotCall is False)
+      self.assertTrue(isinstance(record.CreatedDate, datetime.datetime))
+      self.assertTrue(isinstance(record.Owner.Name, basestring))
+
+      result = self.h.retrieve('DoNotCall, LastName', 'Lead', (lead.Id))
+      self.assertTrue(result.DoNotCall is False)
+      self.assertEqual(result.LastName, u'Möke')
+    finally:
+      self.h.setTypedFields(False)
+
+  def testCompactRecords(self):
+    self.setHeaders('update')
+
+    (result, lead) = self.createLead(True)
+
+    self.h.setCompactRecords(True)
+    try:
+      result = self.h.query("SELECT Id, FirstName, LastName FROM Lead WHERE Id = '%s'" % lead.Id)
+      record = result.records[0]
+      self.assertTrue(isinstance(record, Record))
+      self.assertFalse(hasattr(record, '__dict__'))
+      self.assertEqual(record.asDict()['LastName'], u'Möke')
+
+      record.FirstName = 'Joe'
+      result = self.h.update(record)
+      self.assertTrue(result.success)
+    finally:
+      self.h.setCompactRecords(False)
+
+    result = self.h.retrieve('FirstName', 'Lead', (lead.Id))
+    self.assertEqual(result.FirstName, 'Joe')
+
+  def testCompactRecordWithChildRelationship(self):
+    self.setHeaders('update')
+
+    (result, lead) = self.createLead(True)
+    member = self.h.generateObject('CampaignMember')
+    member.LeadId = lead.Id
+    member.Status = 'Sent'
+    result = self.h.create(member)
+    self.assertTrue(result.success)
+
+    self.h.setCompactRecords(True)
+    try:
+      result = self.h.query("SELECT Id, FirstName, (SELECT Id, Status FROM CampaignMembers) "
+                            "FROM Lead WHERE Id = '%s'" % lead.Id)
+      record = result.records[0]
+      (child, ) = record.CampaignMembers.records
+      self.assertTrue(isinstance(child, Record))
+      self.assertEqual(child.Status, 'Sent')
+
+      record.FirstName = 'Joe'
+      result = self.h.update(record)
+      self.assertTrue(result.success)
+    finally:
+      self.h.setCompactRecords(False)
+
+    result = self.h.retrieve('FirstName', 'Lead', (lead.Id))
+    self.assertEqual(result.FirstName, 'Joe')
+
+  def testQueryStream(self):
+    self.setHeaders('queryMore')
+
+    expected = list(self.h.queryIter('SELECT Id, FirstName, Owner.Name FROM Lead'))
+    records = list(self.h.queryStream('SELECT Id, FirstName, Owner.Name FROM Lead'))
+    self.assertEqual([record.Id for record in records], [record.Id for record in expected])
+    for (record, other) in zip(records, expected)[:10]:
+      self.assertEqual(record.__keylist__, other.__keylist__)
+      self.assertEqual(record.FirstName, other.FirstName)
+      self.assertEqual(record.Owner.Name, other.Owner.Name)
+
+  def testChildRelationships(self):
+    account = self.h.generateObject('Account')
+    account.Name = u'你好公司'
+    accountId = self.h.create(account).id
+    contacts = []
+    for lastName in ('Moke', 'Bob', 'Joe'):
+      contact = self.h.generateObject('Contact')
+      contact.LastName = lastName
+      contact.AccountId = accountId
+      contacts.append(contact)
+    self.h.create(contacts)
+
+    soql = ("SELECT Id, (SELECT LastName FROM Contacts) FROM Account "
+            "WHERE Id = '%s'" % accountId)
+    result = self.h.query(soql)
+    (record, ) = self.h._asList(result.records)
+    (streamed, ) = list(self.h.queryStream(soql))
+
+    # query() used to keep only the first of a child relationship's records
+    for children in (record.Contacts, streamed.Contacts):
+      self.assertEqual(children.size, '3')
+      self.assertEqual(sorted([contact.LastName for contact in children.records]),
+                       ['Bob', 'Joe', 'Moke'])
+
+  def testQueryStreamListener(self):
+    stats = CallStats()
+    self.h.addListener(stats)
+    try:
+      records = list(self.h.queryStream('SELECT Id FROM Lead LIMIT 3'))
+      try:
+        list(self.h.queryStream('SELECT NoSuchField__c FROM Lead'))
+      except WebFault:
+        pass
+    finally:
+      self.h.removeListener(stats)
+
+    query = stats.getStats()['query']
+    self.assertEqual(query['calls'], 2)
+    self.assertEqual(query['errors'], 1)
+    self.assertEqual(query['responseRecords'], len(records))
+    self.assertTrue(query['requestBytes'] > 0)
+    self.assertTrue(query['responseBytes'] > 0)
+    self.assertTrue(query['total'] >= query['network'] > 0)
+
+  def testStreamTransportSettings(self):
+    h = SforcePartnerClient(self.wsdl, location = test_config.LOCATION, username = 'proxyuser',
+                            password = 'proxypass')
+    transport = _transport(h)
+    self.assertEqual((transport.username, transport.password), ('proxyuser', 'proxypass'))
+    self.assertEqual(transport.poolSize, 0)
+
+  def testRetrieveAndSearchStream(self):
+    (result, lead) = self.createLead(True)
+
+    records = list(self.h.retrieveStream('FirstName, LastName, Email', 'Lead', (lead.Id, '00Q000000000000')))
+    self.assertEqual(records[0].LastName, u'Möke')
+    self.assertEqual(records[1], None)
+
+    records = list(self.h.searchStream('FIND {Single User} IN Name Fields RETURNING Lead(Name, Description)'))
+    self.assertEqual(records[0].Name, 'Single User')
+    self.assertEqual(records[0].Description, None)
+
 if __name__ == '__main__':
   unittest.main('test_partner')
@@ -0,0 +1,151 @@
+# coding: utf-8
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the (LGPL) GNU Lesser General Public License as
+# published by the Free Software Foundation; either version 3 of the 
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Library Lesser General Public License for more details at
+# ( http://www.gnu.org/licenses/lgpl.html ).
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+# Written by: David Lanstein ( lanstein yahoo com )
+
+import sys
+import threading
+import unittest
+
+sys.path.append('../')
+
+import test_config
+from sforce.instrument import CallStats
+from sforce.partner import SforcePartnerClient
+from sforce.pool import SforceClientPool
+from sforce.record import Record
+from sforce.retry import RetryPolicy
+
+class SforceClientPoolTest(unittest.TestCase):
+  pool = None
+
+  def setUp(self):
+    if self.pool is None:
+      self.pool = SforceClientPool(SforcePartnerClient, test_config.PARTNER_WSDL, maxClients = 2,
+                                   location = test_config.LOCATION)
+      self.pool.getClient().login(test_config.USERNAME, test_config.PASSWORD, test_config.TOKEN)
+
+  def testCheckoutSharesSession(self):
+    h = self.pool.checkout()
+    try:
+      self.assertEqual(h.getSessionId(), self.pool.getClient().getSessionId())
+      self.assertEqual(h.getLocation(), self.pool.getClient().getLocation())
+      self.assertTrue(h.getConnection().wsdl is self.pool.getClient().getConnection().wsdl)
+    finally:
+      self.pool.checkin(h)
+
+  def testMaxClients(self):
+    h1 = self.pool.checkout()
+    h2 = self.pool.checkout()
+    try:
+      self.assertEqual(self.pool.checkout(False), None)
+    finally:
+      self.pool.checkin(h1)
+      self.pool.checkin(h2)
+
+    h3 = self.pool.checkout(False)
+    self.assertTrue(h3 is not None)
+    self.pool.checkin(h3)
+
+  def testHeadersAreIsolated(self):
+    h1 = self.pool.checkout()
+    h2 = self.pool.checkout()
+    try:
+      header = h1.generateHeader('QueryOptions')
+      header.batchSize = 200
+      h1.setQueryOptions(header)
+
+      h1.query('SELECT Id FROM Lead')
+      h2.query('SELECT Id FROM Lead')
+
+      self.assertTrue(h1.getLastRequest().find('<tns:batchSize>200</tns:batchSize>') != -1)
+      self.assertTrue(h2.getLastRequest().find('batchSize') == -1)
+    finally:
+      self.pool.checkin(h1)
+      self.pool.checkin(h2)
+
+    # h1's header doesn't leak to whoever checks it out next
+    h = self.pool.checkout()
+    try:
+      h.query('SELECT Id FROM Lead')
+      self.assertTrue(h.getLastRequest().find('batchSize') == -1)
+    finally:
+      self.pool.checkin(h)
+
+  def testSettingsAreIsolated(self):
+    h = self.pool.checkout()
+    try:
+      h.setCompactRecords(True)
+      h.setTypedFields(True)
+      h.setRetryPolicy(RetryPolicy())
+      h.addListener(CallStats())
+    finally:
+      self.pool.checkin(h)
+
+    # None of them reach whoever checks a client out next
+    h = self.pool.checkout()
+    try:
+      self.assertEqual(h._compactRecords, False)
+      self.assertEqual(h._converter, None)
+      self.assertEqual(h._retryPolicy, None)
+      self.assertEqual(h._listeners, ())
+      (record, ) = h.query('SELECT Id FROM Lead LIMIT 1').records
+      self.assertFalse(isinstance(record, Record))
+    finally:
+      self.pool.checkin(h)
+
+  def testReloginReachesPool(self):
+    client = self.pool.getClient()
+    client.setRetryPolicy(RetryPolicy(baseDelay = 0.1))
+    stale = client.getSessionId()
+
+    h = self.pool.checkout()
+    try:
+      client.invalidateSessions(stale)
+      # Logs in again, having found the session expired
+      h.getServerTimestamp()
+      self.assertNotEqual(h.getSessionId(), stale)
+    finally:
+      self.pool.checkin(h)
+
+    self.assertEqual(client.getSessionId(), h.getSessionId())
+    client.setRetryPolicy(None)
+    client.getServerTimestamp()
+
+  def testThreads(self):
+    errors = []
+
+    def work():
+      try:
+        for i in range(3):
+          h = self.pool.checkout()
+          try:
+            h.getServerTimestamp()
+          finally:
+            self.pool.checkin(h)
+      except Exception, e:
+        errors.append(e)
+
+    threads = [threading.Thread(target = work) for i in range(6)]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+
+    self.assertEqual(errors, [])
+
+if __name__ == '__main__':
+  unittest.main('test_pool')
@@ -0,0 +1,235 @@
+# coding: utf-8
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the (LGPL) GNU Lesser General Public License as
+# published by the Free Software Foundation; either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Library Lesser General Public License for more details at
+# ( http://www.gnu.org/licenses/lgpl.html ).
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+# Written by: David Lanstein ( lanstein yahoo com )
+
+import csv
+import httplib
+import sys
+import time
+import unittest
+import urlparse
+
+sys.path.append('../')
+
+from StringIO import StringIO
+from xml.etree import ElementTree
+
+from sforce.testserver import FIXTURE_LEADS, SforceTestServer, makeId
+
+PARTNER_NS = 'urn:partner.soap.sforce.com'
+SOBJECT_NS = 'urn:sobject.partner.soap.sforce.com'
+BULK_NS = 'http://www.force.com/2009/06/asyncapi/dataload'
+
+class SforceTestServerTest(unittest.TestCase):
+  '''
+  Talks to the stand-in server directly, so runs without suds or a Salesforce org
+  '''
+  server = None
+
+  def setUp(self):
+    if self.server is None:
+      SforceTestServerTest.server = SforceTestServer(records = 50, pageSize = 20).start()
+    self.sessionId = self.login()
+
+  def call(self, operation, body = '', sessionId = None, headers = ''):
+    if sessionId is not None:
+      headers += '<SessionHeader><sessionId>%s</sessionId></SessionHeader>' % sessionId
+    message = ('<?xml version="1.0" encoding="UTF-8"?>'
+               '<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/" '
+               'xmlns="%s" xmlns:sf="%s" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">'
+               '<soapenv:Header>%s</soapenv:Header><soapenv:Body><%s>%s</%s></soapenv:Body>'
+               '</soapenv:Envelope>' % (PARTNER_NS, SOBJECT_NS, headers, operation, body, operation))
+
+    url = urlparse.urlsplit(self.server.getServerUrl())
+    conn = httplib.HTTPConnection(url.hostname, url.port)
+    try:
+      conn.request('POST', url.path, message, {'Content-Type': 'text/xml; charset=utf-8'})
+      response = conn.getresponse()
+      return (response.status, ElementTree.fromstring(response.read()))
+    finally:
+      conn.close()
+
+  def login(self):
+    (status, envelope) = self.call('login', '<username>joe@example.com</username><password>secret</password>')
+    self.assertEqual(status, 200)
+    return envelope.findtext('.//{%s}sessionId' % PARTNER_NS)
+
+  def query(self, soql, operation = 'query'):
+    (status, envelope) = self.call(operation, '<queryString>%s</queryString>' % soql, self.sessionId)
+    self.assertEqual(status, 200)
+    return envelope.find('.//{%s}result' % PARTNER_NS)
+
+  def testMakeId(self):
+    id = makeId('00Q', 1)
+    self.assertEqual(len(id), 18)
+    self.assertEqual(id[:15], '00Q000000000001')
+    self.assertEqual(id[15:], 'EAA')
+
+  def testInvalidSession(self):
+    (status, envelope) = self.call('getServerTimestamp', '', 'bogus')
+    self.assertEqual(status, 500)
+    self.assertEqual(envelope.findtext('.//faultcode'), 'sf:INVALID_SESSION_ID')
+
+  def testQueryPages(self):
+    leads = 50 + len(FIXTURE_LEADS)
+    result = self.query('SELECT Id, FirstName FROM Lead')
+    self.assertEqual(result.findtext('{%s}size' % PARTNER_NS), str(leads))
+    self.assertEqual(result.findtext('{%s}done' % PARTNER_NS), 'false')
+    ids = [el.findtext('{%s}Id' % SOBJECT_NS) for el in result.findall('{%s}records' % PARTNER_NS)]
+    self.assertEqual(len(ids), 20)
+
+    while result.findtext('{%s}done' % PARTNER_NS) == 'false':
+      locator = result.findtext('{%s}queryLocator' % PARTNER_NS)
+      (status, envelope) = self.call('queryMore', '<queryLocator>%s</queryLocator>' % locator, self.sessionId)
+      result = envelope.find('.//{%s}result' % PARTNER_NS)
+      ids.extend([el.findtext('{%s}Id' % SOBJECT_NS) for el in result.findall('{%s}records' % PARTNER_NS)])
+
+    self.assertEqual(len(ids), leads)
+    self.assertEqual(ids, sorted(ids))
+
+  def testQueryWhereOrderLimit(self):
+    result = self.query("SELECT Id, Email FROM Contact WHERE Email LIKE 'contact1%' ORDER BY Email DESC LIMIT 3")
+    emails = [el.findtext('{%s}Email' % SOBJECT_NS) for el in result.findall('{%s}records' % PARTNER_NS)]
+    self.assertEqual(emails, ['contact1@example.com', 'contact19@example.com', 'contact18@example.com'])
+
+  def testQueryRelationship(self):
+    result = self.query('SELECT Id, Account.Name FROM Contact LIMIT 1')
+    account = result.find('{%s}records/{%s}Account' % (PARTNER_NS, SOBJECT_NS))
+    self.assertEqual(account.findtext('{%s}type' % SOBJECT_NS), 'Account')
+    self.assertTrue(account.findtext('{%s}Name' % SOBJECT_NS))
+
+  def testQueryCount(self):
+    result = self.query('SELECT COUNT() FROM Account')
+    self.assertEqual(result.findtext('{%s}size' % PARTNER_NS), '50')
+
+  def testMalformedQuery(self):
+    (status, envelope) = self.call('query', '<queryString>SELECT FROM</queryString>', self.sessionId)
+    self.assertEqual(status, 500)
+    self.assertEqual(envelope.findtext('.//faultcode'), 'sf:MALFORMED_QUERY')
+
+  def testDuplicateFieldRejected(self):
+    for soql in ('SELECT Id, LastName, id FROM Lead',
+                 'SELECT Id, (SELECT LastName, LastName FROM Contacts) FROM Account'):
+      (status, envelope) = self.call('query', '<queryString>%s</queryString>' % soql, self.sessionId)
+      self.assertEqual(status, 500)
+      self.assertEqual(envelope.findtext('.//faultcode'), 'sf:MALFORMED_QUERY')
+      self.assertTrue('duplicate field selected' in envelope.findtext('.//faultstring'))
+
+  def testCreateUpdateDelete(self):
+    (status, envelope) = self.call('create', '<sObjects><sf:type>Lead</sf:type><sf:LastName>Moke</sf:LastName>'
+                                   '<sf:Company>Jamoke, Inc.</sf:Company></sObjects>'
+                                   '<sObjects><sf:type>Lead</sf:type></sObjects>', self.sessionId)
+    results = envelope.findall('.//{%s}result' % PARTNER_NS)
+    self.assertEqual(results[0].findtext('{%s}success' % PARTNER_NS), 'true')
+    self.assertEqual(results[1].findtext('{%s}success' % PARTNER_NS), 'false')
+    self.assertEqual(results[1].findtext('{%s}errors/{%s}statusCode' % (PARTNER_NS, PARTNER_NS)), 'REQUIRED_FIELD_MISSING')
+    id = results[0].findtext('{%s}id' % PARTNER_NS)
+
+    self.call('update', '<sObjects><sf:type>Lead</sf:type><sf:Id>%s</sf:Id><sf:FirstName>Joe</sf:FirstName>'
+              '<sf:fieldsToNull>Company</sf:fieldsToNull></sObjects>' % id, self.sessionId)
+    result = self.query("SELECT Id, Name, Company FROM Lead WHERE Id = '%s'" % id[:15])
+    record = result.find('{%s}records' % PARTNER_NS)
+    self.assertEqual(record.findtext('{%s}Name' % SOBJECT_NS), 'Joe Moke')
+    self.assertEqual(record.find('{%s}Company' % SOBJECT_NS).get('{http://www.w3.org/2001/XMLSchema-instance}nil'), 'true')
+
+    self.call('delete', '<ids>%s</ids>' % id, self.sessionId)
+    result = self.query("SELECT Id FROM Lead WHERE Id = '%s'" % id)
+    self.assertEqual(result.findtext('{%s}size' % PARTNER_NS), '0')
+    result = self.query("SELECT Id FROM Lead WHERE Id = '%s'" % id, 'queryAll')
+    self.assertEqual(result.findtext('{%s}size' % PARTNER_NS), '1')
+
+  def testRetrieveMissing(self):
+    result = self.query('SELECT Id FROM Account LIMIT 1')
+    id = result.findtext('{%s}records/{%s}Id' % (PARTNER_NS, SOBJECT_NS))
+    (status, envelope) = self.call('retrieve', '<fieldList>Name</fieldList><sObjectType>Account</sObjectType>'
+                                   '<ids>%s</ids><ids>001000000000000ZZZ</ids>' % id, self.sessionId)
+    results = envelope.findall('.//{%s}result' % PARTNER_NS)
+    self.assertEqual(len(results), 2)
+    self.assertEqual(results[0].findtext('{%s}Id' % SOBJECT_NS), id)
+    self.assertEqual(results[1].get('{http://www.w3.org/2001/XMLSchema-instance}nil'), 'true')
+
+  def testDescribeSObject(self):
+    (status, envelope) = self.call('describeSObject', '<sObjectType>lead</sObjectType>', self.sessionId)
+    result = envelope.find('.//{%s}result' % PARTNER_NS)
+    self.assertEqual(result.findtext('{%s}name' % PARTNER_NS), 'Lead')
+    self.assertEqual(result.findtext('{%s}keyPrefix' % PARTNER_NS), '00Q')
+    types = dict([(field.findtext('{%s}name' % PARTNER_NS), field.findtext('{%s}type' % PARTNER_NS))
+                  for field in result.findall('{%s}fields' % PARTNER_NS)])
+    self.assertEqual(types['DoNotCall'], 'boolean')
+    self.assertEqual(types['CreatedDate'], 'datetime')
+
+  def testQueryOptionsBatchSize(self):
+    (status, envelope) = self.call('query', '<queryString>SELECT Id FROM Lead</queryString>', self.sessionId,
+                                   '<QueryOptions><batchSize>5</batchSize></QueryOptions>')
+    # Like Salesforce, the server doesn't go below 200, so its own 20 applies
+    self.assertEqual(len(envelope.findall('.//{%s}records' % PARTNER_NS)), 20)
+
+  def bulk(self, method, path, body = None, contentType = 'application/xml'):
+    url = urlparse.urlsplit(self.server.getServerUrl())
+    conn = httplib.HTTPConnection(url.hostname, url.port)
+    try:
+      conn.request(method, '/services/async/20.0/' + path, body,
+                   {'X-SFDC-Session': self.sessionId, 'Content-Type': contentType})
+      response = conn.getresponse()
+      return (response.status, response.read())
+    finally:
+      conn.close()
+
+  def testBulkJob(self):
+    (status, body) = self.bulk('POST', 'job', '<jobInfo xmlns="%s"><operation>insert</operation>'
+                               '<object>Lead</object><contentType>CSV</contentType></jobInfo>' % BULK_NS)
+    self.assertEqual(status, 201)
+    jobId = ElementTree.fromstring(body).findtext('{%s}id' % BULK_NS)
+
+    (status, body) = self.bulk('POST', 'job/%s/batch' % jobId,
+                               'LastName,Company\nMoke,"Jamoke, Inc."\n,Initech\n', 'text/csv')
+    self.assertEqual(status, 201)
+    batchId = ElementTree.fromstring(body).findtext('{%s}id' % BULK_NS)
+    self.bulk('POST', 'job/%s' % jobId, '<jobInfo xmlns="%s"><state>Closed</state></jobInfo>' % BULK_NS)
+
+    for i in range(100):
+      (status, body) = self.bulk('GET', 'job/%s/batch/%s' % (jobId, batchId))
+      state = ElementTree.fromstring(body).findtext('{%s}state' % BULK_NS)
+      if state == 'Completed':
+        break
+      time.sleep(0.01)
+    self.assertEqual(state, 'Completed')
+
+    (status, body) = self.bulk('GET', 'job/%s/batch/%s/result' % (jobId, batchId))
+    rows = list(csv.reader(StringIO(body)))
+    self.assertEqual(rows[0], ['Id', 'Success', 'Created', 'Error'])
+    self.assertEqual(rows[1][1:], ['true', 'true', ''])
+    self.assertEqual(rows[2][1], 'false')
+    self.assertTrue(rows[2][3].startswith('REQUIRED_FIELD_MISSING'))
+
+    result = self.query("SELECT Company FROM Lead WHERE Id = '%s'" % rows[1][0])
+    self.assertEqual(result.findtext('{%s}records/{%s}Company' % (PARTNER_NS, SOBJECT_NS)), 'Jamoke, Inc.')
+
+    # A closed job takes no more batches
+    (status, body) = self.bulk('POST', 'job/%s/batch' % jobId, 'LastName\nLee\n', 'text/csv')
+    self.assertEqual(status, 400)
+    self.assertEqual(ElementTree.fromstring(body).findtext('{%s}exceptionCode' % BULK_NS), 'InvalidJobState')
+    self.call('delete', '<ids>%s</ids>' % rows[1][0], self.sessionId)
+
+  def testBulkInvalidSession(self):
+    self.sessionId = 'bogus'
+    (status, body) = self.bulk('GET', 'job/750000000000000001')
+    self.assertEqual(status, 400)
+    self.assertEqual(ElementTree.fromstring(body).findtext('{%s}exceptionCode' % BULK_NS), 'InvalidSessionId')
+
+if __name__ == '__main__':
+  unittest.main('test_server')
@@ -0,0 +1,196 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the (LGPL) GNU Lesser General Public License as
+# published by the Free Software Foundation; either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Library Lesser General Public License for more details at
+# ( http://www.gnu.org/licenses/lgpl.html ).
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+# Written by: David Lanstein ( lanstein yahoo com )
+
+import socket
+import sys
+import threading
+import unittest
+import zlib
+
+sys.path.append('../')
+
+from suds.transport import Request
+
+from sforce.asynctransport import AsyncHttpTransport, _Response
+from sforce.transport import HttpTransport, _decompressor
+
+BODY = '<soapenv:Envelope>%s</soapenv:Envelope>' % ('<records/>' * 1000)
+
+def rawDeflate(data):
+  compressor = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS)
+  return compressor.compress(data) + compressor.flush()
+
+class DecompressTest(unittest.TestCase):
+  '''
+  Response decoding, which needs neither a server nor a Salesforce org
+  '''
+  def inflate(self, encoding, data, chunkSize):
+    decompressor = _decompressor(encoding)
+    pieces = [decompressor.decompress(data[i:i + chunkSize])
+              for i in range(0, len(data), chunkSize)]
+    return ''.join(pieces) + decompressor.flush()
+
+  def testStreamedDeflate(self):
+    for data in (zlib.compress(BODY), rawDeflate(BODY)):
+      for chunkSize in (1, 7, 65536):
+        self.assertEqual(self.inflate('deflate', data, chunkSize), BODY)
+
+  def testStreamedGzip(self):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    data = compressor.compress(BODY) + compressor.flush()
+    self.assertEqual(self.inflate('GZIP', data, 5), BODY)
+
+  def testIdentity(self):
+    self.assertTrue(_decompressor('identity') is None)
+
+  def testDecode(self):
+    transport = HttpTransport(poolSize = 0)
+    for data in (zlib.compress(BODY), rawDeflate(BODY)):
+      headers = {'content-encoding': 'deflate'}
+      self.assertEqual(transport._decode(headers, data), BODY)
+      self.assertEqual(headers, {})
+
+class ResponseTest(unittest.TestCase):
+  '''
+  AsyncHttpTransport's response parsing, fed a byte at a time as well as all at once
+  '''
+  def parse(self, data, chunkSize):
+    response = _Response()
+    for i in range(0, len(data), chunkSize):
+      if response.feed(data[i:i + chunkSize]):
+        return response
+    self.assertTrue(response.closed())
+    return response
+
+  def testChunked(self):
+    data = ('HTTP/1.1 100 Continue\r\n\r\n'
+            'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n'
+            '5\r\nHello\r\n7;ext=1\r\n, world\r\n0\r\nX-Trailer: 1\r\n\r\n')
+    for chunkSize in (1, 3, len(data)):
+      response = self.parse(data, chunkSize)
+      self.assertEqual(response.result(), (200, 'OK', {'transfer-encoding': 'chunked'},
+                                           'Hello, world'))
+      self.assertFalse(response.willClose)
+
+  def testContentLength(self):
+    body = rawDeflate('fault')
+    data = ('HTTP/1.1 500 Server Error\r\nContent-Length: %d\r\nContent-Encoding: deflate\r\n'
+            'Connection: close\r\n\r\n%s' % (len(body), body))
+    response = self.parse(data, 2)
+    self.assertEqual(response.result()[::3], (500, 'fault'))
+    self.assertTrue(response.willClose)
+
+  def testUntilClose(self):
+    response = self.parse('HTTP/1.0 200 OK\r\n\r\n<a/>', 1)
+    self.assertEqual(response.result()[3], '<a/>')
+    self.assertTrue(response.willClose)
+
+class AsyncHttpTransportTest(unittest.TestCase):
+  '''
+  AsyncHttpTransport against a bare socket server that answers every request with its body
+  '''
+  def setUp(self):
+    self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    self.listener.bind(('127.0.0.1', 0))
+    self.listener.listen(64)
+    self.url = 'http://127.0.0.1:%d/services/Soap/u/20.0' % self.listener.getsockname()[1]
+    self.connections = 0
+    # Close each connection on its nth request, without answering it
+    self.requestsPerConnection = None
+
+    thread = threading.Thread(target = self.accept)
+    thread.setDaemon(True)
+    thread.start()
+
+  def tearDown(self):
+    self.listener.close()
+
+  def accept(self):
+    while True:
+      try:
+        (conn, address) = self.listener.accept()
+      except socket.error:
+        return
+      self.connections += 1
+      thread = threading.Thread(target = self.serve, args = (conn, ))
+      thread.setDaemon(True)
+      thread.start()
+
+  def serve(self, conn):
+    data = ''
+    requests = 0
+    while True:
+      while '\r\n\r\n' not in data:
+        received = conn.recv(65536)
+        if not received:
+          conn.close()
+          return
+        data += received
+      (head, data) = data.split('\r\n\r\n', 1)
+      length = int(head.lower().split('content-length: ')[1].split('\r\n')[0])
+      while len(data) < length:
+        data += conn.recv(65536)
+      (body, data) = (data[:length], data[length:])
+
+      requests += 1
+      if requests == self.requestsPerConnection:
+        conn.close()
+        return
+      conn.sendall('HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n'
+                   '%x\r\n%s\r\n0\r\n\r\n' % (len(body), body))
+
+  def send(self, transport, message):
+    request = Request(self.url, message)
+    request.headers = {'SOAPAction': '""'}
+    return transport.submit(request)
+
+  def testManyRequestsFewConnections(self):
+    transport = AsyncHttpTransport(maxConnections = 4)
+    try:
+      futures = [self.send(transport, '<call%d/>' % i) for i in range(100)]
+      for (i, future) in enumerate(futures):
+        self.assertEqual(future.result()[::3], (200, '<call%d/>' % i))
+    finally:
+      transport.close()
+    self.assertTrue(self.connections <= 4)
+
+  def testClosedIdleConnectionResent(self):
+    self.requestsPerConnection = 2
+    transport = AsyncHttpTransport(maxConnections = 1)
+    try:
+      self.assertEqual(self.send(transport, '<first/>').result()[3], '<first/>')
+      # The server drops the connection rather than answer this, so it goes out again
+      self.assertEqual(self.send(transport, '<second/>').result()[3], '<second/>')
+    finally:
+      transport.close()
+    self.assertEqual(self.connections, 2)
+
+  def testCloseFailsRequestsInFlight(self):
+    # Connections wait in its backlog, never answered
+    silent = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    silent.bind(('127.0.0.1', 0))
+    silent.listen(1)
+    self.url = 'http://127.0.0.1:%d/' % silent.getsockname()[1]
+    try:
+      transport = AsyncHttpTransport()
+      future = self.send(transport, '<call/>')
+      transport.close()
+      self.assertTrue(isinstance(future.exception(), RuntimeError))
+    finally:
+      silent.close()
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,50 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the (LGPL) GNU Lesser General Public License as
+# published by the Free Software Foundation; either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Library Lesser General Public License for more details at
+# ( http://www.gnu.org/licenses/lgpl.html ).
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+# Written by: David Lanstein ( lanstein yahoo com )
+
+import sys
+import unittest
+
+sys.path.append('../')
+
+from sforce.tuning import BatchSizeTuner
+
+class BatchSizeTunerTest(unittest.TestCase):
+  '''
+  Batch size choices, which need neither a server nor a Salesforce org
+  '''
+  def testGrowthCapped(self):
+    tuner = BatchSizeTuner(targetLatency = 2.0, batchSize = 200)
+    tuner.observe(200, 0.1, 0)
+    self.assertEqual(tuner.batchSize, 400)
+
+  def testShrinksToLatency(self):
+    tuner = BatchSizeTuner(targetLatency = 2.0, batchSize = 2000, smoothing = 1)
+    tuner.observe(2000, 20.0, 0)
+    self.assertEqual(tuner.batchSize, 200)
+
+  def testOversizedPage(self):
+    tuner = BatchSizeTuner(targetLatency = None, maxPageBytes = 500000, batchSize = 500,
+                           smoothing = 0.5)
+    # Small records, then one page of records ten times the size
+    tuner.observe(500, 1.0, 50000)
+    tuner.observe(tuner.batchSize, 1.0, tuner.batchSize * 1000)
+    self.assertEqual(tuner.batchSize, 500)
+    # The next page fits
+    tuner.observe(tuner.batchSize, 1.0, tuner.batchSize * 1000)
+    self.assertTrue(tuner.batchSize * 1000 <= 500000)
+
+if __name__ == '__main__':
+  unittest.main()